@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+""" Compare two benchmark result files from run_benchmarks.py.
+
+Prints the change in each stage's time, the peak memory and the report size
+for every benchmark that is in both files, and exits with a non-zero code if
+anything got slower or bigger than the threshold.
+
+Usage:
+    python benchmarks/compare.py baseline.json results.json --threshold 1.2
+"""
+
+import argparse
+import json
+import sys
+from typing import Dict, Iterator, Tuple
+
+# Differences smaller than this are noise, whatever the ratio
+MIN_SECONDS = 0.05
+MIN_BYTES = 10_000
+
+
+def _metrics(result: Dict) -> Iterator[Tuple[str, float, float]]:
+    """Yields (name, value, noise floor) for every metric in a result"""
+    for key, value in result["timings"].items():
+        if isinstance(value, dict):
+            for subkey, subvalue in value.items():
+                yield f"{key}.{subkey}", subvalue, MIN_SECONDS
+        else:
+            yield key, value, MIN_SECONDS
+    yield "peak_rss_mb", result["peak_rss_mb"], 10
+    for key in ["report_size", "data_dir_size"]:
+        if result.get(key) is not None:
+            yield key, result[key], MIN_BYTES
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two MultiQC benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("results")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Ratio above which a change is a regression")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as fh:
+        baseline = json.load(fh)
+    with open(args.results) as fh:
+        results = json.load(fh)
+    print(f"Baseline: {baseline['meta'].get('commit')} ({baseline['meta'].get('date')})")
+    print(f"Results:  {results['meta'].get('commit')} ({results['meta'].get('date')})\n")
+
+    base_by_key = {(r["benchmark"], r["n_samples"]): r for r in baseline["results"]}
+    regressions = []
+    print(f"{'benchmark':<28} {'metric':<32} {'baseline':>12} {'result':>12} {'ratio':>7}")
+    for result in results["results"]:
+        key = (result["benchmark"], result["n_samples"])
+        if key not in base_by_key:
+            continue
+        base_metrics = {name: value for name, value, _ in _metrics(base_by_key[key])}
+        for name, value, noise_floor in _metrics(result):
+            if name not in base_metrics:
+                continue
+            base_value = base_metrics[name]
+            ratio = value / base_value if base_value else float("inf") if value else 1.0
+            flag = ""
+            if ratio > args.threshold and value - base_value > noise_floor:
+                flag = " !"
+                regressions.append((key, name))
+            elif ratio < 1 / args.threshold and base_value - value > noise_floor:
+                flag = " +"
+            label = f"{key[0]} n={key[1]}"
+            print(f"{label:<28} {name:<32} {base_value:>12.3f} {value:>12.3f} {ratio:>7.2f}{flag}")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) above {args.threshold}x:")
+        for (name, n), metric in regressions:
+            print(f"  {name} n={n}: {metric}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
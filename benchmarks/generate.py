@@ -0,0 +1,387 @@
+#!/usr/bin/env python
+
+""" Deterministic synthetic tool outputs for benchmarking MultiQC.
+
+Each generator writes the outputs of one tool for n samples into a directory.
+Values are drawn from a random.Random seeded with the sample index, so the same
+(generator, n) always produces byte-identical files, and the first k samples
+are the same whatever n is.
+
+Usage:
+    python benchmarks/generate.py fastqc 1000 /tmp/bench/fastqc_1000
+"""
+
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import zipfile
+from typing import Callable, Dict
+
+SEED = 20240101
+
+
+def _rng(i: int) -> random.Random:
+    return random.Random(SEED * 1_000_003 + i)
+
+
+def sample_name(i: int) -> str:
+    return f"SAMPLE_{i:06d}"
+
+
+def _fastqc_data(s_name: str, rng: random.Random) -> str:
+    read_len = rng.choice([100, 150, 151])
+    total = rng.randint(10**6, 5 * 10**7)
+    gc = rng.randint(38, 52)
+    out = io.StringIO()
+    out.write("##FastQC\t0.12.1\n")
+    out.write(">>Basic Statistics\tpass\n#Measure\tValue\n")
+    out.write(f"Filename\t{s_name}.fastq.gz\nFile type\tConventional base calls\n")
+    out.write("Encoding\tSanger / Illumina 1.9\n")
+    out.write(f"Total Sequences\t{total}\nTotal Bases\t{total * read_len // 10**6} Mbp\n")
+    out.write(f"Sequences flagged as poor quality\t0\nSequence length\t35-{read_len}\n%GC\t{gc}\n")
+    out.write(">>END_MODULE\n")
+
+    out.write(">>Per base sequence quality\tpass\n")
+    out.write("#Base\tMean\tMedian\tLower Quartile\tUpper Quartile\t10th Percentile\t90th Percentile\n")
+    for b in range(1, read_len + 1):
+        m = 36 - 6 * b / read_len + rng.uniform(-0.5, 0.5)
+        out.write(f"{b}\t{m:.2f}\t{int(m)}.0\t{int(m) - 2}.0\t{int(m) + 1}.0\t{int(m) - 6}.0\t{int(m) + 2}.0\n")
+    out.write(">>END_MODULE\n")
+
+    out.write(">>Per sequence quality scores\tpass\n#Quality\tCount\n")
+    for q in range(2, 42):
+        out.write(f"{q}\t{rng.random() * total / 40:.1f}\n")
+    out.write(">>END_MODULE\n")
+
+    out.write(">>Per base sequence content\twarn\n#Base\tG\tA\tT\tC\n")
+    for b in range(1, read_len + 1):
+        g, a, t = (rng.uniform(20, 30) for _ in range(3))
+        out.write(f"{b}\t{g:.2f}\t{a:.2f}\t{t:.2f}\t{100 - g - a - t:.2f}\n")
+    out.write(">>END_MODULE\n")
+
+    out.write(">>Per sequence GC content\tpass\n#GC Content\tCount\n")
+    for p in range(0, 101):
+        out.write(f"{p}\t{max(0.0, total / 20 - abs(p - gc) * total / 400 + rng.uniform(0, 100)):.1f}\n")
+    out.write(">>END_MODULE\n")
+
+    out.write(">>Per base N content\tpass\n#Base\tN-Count\n")
+    for b in range(1, read_len + 1):
+        out.write(f"{b}\t{rng.random() * 0.1:.3f}\n")
+    out.write(">>END_MODULE\n")
+
+    out.write(">>Sequence Length Distribution\twarn\n#Length\tCount\n")
+    for lo in range(35, read_len, 5):
+        out.write(f"{lo}-{lo + 4}\t{rng.randint(0, 1000)}.0\n")
+    out.write(f"{read_len}\t{total}.0\n")
+    out.write(">>END_MODULE\n")
+
+    out.write(">>Sequence Duplication Levels\tpass\n")
+    out.write(f"#Total Deduplicated Percentage\t{rng.uniform(60, 95):.2f}\n")
+    out.write("#Duplication Level\tPercentage of deduplicated\tPercentage of total\n")
+    for level in ["1", "2", "3", "4", "5", "6", "7", "8", "9", ">10", ">50", ">100", ">500", ">1k", ">5k", ">10k+"]:
+        out.write(f"{level}\t{rng.uniform(0, 10):.2f}\t{rng.uniform(0, 10):.2f}\n")
+    out.write(">>END_MODULE\n")
+
+    out.write(">>Overrepresented sequences\tpass\n>>END_MODULE\n")
+
+    out.write(">>Adapter Content\tpass\n")
+    out.write("#Position\tIllumina Universal Adapter\tIllumina Small RNA 3' Adapter\tNextera Transposase Sequence\n")
+    for b in range(1, read_len + 1):
+        out.write(f"{b}\t{b * rng.uniform(0, 0.01):.4f}\t0.0\t0.0\n")
+    out.write(">>END_MODULE\n")
+    return out.getvalue()
+
+
+def fastqc(outdir: str, n: int):
+    """FastQC fastqc_data.txt files, as extracted from the report zips"""
+    for i in range(n):
+        s_name = sample_name(i)
+        os.makedirs(os.path.join(outdir, f"{s_name}_fastqc"), exist_ok=True)
+        with open(os.path.join(outdir, f"{s_name}_fastqc", "fastqc_data.txt"), "w") as fh:
+            fh.write(_fastqc_data(s_name, _rng(i)))
+
+
+def fastqc_zip(outdir: str, n: int):
+    """FastQC report zips"""
+    for i in range(n):
+        s_name = sample_name(i)
+        # Fixed timestamps so that the archive is identical between runs. Like the real
+        # archives, the report directory is the first entry.
+        date_time = (2024, 1, 1, 0, 0, 0)
+        with zipfile.ZipFile(os.path.join(outdir, f"{s_name}_fastqc.zip"), "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr(zipfile.ZipInfo(f"{s_name}_fastqc/", date_time=date_time), "")
+            zf.writestr(
+                zipfile.ZipInfo(f"{s_name}_fastqc/fastqc_data.txt", date_time=date_time),
+                _fastqc_data(s_name, _rng(i)),
+                compress_type=zipfile.ZIP_DEFLATED,
+            )
+
+
+def starsolo(outdir: str, n: int):
+    """STARsolo summary, read_stats, umi_count, saturation and median_gene JSON files"""
+    for i in range(n):
+        rng = _rng(i)
+        s_name = sample_name(i)
+        n_cells = rng.randint(500, 20000)
+        summary = {
+            "Number of Reads": rng.randint(10**7, 10**9),
+            "Reads With Valid Barcodes": rng.uniform(0.8, 0.99),
+            "Sequencing Saturation": rng.uniform(0.2, 0.9),
+            "Q30 Bases in CB+UMI": rng.uniform(0.85, 0.98),
+            "Q30 Bases in RNA read": rng.uniform(0.8, 0.95),
+            "Reads Mapped to Genome: Unique+Multiple": rng.uniform(0.8, 0.95),
+            "Reads Mapped to Genome: Unique": rng.uniform(0.7, 0.9),
+            "Reads Mapped to GeneFull_Ex50pAS: Unique+Multiple GeneFull_Ex50pAS": rng.uniform(0.5, 0.8),
+            "Reads Mapped to GeneFull_Ex50pAS: Unique GeneFull_Ex50pAS": rng.uniform(0.5, 0.8),
+            "Estimated Number of Cells": n_cells,
+            "Unique Reads in Cells Mapped to GeneFull_Ex50pAS": rng.randint(10**6, 10**8),
+            "Fraction of Unique Reads in Cells": rng.uniform(0.5, 0.95),
+            "Mean Reads per Cell": rng.randint(1000, 100000),
+            "Median Reads per Cell": rng.randint(1000, 100000),
+            "UMIs in Cells": rng.randint(10**6, 10**8),
+            "Mean UMI per Cell": rng.randint(500, 50000),
+            "Median UMI per Cell": rng.randint(500, 50000),
+            "Mean GeneFull_Ex50pAS per Cell": rng.randint(200, 5000),
+            "Median GeneFull_Ex50pAS per Cell": rng.randint(200, 5000),
+            "Total GeneFull_Ex50pAS Detected": rng.randint(10000, 30000),
+        }
+        read_stats = {k: rng.randint(10**6, 10**8) for k in ["exonic", "intronic", "intergenic", "antisense"]}
+        # Barcode rank curve, sampled at log-spaced ranks like the real output
+        ranks = sorted({int(1.05**k) for k in range(0, 330)})
+        umi_count = {}
+        for sub, lo, hi in [("pure", 1, n_cells), ("mix", n_cells, n_cells * 2), ("background", n_cells * 2, None)]:
+            top = 50000.0 if sub == "pure" else 500.0
+            umi_count[f"{s_name} {sub}"] = {
+                str(r): round(top / (1 + r / max(n_cells, 1)) ** 2, 1)
+                for r in ranks
+                if r >= lo and (hi is None or r < hi)
+            }
+        fractions = [round(x / 20, 2) for x in range(1, 21)]
+        saturation = {str(x): round(1 - 1 / (1 + 3 * x * rng.uniform(0.5, 1.5)), 4) for x in fractions}
+        median_gene = {str(x): int(rng.randint(1000, 3000) * x**0.5) for x in fractions}
+        for seg, data in [
+            ("summary", summary),
+            ("read_stats", read_stats),
+            ("umi_count", umi_count),
+            ("saturation", saturation),
+            ("median_gene", median_gene),
+        ]:
+            with open(os.path.join(outdir, f"{s_name}.{seg}.json"), "w") as fh:
+                json.dump(data, fh, indent=2)
+
+
+def picard(outdir: str, n: int):
+    """Picard MarkDuplicates and CollectInsertSizeMetrics outputs, with their histograms"""
+    for i in range(n):
+        rng = _rng(i)
+        s_name = sample_name(i)
+        pairs = rng.randint(10**6, 10**8)
+        dup_pairs = int(pairs * rng.uniform(0.05, 0.4))
+        with open(os.path.join(outdir, f"{s_name}.markdup_metrics.txt"), "w") as fh:
+            fh.write("## htsjdk.samtools.metrics.StringHeader\n")
+            fh.write(
+                f"# picard.sam.markduplicates.MarkDuplicates INPUT=[{s_name}.bam] OUTPUT={s_name}.dedup.bam "
+                f"METRICS_FILE={s_name}.markdup_metrics.txt\n"
+            )
+            fh.write("## htsjdk.samtools.metrics.StringHeader\n# Started on: Mon Jan 01 00:00:00 UTC 2024\n\n")
+            fh.write("## METRICS CLASS\tpicard.sam.DuplicationMetrics\n")
+            fh.write(
+                "LIBRARY\tUNPAIRED_READS_EXAMINED\tREAD_PAIRS_EXAMINED\tSECONDARY_OR_SUPPLEMENTARY_RDS\t"
+                "UNMAPPED_READS\tUNPAIRED_READ_DUPLICATES\tREAD_PAIR_DUPLICATES\tREAD_PAIR_OPTICAL_DUPLICATES\t"
+                "PERCENT_DUPLICATION\tESTIMATED_LIBRARY_SIZE\n"
+            )
+            fh.write(
+                f"{s_name}\t{rng.randint(0, 10000)}\t{pairs}\t{rng.randint(0, 10000)}\t{rng.randint(0, 10**5)}\t"
+                f"{rng.randint(0, 1000)}\t{dup_pairs}\t{dup_pairs // 50}\t{dup_pairs / pairs:.6f}\t"
+                f"{int(pairs * rng.uniform(2, 10))}\n\n"
+            )
+            fh.write("## HISTOGRAM\tjava.lang.Double\nBIN\tCoverageMult\tall_sets\tnon_optical_sets\n")
+            for b in range(1, 101):
+                fh.write(f"{b}.0\t{b * rng.uniform(0.5, 1):.6f}\t{rng.randint(0, 10**6)}\t{rng.randint(0, 10**6)}\n")
+            fh.write("\n")
+
+        median = rng.randint(200, 400)
+        with open(os.path.join(outdir, f"{s_name}.insert_size_metrics.txt"), "w") as fh:
+            fh.write("## htsjdk.samtools.metrics.StringHeader\n")
+            fh.write(
+                f"# picard.analysis.CollectInsertSizeMetrics HISTOGRAM_FILE={s_name}.pdf INPUT={s_name}.bam "
+                f"OUTPUT={s_name}.insert_size_metrics.txt\n"
+            )
+            fh.write("## htsjdk.samtools.metrics.StringHeader\n# Started on: Mon Jan 01 00:00:00 UTC 2024\n\n")
+            fh.write("## METRICS CLASS\tpicard.analysis.InsertSizeMetrics\n")
+            fh.write(
+                "MEDIAN_INSERT_SIZE\tMODE_INSERT_SIZE\tMEDIAN_ABSOLUTE_DEVIATION\tMIN_INSERT_SIZE\tMAX_INSERT_SIZE\t"
+                "MEAN_INSERT_SIZE\tSTANDARD_DEVIATION\tREAD_PAIRS\tPAIR_ORIENTATION\tWIDTH_OF_10_PERCENT\t"
+                "WIDTH_OF_50_PERCENT\tWIDTH_OF_90_PERCENT\tWIDTH_OF_99_PERCENT\tSAMPLE\tLIBRARY\tREAD_GROUP\n"
+            )
+            fh.write(
+                f"{median}\t{median}\t{rng.randint(30, 80)}\t2\t{rng.randint(10**4, 10**6)}\t{median + 5.5}\t"
+                f"{rng.uniform(50, 120):.6f}\t{pairs}\tFR\t15\t75\t221\t601\t\t\t\n\n"
+            )
+            fh.write("## HISTOGRAM\tjava.lang.Integer\ninsert_size\tAll_Reads.fr_count\n")
+            for size in range(2, 1000):
+                fh.write(f"{size}\t{int(pairs / 200 / (1 + ((size - median) / 60) ** 2))}\n")
+            fh.write("\n")
+
+
+def samtools(outdir: str, n: int):
+    """samtools stats outputs, with the summary numbers, coverage and GC-depth sections"""
+    for i in range(n):
+        rng = _rng(i)
+        total = rng.randint(10**6, 10**8)
+        mapped = int(total * rng.uniform(0.8, 0.99))
+        with open(os.path.join(outdir, f"{sample_name(i)}.stats"), "w") as fh:
+            fh.write(
+                "# This file was produced by samtools stats (1.17+htslib-1.17) and can be plotted using plot-bamstats\n"
+                "# The command line was:  stats\n"
+            )
+            for key, value in [
+                ("raw total sequences", total),
+                ("filtered sequences", 0),
+                ("sequences", total),
+                ("is sorted", 1),
+                ("1st fragments", total // 2),
+                ("last fragments", total // 2),
+                ("reads mapped", mapped),
+                ("reads mapped and paired", mapped - mapped % 2),
+                ("reads unmapped", total - mapped),
+                ("reads properly paired", int(mapped * 0.95)),
+                ("reads paired", total),
+                ("reads duplicated", int(mapped * rng.uniform(0.05, 0.3))),
+                ("reads MQ0", rng.randint(0, 10**4)),
+                ("reads QC failed", 0),
+                ("non-primary alignments", rng.randint(0, 10**4)),
+                ("supplementary alignments", rng.randint(0, 10**4)),
+                ("total length", total * 150),
+                ("total first fragment length", total * 75),
+                ("total last fragment length", total * 75),
+                ("bases mapped", mapped * 150),
+                ("bases mapped (cigar)", mapped * 148),
+                ("bases trimmed", 0),
+                ("bases duplicated", rng.randint(0, 10**6)),
+                ("mismatches", rng.randint(10**4, 10**6)),
+                ("error rate", f"{rng.uniform(0.001, 0.01):.6e}"),
+                ("average length", 150),
+                ("average first fragment length", 150),
+                ("average last fragment length", 150),
+                ("maximum length", 151),
+                ("maximum first fragment length", 151),
+                ("maximum last fragment length", 151),
+                ("average quality", f"{rng.uniform(30, 38):.1f}"),
+                ("insert size average", f"{rng.uniform(250, 400):.1f}"),
+                ("insert size standard deviation", f"{rng.uniform(50, 100):.1f}"),
+                ("inward oriented pairs", rng.randint(10**5, 10**7)),
+                ("outward oriented pairs", rng.randint(0, 10**4)),
+                ("pairs with other orientation", rng.randint(0, 10**3)),
+                ("pairs on different chromosomes", rng.randint(0, 10**4)),
+                ("percentage of properly paired reads (%)", "95.0"),
+            ]:
+                fh.write(f"SN\t{key}:\t{value}\n")
+            for depth in range(1, 1001):
+                fh.write(f"COV\t[{depth}-{depth}]\t{depth}\t{int(mapped / 500 / (1 + (depth - 30) ** 2 / 100))}\n")
+            for gc in range(0, 100):
+                fh.write(f"GCD\t{gc}.0\t{gc / 100:.3f}\t0.1\t0.2\t0.3\t0.4\t0.5\n")
+
+
+def mosdepth(outdir: str, n: int):
+    """mosdepth global coverage distributions, for 24 contigs and the total"""
+    contigs = [f"chr{c}" for c in list(range(1, 23)) + ["X", "Y"]] + ["total"]
+    for i in range(n):
+        rng = _rng(i)
+        mean = rng.uniform(20, 60)
+        with open(os.path.join(outdir, f"{sample_name(i)}.mosdepth.global.dist.txt"), "w") as fh:
+            for contig in contigs:
+                for depth in range(int(mean * 3), -1, -1):
+                    frac = min(1.0, 1 / (1 + max(0.0, depth - mean * 0.5) ** 2 / (mean * 4)))
+                    fh.write(f"{contig}\t{depth}\t{frac:.2f}\n")
+
+
+def kraken(outdir: str, n: int):
+    """Kraken2 reports with minimizer counts, for 2000 species in 40 genera and 10 phyla"""
+    for i in range(n):
+        rng = _rng(i)
+        unclassified = rng.randint(10**4, 10**6)
+        # Lines are (rank code, taxonomy ID, depth, name, direct count), parents before children
+        taxa = [("R", 1, 0, "root", rng.randint(0, 100)), ("D", 2, 1, "Bacteria", rng.randint(0, 1000))]
+        for p in range(10):
+            taxa.append(("P", 1000 + p, 2, f"Phylum {p}", rng.randint(0, 1000)))
+            for g in range(4):
+                taxa.append(("G", 10000 + p * 10 + g, 3, f"Genus {p}-{g}", rng.randint(0, 1000)))
+                for sp in range(50):
+                    count = int(rng.expovariate(1 / 2000)) if rng.random() < 0.7 else 0
+                    taxa.append(("S", 100000 + p * 1000 + g * 100 + sp, 4, f"Species {p}-{g}-{sp}", count))
+
+        # Counts of the clade rooted at each taxon: sum the direct counts of the taxon and its children
+        rooted = [direct for _, _, _, _, direct in taxa]
+        for t in range(len(taxa) - 1, 0, -1):
+            parent = next(j for j in range(t - 1, -1, -1) if taxa[j][2] == taxa[t][2] - 1)
+            rooted[parent] += rooted[t]
+        total = rooted[0] + unclassified
+
+        with open(os.path.join(outdir, f"{sample_name(i)}.kreport2"), "w") as fh:
+            minimizers = unclassified * 3
+            fh.write(f"{unclassified / total * 100:6.2f}\t{unclassified}\t{unclassified}\t")
+            fh.write(f"{minimizers}\t{minimizers // 2}\tU\t0\tunclassified\n")
+            for (rank, tax_id, depth, name, direct), clade in zip(taxa, rooted):
+                if clade == 0:
+                    continue
+                minimizers = clade * rng.randint(1, 5)
+                distinct = max(1, minimizers // rng.randint(1, 4))
+                indent = "  " * depth
+                fh.write(f"{clade / total * 100:6.2f}\t{clade}\t{direct}\t{minimizers}\t{distinct}\t")
+                fh.write(f"{rank}\t{tax_id}\t{indent}{name}\n")
+
+
+def custom_content(outdir: str, n: int):
+    """One custom content TSV table with a row per sample"""
+    with open(os.path.join(outdir, "sample_metrics_mqc.tsv"), "w") as fh:
+        fh.write("# id: 'benchmark_table'\n# section_name: 'Benchmark table'\n# plot_type: 'table'\n")
+        fh.write("Sample\tReads\tYield (Gb)\tQ30 (%)\tStatus\n")
+        for i in range(n):
+            rng = _rng(i)
+            reads = rng.randint(10**6, 10**8)
+            status = rng.choice(["pass", "warn", "fail"])
+            fh.write(f"{sample_name(i)}\t{reads}\t{reads * 300 / 1e9:.3f}\t{rng.uniform(80, 98):.2f}\t{status}\n")
+
+
+GENERATORS: Dict[str, Callable[[str, int], None]] = {
+    "fastqc": fastqc,
+    "fastqc_zip": fastqc_zip,
+    "starsolo": starsolo,
+    "picard": picard,
+    "samtools": samtools,
+    "mosdepth": mosdepth,
+    "kraken": kraken,
+    "custom_content": custom_content,
+}
+
+
+def generate(name: str, n: int, outdir: str) -> str:
+    """
+    Write the synthetic data for a generator into outdir, unless it's already there
+    from a previous run. Returns the directory.
+    """
+    done_flag = os.path.join(outdir, ".complete")
+    if os.path.exists(done_flag):
+        return outdir
+    os.makedirs(outdir, exist_ok=True)
+    GENERATORS[name](outdir, n)
+    with open(done_flag, "w") as fh:
+        fh.write(f"{name}\t{n}\n")
+    return outdir
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic tool outputs for benchmarking MultiQC")
+    parser.add_argument("generator", choices=sorted(GENERATORS))
+    parser.add_argument("n_samples", type=int)
+    parser.add_argument("outdir")
+    args = parser.parse_args(argv)
+    generate(args.generator, args.n_samples, args.outdir)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+
+""" Run the MultiQC benchmarks.
+
+For every generator and sample count, synthetic data is generated (and cached)
+and MultiQC is run on it in a fresh Python process, so that import caches and
+peak memory of one benchmark don't leak into the next. The run is timed stage
+by stage and the results are written to a JSON file that can be compared
+between commits with compare.py.
+
+Usage:
+    python benchmarks/run_benchmarks.py --sizes 10 1000 --output results.json
+    python benchmarks/run_benchmarks.py --benchmarks fastqc samtools --sizes 10000
+"""
+
+import argparse
+import datetime
+import functools
+import importlib
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+import generate  # noqa: E402
+
+# Generator name: MultiQC module that parses its output
+BENCHMARKS = {
+    "fastqc": "fastqc",
+    "fastqc_zip": "fastqc",
+    "starsolo": "starsolo",
+    "picard": "picard",
+    "samtools": "samtools",
+    "mosdepth": "mosdepth",
+    "kraken": "kraken",
+    "custom_content": "custom_content",
+}
+DEFAULT_SIZES = [10, 1000]
+ALL_SIZES = [10, 1000, 10000, 100000]
+
+# Plot functions that are timed separately, as table/plot build time
+PLOT_MODULES = ["bargraph", "linegraph", "table", "violin", "heatmap", "scatter", "box", "beeswarm"]
+
+
+def _peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, fns in os.walk(path):
+        for fn in fns:
+            total += os.path.getsize(os.path.join(root, fn))
+    return total
+
+
+def run_worker(data_dir: str, module: str, outdir: str) -> Dict:
+    """Run MultiQC once in this process and return the stage timings"""
+    os.environ["MULTIQC_NO_VERSION_CHECK"] = "1"
+    t_import = time.time()
+    import multiqc
+    from multiqc.utils import report
+
+    import_time = time.time() - t_import
+
+    def timed(func, totals, key):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            t0 = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                totals[key] += time.time() - t0
+
+        return wrapper
+
+    # Time the plot and table builders, which are called from the module code
+    plot_times = defaultdict(float)
+    for name in PLOT_MODULES:
+        plot_mod = importlib.import_module(f"multiqc.plots.{name}")
+        if hasattr(plot_mod, "plot"):
+            plot_mod.plot = timed(plot_mod.plot, plot_times, name)
+
+    # Time compress_json on its own, the report's compression time also includes dumping the data
+    other_times = defaultdict(float)
+    report.compress_json = timed(report.compress_json, other_times, "compress_json")
+
+    t0 = time.time()
+    result = multiqc.run(data_dir, outdir=outdir, module=(module,), force=True, quiet=True, no_ansi=True)
+    wall_time = time.time() - t0
+
+    report_fn = os.path.join(outdir, "multiqc_report.html")
+    data_dir_out = os.path.join(outdir, "multiqc_data")
+    return {
+        "exit_code": result["sys_exit_code"],
+        "timings": {
+            "import": import_time,
+            "get_filelist": report.runtimes["total_sp"],
+            "parse": dict(report.runtimes["mods"]),
+            "plot_build": dict(plot_times),
+            "compress_json": other_times["compress_json"],
+            "render": report.runtimes.get("total_render", 0),
+            "total": wall_time,
+        },
+        "n_files_searched": sum(report.file_search_stats.values()),
+        "report_size": os.path.getsize(report_fn) if os.path.exists(report_fn) else None,
+        "data_dir_size": _dir_size(data_dir_out) if os.path.isdir(data_dir_out) else None,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _summarise(runs: List[Dict]) -> Dict:
+    """Median of each timing over repeats, to reduce noise"""
+
+    def median_of(path):
+        values = []
+        for run in runs:
+            v = run["timings"]
+            for key in path:
+                v = v.get(key, 0) if isinstance(v, dict) else 0
+            values.append(v)
+        return statistics.median(values)
+
+    timings = {}
+    for key, value in runs[0]["timings"].items():
+        if isinstance(value, dict):
+            timings[key] = {k: median_of([key, k]) for k in value}
+        else:
+            timings[key] = median_of([key])
+    summary = {k: v for k, v in runs[-1].items() if k != "timings"}
+    summary["timings"] = timings
+    summary["peak_rss_mb"] = max(run["peak_rss_mb"] for run in runs)
+    summary["repeats"] = len(runs)
+    return summary
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the MultiQC benchmarks")
+    parser.add_argument("--benchmarks", nargs="+", choices=sorted(BENCHMARKS), default=sorted(BENCHMARKS))
+    parser.add_argument(
+        "--sizes", nargs="+", type=int, default=DEFAULT_SIZES, help=f"Numbers of samples, e.g. {ALL_SIZES}"
+    )
+    parser.add_argument("--repeat", type=int, default=1, help="Number of runs per benchmark, timings are medians")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "multiqc_benchmark_data"))
+    parser.add_argument("--output", "-o", default="benchmark_results.json")
+    # Internal: run a single benchmark in this process
+    parser.add_argument("--worker", nargs=3, metavar=("DATA_DIR", "MODULE", "OUTDIR"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(run_worker(*args.worker)))
+        return 0
+
+    results = []
+    for n in args.sizes:
+        for name in args.benchmarks:
+            data_dir = os.path.join(args.data_dir, f"{name}_{n}")
+            t0 = time.time()
+            generate.generate(name, n, data_dir)
+            print(f"{name:>15} n={n:<7} data ready in {time.time() - t0:.1f}s", file=sys.stderr)
+
+            runs = []
+            for _ in range(args.repeat):
+                outdir = tempfile.mkdtemp(prefix="multiqc_benchmark_")
+                try:
+                    proc = subprocess.run(
+                        [sys.executable, __file__, "--worker", data_dir, BENCHMARKS[name], outdir],
+                        stdout=subprocess.PIPE,
+                        text=True,
+                    )
+                finally:
+                    shutil.rmtree(outdir, ignore_errors=True)
+                if proc.returncode != 0:
+                    print(f"{name:>15} n={n:<7} FAILED with exit code {proc.returncode}", file=sys.stderr)
+                    break
+                runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+            if not runs:
+                continue
+
+            result = {"benchmark": name, "module": BENCHMARKS[name], "n_samples": n, **_summarise(runs)}
+            results.append(result)
+            print(
+                f"{name:>15} n={n:<7} total {result['timings']['total']:.2f}s, "
+                f"peak RSS {result['peak_rss_mb']:.0f} MB, report {(result['report_size'] or 0) / 1e6:.1f} MB",
+                file=sys.stderr,
+            )
+
+    from multiqc.utils import config
+
+    output = {
+        "meta": {
+            "multiqc_version": config.version,
+            "commit": _git_commit(),
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as fh:
+        json.dump(output, fh, indent=2)
+    print(f"Results written to {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,6 +9,9 @@ $ python -m multiqc .
 """
 
 
+import os
+import sys
+
 from importlib_metadata import entry_points
 
 from . import multiqc
@@ -19,6 +22,24 @@ def run_multiqc():
     for entry_point in entry_points(group="multiqc.cli_options.v1"):
         opt_func = entry_point.load()
         multiqc.run_cli = opt_func(multiqc.run_cli)
+    # Long-running server mode, unless "serve" is a directory to analyse
+    if len(sys.argv) > 1 and sys.argv[1] == "serve" and not os.path.exists("serve"):
+        from .serve import serve_cli
+
+        serve_cli(args=sys.argv[2:], prog_name="multiqc serve")
+        return
+    # Many reports from one search, unless "batch" is a directory to analyse
+    if len(sys.argv) > 1 and sys.argv[1] == "batch" and not os.path.exists("batch"):
+        from .batch import batch_cli
+
+        batch_cli(args=sys.argv[2:], prog_name="multiqc batch")
+        return
+    # Reports for subsets of the samples of a snapshot, unless "slice" is a directory to analyse
+    if len(sys.argv) > 1 and sys.argv[1] == "slice" and not os.path.exists("slice"):
+        from .slicing import slice_cli
+
+        slice_cli(args=sys.argv[2:], prog_name="multiqc slice")
+        return
     # Call the main function
     multiqc.run_cli(prog_name="multiqc")
 
@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+
+""" MultiQC batch mode.
+
+`multiqc batch MANIFEST` makes many reports from the same analysis directories,
+e.g. one per project and one per sequencing run. The directories are walked and
+the files are searched once, for all reports. Each report then gets the files that
+match its path filters, and runs with its own title, samples, config and output
+directory. Reports are generated in a pool of processes, with the config and the
+report reset for every one of them.
+
+The manifest is a YAML (or JSON) file. Relative paths in it are relative to the
+directory of the manifest:
+
+    analysis_dir:
+      - run_42/
+    config:  # Optional, used for the search and for all reports
+      fn_ignore_dirs: ["work"]
+    reports:
+      - title: Project A
+        output_dir: reports/project_a
+        path_filters: ["*/project_a/*"]
+        samples: project_a_samples.txt
+      - title: Run 42
+        output_dir: reports/run_42
+        ignore_samples: ["Undetermined*"]
+"""
+
+import fnmatch
+import json
+import logging
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+import rich_click as click
+
+from multiqc.utils import config, loaders, log, report, util_functions
+
+logger = logging.getLogger("multiqc.batch")
+
+# Keys of a report in the manifest
+REPORT_KEYS = {
+    "title",
+    "comment",
+    "output_dir",
+    "filename",
+    "template",
+    "modules",
+    "path_filters",
+    "path_filters_exclude",
+    "samples",
+    "ignore_samples",
+    "config",
+}
+
+# Config that changes which files are found, so can only be set for all reports
+SEARCH_CONFIG_KEYS = {
+    "sp",
+    "fn_ignore_dirs",
+    "fn_ignore_paths",
+    "fn_ignore_files",
+    "ignore_symlinks",
+    "ignore_images",
+    "log_filesize_limit",
+    "filesearch_lines_limit",
+    "filesearch_max_filesize",
+    "filesearch_file_shared",
+}
+
+
+class ManifestError(Exception):
+    pass
+
+
+def load_manifest(path: str) -> Dict:
+    """Load and check a batch manifest, resolving paths relative to its directory"""
+    try:
+        with open(path) as fh:
+            manifest = loaders.load_yaml(fh)
+    except Exception as e:
+        raise ManifestError(f"Could not load '{path}': {e}")
+    if not isinstance(manifest, dict):
+        raise ManifestError(f"'{path}' should contain a mapping with 'analysis_dir' and 'reports'")
+
+    base_dir = os.path.dirname(os.path.abspath(path))
+    analysis_dirs = manifest.get("analysis_dir")
+    if isinstance(analysis_dirs, str):
+        analysis_dirs = [analysis_dirs]
+    if not analysis_dirs:
+        raise ManifestError("No 'analysis_dir' in the manifest")
+    analysis_dirs = [os.path.normpath(os.path.join(base_dir, d)) for d in analysis_dirs]
+    for d in analysis_dirs:
+        if not os.path.exists(d):
+            raise ManifestError(f"Analysis directory '{d}' does not exist")
+
+    reports = manifest.get("reports")
+    if not reports or not isinstance(reports, list):
+        raise ManifestError("No 'reports' in the manifest")
+    for i, job in enumerate(reports):
+        if not isinstance(job, dict) or not job.get("output_dir"):
+            raise ManifestError(f"Report {i + 1} in the manifest has no 'output_dir'")
+        unknown = set(job) - REPORT_KEYS
+        if unknown:
+            logger.warning(f"Unknown keys for report {i + 1} in the manifest: {', '.join(sorted(unknown))}")
+        search_keys = set(job.get("config") or {}) & SEARCH_CONFIG_KEYS
+        if search_keys:
+            logger.warning(
+                f"Ignoring {', '.join(sorted(search_keys))} in the config of report {i + 1}, "
+                "as the files are searched once for all reports. Set them in the top-level config."
+            )
+        job["output_dir"] = os.path.normpath(os.path.join(base_dir, job["output_dir"]))
+        for key in ["samples", "ignore_samples"]:
+            job[key] = _sample_list(job.get(key), base_dir)
+
+    return {"analysis_dir": analysis_dirs, "config": manifest.get("config") or {}, "reports": reports}
+
+
+def _sample_list(value, base_dir: str) -> List[str]:
+    """A list of sample names or patterns, or a file with one per line"""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        with open(os.path.join(base_dir, value)) as fh:
+            return [line.strip() for line in fh if line.strip() and not line.startswith("#")]
+    return [str(s) for s in value]
+
+
+def search_files(analysis_dirs: List[str]) -> Dict[str, List[Dict]]:
+    """Walk the analysis directories and search the files for every module, once"""
+    report.init()
+    config.analysis_dir = analysis_dirs
+    run_module_names = list(config.avail_modules.keys()) + list(config.custom_data.keys()) + ["software_versions"]
+    for d in analysis_dirs:
+        logger.info(f"Search path : {d}")
+    report.get_filelist(run_module_names)
+    return report.files
+
+
+def partition_files(
+    found_files: Dict[str, List[Dict]],
+    analysis_dirs: List[str],
+    path_filters: Optional[List[str]] = None,
+    path_filters_exclude: Optional[List[str]] = None,
+) -> Dict[str, List[Dict]]:
+    """
+    The found files that match any of the path filters, and none of the exclusion filters.
+    Like the path_filters of a module, patterns are matched against the full paths and
+    against the paths within each analysis directory.
+    """
+
+    def matches(path: str, patterns: List[str]) -> bool:
+        for pattern in patterns:
+            if fnmatch.fnmatch(path, pattern):
+                return True
+            if any(fnmatch.fnmatch(path, os.path.join(d, pattern)) for d in analysis_dirs):
+                return True
+        return False
+
+    partition = {}
+    for key, key_files in found_files.items():
+        partition[key] = [
+            f
+            for f in key_files
+            if (not path_filters or matches(os.path.join(f["root"], f["fn"]), path_filters))
+            and not (path_filters_exclude and matches(os.path.join(f["root"], f["fn"]), path_filters_exclude))
+        ]
+    return partition
+
+
+def run_job(params: Dict, cwd: str) -> int:
+    """Generate one report, possibly in a worker process. Returns the exit code."""
+    from multiqc import multiqc
+
+    # Start from a clean config, as if MultiQC had just been launched
+    config.reset(cwd)
+    multiqc.start_execution_time = time.time()
+    try:
+        return multiqc.run(**params)["sys_exit_code"]
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else 1
+    except Exception:
+        traceback.print_exc()
+        return 1
+
+
+@click.command(context_settings=dict(help_option_names=["-h", "--help"]))
+@click.argument("manifest", type=click.Path(exists=True, dir_okay=False))
+@click.option("-p", "--processes", type=int, default=1, help="Number of reports to generate at the same time")
+@click.option("-f", "--force", is_flag=True, help="Overwrite any existing reports")
+@click.option(
+    "-c",
+    "--config",
+    "config_file",
+    type=click.Path(exists=True, readable=True),
+    multiple=True,
+    help="Specific config file to load, for the search and for all reports",
+)
+@click.option("--cl-config", type=str, multiple=True, help="Specify MultiQC config YAML on the command line")
+@click.option("-v", "--verbose", count=True, default=0, help="Increase output verbosity")
+@click.option("-q", "--quiet", is_flag=True, help="Only show log warnings")
+@click.option("--no-ansi", is_flag=True, help="Disable coloured log output")
+def batch_cli(manifest, processes, force, config_file, cl_config, verbose, quiet, no_ansi):
+    """Generate many MultiQC reports from one search of the analysis directories.
+
+    The [yellow]MANIFEST[/] lists the directories to search, and the title, output
+    directory, path filters and samples of each report.
+    """
+    loglevel = log.LEVELS.get(min(verbose, 1), "INFO")
+    if quiet:
+        loglevel = "WARNING"
+        config.quiet = True
+    # Every report sets up the "multiqc" logger again, so keep the batch logs apart
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter("|%(module)18s | %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(loglevel)
+    logger.propagate = False
+    log.init_log(config.logger, loglevel=loglevel, no_ansi=no_ansi)
+    t0 = time.time()
+    try:
+        batch = load_manifest(manifest)
+    except ManifestError as e:
+        logger.error(str(e))
+        sys.exit(1)
+
+    # Search once, with the config shared by all reports
+    config.mqc_load_userconfig(config_file)
+    config.mqc_cl_config(cl_config)
+    config.mqc_add_config(batch["config"])
+    found_files = search_files(batch["analysis_dir"])
+    n_found = len({(f["root"], f["fn"]) for key_files in found_files.values() for f in key_files})
+    logger.info(f"Found {n_found} files in {time.time() - t0:.2f}s, generating {len(batch['reports'])} reports")
+
+    jobs = []
+    for job in batch["reports"]:
+        job_config = dict(job.get("config") or {})
+        for key in SEARCH_CONFIG_KEYS:
+            job_config.pop(key, None)
+        if job["samples"]:
+            job_config["sample_names_only_include"] = job["samples"]
+        params = dict(
+            analysis_dir=batch["analysis_dir"],
+            outdir=job["output_dir"],
+            title=job.get("title"),
+            report_comment=job.get("comment"),
+            filename=job.get("filename"),
+            template=job.get("template"),
+            module=tuple(job.get("modules") or ()),
+            ignore_samples=tuple(job["ignore_samples"]),
+            force=force,
+            config_file=config_file,
+            cl_config=tuple(cl_config) + (json.dumps(batch["config"]), json.dumps(job_config)),
+            # Logs of reports generated at the same time would be mixed up, they are all in multiqc.log
+            verbose=verbose,
+            quiet=quiet or (processes > 1 and not verbose),
+            no_ansi=no_ansi,
+            found_files=partition_files(
+                found_files, batch["analysis_dir"], job.get("path_filters"), job.get("path_filters_exclude")
+            ),
+        )
+        jobs.append((job, params))
+
+    # The log of the search isn't kept, each report has its own
+    for h in config.logger.handlers[:]:
+        if isinstance(h, logging.FileHandler):
+            h.close()
+            config.logger.removeHandler(h)
+    util_functions.robust_rmtree(log.log_tmp_dir)
+
+    exit_codes = []
+    cwd = os.getcwd()
+    if processes > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            futures = {pool.submit(run_job, params, cwd): job for job, params in jobs}
+            for future in as_completed(futures):
+                exit_codes.append(_log_job(futures[future], future))
+    else:
+        for job, params in jobs:
+            exit_codes.append(_log_job(job, run_job(params, cwd)))
+
+    n_failed = sum(1 for code in exit_codes if code != 0)
+    logger.info(f"Generated {len(jobs) - n_failed} of {len(jobs)} reports in {time.time() - t0:.2f}s")
+    sys.exit(1 if n_failed else 0)
+
+
+def _log_job(job: Dict, result) -> int:
+    """Log the outcome of a report, given its exit code or the future for it"""
+    if not isinstance(result, int):
+        try:
+            result = result.result()
+        except Exception as e:
+            logger.error(f"Report '{job.get('title') or job['output_dir']}' crashed: {e}")
+            return 1
+    name = job.get("title") or os.path.relpath(job["output_dir"])
+    if result == 0:
+        logger.info(f"Finished report '{name}': {os.path.relpath(job['output_dir'])}")
+    else:
+        logger.error(f"Report '{name}' failed with exit code {result}")
+    return result
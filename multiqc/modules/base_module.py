@@ -1,19 +1,22 @@
 """ MultiQC modules base class, contains helper functions """
-from typing import List, Union, Optional
+from typing import Any, Callable, Iterable, Iterator, List, Tuple, Union, Optional
 
+import contextlib
 import fnmatch
 import io
 import itertools
 import logging
 import mimetypes
+import multiprocessing
 import os
 import re
 import textwrap
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
 import markdown
 
-from multiqc.utils import config, report, software_versions, util_functions
+from multiqc.utils import config, report, software_versions, spill, util_functions
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +25,66 @@ class ModuleNoSamplesFound(Exception):
     """Module checked all input files but couldn't find any data to use"""
 
 
+class LogFile(dict):
+    """
+    A file found by find_log_files(): a dict with the filename (fn), root directory
+    (root), search pattern key (sp_key) and cleaned sample name (s_name).
+
+    The file contents in f["f"] are only read and decoded the first time they are
+    accessed, so files that a module doesn't read cost nothing. Modules that can
+    parse a file as a stream should use f.open() or f.lines() instead of f["f"],
+    to avoid holding the whole file in memory.
+    """
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self["root"], self["fn"])
+
+    @contextlib.contextmanager
+    def open(self, errors: str = "strict"):
+        """Open the file for reading text"""
+        with io.open(self.path, "r", encoding="utf-8", errors=errors) as fh:
+            try:
+                yield fh
+            finally:
+                report.count_bytes_read(self.get("sp_key"), fh)
+
+    def lines(self) -> Iterator[str]:
+        """Iterate over the lines of the file"""
+        with self.open() as fh:
+            yield from fh
+
+    def read(self) -> Optional[str]:
+        """Read the whole file, skipping any characters that aren't valid utf-8"""
+        try:
+            with self.open() as fh:
+                return fh.read()
+        except UnicodeDecodeError as e:
+            logger.debug(f"Couldn't read file as utf-8: {self['fn']}, will attempt to skip non-unicode characters\n{e}")
+            try:
+                with self.open(errors="ignore") as fh:
+                    return fh.read()
+            except Exception as e:
+                logger.debug(f"Still couldn't read file: {self['fn']}\n{e}")
+        except (IOError, OSError, ValueError) as e:
+            logger.debug(f"Couldn't read file: {self['fn']}\n{e}")
+        return None
+
+    def __missing__(self, key):
+        if key != "f":
+            raise KeyError(key)
+        self["f"] = self.read()
+        return self["f"]
+
+    def __contains__(self, key):
+        return key == "f" or super().__contains__(key)
+
+    def get(self, key, default=None):
+        if key == "f":
+            return self["f"]
+        return super().get(key, default)
+
+
 class BaseMultiqcModule(object):
     def __init__(
         self,
@@ -105,9 +168,10 @@ class BaseMultiqcModule(object):
         Return matches log files of interest.
         :param sp_key: Search pattern key specified in config
         :param filehandles: Set to true to return a file handle instead of slurped file contents
-        :return: Yields a dict with filename (fn), root directory (root), cleaned sample name
+        :return: Yields a LogFile dict with filename (fn), root directory (root), cleaned sample name
                  generated from the filename (s_name) and either the file contents or file handle
-                 for the current matched file (f).
+                 for the current matched file (f). File contents are only read when f["f"] is first
+                 accessed, see LogFile.
                  As yield is used, the results can be iterated over without loading all files at once
         """
 
@@ -136,6 +200,7 @@ class BaseMultiqcModule(object):
             logger.warning("Did not understand find_log_files() search key")
             return
 
+        report.searched_sp_keys.append(sp_key)
         for f in report.files[sp_key]:
             # Make a note of the filename so that we can report it if something crashes
             report.last_found_file = os.path.join(f["root"], f["fn"])
@@ -182,45 +247,103 @@ class BaseMultiqcModule(object):
             # Make a sample name from the filename
             f["sp_key"] = sp_key
             f["s_name"] = self.clean_s_name(f["fn"], f)
+            # Yield a copy, so that file contents read by the module aren't kept in report.files
+            f = LogFile(f)
             if filehandles or filecontents:
                 try:
                     # Custom content module can now handle image files
-                    (ftype, encoding) = mimetypes.guess_type(os.path.join(f["root"], f["fn"]))
+                    (ftype, encoding) = mimetypes.guess_type(f.path)
                     if ftype is not None and ftype.startswith("image"):
-                        with io.open(os.path.join(f["root"], f["fn"]), "rb") as fh:
+                        with io.open(f.path, "rb") as fh:
                             # always return file handles
                             f["f"] = fh
                             yield f
-                    else:
+                    elif filehandles:
                         # Everything else - should be all text files
-                        with io.open(os.path.join(f["root"], f["fn"]), "r", encoding="utf-8") as fh:
-                            if filehandles:
-                                f["f"] = fh
-                                yield f
-                            elif filecontents:
-                                try:
-                                    f["f"] = fh.read()
-                                except UnicodeDecodeError as e:
-                                    logger.debug(
-                                        f"Couldn't read file as utf-8: {f['fn']}, will attempt to skip non-unicode characters\n{e}"
-                                    )
-                                    try:
-                                        with io.open(
-                                            os.path.join(f["root"], f["fn"]), "r", encoding="utf-8", errors="ignore"
-                                        ) as fh_ignoring:
-                                            f["f"] = fh_ignoring.read()
-                                    except Exception as e:
-                                        logger.debug(f"Still couldn't read file: {f['fn']}\n{e}")
-                                        f["f"] = None
-                                    finally:
-                                        fh.close()
-                                yield f
+                        with f.open() as fh:
+                            f["f"] = fh
+                            yield f
+                    elif os.access(f.path, os.R_OK):
+                        # Contents are read when the module first accesses f["f"]
+                        yield f
+                    else:
+                        logger.debug(f"Couldn't open file for reading: {f['fn']}")
                 except (IOError, OSError, ValueError, UnicodeDecodeError) as e:
                     logger.debug(f"Couldn't open filehandle when returning file: {f['fn']}\n{e}")
-                    f["f"] = None
             else:
                 yield f
 
+    def map_log_files(
+        self,
+        sp_key: Union[str, Iterable[LogFile]],
+        parser_fn: Callable[..., Any],
+        workers: Optional[int] = None,
+        filecontents: bool = True,
+        keep_fn: Optional[Callable[[LogFile, Any], bool]] = None,
+    ) -> List[Tuple[LogFile, Any]]:
+        """
+        Parse all files of a search pattern with parser_fn(module, f), in a pool of
+        processes if there are enough files. Files are read by the process that parses them.
+        :param sp_key: Search pattern key specified in config, or a list of files already
+                       returned by find_log_files()
+        :param parser_fn: Function called for every file. It must be defined at the top level
+                          of a Python module (or be a functools.partial of such a function),
+                          so that it can be sent to the worker processes. It gets a
+                          ModuleCallRecorder in place of the module: that can clean sample
+                          names, and records calls to add_data_source() and
+                          add_software_version(), which are then replayed on this module.
+                          Anything else that the parser finds must be in its return value.
+        :param workers: Number of processes, by default config.parse_processes but no more than
+                        the available CPUs. Files are parsed in this process if it's 1, if there
+                        are fewer files than config.parse_processes_min_files, or if processes
+                        can't be forked
+        :param keep_fn: Optional function called as keep_fn(f, result) for every file, in file
+                        order. Results for which it returns False are dropped, and the calls
+                        recorded while parsing them are not replayed
+        :return: A list of (f, result) tuples, in the order in which the files were found
+        """
+        if isinstance(sp_key, str):
+            files = list(self.find_log_files(sp_key, filecontents=filecontents))
+        else:
+            files = list(sp_key)
+        if workers is None:
+            workers = min(config.parse_processes, _available_cpus())
+        workers = min(workers or 1, len(files))
+        use_pool = (
+            workers > 1
+            and len(files) >= config.parse_processes_min_files
+            and "fork" in multiprocessing.get_all_start_methods()
+        )
+
+        recorder = ModuleCallRecorder(self)
+        tasks = [(parser_fn, recorder, f) for f in files]
+        results = []
+        if use_pool:
+            logger.debug(f"{self.name}: parsing {len(files)} files in {workers} processes")
+            # Let the data file writer threads finish, so that they don't hold any locks while forking
+            util_functions.wait_for_data_files()
+            # Worker processes are forked, so that they see the current config and module settings
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork")) as pool:
+                outputs = pool.map(_parse_log_file, tasks, chunksize=max(1, len(tasks) // (workers * 4)))
+                for f, (result, calls, bytes_read) in _track_last_found_file(files, outputs):
+                    for key, n_bytes in bytes_read.items():
+                        report.file_bytes_read[key] += n_bytes
+                    results.append((f, result, calls))
+        else:
+            outputs = (_parse_log_file(task) for task in tasks)
+            for f, (result, calls, _) in _track_last_found_file(files, outputs):
+                results.append((f, result, calls))
+
+        # Replay the calls recorded by the parsers, in file order
+        kept = []
+        for f, result, calls in results:
+            if keep_fn is not None and not keep_fn(f, result):
+                continue
+            for method, args, kwargs in calls:
+                getattr(self, method)(*args, **kwargs)
+            kept.append((f, result))
+        return kept
+
     def add_section(
         self,
         name=None,
@@ -480,6 +603,12 @@ class BaseMultiqcModule(object):
 
     def ignore_samples(self, data):
         """Strip out samples which match `sample_names_ignore`"""
+        if isinstance(data, spill.SpillDict):
+            # Samples kept on disk with --low-memory are removed in place, without loading them
+            for s_name in data:
+                if self.is_ignore_sample(s_name):
+                    del data[s_name]
+            return data
         try:
             if isinstance(data, dict):
                 newdata = dict()
@@ -492,11 +621,15 @@ class BaseMultiqcModule(object):
         except (TypeError, AttributeError):
             return data
 
-    def is_ignore_sample(self, s_name):
+    @staticmethod
+    def is_ignore_sample(s_name):
         """Should a sample name be ignored?"""
         glob_match = any(fnmatch.fnmatch(s_name, sn) for sn in config.sample_names_ignore)
         re_match = any(re.match(sn, s_name) for sn in config.sample_names_ignore_re)
-        return glob_match or re_match
+        not_included = bool(config.sample_names_only_include) and not any(
+            fnmatch.fnmatch(s_name, sn) for sn in config.sample_names_only_include
+        )
+        return glob_match or re_match or not_included
 
     def general_stats_addcols(self, data, headers=None, namespace=None):
         """Helper function to add to the General Statistics variable.
@@ -610,7 +743,7 @@ class BaseMultiqcModule(object):
             i += 1
 
         # Save the file
-        report.saved_raw_data[fn] = data
+        report.save_raw_data(fn, data)
         util_functions.write_data_file(data, fn, sort_cols, data_format)
 
     ##################################################
@@ -630,3 +763,53 @@ class BaseMultiqcModule(object):
         if pconfig is None:
             pconfig = {}
         return linegraph.plot(data, pconfig)
+
+
+class ModuleCallRecorder:
+    """
+    Stands in for a module in the parser functions of map_log_files(), which can run in
+    other processes. Sample names are cleaned and ignored like the module would do, and the
+    calls that add to the report are recorded, to be replayed on the module afterwards.
+    """
+
+    def __init__(self, module: BaseMultiqcModule):
+        self.name = module.name
+        self.anchor = module.anchor
+        self.mod_cust_config = getattr(module, "mod_cust_config", {})
+        self.calls: List[Tuple[str, tuple, dict]] = []
+
+    clean_s_name = BaseMultiqcModule.clean_s_name
+    _clean_fastq_pair = BaseMultiqcModule._clean_fastq_pair
+    is_ignore_sample = BaseMultiqcModule.is_ignore_sample
+
+    def add_data_source(self, *args, **kwargs):
+        self.calls.append(("add_data_source", args, kwargs))
+
+    def add_software_version(self, *args, **kwargs):
+        self.calls.append(("add_software_version", args, kwargs))
+
+
+def _parse_log_file(task):
+    """Runs a map_log_files() parser on one file, possibly in a worker process"""
+    parser_fn, recorder, f = task
+    recorder.calls = []
+    bytes_before = dict(report.file_bytes_read)
+    result = parser_fn(recorder, f)
+    # Bytes read by the worker processes are added up in the main process
+    bytes_read = {k: n - bytes_before.get(k, 0) for k, n in report.file_bytes_read.items() if n != bytes_before.get(k)}
+    return result, recorder.calls, bytes_read
+
+
+def _available_cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # not available on macOS
+        return os.cpu_count() or 1
+
+
+def _track_last_found_file(files: List[LogFile], outputs: Iterable) -> Iterator:
+    """Pairs files with their parser outputs, noting each file in case the parser crashed on it"""
+    outputs = iter(outputs)
+    for f in files:
+        report.last_found_file = f.path
+        yield f, next(outputs)
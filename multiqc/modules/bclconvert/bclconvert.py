@@ -357,7 +357,7 @@ class MultiqcModule(BaseMultiqcModule):
 
         run_data = bclconvert_data.get(demux_file["run_id"], dict())
         bclconvert_data[demux_file["run_id"]] = run_data
-        with open(filename) as fh:
+        with demux_file.open() as fh:
             reader: csv.DictReader = csv.DictReader(fh, delimiter=",")
             for row in reader:
                 lane_id = f"L{row['Lane']}"
@@ -423,29 +423,30 @@ class MultiqcModule(BaseMultiqcModule):
         filename = str(os.path.join(qmetrics_file["root"], qmetrics_file["fn"]))
         self.total_reads_in_lane_per_file[filename] = dict()
 
-        reader: csv.DictReader = csv.DictReader(open(filename), delimiter=",")
-        for row in reader:
-            run_data = bclconvert_data[qmetrics_file["run_id"]]
-            lane_id = f"L{row['Lane']}"
-            if lane_id not in run_data:
-                log.warning(f"Found unrecognised lane {lane_id} in Quality Metrics file, skipping")
-                continue
-            lane = run_data[lane_id]
-            sample = row["SampleID"]
-            if sample != "Undetermined":  # don't include undetermined reads at all in any of the calculations...
-                if sample not in run_data[lane_id]["samples"]:
-                    log.warning(f"Found unrecognised sample {sample} in Quality Metrics file, skipping")
+        with qmetrics_file.open() as fh:
+            reader: csv.DictReader = csv.DictReader(fh, delimiter=",")
+            for row in reader:
+                run_data = bclconvert_data[qmetrics_file["run_id"]]
+                lane_id = f"L{row['Lane']}"
+                if lane_id not in run_data:
+                    log.warning(f"Found unrecognised lane {lane_id} in Quality Metrics file, skipping")
                     continue
-                lane_sample = run_data[lane_id]["samples"][sample]  # this sample in this lane
-
-                # Parse the stats that moved to this file in v3.9.3
-                lane["yield"] += int(row["Yield"])
-                lane["basesQ30"] += int(row["YieldQ30"])
-                lane_sample["yield"] += int(row["Yield"])
-                lane_sample["basesQ30"] += int(row["YieldQ30"])
-                # Collecting to re-calculate mean_quality:
-                lane["_quality_score_sum"] += float(row["QualityScoreSum"])
-                lane_sample["_quality_score_sum"] += float(row["QualityScoreSum"])
+                lane = run_data[lane_id]
+                sample = row["SampleID"]
+                if sample != "Undetermined":  # don't include undetermined reads at all in any of the calculations...
+                    if sample not in run_data[lane_id]["samples"]:
+                        log.warning(f"Found unrecognised sample {sample} in Quality Metrics file, skipping")
+                        continue
+                    lane_sample = run_data[lane_id]["samples"][sample]  # this sample in this lane
+
+                    # Parse the stats that moved to this file in v3.9.3
+                    lane["yield"] += int(row["Yield"])
+                    lane["basesQ30"] += int(row["YieldQ30"])
+                    lane_sample["yield"] += int(row["Yield"])
+                    lane_sample["basesQ30"] += int(row["YieldQ30"])
+                    # Collecting to re-calculate mean_quality:
+                    lane["_quality_score_sum"] += float(row["QualityScoreSum"])
+                    lane_sample["_quality_score_sum"] += float(row["QualityScoreSum"])
 
     def _parse_top_unknown_barcodes(self, bclconvert_data, last_run_id):
         run_data = bclconvert_data[last_run_id]
@@ -1,12 +1,12 @@
 """ MultiQC module to parse output from Cell Ranger count """
 
-import json
 import logging
 import re
 
 from multiqc import config
 from multiqc.modules.cellranger.utils import set_hidden_cols, update_dict, parse_bcknee_data, clean_title_case
 from multiqc.plots import linegraph, table
+from multiqc.utils import loaders
 
 # Initialise the logger
 log = logging.getLogger(__name__)
@@ -168,7 +168,7 @@ class CellRangerVdjMixin:
             line = line.strip()
             if line.startswith("const data"):
                 line = line.replace("const data = ", "")
-                mydict = json.loads(line)
+                mydict = loaders.load_json(line)
                 mydict = mydict["summary"]
                 break
 
@@ -2,18 +2,20 @@
 
 
 import base64
-import json
 import logging
 import os
 import re
 from collections import defaultdict
+from itertools import chain
+from typing import List, Optional
 
+import numpy as np
 import yaml
 
 from multiqc import config
 from multiqc.modules.base_module import BaseMultiqcModule, ModuleNoSamplesFound
 from multiqc.plots import bargraph, beeswarm, heatmap, linegraph, scatter, table
-from multiqc.utils import report
+from multiqc.utils import loaders, report
 
 # Initialise the logger
 log = logging.getLogger(__name__)
@@ -82,7 +84,7 @@ def custom_module_classes():
                 parsed_data = None
                 if f_extension == ".yaml" or f_extension == ".yml":
                     try:
-                        parsed_data = yaml.safe_load(f["f"])
+                        parsed_data = loaders.load_yaml(f["f"])
                     except Exception as e:
                         log.warning(f"Error parsing YAML file '{f['fn']}' (probably invalid YAML)")
                         log.debug(f"YAML error: {e}", exc_info=True)
@@ -90,7 +92,7 @@ def custom_module_classes():
                     parsed_data["id"] = parsed_data.get("id", f["s_name"])
                 elif f_extension == ".json":
                     try:
-                        parsed_data = json.loads(f["f"])
+                        parsed_data = loaders.load_json(f["f"])
                     except Exception as e:
                         log.warning(f"Error parsing JSON file '{f['fn']}' (probably invalid JSON)")
                         log.warning(f"JSON error: {e}")
@@ -133,8 +135,9 @@ def custom_module_classes():
 
                 # txt, csv, tsv etc
                 else:
+                    lines = f["f"].splitlines()
                     # Look for configuration details in the header
-                    m_config = _find_file_header(f)
+                    m_config = _find_file_header(f, lines)
                     s_name = None
                     if m_config is not None:
                         c_id = m_config.get("id", k)
@@ -168,10 +171,10 @@ def custom_module_classes():
 
                     # Guess file format if not given
                     if m_config.get("file_format") is None:
-                        m_config["file_format"] = _guess_file_format(f)
+                        m_config["file_format"] = _guess_file_format(f, lines)
                     # Parse data
                     try:
-                        parsed_data, conf = _parse_txt(f, m_config)
+                        parsed_data, conf = _parse_txt(f, m_config, lines)
                         if parsed_data is None or len(parsed_data) == 0:
                             log.warning(f"Not able to parse custom data in {f['fn']}")
                         else:
@@ -420,17 +423,14 @@ class MultiqcModule(BaseMultiqcModule):
         self.add_section(name=section_name, anchor=c_id, description=section_description, plot=plot, content=content)
 
 
-def _find_file_header(f):
+def _find_file_header(f, lines):
     # Collect commented out header lines
-    hlines = []
-    for line in f["f"].splitlines():
-        if line.startswith("#"):
-            hlines.append(line[1:])
+    hlines = [line[1:] for line in lines if line.startswith("#")]
     if len(hlines) == 0:
         return None
     hconfig = None
     try:
-        hconfig = yaml.safe_load("\n".join(hlines))
+        hconfig = loaders.load_yaml("\n".join(hlines))
         assert isinstance(hconfig, dict)
     except yaml.YAMLError as e:
         log.warning(f"Could not parse comment file header for MultiQC custom content: {f['fn']}")
@@ -449,14 +449,14 @@ def _find_html_file_header(f):
             comment = match.group(1)
             if comment:
                 try:
-                    return yaml.load(comment, Loader=yaml.SafeLoader)
+                    return loaders.load_yaml(comment)
                 except Exception as e:
                     log.debug(f"Found Custom Content HTML comment, but couldn't load as YAML: {e}", exc_info=True)
                     log.debug(f"Comment:\n{comment}")
     return {}
 
 
-def _guess_file_format(f):
+def _guess_file_format(f, lines):
     """
     Tries to guess file format, first based on file extension (csv / tsv),
     then by looking for common column separators in the first 10 non-commented lines.
@@ -470,11 +470,11 @@ def _guess_file_format(f):
     commas = []
     spaces = []
     j = 0
-    for line in f["f"].splitlines():
+    for line in lines:
         if not line.startswith("#"):
             j += 1
-            tabs.append(len(line.split("\t")))
-            commas.append(len(line.split(",")))
+            tabs.append(line.count("\t") + 1)
+            commas.append(line.count(",") + 1)
             spaces.append(len(line.split()))
         if j == 10:
             break
@@ -504,94 +504,135 @@ def _guess_file_format(f):
     return "spaces"
 
 
-def _parse_txt(f, conf):
+class _Table:
+    """
+    A delimited text file, parsed column by column. Values are floats where they can be
+    converted, otherwise strings with any surrounding quotes removed. The first row is
+    kept apart from the others, as it may or may not be a header.
+    """
+
+    def __init__(self, raw_columns: List[List[str]]):
+        self.header = [_to_value(col[0]) for col in raw_columns]
+        self.columns: List[list] = []
+        # Whether every value below the first row is a number, for each column
+        self.numeric: List[bool] = []
+        for col in raw_columns:
+            values, numeric = _parse_column(col[1:])
+            self.columns.append(values)
+            self.numeric.append(numeric)
+
+    @property
+    def n_rows(self) -> int:
+        """Number of rows after the first row"""
+        return len(self.columns[0])
+
+    def rows(self, with_header: bool = False):
+        """Iterate over the rows as tuples, optionally starting with the first row"""
+        rows = zip(*self.columns)
+        if with_header:
+            return chain([tuple(self.header)], rows)
+        return rows
+
+
+def _read_table(lines: List[str], sep: Optional[str]) -> Optional[_Table]:
+    """
+    Split lines into columns. With a separator, the lines are joined and split in one go
+    after checking that every line has the same number of separators. Returns None if the
+    lines don't all have the same number of columns.
+    """
+    if sep is None:
+        rows = [line.split() for line in lines]
+        ncols = len(rows[0])
+        if ncols == 0 or any(len(row) != ncols for row in rows):
+            return None
+        return _Table([list(col) for col in zip(*rows)])
+
+    nseps = {line.count(sep) for line in lines}
+    if len(nseps) > 1:
+        return None
+    ncols = nseps.pop() + 1
+    tokens = sep.join(lines).split(sep)
+    return _Table([tokens[j::ncols] for j in range(ncols)])
+
+
+def _to_value(v: str):
+    """A value as a float if possible, otherwise as a string without surrounding quotes"""
+    try:
+        return float(v)
+    except ValueError:
+        if (v.startswith('"') and v.endswith('"')) or (v.startswith("'") and v.endswith("'")):
+            v = v[1:-1]
+        return v
+
+
+def _parse_column(values: List[str]):
+    """Values of a column, converted all at once if they are all numbers. Returns whether they are."""
+    try:
+        return np.array(values, dtype=float).tolist(), True
+    except ValueError:
+        parsed = [_to_value(v) for v in values]
+        return parsed, all(isinstance(v, float) for v in parsed)
+
+
+def _parse_txt(f, conf, lines):
     # Split the data into a list of lists by column
     sep = None
     if conf["file_format"] == "csv":
         sep = ","
     if conf["file_format"] == "tsv":
         sep = "\t"
-    lines = f["f"].splitlines()
-    d = []
+    data_lines = [line for line in lines if line and not line.startswith("#")]
 
     # Check for special case - HTML
     if conf.get("plot_type") == "html":
-        for line in lines:
-            if line and not line.startswith("#"):
-                d.append(line)
-        return "\n".join(d), conf
+        return "\n".join(data_lines), conf
 
     # Not HTML, need to parse data
-    ncols = None
-    for line in lines:
-        if line and not line.startswith("#"):
-            sections = line.split(sep)
-            d.append(sections)
-            if ncols is None:
-                ncols = len(sections)
-            elif ncols != len(sections):
-                log.warning(f"Inconsistent number of columns found in {f['fn']}! Skipping..")
-                return None, conf
-
-    # Convert values to floats if we can
-    first_row_str = 0
-    for i, line in enumerate(d):
-        for j, v in enumerate(line):
-            try:
-                v = float(v)
-            except ValueError:
-                pass
-            if isinstance(v, str):
-                if (v.startswith('"') and v.endswith('"')) or (v.startswith("'") and v.endswith("'")):
-                    v = v[1:-1]
-                # Count strings in first row (header?)
-                if i == 0:
-                    first_row_str += 1
-            d[i][j] = v
-
-    all_numeric = all([isinstance(line, float) for i in range(1, len(d)) for line in d[i][1:]])
+    if not data_lines:
+        return None, conf
+    t = _read_table(data_lines, sep)
+    if t is None:
+        log.warning(f"Inconsistent number of columns found in {f['fn']}! Skipping..")
+        return None, conf
+    header = t.header
+    ncols = len(header)
+
+    # Count strings in first row (header?)
+    first_row_str = sum(isinstance(v, str) for v in header)
+    all_numeric = all(t.numeric[1:])
 
     # General stat info files - expected to have at least 2 rows (first row always being the header)
     # and have at least 2 columns (first column always being sample name)
-    if conf.get("plot_type") == "generalstats" and len(d) >= 2 and ncols >= 2:
+    if conf.get("plot_type") == "generalstats" and t.n_rows >= 1 and ncols >= 2:
         data = defaultdict(dict)
-        for i, line in enumerate(d[1:], 1):
-            for j, v in enumerate(line[1:], 1):
-                data[line[0]][d[0][j]] = v
+        for s_name, *values in t.rows():
+            data[s_name].update(zip(header[1:], values))
         return data, conf
 
     # Heatmap: Number of headers == number of lines
     if conf.get("plot_type") is None and first_row_str == len(lines) and all_numeric:
         conf["plot_type"] = "heatmap"
     if conf.get("plot_type") == "heatmap":
-        conf["xcats"] = d[0][1:]
-        conf["ycats"] = [s[0] for s in d[1:]]
-        data = [s[1:] for s in d[1:]]
+        conf["xcats"] = header[1:]
+        conf["ycats"] = list(t.columns[0])
+        data = [list(values) for _, *values in t.rows()]
         return data, conf
 
     # Header row of strings, or configured as table
-    if first_row_str == len(d[0]) or conf.get("plot_type") == "table":
-        data = dict()
-        for s in d[1:]:
-            data[s[0]] = dict()
-            for i, v in enumerate(s[1:]):
-                cat = str(d[0][i + 1])
-                data[s[0]][cat] = v
+    if first_row_str == ncols or conf.get("plot_type") == "table":
+        cats = [str(c) for c in header[1:]]
+        data = {s_name: dict(zip(cats, values)) for s_name, *values in t.rows()}
         # Bar graph or table - if numeric data, go for bar graph
         if conf.get("plot_type") is None:
-            allfloats = True
-            for r in d[1:]:
-                for v in r[1:]:
-                    allfloats = allfloats and isinstance(v, float)
-            if allfloats:
+            if all_numeric:
                 conf["plot_type"] = "bargraph"
             else:
                 conf["plot_type"] = "table"
         # Set table col_1 header
-        if conf.get("plot_type") == "table" and d[0][0].strip() != "":
+        if conf.get("plot_type") == "table" and header[0].strip() != "":
             conf["pconfig"] = conf.get("pconfig", {})
             if not conf["pconfig"].get("col1_header"):
-                conf["pconfig"]["col1_header"] = d[0][0].strip()
+                conf["pconfig"]["col1_header"] = header[0].strip()
         # Return parsed data
         if conf.get("plot_type") == "bargraph" or conf.get("plot_type") == "table":
             return data, conf
@@ -601,16 +642,16 @@ def _parse_txt(f, conf):
     # Scatter plot: First row is  str : num : num
     if (
         conf.get("plot_type") is None
-        and len(d[0]) == 3
-        and not isinstance(d[0][0], float)
-        and isinstance(d[0][1], float)
-        and isinstance(d[0][2], float)
+        and ncols == 3
+        and not isinstance(header[0], float)
+        and isinstance(header[1], float)
+        and isinstance(header[2], float)
     ):
         conf["plot_type"] = "scatter"
 
     if conf.get("plot_type") == "scatter":
         data = dict()
-        for s in d:
+        for s in t.rows(with_header=True):
             try:
                 data[s[0]] = {"x": float(s[1]), "y": float(s[2])}
             except (IndexError, ValueError):
@@ -618,12 +659,12 @@ def _parse_txt(f, conf):
         return data, conf
 
     # Single sample line / bar graph - first row has two columns
-    if len(d[0]) == 2:
+    if ncols == 2:
         # Line graph - num : num
-        if conf.get("plot_type") is None and isinstance(d[0][0], float) and isinstance(d[0][1], float):
+        if conf.get("plot_type") is None and isinstance(header[0], float) and isinstance(header[1], float):
             conf["plot_type"] = "linegraph"
         # Bar graph - str : num
-        if conf.get("plot_type") is None and not isinstance(d[0][0], float) and isinstance(d[0][1], float):
+        if conf.get("plot_type") is None and not isinstance(header[0], float) and isinstance(header[1], float):
             conf["plot_type"] = "bargraph"
 
         # Data structure is the same
@@ -631,34 +672,33 @@ def _parse_txt(f, conf):
             # Set section id based on directory if not known
             if conf.get("id") is None:
                 conf["id"] = os.path.basename(f["root"])
-            data = dict()
-            for s in d:
-                data[s[0]] = s[1]
+            data = dict(t.rows(with_header=True))
             return {f["s_name"]: data}, conf
 
     # Multi-sample line graph: No header row, str : lots of num columns
-    if conf.get("plot_type") is None and len(d[0]) > 4 and all_numeric:
+    if conf.get("plot_type") is None and ncols > 4 and all_numeric:
         conf["plot_type"] = "linegraph"
 
     if conf.get("plot_type") == "linegraph":
-        data = dict()
         # If the first row has no header, use it as axis labels
         x_labels = []
-        if d[0][0].strip() == "":
-            x_labels = d.pop(0)[1:]
+        rows = t.rows(with_header=True)
+        if header[0].strip() == "":
+            x_labels = header[1:]
+            rows = t.rows()
         # Use 1..n range for x values
-        for s in d:
-            data[s[0]] = dict()
-            for i, v in enumerate(s[1:]):
+        x_vals = []
+        for i in range(ncols - 1):
+            try:
+                x_val = x_labels[i]
                 try:
-                    x_val = x_labels[i]
-                    try:
-                        x_val = float(x_val)
-                    except ValueError:
-                        pass
-                except IndexError:
-                    x_val = i + 1
-                data[s[0]][x_val] = v
+                    x_val = float(x_val)
+                except ValueError:
+                    pass
+            except IndexError:
+                x_val = i + 1
+            x_vals.append(x_val)
+        data = {s_name: dict(zip(x_vals, values)) for s_name, *values in rows}
         return data, conf
 
     # Got to the end and haven't returned. It's a mystery, capn'!
@@ -519,8 +519,8 @@ class DragenCoverageMetrics(BaseMultiqcModule):
         # Metric IDs with original consistent metric strings.
         all_metrics = {}
 
-        for file in self.find_log_files("dragen/coverage_metrics"):
-            out = coverage_parser(file)
+        for file, (out, file_log_data) in self.map_log_files("dragen/coverage_metrics", parse_coverage_metrics_file):
+            merge_log_data(file_log_data)
             if out["success"]:
                 self.add_data_source(file, section="coverage_metrics")
 
@@ -922,12 +922,18 @@ debug/info:
   Their headers are incomplete, hence uninformative and ugly table's columns.
 - unusual_values are those except for int/float/NA.
 '''
-log_data = {
-    "invalid_file_names": defaultdict(list),
-    "invalid_file_lines": defaultdict(lambda: defaultdict(list)),
-    "unknown_metrics": [],
-    "unusual_values": defaultdict(lambda: defaultdict(dict)),
-}
+
+
+def new_log_data():
+    return {
+        "invalid_file_names": defaultdict(list),
+        "invalid_file_lines": defaultdict(lambda: defaultdict(list)),
+        "unknown_metrics": [],
+        "unusual_values": defaultdict(lambda: defaultdict(dict)),
+    }
+
+
+log_data = new_log_data()
 
 
 def construct_coverage_parser():
@@ -1102,6 +1108,39 @@ def construct_coverage_parser():
 coverage_parser = construct_coverage_parser()
 
 
+def parse_coverage_metrics_file(module, f):
+    """
+    Runs coverage_parser() on a file, for map_log_files(). The parser adds to log_data, which
+    would be lost in worker processes, so the entries for this file are collected separately
+    and returned with the parsed data, to be added back with merge_log_data().
+    """
+    global log_data
+    saved_log_data = log_data
+    log_data = new_log_data()
+    try:
+        out = coverage_parser(f)
+        file_log_data = {
+            "invalid_file_names": dict(log_data["invalid_file_names"]),
+            "invalid_file_lines": {root: dict(by_file) for root, by_file in log_data["invalid_file_lines"].items()},
+            "unusual_values": {root: dict(by_file) for root, by_file in log_data["unusual_values"].items()},
+        }
+    finally:
+        log_data = saved_log_data
+    return out, file_log_data
+
+
+def merge_log_data(file_log_data):
+    """Adds the log_data entries returned by parse_coverage_metrics_file()"""
+    for root, files in file_log_data["invalid_file_names"].items():
+        log_data["invalid_file_names"][root].extend(files)
+    for root, by_file in file_log_data["invalid_file_lines"].items():
+        for file, lines in by_file.items():
+            log_data["invalid_file_lines"][root][file].extend(lines)
+    for root, by_file in file_log_data["unusual_values"].items():
+        for file, values in by_file.items():
+            log_data["unusual_values"][root][file].update(values)
+
+
 def create_coverage_headers_handler():
     """Isolation for all the headers-building machinery."""
 
@@ -124,8 +124,9 @@ def parse_wgs_contig_mean_cov(f):
     main_contig_perchrom_data = dict()
     other_contig_perchrom_data = dict()
 
-    for line in f["f"].splitlines():
-        chrom, bases, depth = line.split(",")
+    # Read line by line, as there is a line for every contig of the reference
+    for line in f.lines():
+        chrom, bases, depth = line.rstrip("\r\n").split(",")
         chrom = chrom.strip()
         depth = float(depth)
         # skipping unplaced and alternative contigs, as well as the mitochondria (might attract 100 times more coverage
@@ -1,7 +1,10 @@
 # Initialise the logger
 import logging
+import re
 from collections import defaultdict
 
+import numpy as np
+
 from multiqc.modules.base_module import BaseMultiqcModule
 from multiqc.plots import linegraph
 
@@ -38,7 +41,10 @@ class DragenFragmentLength(BaseMultiqcModule):
             return set()
 
         # Write data to file
-        self.write_data_file(data_by_rg_by_sample, "dragen_frag_len")
+        self.write_data_file(
+            {sn: {rg: d.to_dict() for rg, d in d_rg.items()} for sn, d_rg in data_by_rg_by_sample.items()},
+            "dragen_frag_len",
+        )
 
         # Merging all data
         data_by_rg = {}
@@ -101,24 +107,24 @@ def parse_fragment_length_hist_file(f):
     ...
     39316,0
     39317,1
+
+    Returns a linegraph.Series of counts by fragment length for each read group.
     """
 
-    data_by_rg = defaultdict(dict)
-
-    read_group = None
-    for line in f["f"].splitlines():
-        if line.startswith("#Sample"):
-            read_group = line.split("#Sample: ")[1]
-        else:
-            assert read_group is not None
-            frag_len, cnt = line.split(",")
-            try:
-                frag_len = int(frag_len)
-                cnt = int(cnt)
-            except ValueError:
-                assert line == "FragmentLength,Count", line
-            else:
-                if cnt >= MIN_CNT_TO_SHOW_ON_PLOT:  # to prevent long flat tail
-                    data_by_rg[read_group][frag_len] = cnt
+    data_by_rg = dict()
+
+    # Split into [text before the first read group, read group, its lines, read group, its lines, ...]
+    parts = re.split(r"^#Sample: ?([^\r\n]*)", f["f"], flags=re.MULTILINE)
+    assert parts[0].strip() == "", parts[0]
+    for read_group, block in zip(parts[1::2], parts[2::2]):
+        lines = [line for line in block.splitlines() if line and line != "FragmentLength,Count"]
+        values = np.array(",".join(lines).split(","), dtype=np.int64).reshape(-1, 2) if lines else np.empty((0, 2))
+        values = values[values[:, 1] >= MIN_CNT_TO_SHOW_ON_PLOT]  # to prevent long flat tail
+        if len(values) == 0:
+            continue
+        hist = linegraph.Series(values[:, 0], values[:, 1])
+        if read_group in data_by_rg:
+            hist = linegraph.Series.from_dict({**data_by_rg[read_group].to_dict(), **hist.to_dict()})
+        data_by_rg[read_group] = hist
 
     return data_by_rg
@@ -9,6 +9,7 @@ from typing import Dict, Optional, Tuple
 from multiqc import config
 from multiqc.modules.base_module import BaseMultiqcModule, ModuleNoSamplesFound
 from multiqc.plots import bargraph, linegraph
+from multiqc.utils import loaders
 
 # Initialise the logger
 log = logging.getLogger(__name__)
@@ -151,7 +152,7 @@ class MultiqcModule(BaseMultiqcModule):
     def parse_fastp_log(self, f) -> Tuple[Optional[str], Dict]:
         """Parse the JSON output from fastp and save the summary statistics"""
         try:
-            parsed_json = json.load(f["f"])
+            parsed_json = loaders.load_json(f["f"])
         except json.JSONDecodeError as e:
             log.warning(f"Could not parse fastp JSON: '{f['fn']}': {e}, skipping sample")
             return None, {}
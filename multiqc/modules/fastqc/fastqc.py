@@ -18,6 +18,8 @@ import re
 import zipfile
 from collections import Counter
 
+import numpy as np
+
 from multiqc import config
 from multiqc.modules.base_module import BaseMultiqcModule, ModuleNoSamplesFound
 from multiqc.plots import bargraph, heatmap, linegraph, table
@@ -41,46 +43,35 @@ class MultiqcModule(BaseMultiqcModule):
             # No publication / DOI // doi=
         )
 
-        self.fastqc_data = dict()
+        self.fastqc_data = report.new_sample_store(f"{self.anchor}/fastqc_data", by_field=True)
 
         # Find and parse unzipped FastQC reports
-        for f in self.find_log_files("fastqc/data"):
-            s_name = self.clean_s_name(os.path.basename(f["root"]), f, root=os.path.dirname(f["root"]))
-            self.parse_fastqc_report(f["f"], s_name, f)
+        for f, parsed in self.map_log_files("fastqc/data", parse_fastqc_data):
+            self.add_fastqc_report(*parsed)
 
         # Find and parse zipped FastQC reports
+        zip_files = []
         for f in self.find_log_files("fastqc/zip", filecontents=False):
-            s_name = f["fn"]
-            if s_name.endswith("_fastqc.zip"):
-                s_name = s_name[:-11]
             # Skip if we already have this report - parsing zip files is slow..
-            if s_name in self.fastqc_data.keys():
-                log.debug(f"Skipping '{f['fn']}' as already parsed '{s_name}'")
-                continue
-            try:
-                fqc_zip = zipfile.ZipFile(os.path.join(f["root"], f["fn"]))
-            except Exception as e:
-                log.warning(f"Couldn't read '{f['fn']}' - Bad zip file")
-                log.debug(f"Bad zip file error: {e}")
+            if _zip_s_name(f) in self.fastqc_data.keys():
+                log.debug(f"Skipping '{f['fn']}' as already parsed '{_zip_s_name(f)}'")
                 continue
-            # FastQC zip files should have just one directory inside, containing report
-            d_name = fqc_zip.namelist()[0]
-            try:
-                path = os.path.join(d_name, "fastqc_data.txt")
-                with fqc_zip.open(path) as fh:
-                    r_data = fh.read()
-                    try:
-                        r_data = r_data.decode("utf8")
-                    except UnicodeDecodeError as e:
-                        log.debug(f"Could not parse {path} as Unicode: {e}, attempting the latin-1 encoding")
-                        try:
-                            r_data = r_data.decode("latin-1")
-                        except Exception as e:
-                            log.warning(f"Error reading FastQC data file {path}: {e}. Skipping sample {s_name}.")
-                            continue
-                    self.parse_fastqc_report(r_data, s_name, f)
-            except KeyError:
-                log.warning(f"Error - can't find fastqc_raw_data.txt in {f}")
+            zip_files.append(f)
+        s_names = set(self.fastqc_data.keys())
+
+        def keep_zip_report(f, parsed):
+            # Reports earlier in the list can also have this sample name from their contents
+            if _zip_s_name(f) in s_names:
+                log.debug(f"Skipping '{f['fn']}' as already parsed '{_zip_s_name(f)}'")
+                return False
+            if parsed is None:
+                return False
+            s_names.add(parsed[0])
+            return True
+
+        # Data sources and software versions are only added for the reports that are kept
+        for f, parsed in self.map_log_files(zip_files, parse_fastqc_zip, keep_fn=keep_zip_report):
+            self.add_fastqc_report(*parsed)
 
         # Filter to strip out ignored sample names
         self.fastqc_data = self.ignore_samples(self.fastqc_data)
@@ -139,100 +130,13 @@ class MultiqcModule(BaseMultiqcModule):
         self.adapter_content_plot()
         self.status_heatmap()
 
-    def parse_fastqc_report(self, file_contents, s_name=None, f=None):
-        """Takes contents from a fastq_data.txt file and parses out required
-        statistics and data. Returns a dict with keys 'stats' and 'data'.
-        Data is for plotting graphs, stats are for top table."""
-
-        # Make the sample name from the input filename if we find it
-        fn_search = re.search(r"Filename\s+(.+)", file_contents)
-        if fn_search:
-            s_name = fn_search.group(1)
-
+    def add_fastqc_report(self, s_name, sample_data, dup_keys):
+        """Adds a report parsed by parse_fastqc_report()"""
         if s_name in self.fastqc_data.keys():
             log.debug(f"Duplicate sample name found! Overwriting: {s_name}")
-        self.add_data_source(f, s_name)
-        self.fastqc_data[s_name] = {"statuses": dict()}
-
-        # Parse the report
-        section = None
-        s_headers = None
-        self.dup_keys = []
-        for line in file_contents.splitlines():
-            if line.startswith("##FastQC"):
-                version_match = re.search(VERSION_REGEX, line)
-                if version_match:
-                    self.add_software_version(version_match.group(1), s_name)
-            if line == ">>END_MODULE":
-                section = None
-                s_headers = None
-            elif line.startswith(">>"):
-                (section, status) = line[2:].split("\t", 1)
-                section = section.lower().replace(" ", "_")
-                self.fastqc_data[s_name]["statuses"][section] = status
-            elif section is not None:
-                if line.startswith("#"):
-                    s_headers = line[1:].split("\t")
-                    # Special case: Total Deduplicated Percentage header line
-                    if s_headers[0] == "Total Deduplicated Percentage":
-                        self.fastqc_data[s_name]["basic_statistics"].append(
-                            {"measure": "total_deduplicated_percentage", "value": float(s_headers[1])}
-                        )
-                    else:
-                        # Special case: Rename dedup header in old versions of FastQC (v10)
-                        if s_headers[1] == "Relative count":
-                            s_headers[1] = "Percentage of total"
-                        s_headers = [s.lower().replace(" ", "_") for s in s_headers]
-                        self.fastqc_data[s_name][section] = list()
-
-                elif s_headers is not None:
-                    s = line.split("\t")
-                    row = dict()
-                    for i, v in enumerate(s):
-                        v.replace("NaN", "0")
-                        try:
-                            v = float(v)
-                        except ValueError:
-                            pass
-                        row[s_headers[i]] = v
-                    self.fastqc_data[s_name][section].append(row)
-                    # Special case - need to remember order of duplication keys
-                    if section == "sequence_duplication_levels":
-                        try:
-                            self.dup_keys.append(float(s[0]))
-                        except ValueError:
-                            self.dup_keys.append(s[0])
-
-        # Tidy up the Basic Stats
-        self.fastqc_data[s_name]["basic_statistics"] = {
-            d["measure"]: d["value"] for d in self.fastqc_data[s_name]["basic_statistics"]
-        }
-
-        # we sort by the avg of the range, which is effectively
-        # sorting ranges in asc order assuming no overlap
-        sequence_length_distributions = self.fastqc_data[s_name].get("sequence_length_distribution", [])
-        sequence_length_distributions.sort(key=lambda d: self.avg_bp_from_range(d["length"]))
-
-        # Calculate the average sequence length (Basic Statistics gives a range)
-        length_reads = 0
-        length_bp = 0
-        total_count = sum(d["count"] for d in sequence_length_distributions)
-        median = None
-
-        for d in sequence_length_distributions:
-            length_reads += d["count"]
-            length_bp += d["count"] * self.avg_bp_from_range(d["length"])
-
-            if median is None and length_reads >= total_count / 2:
-                # if the distribution-entry is a range, we use the average of the range.
-                # this isn't technically correct, because we can't know what the distribution
-                # is within that range. Probably good enough though.
-                median = self.avg_bp_from_range(d["length"])
-
-        if total_count > 0:
-            self.fastqc_data[s_name]["basic_statistics"]["avg_sequence_length"] = length_bp / total_count
-        if median is not None:
-            self.fastqc_data[s_name]["basic_statistics"]["median_sequence_length"] = median
+        self.fastqc_data[s_name] = sample_data
+        # Special case - need to remember order of duplication keys
+        self.dup_keys = dup_keys
 
     def fastqc_general_stats(self):
         """Add some single-number stats to the basic statistics
@@ -406,10 +310,7 @@ class MultiqcModule(BaseMultiqcModule):
         data = dict()
         for s_name in self.fastqc_data:
             try:
-                data[s_name] = {
-                    self.avg_bp_from_range(d["base"]): d["mean"]
-                    for d in self.fastqc_data[s_name]["per_base_sequence_quality"]
-                }
+                data[s_name] = self.section_series(s_name, "per_base_sequence_quality", "base", "mean")
             except KeyError:
                 pass
         if len(data) == 0:
@@ -457,9 +358,7 @@ class MultiqcModule(BaseMultiqcModule):
         data = dict()
         for s_name in self.fastqc_data:
             try:
-                data[s_name] = {
-                    d["quality"]: d["count"] for d in self.fastqc_data[s_name]["per_sequence_quality_scores"]
-                }
+                data[s_name] = self.section_series(s_name, "per_sequence_quality_scores", "quality", "count")
             except KeyError:
                 pass
         if len(data) == 0:
@@ -600,19 +499,11 @@ class MultiqcModule(BaseMultiqcModule):
         data_norm = dict()
         for s_name in self.fastqc_data:
             try:
-                data[s_name] = {
-                    d["gc_content"]: d["count"] for d in self.fastqc_data[s_name]["per_sequence_gc_content"]
-                }
+                data[s_name] = self.section_series(s_name, "per_sequence_gc_content", "gc_content", "count")
             except KeyError:
                 pass
             else:
-                data_norm[s_name] = dict()
-                total = sum([c for c in data[s_name].values()])
-                for gc, count in data[s_name].items():
-                    try:
-                        data_norm[s_name][gc] = (count / total) * 100
-                    except ZeroDivisionError:
-                        data_norm[s_name][gc] = 0
+                data_norm[s_name] = data[s_name].pct()
         if len(data) == 0:
             log.debug("per_sequence_gc_content not found in FastQC reports")
             return None
@@ -720,10 +611,7 @@ class MultiqcModule(BaseMultiqcModule):
         data = dict()
         for s_name in self.fastqc_data:
             try:
-                data[s_name] = {
-                    self.avg_bp_from_range(d["base"]): d["n-count"]
-                    for d in self.fastqc_data[s_name]["per_base_n_content"]
-                }
+                data[s_name] = self.section_series(s_name, "per_base_n_content", "base", "n-count")
             except KeyError:
                 pass
         if len(data) == 0:
@@ -1189,7 +1077,20 @@ class MultiqcModule(BaseMultiqcModule):
             plot=heatmap.plot(data, list(status_cats.values()), s_names, pconfig),
         )
 
-    def avg_bp_from_range(self, bp):
+    def section_series(self, s_name, section, x_key, y_key):
+        """
+        One column of a section of a sample's report against another, as a line for
+        linegraph.plot(). Base pair ranges in the "base" column are averaged.
+        """
+        rows = self.fastqc_data[s_name][section]
+        if x_key == "base":
+            xs = [self.avg_bp_from_range(d[x_key]) for d in rows]
+        else:
+            xs = [d[x_key] for d in rows]
+        return linegraph.Series(xs, np.array([d[y_key] for d in rows], dtype=float))
+
+    @staticmethod
+    def avg_bp_from_range(bp):
         """Helper function - FastQC often gives base pair ranges (eg. 10-15)
         which are not helpful when plotting. This returns the average from such
         ranges as an int, which is helpful. If not a range, just returns the int"""
@@ -1211,3 +1112,143 @@ class MultiqcModule(BaseMultiqcModule):
             status = self.fastqc_data[s_name]["statuses"].get(section, "default")
             colours[s_name] = self.status_colours[status]
         return colours
+
+
+def parse_fastqc_report(module, file_contents, s_name=None, f=None):
+    """Takes contents from a fastq_data.txt file and parses out required
+    statistics and data. Returns the sample name, a dict with the data of the
+    sample and the order of the duplication keys. Run by map_log_files(),
+    so module is a ModuleCallRecorder."""
+
+    # Make the sample name from the input filename if we find it
+    fn_search = re.search(r"Filename\s+(.+)", file_contents)
+    if fn_search:
+        s_name = fn_search.group(1)
+
+    # Replayed as self.add_data_source() by map_log_files()
+    module.add_data_source(f, s_name)
+    sample_data = {"statuses": dict()}
+
+    # Parse the report
+    section = None
+    s_headers = None
+    dup_keys = []
+    for line in file_contents.splitlines():
+        if line.startswith("##FastQC"):
+            version_match = re.search(VERSION_REGEX, line)
+            if version_match:
+                # Replayed as self.add_software_version() by map_log_files()
+                module.add_software_version(version_match.group(1), s_name)
+        if line == ">>END_MODULE":
+            section = None
+            s_headers = None
+        elif line.startswith(">>"):
+            (section, status) = line[2:].split("\t", 1)
+            section = section.lower().replace(" ", "_")
+            sample_data["statuses"][section] = status
+        elif section is not None:
+            if line.startswith("#"):
+                s_headers = line[1:].split("\t")
+                # Special case: Total Deduplicated Percentage header line
+                if s_headers[0] == "Total Deduplicated Percentage":
+                    sample_data["basic_statistics"].append(
+                        {"measure": "total_deduplicated_percentage", "value": float(s_headers[1])}
+                    )
+                else:
+                    # Special case: Rename dedup header in old versions of FastQC (v10)
+                    if s_headers[1] == "Relative count":
+                        s_headers[1] = "Percentage of total"
+                    s_headers = [s.lower().replace(" ", "_") for s in s_headers]
+                    sample_data[section] = list()
+
+            elif s_headers is not None:
+                s = line.split("\t")
+                row = dict()
+                for i, v in enumerate(s):
+                    v.replace("NaN", "0")
+                    try:
+                        v = float(v)
+                    except ValueError:
+                        pass
+                    row[s_headers[i]] = v
+                sample_data[section].append(row)
+                # Special case - need to remember order of duplication keys
+                if section == "sequence_duplication_levels":
+                    try:
+                        dup_keys.append(float(s[0]))
+                    except ValueError:
+                        dup_keys.append(s[0])
+
+    # Tidy up the Basic Stats
+    sample_data["basic_statistics"] = {d["measure"]: d["value"] for d in sample_data["basic_statistics"]}
+
+    # we sort by the avg of the range, which is effectively
+    # sorting ranges in asc order assuming no overlap
+    sequence_length_distributions = sample_data.get("sequence_length_distribution", [])
+    sequence_length_distributions.sort(key=lambda d: MultiqcModule.avg_bp_from_range(d["length"]))
+
+    # Calculate the average sequence length (Basic Statistics gives a range)
+    length_reads = 0
+    length_bp = 0
+    total_count = sum(d["count"] for d in sequence_length_distributions)
+    median = None
+
+    for d in sequence_length_distributions:
+        length_reads += d["count"]
+        length_bp += d["count"] * MultiqcModule.avg_bp_from_range(d["length"])
+
+        if median is None and length_reads >= total_count / 2:
+            # if the distribution-entry is a range, we use the average of the range.
+            # this isn't technically correct, because we can't know what the distribution
+            # is within that range. Probably good enough though.
+            median = MultiqcModule.avg_bp_from_range(d["length"])
+
+    if total_count > 0:
+        sample_data["basic_statistics"]["avg_sequence_length"] = length_bp / total_count
+    if median is not None:
+        sample_data["basic_statistics"]["median_sequence_length"] = median
+
+    return s_name, sample_data, dup_keys
+
+
+def parse_fastqc_data(module, f):
+    """Parses an unzipped fastqc_data.txt file, for map_log_files()"""
+    s_name = module.clean_s_name(os.path.basename(f["root"]), f, root=os.path.dirname(f["root"]))
+    return parse_fastqc_report(module, f["f"], s_name, f)
+
+
+def _zip_s_name(f):
+    s_name = f["fn"]
+    if s_name.endswith("_fastqc.zip"):
+        s_name = s_name[:-11]
+    return s_name
+
+
+def parse_fastqc_zip(module, f):
+    """Parses the fastqc_data.txt file in a FastQC zip file, for map_log_files()"""
+    s_name = _zip_s_name(f)
+    try:
+        fqc_zip = zipfile.ZipFile(os.path.join(f["root"], f["fn"]))
+    except Exception as e:
+        log.warning(f"Couldn't read '{f['fn']}' - Bad zip file")
+        log.debug(f"Bad zip file error: {e}")
+        return None
+    # FastQC zip files should have just one directory inside, containing report
+    d_name = fqc_zip.namelist()[0]
+    try:
+        path = os.path.join(d_name, "fastqc_data.txt")
+        with fqc_zip.open(path) as fh:
+            r_data = fh.read()
+            try:
+                r_data = r_data.decode("utf8")
+            except UnicodeDecodeError as e:
+                log.debug(f"Could not parse {path} as Unicode: {e}, attempting the latin-1 encoding")
+                try:
+                    r_data = r_data.decode("latin-1")
+                except Exception as e:
+                    log.warning(f"Error reading FastQC data file {path}: {e}. Skipping sample {s_name}.")
+                    return None
+            return parse_fastqc_report(module, r_data, s_name, f)
+    except KeyError:
+        log.warning(f"Error - can't find fastqc_raw_data.txt in {f}")
+        return None
@@ -4,9 +4,12 @@
 import logging
 import re
 
+import numpy as np
+
 from multiqc import config
 from multiqc.modules.base_module import BaseMultiqcModule, ModuleNoSamplesFound
 from multiqc.plots import bargraph, heatmap
+from multiqc.utils.taxonomy import TaxonomyTable
 
 # Initialise the logger
 log = logging.getLogger(__name__)
@@ -44,40 +47,38 @@ class MultiqcModule(BaseMultiqcModule):
             "U": "Unclassified",
         }
 
-        self.top_n = getattr(config, "kraken", {}).get("top_n", 5)
+        kraken_config = getattr(config, "kraken", {})
+        self.top_n = kraken_config.get("top_n", 5)
 
-        # Find and load any kraken reports
-        self.kraken_raw_data = dict()
+        # Find and load any kraken reports. Each report is stored as columns of NumPy arrays,
+        # optionally without the taxa that have a smaller percentage than min_pct
+        self.kraken_data = TaxonomyTable(min_pct=kraken_config.get("min_pct", 0))
         new_report_present = False
-        for f in self.find_log_files(sp_key, filehandles=True):
-            log_is_new = self.log_is_new(f)
-            f["f"].seek(0)
-            if not log_is_new:
-                self.parse_logs(f)
-            else:
+        for f, (log_is_new, columns) in self.map_log_files(sp_key, parse_report):
+            if log_is_new:
                 new_report_present = True
-                self.parse_logs_minimizer(f)
+            self.kraken_data.add_sample(f["s_name"], columns)
             self.add_data_source(f)
 
-        self.kraken_raw_data = self.ignore_samples(self.kraken_raw_data)
+        self.kraken_data.keep_samples(self.ignore_samples(self.kraken_data.samples))
 
-        if len(self.kraken_raw_data) == 0:
+        if len(self.kraken_data.samples) == 0:
             raise ModuleNoSamplesFound
 
-        log.info(f"Found {len(self.kraken_raw_data)} reports")
+        log.info(f"Found {len(self.kraken_data.samples)} reports")
 
         # Superfluous function call to confirm that it is used in this module
         # Replace None with actual version if it is available
         self.add_software_version(None)
 
-        self.write_data_file(self.kraken_raw_data, f"multiqc_{self.anchor}")
+        self.write_data_file(
+            {s_name: self.kraken_data.rows(s_name) for s_name in self.kraken_data.samples}, f"multiqc_{self.anchor}"
+        )
 
         # Sum counts across all samples, so that we can pick top species
-        self.kraken_total_pct = dict()
-        self.kraken_total_counts = dict()
-        self.kraken_sample_total_readcounts = dict()
+        self.kraken_sample_total_readcounts = self.kraken_data.sample_totals
         self.sample_total_readcounts()
-        self.sum_sample_counts()
+        self.kraken_total_pct = self.kraken_data.summed_fractions()
 
         self.general_stats_cols()
         self.top_taxa_barplot()
@@ -99,9 +100,10 @@ class MultiqcModule(BaseMultiqcModule):
                 return False
         return False
 
-    def parse_logs(self, f):
+    @staticmethod
+    def parse_logs(f):
         """
-        Parses a kraken report output file
+        Parses a kraken report output file into columns
 
         1. Percentage of fragments covered by the clade rooted at this taxon
         2. Number of fragments covered by the clade rooted at this taxon
@@ -128,26 +130,20 @@ class MultiqcModule(BaseMultiqcModule):
 
         # Search regexes for stats
         k2_regex = re.compile(r"^\s{0,2}(\d{1,3}\.\d{1,2})\t(\d+)\t(\d+)\t([\dUDKRPCOFGS-]{1,3})\t(\d+)(\s+)(.+)")
-        data = []
+        fields = ["percent", "counts_rooted", "counts_direct", "rank_code", "tax_id", "num_spaces", "classif"]
+        columns = {field: [] for field in fields}
         for line in f["f"]:
             match = k2_regex.search(line)
             if match:
-                row = {
-                    "percent": float(match.group(1)),
-                    "counts_rooted": int(match.group(2)),
-                    "counts_direct": int(match.group(3)),
-                    "rank_code": match.group(4),
-                    "tax_id": int(match.group(5)),
-                    "num_spaces": len(match.group(6)),
-                    "classif": match.group(7),
-                }
-                data.append(row)
-
-        self.kraken_raw_data[f["s_name"]] = data
-
-    def parse_logs_minimizer(self, f):
+                for field, value in zip(fields, match.groups()):
+                    columns[field].append(value)
+        columns["num_spaces"] = [len(spaces) for spaces in columns["num_spaces"]]
+        return columns
+
+    @staticmethod
+    def parse_logs_minimizer(f):
         """
-        Parses a kraken report output file
+        Parses a kraken report output file into columns
 
         1. Percentage of fragments covered by the clade rooted at this taxon
         2. Number of fragments covered by the clade rooted at this taxon
@@ -175,92 +171,40 @@ class MultiqcModule(BaseMultiqcModule):
         8. Indented scientific name
         """
 
-        def duplication(total, distinct):
-            """Get duplication factor
-
-            Args:
-                total (int): Total number of elements
-                distinct (int): Number of distinct elements
-            """
-            try:
-                res = float(total) / distinct
-            except ZeroDivisionError:
-                res = 0.0
-            return res
-
         # Search regexes for stats
         k2_regex = re.compile(
             r"^\s{0,2}(\d{1,3}\.\d{1,2})\t(\d+)\t(\d+)\t(\d+)\t(\d+)\t([URDKPCOFGS-]\d{0,2})\t(\d+)(\s+)(.+)"
         )
-        data = []
+        fields = [
+            "percent",
+            "counts_rooted",
+            "counts_direct",
+            "minimizer",
+            "minimizer_distinct",
+            "rank_code",
+            "tax_id",
+            "num_spaces",
+            "classif",
+        ]
+        columns = {field: [] for field in fields}
         for line in f["f"]:
             match = k2_regex.search(line)
             if match:
-                row = {
-                    "percent": float(match.group(1)),
-                    "counts_rooted": int(match.group(2)),
-                    "counts_direct": int(match.group(3)),
-                    "minimizer": int(match.group(4)),
-                    "minimizer_distinct": int(match.group(5)),
-                    "minimizer_duplication": duplication(int(match.group(4)), int(match.group(5))),
-                    "rank_code": match.group(6),
-                    "tax_id": int(match.group(7)),
-                    "num_spaces": len(match.group(8)),
-                    "classif": match.group(9),
-                }
-                data.append(row)
+                for field, value in zip(fields, match.groups()):
+                    columns[field].append(value)
             else:
                 log.debug(f"{f['s_name']}: Could not parse line: {line}")
-
-        self.kraken_raw_data[f["s_name"]] = data
+        columns["num_spaces"] = [len(spaces) for spaces in columns["num_spaces"]]
+        return columns
 
     def sample_total_readcounts(self):
-        """Compute the total read counts for each sample"""
+        """Check that we had some counts for some samples, exit if not"""
 
-        total_all_samples = 0
-        for s_name, data in self.kraken_raw_data.items():
-            self.kraken_sample_total_readcounts[s_name] = 0
-            for row in data:
-                self.kraken_sample_total_readcounts[s_name] += row["counts_direct"]
-            total_all_samples += self.kraken_sample_total_readcounts[s_name]
-
-        # Check that we had some counts for some samples, exit if not
-        if total_all_samples == 0:
+        # The totals are the sums of the direct counts of each report, computed when parsing
+        if sum(self.kraken_sample_total_readcounts.values()) == 0:
             log.warning("No samples had any reads")
             raise ModuleNoSamplesFound
 
-    def sum_sample_counts(self):
-        """Sum counts across all samples for kraken data"""
-
-        # Sum the percentages for each taxa across all samples
-        # Allows us to pick the top taxa for each rank
-        # Use percentages instead of counts so that deeply-sequences samples
-        # are not unfairly over-represented
-        for s_name, data in self.kraken_raw_data.items():
-            for row in data:
-                # Convenience vars that are easier to read
-                rank_code = row["rank_code"]
-                classif = row["classif"]
-
-                # Skip anything that doesn't exactly fit a tax rank level
-                if row["rank_code"] == "-" or any(c.isdigit() for c in row["rank_code"]):
-                    continue
-
-                if rank_code not in self.kraken_total_pct:
-                    self.kraken_total_pct[rank_code] = dict()
-                    self.kraken_total_counts[rank_code] = dict()
-
-                if classif not in self.kraken_total_pct[rank_code]:
-                    self.kraken_total_pct[rank_code][classif] = 0
-                    self.kraken_total_counts[rank_code][classif] = 0
-                try:
-                    self.kraken_total_pct[rank_code][classif] += (
-                        row["counts_rooted"] / self.kraken_sample_total_readcounts[s_name]
-                    )
-                except ZeroDivisionError:
-                    pass
-                self.kraken_total_counts[rank_code][classif] += row["counts_rooted"]
-
     def general_stats_cols(self):
         """Add a couple of columns to the General Statistics table"""
 
@@ -269,16 +213,13 @@ class MultiqcModule(BaseMultiqcModule):
         top_rank_code = None
         top_rank_name = None
         for rank_code, rank_name in self.t_ranks.items():
-            try:
-                sorted_pct = sorted(self.kraken_total_pct[rank_code].items(), key=lambda x: x[1], reverse=True)
-                for classif, pct_sum in sorted_pct[: self.top_n]:
-                    top_taxa.append(classif)
-                top_rank_code = rank_code
-                top_rank_name = rank_name
-                break
-            except KeyError:
-                # No species-level data found etc
-                pass
+            # No species-level data found etc
+            if rank_code not in self.kraken_total_pct:
+                continue
+            top_taxa = self.kraken_data.top_taxa(rank_code, self.top_n, self.kraken_total_pct)
+            top_rank_code = rank_code
+            top_rank_name = rank_name
+            break
 
         # Column headers
         headers = dict()
@@ -316,19 +257,20 @@ class MultiqcModule(BaseMultiqcModule):
 
         # Get table data
         tdata = {}
-        for s_name, d in self.kraken_raw_data.items():
+        top_ids = self.kraken_data.taxon_ids(top_rank_code, top_taxa)
+        for s_name, fraction in self.kraken_data.fraction_of_total().items():
             tdata[s_name] = {}
-            for row in d:
-                try:
-                    percent = (row["counts_rooted"] / self.kraken_sample_total_readcounts[s_name]) * 100.0
-                except ZeroDivisionError:
-                    percent = 0
-                if row["rank_code"] == "U":
-                    tdata[s_name]["pct_unclassified"] = percent
-                if row["rank_code"] == top_rank_code and row["classif"] in top_taxa:
-                    tdata[s_name]["pct_top_n"] = percent + tdata[s_name].get("pct_top_n", 0)
-                if row["rank_code"] == top_rank_code and row["classif"] == top_taxa[0]:
-                    tdata[s_name]["pct_top_one"] = percent
+            taxon = self.kraken_data.samples[s_name]["taxon"]
+            percent = fraction * 100.0
+            unclassified = percent[self.kraken_data.rank_mask(s_name, "U")]
+            if len(unclassified):
+                tdata[s_name]["pct_unclassified"] = float(unclassified[-1])
+            in_top_n = np.isin(taxon, top_ids)
+            if in_top_n.any():
+                tdata[s_name]["pct_top_n"] = sum(percent[in_top_n].tolist())
+                top_one_pct = percent[taxon == top_ids[0]]
+                if len(top_one_pct):
+                    tdata[s_name]["pct_top_one"] = float(top_one_pct[-1])
 
             if top_one is not None and "pct_top_one" not in tdata[s_name]:
                 tdata[s_name]["pct_top_one"] = 0
@@ -343,48 +285,43 @@ class MultiqcModule(BaseMultiqcModule):
         # Keeping track of encountered codes to display only tabs with available data
         found_rank_codes = set()
 
-        for rank_code in self.t_ranks:
-            rank_cats = dict()
-            rank_data = dict()
+        # Unclassified reads are added to every rank: the count of the (last) unclassified line
+        # is shown, and the counts of all unclassified lines are taken out of "other"
+        s_names = list(self.kraken_data.samples)
+        unclassified = dict()
+        for s_name in s_names:
+            counts = self.kraken_data.samples[s_name]["counts_rooted"][self.kraken_data.rank_mask(s_name, "U")]
+            unclassified[s_name] = (int(counts[-1]) if len(counts) else None, int(counts.sum()))
 
-            # Loop through the summed tax percentages to get the top-N across all samples
-            try:
-                sorted_pct = sorted(self.kraken_total_pct[rank_code].items(), key=lambda x: x[1], reverse=True)
-            except KeyError:
-                # Taxa rank not found in this sample
+        for rank_code in self.t_ranks:
+            # Taxa rank not found in this sample
+            if rank_code not in self.kraken_total_pct:
                 continue
-            i = 0
-            counts_shown = {}
-            for classif, pct_sum in sorted_pct:
-                i += 1
-                if i > self.top_n:
-                    break
-                rank_cats[classif] = {"name": classif}
-                # Pull out counts for this rank + classif from each sample
-                for s_name, d in self.kraken_raw_data.items():
-                    if s_name not in rank_data:
-                        rank_data[s_name] = dict()
-                    if s_name not in counts_shown:
-                        counts_shown[s_name] = 0
-
-                    for row in d:
-                        if row["rank_code"] == rank_code:
-                            found_rank_codes.add(rank_code)
-                            # unclassified are handled separately
-                            if row["rank_code"] != "U":
-                                if row["classif"] == classif:
-                                    if classif not in rank_data[s_name]:
-                                        rank_data[s_name][classif] = 0
-                                    rank_data[s_name][classif] += row["counts_rooted"]
-                                    counts_shown[s_name] += row["counts_rooted"]
+            found_rank_codes.add(rank_code)
+
+            # Get the top-N across all samples from the summed tax percentages, then pull out
+            # the counts for these taxa from each sample. Unclassified are handled separately.
+            top_taxa = self.kraken_data.top_taxa(rank_code, self.top_n, self.kraken_total_pct)
+            rank_cats = {classif: {"name": classif} for classif in top_taxa}
+            rank_data = dict()
+            if rank_code != "U":
+                counts, present = self.kraken_data.taxon_matrix(rank_code, top_taxa, s_names=s_names)
+                counts = counts.astype(np.int64)
+                counts_shown = (counts * present).sum(axis=1).tolist()
+            else:
+                counts, present = None, None
+                counts_shown = [0] * len(s_names)
 
             # Add in unclassified reads and "other" - we presume from other species etc.
-            for s_name, d in self.kraken_raw_data.items():
-                for row in d:
-                    if row["rank_code"] == "U":
-                        rank_data[s_name]["U"] = row["counts_rooted"]
-                        counts_shown[s_name] += row["counts_rooted"]
-                rank_data[s_name]["other"] = self.kraken_sample_total_readcounts[s_name] - counts_shown[s_name]
+            for i, s_name in enumerate(s_names):
+                rank_data[s_name] = dict()
+                if counts is not None:
+                    for j in np.flatnonzero(present[i]).tolist():
+                        rank_data[s_name][top_taxa[j]] = int(counts[i, j])
+                u_count, u_sum = unclassified[s_name]
+                if u_count is not None:
+                    rank_data[s_name]["U"] = u_count
+                rank_data[s_name]["other"] = self.kraken_sample_total_readcounts[s_name] - counts_shown[i] - u_sum
 
                 # This should never happen... But it does sometimes if the total read count is a bit off
                 if rank_data[s_name]["other"] < 0:
@@ -432,7 +369,6 @@ class MultiqcModule(BaseMultiqcModule):
     def top_taxa_duplication_heatmap(self):
         """Add a heatmap showing the minimizer duplication of the top taxa"""
 
-        duplication = list()
         pconfig = {
             "id": f"{self.anchor}-top-duplication_plot",
             "title": f"{self.name}: Top {self.top_n} species duplication",
@@ -442,55 +378,27 @@ class MultiqcModule(BaseMultiqcModule):
         }
 
         rank_code = "S"
-        rank_data = dict()
-        # Loop through the summed tax percentages to get the top taxa across all samples
-        try:
-            sorted_pct = sorted(self.kraken_total_pct[rank_code].items(), key=lambda x: x[1], reverse=True)
-        except KeyError:
+        if rank_code not in self.kraken_total_pct:
             log.debug("Taxa rank not found, skipping Taxa duplication heatmap")
             return
 
-        i = 0
-        counts_shown = {}
-        showed_warning = False
-        for classif, pct_sum in sorted_pct:
-            i += 1
-            if i > self.top_n:
-                break
-            # Pull out counts for this rank + classif from each sample
-            for s_name, d in self.kraken_raw_data.items():
-                if s_name not in rank_data:
-                    rank_data[s_name] = dict()
-                if s_name not in counts_shown:
-                    counts_shown[s_name] = 0
-
-                if classif not in rank_data[s_name]:
-                    rank_data[s_name][classif] = None
-
-                try:
-                    row = next(row for row in d if row["rank_code"] == rank_code and row["classif"] == classif)
-                except StopIteration:
-                    # if nothing is found at the rank + classification, leave as 0
-                    continue
-
-                try:
-                    rank_data[s_name][classif] = row["minimizer_duplication"]
-                except KeyError:
-                    del rank_data[s_name]
-                    if not showed_warning:
-                        log.warning("Kraken2 reports of different versions were found")
-                        showed_warning = True
-
-        # Strip empty samples
-        for sample, vals in dict(rank_data).items():
-            if len(vals) == 0:
-                del rank_data[sample]
-
-        # Build data structures for heatmap
-        ylabels = list(rank_data.keys())
-        xlabels = list(rank_data[ylabels[0]].keys())
-        for sample in rank_data:
-            duplication.append(list(rank_data[sample].values()))
+        # Only the reports from the newer Kraken2 versions have minimizer counts
+        ylabels = [s_name for s_name in self.kraken_data.samples if self.kraken_data.has_minimizers(s_name)]
+        if len(ylabels) < len(self.kraken_data.samples):
+            log.warning("Kraken2 reports of different versions were found")
+        if len(ylabels) == 0:
+            return
+
+        # Get the top taxa across all samples from the summed tax percentages, and the duplication
+        # of the first line for each of them in each sample. Missing taxa are left empty.
+        xlabels = self.kraken_data.top_taxa(rank_code, self.top_n, self.kraken_total_pct)
+        values, present = self.kraken_data.taxon_matrix(
+            rank_code, xlabels, column="minimizer_duplication", first=True, s_names=ylabels
+        )
+        duplication = [
+            [value if is_present else None for value, is_present in zip(row, row_present)]
+            for row, row_present in zip(values.tolist(), present.tolist())
+        ]
 
         self.add_section(
             name="Duplication rate of top species",
@@ -505,3 +413,17 @@ class MultiqcModule(BaseMultiqcModule):
             """,
             plot=heatmap.plot(duplication, xlabels, ylabels, pconfig),
         )
+
+
+def parse_report(module, f):
+    """
+    Parses a report in either format, for map_log_files(). Returns whether it is
+    a report with minimizer counts, and its columns.
+    """
+    with f.open() as fh:
+        f["f"] = fh
+        log_is_new = MultiqcModule.log_is_new(f)
+        fh.seek(0)
+        if not log_is_new:
+            return False, MultiqcModule.parse_logs(f)
+        return True, MultiqcModule.parse_logs_minimizer(f)
@@ -5,10 +5,9 @@ import logging
 import os
 import re
 
-import yaml
-
 from multiqc.modules.base_module import BaseMultiqcModule, ModuleNoSamplesFound
 from multiqc.plots import linegraph, table
+from multiqc.utils import loaders
 
 # Initialise the logger
 log = logging.getLogger(__name__)
@@ -68,7 +67,7 @@ class MultiqcModule(BaseMultiqcModule):
         Uses only the "All reads" stats. Ignores "Q>=x" part.
         """
         try:
-            summary_dict = yaml.safe_load(f["f"])
+            summary_dict = loaders.load_yaml(f["f"])
         except Exception as e:
             log.error(f"Error parsing MinIONQC input file {f['f']}: {e}")
             return
@@ -2,9 +2,14 @@
 
 
 import fnmatch
+import functools
 import logging
+import os
+import re
 from collections import defaultdict
 
+import numpy as np
+
 from multiqc import config
 from multiqc.modules.base_module import BaseMultiqcModule, ModuleNoSamplesFound
 
@@ -15,6 +20,91 @@ from multiqc.plots import bargraph, linegraph
 log = logging.getLogger(__name__)
 
 
+class ContigFilter:
+    """
+    Decides whether to show a contig, from the exclude_contigs and include_contigs glob
+    patterns in the config. The patterns of each list are compiled into one regular
+    expression, and the decision is cached for every contig name.
+    """
+
+    def __init__(self, cfg):
+        self.exclude = _compile_globs(cfg.get("exclude_contigs", []))
+        self.include = _compile_globs(cfg.get("include_contigs", []))
+        self.show_excluded_debug_logs = cfg.get("show_excluded_debug_logs") is True
+        self._decisions = dict()
+
+    def __call__(self, contig: str) -> bool:
+        keep = self._decisions.get(contig)
+        if keep is None:
+            name = os.path.normcase(contig)
+            keep = True
+            # filter out contigs based on exclusion patterns
+            if self.exclude is not None and self.exclude.match(name):
+                if self.show_excluded_debug_logs:
+                    log.debug(f"Skipping excluded contig '{contig}'")
+                keep = False
+            # filter out contigs based on inclusion patterns
+            elif self.include is not None and not self.include.match(name):
+                keep = False
+            self._decisions[contig] = keep
+        return keep
+
+
+def _compile_globs(patterns):
+    """One regular expression matching any of the glob patterns, like fnmatch.fnmatch()"""
+    if not patterns:
+        return None
+    return re.compile("|".join(fnmatch.translate(os.path.normcase(str(p))) for p in patterns))
+
+
+def parse_cov_dist_file(module, f, contig_filter):
+    """
+    Parses a mosdepth coverage distribution file, for map_log_files(). Returns the sample
+    name, the cumulative coverage distribution as arrays of coverage thresholds and of the
+    percentage of bases covered, and the contig names with the sum of their fractions.
+    """
+    s_name = module.clean_s_name(f["fn"], f)
+    contigs, cutoffs, fractions = _read_dist_columns(f["f"])
+
+    # Lines with no bases at the coverage threshold don't add anything
+    nonzero = fractions != 0
+    contigs, cutoffs, fractions = contigs[nonzero], cutoffs[nonzero], fractions[nonzero]
+
+    # Parse cumulative coverage
+    is_total = contigs == "total"
+    cumcov_x = cutoffs[is_total]
+    cumcov_y = 100.0 * fractions[is_total]
+
+    # Calculate per-contig coverage, with the contigs in the order they first appear
+    names, first_idx, inverse = np.unique(contigs[~is_total], return_index=True, return_inverse=True)
+    sums = np.bincount(inverse.ravel(), weights=fractions[~is_total], minlength=len(names))
+    perchrom_names, perchrom_sums = [], []
+    for i in np.argsort(first_idx, kind="stable").tolist():
+        contig = str(names[i])
+        if contig_filter(contig):
+            perchrom_names.append(contig)
+            perchrom_sums.append(sums[i])
+    return s_name, (cumcov_x, cumcov_y), (perchrom_names, np.array(perchrom_sums, dtype=float))
+
+
+def _read_dist_columns(text: str):
+    """
+    The three columns of a dist file as arrays: contig, coverage threshold and fraction of
+    bases. The whole file is split into one flat list of fields that is converted in bulk.
+    """
+    fields = text.split()
+    n_rows = len(fields) // 3
+    if len(fields) != 3 * n_rows or text.count("\t") != 2 * n_rows or text.count("\n") not in (n_rows - 1, n_rows):
+        # Not one line of three tab-separated fields per row: only use the lines that are
+        rows = [line.split("\t") for line in text.split("\n") if "\t" in line]
+        fields = [field.strip() for row in rows if len(row) == 3 for field in row]
+    return (
+        np.array(fields[0::3], dtype=str),
+        np.array(fields[1::3], dtype=np.int64),
+        np.array(fields[2::3], dtype=float),
+    )
+
+
 def read_config():
     cfg = getattr(config, "mosdepth_config", dict())
     if not isinstance(cfg, dict):
@@ -121,6 +211,7 @@ class MultiqcModule(BaseMultiqcModule):
         )
 
         self.cfg = read_config()
+        self.contig_filter = ContigFilter(self.cfg)
         genstats_headers = defaultdict(dict)
         genstats = defaultdict(dict)  # mean coverage
 
@@ -375,46 +466,19 @@ class MultiqcModule(BaseMultiqcModule):
         perchrom_avg_data = defaultdict(dict)  # per chromosome average coverage
         xy_cov = dict()
 
-        # Parse coverage distributions
+        # Parse coverage distributions. Both region and global might exist, prioritizing region
+        dist_files = []
         for f in self.find_log_files(f"mosdepth/{scope}_dist"):
-            s_name = self.clean_s_name(f["fn"], f)
-            if s_name in cumcov_dist_data:  # both region and global might exist, prioritizing region
+            if self.clean_s_name(f["fn"], f) not in cumcov_dist_data:
+                dist_files.append(f)
+        parser_fn = functools.partial(parse_cov_dist_file, contig_filter=self.contig_filter)
+        for f, (s_name, (cumcov_x, cumcov_y), (contigs, contig_cov)) in self.map_log_files(dist_files, parser_fn):
+            if s_name in cumcov_dist_data:  # the first file of each sample is used
                 continue
-
-            for line in f["f"].split("\n"):
-                if "\t" not in line:
-                    continue
-                contig, cutoff_reads, bases_fraction = line.split("\t")
-                if float(bases_fraction) == 0:
-                    continue
-
-                # Parse cumulative coverage
-                if contig == "total":
-                    cumcov = 100.0 * float(bases_fraction)
-                    x = int(cutoff_reads)
-                    cumcov_dist_data[s_name][x] = cumcov
-
-                # Calculate per-contig coverage
-                else:
-                    # filter out contigs based on exclusion patterns
-                    if any(fnmatch.fnmatch(contig, str(pattern)) for pattern in self.cfg["exclude_contigs"]):
-                        try:
-                            if self.cfg.get("show_excluded_debug_logs") is True:
-                                log.debug(f"Skipping excluded contig '{contig}'")
-                        except (AttributeError, KeyError):
-                            pass
-                        continue
-
-                    # filter out contigs based on inclusion patterns
-                    if len(self.cfg["include_contigs"]) > 0 and not any(
-                        fnmatch.fnmatch(contig, pattern) for pattern in self.cfg["include_contigs"]
-                    ):
-                        # Commented out since this could be many thousands of contigs!
-                        # log.debug(f"Skipping not included contig '{contig}'")
-                        continue
-
-                    avg = perchrom_avg_data[s_name].get(contig, 0) + float(bases_fraction)
-                    perchrom_avg_data[s_name][contig] = avg
+            if len(cumcov_x):
+                cumcov_dist_data[s_name] = dict(zip(cumcov_x.tolist(), cumcov_y.tolist()))
+            for contig, cov in zip(contigs, contig_cov.tolist()):
+                perchrom_avg_data[s_name][contig] = perchrom_avg_data[s_name].get(contig, 0) + cov
 
             if s_name in cumcov_dist_data:
                 self.add_data_source(f, s_name=s_name, section="genome_results")
@@ -457,22 +521,15 @@ class MultiqcModule(BaseMultiqcModule):
                 )
 
         # Additionally, collect X and Y counts if we have them
+        is_x, is_y = self._xy_contigs({contig for perchrom in perchrom_avg_data.values() for contig in perchrom})
         for s_name, perchrom in perchrom_avg_data.items():
             x_cov = False
             y_cov = False
             for contig, cov in perchrom.items():
-                if self.cfg.get("xchr"):
-                    if str(self.cfg["xchr"]) == str(contig):
-                        x_cov = cov
-                else:
-                    if contig.lower() == "x" or contig.lower() == "chrx":
-                        x_cov = cov
-                if self.cfg.get("ychr"):
-                    if str(self.cfg["ychr"]) == str(contig):
-                        y_cov = cov
-                else:
-                    if contig.lower() == "y" or contig.lower() == "chry":
-                        y_cov = cov
+                if contig in is_x:
+                    x_cov = cov
+                if contig in is_y:
+                    y_cov = cov
             # Only save these counts if we have both x and y
             if x_cov and y_cov:
                 xy_cov[s_name] = {"x": x_cov, "y": y_cov}
@@ -486,28 +543,40 @@ class MultiqcModule(BaseMultiqcModule):
 
         # Calculate absolute coverage distribution (global)
         for s_name, s_cumcov_dist in cumcov_dist_data.items():
-            # Create sorted list of tuples (x, cumcov)
-            cumcov_dist = sorted(s_cumcov_dist.items())
+            x = np.fromiter(s_cumcov_dist.keys(), dtype=np.int64, count=len(s_cumcov_dist))
+            cumcov = np.fromiter(s_cumcov_dist.values(), dtype=float, count=len(s_cumcov_dist))
+            order = np.argsort(x, kind="stable")
+            x, cumcov = x[order], cumcov[order]
 
             # Calculate absolute coverage for the given x by taking the difference between
-            # the current and previous cumulative coverage.
+            # the current and the next cumulative coverage.
             #
             #   *example*              x:  cumcov:  abscov:
             #   3x                     3x  0      =               0
             #   2x     -               2x  0.10   = 0.10 - 0    = 0.10
             #   1x     --------        1x  0.80   = 0.80 - 0.10 = 0.70
             #   genome ..........      0x  1.00   = 1.00 - 0.80 = 0.20
-            prev_x, prev_cumcov = cumcov_dist.pop()
-            if not cumcov_dist:
-                cov_dist_data[s_name][prev_x] = 1.0
+            if len(x) == 1:
+                cov_dist_data[s_name][int(x[0])] = 1.0
             else:
-                while cumcov_dist:
-                    x, cumcov = cumcov_dist.pop()
-                    cov_dist_data[s_name][x] = cumcov - prev_cumcov
-                    prev_x, prev_cumcov = x, cumcov
+                abscov = cumcov[:-1] - cumcov[1:]
+                # From the highest coverage down, like the cumulative distribution
+                cov_dist_data[s_name] = dict(zip(x[-2::-1].tolist(), abscov[::-1].tolist()))
 
         return cumcov_dist_data, cov_dist_data, perchrom_avg_data, xy_cov
 
+    def _xy_contigs(self, contigs):
+        """The names of the X and the Y chromosome among the contigs, from the config or the usual names"""
+        if self.cfg.get("xchr"):
+            is_x = {c for c in contigs if str(self.cfg["xchr"]) == str(c)}
+        else:
+            is_x = {c for c in contigs if c.lower() in ("x", "chrx")}
+        if self.cfg.get("ychr"):
+            is_y = {c for c in contigs if str(self.cfg["ychr"]) == str(c)}
+        else:
+            is_y = {c for c in contigs if c.lower() in ("y", "chry")}
+        return is_x, is_y
+
     def genstats_cov_thresholds(self, genstats, genstats_headers, cumcov_dist_data, threshs, hidden_threshs):
         for s_name, d in cumcov_dist_data.items():
             dist_subset = {t: data for t, data in d.items() if t in threshs}
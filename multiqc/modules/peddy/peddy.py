@@ -5,8 +5,11 @@ import json
 import logging
 import random
 
+import numpy as np
+
 from multiqc.modules.base_module import BaseMultiqcModule, ModuleNoSamplesFound
 from multiqc.plots import scatter
+from multiqc.utils.pairwise import PairwiseTable, read_pairs
 
 # Initialise the logger
 log = logging.getLogger(__name__)
@@ -50,7 +53,7 @@ class MultiqcModule(BaseMultiqcModule):
                 self.add_software_version(None, cleaned_s_name)
 
         # parse peddy CSV files
-        for pattern in ["het_check", "ped_check", "sex_check"]:
+        for pattern in ["het_check", "sex_check"]:
             sp_key = f"peddy/{pattern}"
             for f in self.find_log_files(sp_key):
                 # some columns have the same name in het_check and sex_check (median_depth)
@@ -64,6 +67,20 @@ class MultiqcModule(BaseMultiqcModule):
                         except KeyError:
                             self.peddy_data[s_name] = parsed_data[s_name]
 
+        # parse peddy pairs files. There is a line for every pair of samples,
+        # so they are kept as arrays rather than a dict for every pair
+        self.peddy_pairs = PairwiseTable()
+        for f in self.find_log_files("peddy/ped_check", filehandles=True):
+            n_pairs = read_pairs(
+                self.peddy_pairs,
+                f["f"],
+                sample_cols=("sample_a", "sample_b"),
+                sep=",",
+                rename=lambda s, f=f: self.clean_s_name(s, f),
+            )
+            if n_pairs < 0:
+                log.warning(f"Could not find sample name in Peddy output: {f['fn']}")
+
         # parse background PCA JSON file, this is identical for all peddy runs,
         # so just parse the first one we find
         for f in self.find_log_files("peddy/background_pca"):
@@ -76,14 +93,16 @@ class MultiqcModule(BaseMultiqcModule):
 
         # Filter to strip out ignored sample names
         self.peddy_data = self.ignore_samples(self.peddy_data)
+        self.peddy_pairs.keep_samples(self.ignore_samples(dict.fromkeys(self.peddy_pairs.samples)))
 
-        if len(self.peddy_data) == 0:
+        if len(self.peddy_data) == 0 and len(self.peddy_pairs) == 0:
             raise ModuleNoSamplesFound
 
         log.info(f"Found {len(self.peddy_data)} reports")
 
         # Write parsed report data to a file
         self.write_data_file(self.peddy_data, "multiqc_peddy")
+        self.peddy_pairs.write_data_file("multiqc_peddy_pairs")
 
         # Basic Stats Table
         self.peddy_general_stats_table()
@@ -247,16 +266,20 @@ class MultiqcModule(BaseMultiqcModule):
 
     def peddy_relatedness_plot(self):
         data = dict()
-        for s_name, d in self.peddy_data.items():
-            if "ibs0_ped_check" in d and "ibs2_ped_check" in d:
-                data[s_name] = {"x": d["ibs0_ped_check"], "y": d["ibs2_ped_check"]}
-            if "rel_ped_check" in d:
-                if d["rel_ped_check"] < 0.25:
-                    data[s_name]["color"] = "rgba(109, 164, 202, 0.9)"
-                elif d["rel_ped_check"] < 0.5:
-                    data[s_name]["color"] = "rgba(250, 160, 81, 0.8)"
-                else:
-                    data[s_name]["color"] = "rgba(43, 159, 43, 0.8)"
+        pairs = self.peddy_pairs
+        if "ibs0" in pairs and "ibs2" in pairs:
+            colors = [None] * len(pairs)
+            if "rel" in pairs:
+                rel = pairs.column("rel")
+                colors = np.select(
+                    [rel < 0.25, rel < 0.5],
+                    ["rgba(109, 164, 202, 0.9)", "rgba(250, 160, 81, 0.8)"],
+                    "rgba(43, 159, 43, 0.8)",
+                ).tolist()
+            for pair, x, y, color in zip(pairs.pair_names("-"), pairs.values("ibs0"), pairs.values("ibs2"), colors):
+                data[pair] = {"x": x, "y": y}
+                if color is not None:
+                    data[pair]["color"] = color
 
         pconfig = {
             "id": "peddy_relatedness_plot",
@@ -18,84 +18,11 @@ def parse_reports(module):
     samplestats_by_sample = dict()
 
     # Go through logs and find Metrics
-    for f in module.find_log_files("picard/insertsize", filehandles=True):
-        # Sample name from input file name by default
-        s_name = f["s_name"]
-        in_hist = False
-
-        for line in f["f"]:
-            maybe_s_name = util.extract_sample_name(
-                module,
-                line,
-                f,
-                picard_tool="CollectInsertSizeMetrics",
-                sentieon_algo="InsertSizeMetricAlgo",
-            )
-            if maybe_s_name:
-                s_name = maybe_s_name
-
-            if s_name is None:
-                continue
-
-            # Catch the histogram values
-            if in_hist:
-                try:
-                    sections = line.split("\t")
-                    ins = int(sections[0])
-                    tot_count = sum([int(x) for x in sections[1:]])
-                    histogram_by_sample[s_name][ins] = tot_count
-                    samplestats_by_sample[s_name]["total_count"] += tot_count
-                except ValueError:
-                    # Reset in case we have more in this log file
-                    s_name = None
-                    in_hist = False
-
-            if util.is_line_right_before_table(
-                line, picard_class="InsertSizeMetrics", sentieon_algo="InsertSizeMetricAlgo"
-            ):
-                keys = f["f"].readline().strip("\n").split("\t")
-                vals = f["f"].readline().strip("\n").split("\t")
-                if len(vals) != len(keys):
-                    continue
-
-                if s_name in data_by_sample:
-                    log.debug(f"Duplicate sample name found in {f['fn']}! Overwriting: {s_name}")
-
-                module.add_data_source(f, s_name, section="InsertSizeMetrics")
-                samplestats_by_sample[s_name] = {"total_count": 0, "meansum": 0, "total_pairs": 0}
-                orientation_idx = keys.index("PAIR_ORIENTATION")
-
-                while len(vals) == len(keys):
-                    pair_orientation = vals[orientation_idx]
-                    rowkey = f"{s_name}_{pair_orientation}"
-                    data_by_sample[rowkey] = dict()
-                    data_by_sample[rowkey]["SAMPLE_NAME"] = s_name
-                    for i, k in enumerate(keys):
-                        try:
-                            data_by_sample[rowkey][k] = float(vals[i])
-                        except ValueError:
-                            try:
-                                unfixed = vals[i]
-                                fixed = unfixed.replace(",", ".")
-                                data_by_sample[rowkey][k] = float(fixed)
-                                log.debug(f"Switching commas for points in '{f['fn']}': {unfixed} -> {fixed}")
-                            except ValueError:
-                                data_by_sample[rowkey][k] = vals[i]
-                        except IndexError:
-                            pass  # missing data
-                    # Add to mean sums
-                    rp = data_by_sample[rowkey]["READ_PAIRS"]
-                    mis = data_by_sample[rowkey]["MEAN_INSERT_SIZE"]
-                    samplestats_by_sample[s_name]["meansum"] += rp * mis
-                    samplestats_by_sample[s_name]["total_pairs"] += rp
-
-                    vals = f["f"].readline().strip("\n").split("\t")
-
-            if line.startswith("## HISTOGRAM"):
-                keys = f["f"].readline().strip("\n").split("\t")
-                assert len(keys) >= 2, (keys, f)
-                in_hist = True
-                histogram_by_sample[s_name] = dict()
+    for f, parsed in module.map_log_files("picard/insertsize", _parse_file):
+        file_data, file_histograms, file_samplestats = parsed
+        data_by_sample.update(file_data)
+        histogram_by_sample.update(file_histograms)
+        samplestats_by_sample.update(file_samplestats)
 
     # Calculate summed mean values for all read orientations
     for s_name, v in samplestats_by_sample.items():
@@ -157,12 +84,8 @@ def parse_reports(module):
     # Section with histogram plot
     if len(histogram_by_sample) > 0:
         # Make a normalised percentage version of the data
-        data_percent = {}
-        for s_name, data in histogram_by_sample.items():
-            data_percent[s_name] = dict()
-            total = float(sum(data.values()))
-            for k, v in data.items():
-                data_percent[s_name][k] = (v / total) * 100
+        histogram_by_sample = {s_name: linegraph.Series.from_dict(data) for s_name, data in histogram_by_sample.items()}
+        data_percent = {s_name: hist.pct() for s_name, hist in histogram_by_sample.items()}
 
         # Allow customisation of how smooth the plot is
         try:
@@ -202,3 +125,94 @@ def parse_reports(module):
 
     # Return the number of detected samples to the parent module
     return len(data_by_sample)
+
+
+def _parse_file(module, f):
+    """
+    Parses one InsertSizeMetrics file, for map_log_files(). Returns the metrics rows,
+    histograms and summary counts of the samples in the file.
+    """
+    data_by_sample = dict()
+    histogram_by_sample = dict()
+    samplestats_by_sample = dict()
+
+    # Sample name from input file name by default
+    s_name = f["s_name"]
+    in_hist = False
+
+    with f.open() as fh:
+        for line in fh:
+            maybe_s_name = util.extract_sample_name(
+                module,
+                line,
+                f,
+                picard_tool="CollectInsertSizeMetrics",
+                sentieon_algo="InsertSizeMetricAlgo",
+            )
+            if maybe_s_name:
+                s_name = maybe_s_name
+
+            if s_name is None:
+                continue
+
+            # Catch the histogram values
+            if in_hist:
+                try:
+                    sections = line.split("\t")
+                    ins = int(sections[0])
+                    tot_count = sum([int(x) for x in sections[1:]])
+                    histogram_by_sample[s_name][ins] = tot_count
+                    samplestats_by_sample[s_name]["total_count"] += tot_count
+                except ValueError:
+                    # Reset in case we have more in this log file
+                    s_name = None
+                    in_hist = False
+
+            if util.is_line_right_before_table(
+                line, picard_class="InsertSizeMetrics", sentieon_algo="InsertSizeMetricAlgo"
+            ):
+                keys = fh.readline().strip("\n").split("\t")
+                vals = fh.readline().strip("\n").split("\t")
+                if len(vals) != len(keys):
+                    continue
+
+                if s_name in data_by_sample:
+                    log.debug(f"Duplicate sample name found in {f['fn']}! Overwriting: {s_name}")
+
+                module.add_data_source(f, s_name, section="InsertSizeMetrics")
+                samplestats_by_sample[s_name] = {"total_count": 0, "meansum": 0, "total_pairs": 0}
+                orientation_idx = keys.index("PAIR_ORIENTATION")
+
+                while len(vals) == len(keys):
+                    pair_orientation = vals[orientation_idx]
+                    rowkey = f"{s_name}_{pair_orientation}"
+                    data_by_sample[rowkey] = dict()
+                    data_by_sample[rowkey]["SAMPLE_NAME"] = s_name
+                    for i, k in enumerate(keys):
+                        try:
+                            data_by_sample[rowkey][k] = float(vals[i])
+                        except ValueError:
+                            try:
+                                unfixed = vals[i]
+                                fixed = unfixed.replace(",", ".")
+                                data_by_sample[rowkey][k] = float(fixed)
+                                log.debug(f"Switching commas for points in '{f['fn']}': {unfixed} -> {fixed}")
+                            except ValueError:
+                                data_by_sample[rowkey][k] = vals[i]
+                        except IndexError:
+                            pass  # missing data
+                    # Add to mean sums
+                    rp = data_by_sample[rowkey]["READ_PAIRS"]
+                    mis = data_by_sample[rowkey]["MEAN_INSERT_SIZE"]
+                    samplestats_by_sample[s_name]["meansum"] += rp * mis
+                    samplestats_by_sample[s_name]["total_pairs"] += rp
+
+                    vals = fh.readline().strip("\n").split("\t")
+
+            if line.startswith("## HISTOGRAM"):
+                keys = fh.readline().strip("\n").split("\t")
+                assert len(keys) >= 2, (keys, f)
+                in_hist = True
+                histogram_by_sample[s_name] = dict()
+
+    return data_by_sample, histogram_by_sample, samplestats_by_sample
@@ -1,9 +1,10 @@
+import functools
 import logging
 import os
 import re
 from typing import Dict, List, Optional, Union
 
-from multiqc.utils import config
+from multiqc.utils import config, section_reader
 
 # Initialise the logger
 log = logging.getLogger(__name__)
@@ -23,38 +24,16 @@ def read_histogram(module, program_key, headers, formats, picard_tool, sentieon_
     """
     all_data = dict()
     assert len(formats) == len(headers)
-    sample_data = None
 
     # Go through logs and find Metrics
-    for f in module.find_log_files(program_key, filehandles=True):
-        s_name = f["s_name"]
-        for line in f["f"]:
-            maybe_s_name = extract_sample_name(
-                module,
-                line,
-                f,
-                picard_tool=picard_tool,
-                sentieon_algo=sentieon_algo,
-            )
-            if maybe_s_name:
-                s_name = maybe_s_name
-                sample_data = None
-
-            if is_line_right_before_table(line, sentieon_algo=sentieon_algo):
-                # check the header
-                line = f["f"].readline()
-                if line.strip().split("\t") == headers:
-                    sample_data = dict()
-                else:
-                    sample_data = None
-
-            elif sample_data is not None:
-                fields = line.strip().split("\t")
-                if len(fields) == len(headers):
-                    for i in range(len(fields)):
-                        fields[i] = formats[i](fields[i])
-                    sample_data[fields[0]] = dict(zip(headers, fields))
-
+    parser_fn = functools.partial(
+        _read_histogram_file,
+        headers=headers,
+        formats=formats,
+        picard_tool=picard_tool,
+        sentieon_algo=sentieon_algo,
+    )
+    for f, (s_name, sample_data) in module.map_log_files(program_key, parser_fn, filecontents=False):
         # append the data
         if sample_data:
             if s_name in all_data:
@@ -74,6 +53,45 @@ def read_histogram(module, program_key, headers, formats, picard_tool, sentieon_
     return data
 
 
+def _read_histogram_file(module, f, headers, formats, picard_tool, sentieon_algo=None):
+    """
+    Reads the last histogram of a Picard file, for map_log_files() in read_histogram().
+    Returns the sample name and the histogram rows by their first field.
+    """
+
+    def is_table_marker(line):
+        return is_line_right_before_table(line, sentieon_algo=sentieon_algo)
+
+    def is_histogram(marker, header):
+        return header == headers
+
+    s_name = f["s_name"]
+    sample_data = None
+    with f.open() as fh:
+        for kind, item in section_reader.iter_tables(fh, is_table_marker, keep_table=is_histogram):
+            if kind == "comment":
+                maybe_s_name = extract_sample_name(
+                    module,
+                    item,
+                    f,
+                    picard_tool=picard_tool,
+                    sentieon_algo=sentieon_algo,
+                )
+                if maybe_s_name:
+                    s_name = maybe_s_name
+                    sample_data = None
+                continue
+
+            _, _, rows = item
+            sample_data = dict()
+            for fields in rows:
+                if len(fields) == len(headers):
+                    for i in range(len(fields)):
+                        fields[i] = formats[i](fields[i])
+                    sample_data[fields[0]] = dict(zip(headers, fields))
+    return s_name, sample_data
+
+
 def is_line_right_before_table(
     line: str,
     picard_class: Union[None, str, List[str]] = None,
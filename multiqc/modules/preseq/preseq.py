@@ -82,21 +82,15 @@ class MultiqcModule(BaseMultiqcModule):
         x_axis = getattr(config, "preseq", {}).get("x_axis", "counts")
         y_axis = getattr(config, "preseq", {}).get("y_axis", "coverage" if counts_in_1x else "counts")
 
-        # Modify counts
-        d_cnts = {sn: _modify_raw_data(sample_data, is_basepairs) for sn, sample_data in data_raw.items()}
-
-        # Convert counts (base pairs) -> depths
-        d_covs = {
-            sn: _counts_to_coverages(sample_data, counts_in_1x) if counts_in_1x else None
-            for sn, sample_data in data_raw.items()
-        }
-
-        # Prepare final dataset for plotting
+        # Prepare final dataset for plotting: modify counts, or convert counts (base pairs) -> depths
         data = dict()
-        for sn, s_d_cnts, s_d_covs in zip(d_cnts, d_cnts.values(), d_covs.values()):
-            keys = s_d_covs.keys() if x_axis == "coverage" else s_d_cnts.keys()
-            values = s_d_covs.values() if y_axis == "coverage" else s_d_cnts.values()
-            data[sn] = dict(zip(keys, values))
+        for sn, sample_data in data_raw.items():
+            raw = linegraph.Series.from_dict(sample_data)
+            cnts = _modify_raw_val(raw, is_basepairs)
+            covs = _counts_to_coverages(raw, counts_in_1x) if counts_in_1x else None
+            xs = covs.x if x_axis == "coverage" else cnts.x
+            ys = covs.y if y_axis == "coverage" else cnts.y
+            data[sn] = linegraph.Series(xs, ys)
 
         # Count maximum values to draw the "ideal" line
         max_y_raw, max_sn = max((max(sd.values()), sn) for sn, sd in data_raw.items())
@@ -149,10 +143,16 @@ class MultiqcModule(BaseMultiqcModule):
             max_y *= 0.8
             max_yx *= 0.8
             max_x = 0
-            for x in sorted(list(data[max_sn].keys())):
-                max_x = max(max_x, x)
-                if data[max_sn][x] > max_y and x > real_vals_all.get(max_sn, 0) and x > real_vals_unq.get(max_sn, 0):
-                    break
+            max_sd = data[max_sn].sorted()
+            if len(max_sd) > 0:
+                # Stop at the first point past 80% of the maximum, and past the real counts
+                past = (
+                    (max_sd.y > max_y)
+                    & (max_sd.x > real_vals_all.get(max_sn, 0))
+                    & (max_sd.x > real_vals_unq.get(max_sn, 0))
+                )
+                end = int(np.argmax(past)) + 1 if past.any() else len(max_sd)
+                max_x = max(max_x, max_sd.x[:end].max().item())
             pconfig["xmax"] = max_x
             description += "<p>Note that the x-axis is trimmed at the point where all the datasets \
                 show 80% of their maximum y-value, to avoid ridiculous scales.</p>"
@@ -242,18 +242,24 @@ def _modify_raw_data(sample_data, is_basepairs):
 
 def _modify_raw_val(val, is_basepairs):
     """Modify counts or base pairs according to `read_count_multiplier`
-    or `base_count_multiplier`.
+    or `base_count_multiplier`. Also takes a linegraph.Series, to modify all its points.
     """
-    return float(val) * (config.base_count_multiplier if is_basepairs else config.read_count_multiplier)
+    multiplier = config.base_count_multiplier if is_basepairs else config.read_count_multiplier
+    if isinstance(val, linegraph.Series):
+        return linegraph.Series(val.x.astype(float) * multiplier, val.y.astype(float) * multiplier)
+    return float(val) * multiplier
 
 
 def _counts_to_coverages(sample_data, counts_in_1x):
     """If the user specified read length and genome size in the config,
     convert the raw counts/bases into the depth of coverage.
+    Also takes a linegraph.Series, to convert all its points.
     """
     if not counts_in_1x:
         return {None: None}
 
+    if isinstance(sample_data, linegraph.Series):
+        return linegraph.Series(sample_data.x / counts_in_1x, sample_data.y / counts_in_1x)
     return {_count_to_coverage(x, counts_in_1x): _count_to_coverage(y, counts_in_1x) for x, y in sample_data.items()}
 
 
@@ -34,6 +34,8 @@ class MultiqcModule(BaseMultiqcModule):
 
         self.search_pattern_times_section()
 
+        self.file_reads_section()
+
     def file_search_stats_section(self):
         """Count of all files iterated through by MultiQC, by category"""
 
@@ -43,6 +45,9 @@ class MultiqcModule(BaseMultiqcModule):
             if "skipped_" in key:
                 s_name = f"Skipped: {key.replace('skipped_', '').replace('_', ' ').capitalize()}"
                 pcats[key] = {"name": key, "color": "#999999"}
+            elif key == "streamed_over_filesize_limit":
+                s_name = "Streamed: Over filesize limit"
+                pcats[key] = {"name": key, "color": "#f7a35c"}
             else:
                 s_name = key
                 pcats[key] = {"name": key, "color": "#7cb5ec"}
@@ -72,6 +77,8 @@ class MultiqcModule(BaseMultiqcModule):
                 * `Skipped: No match` - File was searched, but didn't match any search patterns
                 * `Skipped: Ignore pattern` - File matched a MultiQC ignore pattern (see `-x` / `--ignore` / `config.fn_ignore_paths`)
                 * `Skipped: Filesize limit` - File was skipped because it was too large (see `config.log_filesize_limit`)
+                * `Streamed: Over filesize limit` - File was larger than `config.log_filesize_limit`, but was found
+                  by a search pattern with `streaming: true`, for a module that doesn't read whole files into memory
                 * `Skipped: Symlinks` - File was a symlink and skipped (see `config.ignore_symlinks`)
                 * `Skipped: Not a file` - File could not be read (eg. was a unix pipe or something)
             """,
@@ -118,3 +125,56 @@ class MultiqcModule(BaseMultiqcModule):
             """,
             plot=bargraph.plot(pdata, None, pconfig),
         )
+
+    def file_reads_section(self):
+        """Section with a bar plot comparing the size of the files found for each search pattern key
+        to the number of bytes that were read from them"""
+
+        pdata = dict()
+        matched_bytes = report.matched_file_bytes()
+        for key in sorted(set(matched_bytes) | set(report.file_bytes_read) - {"search"}):
+            pdata[key] = {
+                "matched": matched_bytes.get(key, 0) / 1024 / 1024,
+                "read": report.file_bytes_read.get(key, 0) / 1024 / 1024,
+            }
+        if not pdata:
+            return
+
+        pcats = {
+            "matched": {"name": "Size of matched files", "color": "#7cb5ec"},
+            "read": {"name": "Read by the module", "color": "#f7a35c"},
+        }
+        pconfig = {
+            "id": "multiqc_runtime_file_reads_plot",
+            "title": "MultiQC: File reads per search pattern key",
+            "ylab": "Megabytes",
+            "cpswitch": False,
+            "stacking": None,
+        }
+
+        over_read = [k for k, d in pdata.items() if d["read"] > d["matched"] * 1.01 and d["read"] > 0.01]
+        over_read_md = ""
+        if over_read:
+            over_read_md = f"Read more than the size of their files: `{'`, `'.join(over_read)}`."
+
+        self.add_section(
+            name="File reads",
+            anchor="multiqc_runtime_file_reads",
+            description=f"""
+                Bytes read from the files found for each search pattern key, compared to their size.
+                **The file search read {report.file_bytes_read.get("search", 0) / 1024 / 1024:.2f} MB
+                and modules read {sum(d["read"] for d in pdata.values()):.2f} MB,
+                of {sum(d["matched"] for d in pdata.values()):.2f} MB in matched files.**
+                {over_read_md}
+            """,
+            helptext="""
+                Modules get the contents of the files they find through `find_log_files()`, which only
+                reads a file when the module first accesses its contents. A module that reads more than
+                the size of its files is usually reading them twice, for example by opening the file
+                itself after also accessing `f["f"]`.
+
+                Files opened by the module directly by path are not counted here, only reads through
+                `find_log_files()` and the `LogFile` objects that it returns.
+            """,
+            plot=bargraph.plot(pdata, pcats, pconfig),
+        )
@@ -2,11 +2,10 @@
 
 import logging
 
-import yaml
-
 from multiqc import config
 from multiqc.modules.base_module import BaseMultiqcModule, ModuleNoSamplesFound
 from multiqc.plots import bargraph, linegraph, table
+from multiqc.utils import loaders
 
 log = logging.getLogger(__name__)
 
@@ -60,7 +59,7 @@ class MultiqcModule(BaseMultiqcModule):
     def load_data(self, f):
         """Load the PycoQC YAML file"""
         try:
-            return yaml.load(f, Loader=yaml.SafeLoader)
+            return loaders.load_yaml(f)
         except Exception as e:
             log.warning(f"Could not parse YAML for '{f}': \n  {e}")
             return None
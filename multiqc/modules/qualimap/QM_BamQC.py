@@ -3,10 +3,13 @@
 
 import logging
 import os
+from collections import namedtuple
 
 import math
 import re
 
+import numpy as np
+
 from multiqc import config
 from multiqc.modules.qualimap import parse_numerals
 from multiqc.plots import linegraph
@@ -14,6 +17,12 @@ from multiqc.plots import linegraph
 # Initialise the logger
 log = logging.getLogger(__name__)
 
+# A histogram as two arrays: the integer values (depth or insert size), and their counts
+Histogram = namedtuple("Histogram", "x y")
+
+# Maximum number of points per sample in the coverage histogram plot
+COVERAGE_PLOT_POINTS = 1000
+
 
 def parse_reports(self):
     """Find Qualimap BamQC reports and parse their data"""
@@ -176,35 +185,16 @@ def parse_coverage(self, f):
     # Typical path: <sample name>/raw_data_qualimapReport/coverage_histogram.txt
     s_name = self.get_s_name(f)
 
-    d = dict()
-    for line in f["f"]:
-        if line.startswith("#"):
-            continue
-        coverage, count = line.split(None, 1)
-        coverage = int(round(float(coverage.replace(",", "."))))
-        count = float(count)
-        d[coverage] = count
-
-    if len(d) == 0:
+    hist = _read_histogram(f["f"])
+    if len(hist.x) == 0:
         log.debug(f"Couldn't parse contents of coverage histogram file {f['fn']}")
         return None
 
-    # Find median without importing anything to do it for us
-    num_counts = sum(d.values())
-    cum_counts = 0
-    total_cov = 0
-    median_coverage = None
-    for thiscov, thiscount in d.items():
-        cum_counts += thiscount
-        total_cov += thiscov * thiscount
-        if cum_counts >= num_counts / 2:
-            median_coverage = thiscov
-            break
-    self.general_stats_data[s_name]["median_coverage"] = median_coverage
+    self.general_stats_data[s_name]["median_coverage"] = _median(hist)
     # Save results
     if s_name in self.qualimap_bamqc_coverage_hist:
         log.debug(f"Duplicate coverage histogram sample name found! Overwriting: {s_name}")
-    self.qualimap_bamqc_coverage_hist[s_name] = d
+    self.qualimap_bamqc_coverage_hist[s_name] = hist
     self.add_data_source(f, s_name=s_name, section="coverage_histogram")
 
 
@@ -214,35 +204,74 @@ def parse_insert_size(self, f):
     # Typical path: <sample name>/raw_data_qualimapReport/insert_size_histogram.txt
     s_name = self.get_s_name(f)
 
-    d = dict()
-    for line in f["f"]:
-        if line.startswith("#"):
-            continue
-        insertsize, count = line.split(None, 1)
-        insertsize = int(round(float(insertsize)))
-        count = float(count) / 1000000
-        if insertsize != 0:
-            d[insertsize] = count
-
-    # Find median without importing anything to do it for us
-    num_counts = sum(d.values())
-    cum_counts = 0
-    median_insert_size = None
-    for thisins, thiscount in d.items():
-        cum_counts += thiscount
-        if cum_counts >= num_counts / 2:
-            median_insert_size = thisins
-            break
+    hist = _read_histogram(f["f"], skip_zero=True)
+    hist = Histogram(hist.x, hist.y / 1000000)
+
     # Add the median insert size to the general stats table
-    self.general_stats_data[s_name]["median_insert_size"] = median_insert_size
+    self.general_stats_data[s_name]["median_insert_size"] = _median(hist)
 
     # Save results
     if s_name in self.qualimap_bamqc_insert_size_hist:
         log.debug(f"Duplicate insert size histogram sample name found! Overwriting: {s_name}")
-    self.qualimap_bamqc_insert_size_hist[s_name] = d
+    self.qualimap_bamqc_insert_size_hist[s_name] = hist
     self.add_data_source(f, s_name=s_name, section="insert_size_histogram")
 
 
+def _read_histogram(lines, skip_zero=False) -> Histogram:
+    """
+    Read a two-column histogram file into arrays, rounding the values in the first column
+    to integers. A value that appears again after rounding keeps its first position and
+    takes the last count, as with a dict. With skip_zero, the row for 0 is left out.
+    """
+    lines = [line for line in lines if not line.startswith("#")]
+    fields = "".join(lines).split()
+    if len(fields) == 2 * len(lines):
+        # Two fields on every line: split the whole file in one go
+        x_str, y_str = fields[0::2], fields[1::2]
+    else:
+        rows = [row for row in (line.split(None, 1) for line in lines) if len(row) == 2]
+        x_str, y_str = [row[0] for row in rows], [row[1] for row in rows]
+    if not x_str:
+        return Histogram(np.zeros(0, dtype=np.int64), np.zeros(0))
+    x = np.round(np.array([v.replace(",", ".") for v in x_str], dtype=float)).astype(np.int64)
+    y = np.array(y_str, dtype=float)
+    if skip_zero:
+        keep = x != 0
+        x, y = x[keep], y[keep]
+    if len(np.unique(x)) < len(x):
+        d = dict(zip(x.tolist(), y.tolist()))
+        x, y = np.array(list(d.keys()), dtype=np.int64), np.array(list(d.values()), dtype=float)
+    return Histogram(x, y)
+
+
+def _median(hist: Histogram):
+    """First value in file order where the cumulative count reaches half of the total"""
+    cum_counts = np.cumsum(hist.y)
+    if len(cum_counts) == 0:
+        return None
+    reached = cum_counts >= cum_counts[-1] / 2
+    if not reached.any():
+        return None
+    return int(hist.x[np.argmax(reached)])
+
+
+def _hist_series(hist: Histogram, max_x=None, max_points=None) -> linegraph.Series:
+    """
+    A histogram as a line for linegraph.plot(), sorted by value, optionally only up
+    to max_x and downsampled like the smooth_points option of linegraph.plot().
+    """
+    order = np.argsort(hist.x, kind="stable")
+    x, y = hist.x[order], hist.y[order]
+    if max_x is not None:
+        keep = (x >= 0) & (x <= max_x)
+        x, y = x[keep], y[keep]
+    if max_points is not None and len(x) > max_points:
+        binsize = (len(x) - 1) / (max_points - 1)
+        idx = np.unique(np.round(binsize * np.arange(max_points)).astype(np.int64))
+        x, y = x[idx], y[idx]
+    return linegraph.Series(x, y)
+
+
 def parse_gc_dist(self, f):
     """Parse the contents of the Qualimap BamQC Mapped Reads GC content distribution file"""
     # Get the sample name from the parent directory
@@ -355,14 +384,14 @@ def report_sections(self):
         # (find a sensible max x - lose 1% of longest tail)
         max_x = 0
         total_bases_by_sample = dict()
-        for s_name, d in self.qualimap_bamqc_coverage_hist.items():
-            total_bases_by_sample[s_name] = sum(d.values())
-            cumulative = 0
-            for count in sorted(d.keys(), reverse=True):
-                cumulative += d[count]
-                if cumulative / total_bases_by_sample[s_name] > 0.01:
-                    max_x = max(max_x, count)
-                    break
+        for s_name, hist in self.qualimap_bamqc_coverage_hist.items():
+            total = np.cumsum(hist.y)[-1]
+            total_bases_by_sample[s_name] = total
+            order = np.argsort(hist.x)[::-1]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                above = np.cumsum(hist.y[order]) / total > 0.01
+            if above.any():
+                max_x = max(max_x, int(hist.x[order][np.argmax(above)]))
 
         rates_within_threshs = dict()
         for s_name, hist in self.qualimap_bamqc_coverage_hist.items():
@@ -389,7 +418,10 @@ def report_sections(self):
             description="Distribution of the number of locations in the reference genome with a given depth of coverage.",
             helptext=coverage_histogram_helptext,
             plot=linegraph.plot(
-                self.qualimap_bamqc_coverage_hist,
+                {
+                    s_name: _hist_series(hist, max_x, COVERAGE_PLOT_POINTS)
+                    for s_name, hist in self.qualimap_bamqc_coverage_hist.items()
+                },
                 {
                     "id": "qualimap_coverage_histogram",
                     "title": "Qualimap BamQC: Coverage histogram",
@@ -475,7 +507,7 @@ def report_sections(self):
             description="Distribution of estimated insert sizes of mapped reads.",
             helptext=insert_size_helptext,
             plot=linegraph.plot(
-                self.qualimap_bamqc_insert_size_hist,
+                {s_name: _hist_series(hist) for s_name, hist in self.qualimap_bamqc_insert_size_hist.items()},
                 {
                     "id": "qualimap_insert_size",
                     "title": "Qualimap BamQC: Insert size histogram",
@@ -654,27 +686,26 @@ def general_stats_headers(self):
     }
 
 
-def _calculate_bases_within_thresholds(bases_by_depth, total_size, depth_thresholds):
-    bases_within_threshs = {depth: 0 for depth in depth_thresholds}
-    rates_within_threshs = {depth: None for depth in depth_thresholds}
-
-    dt = sorted(depth_thresholds, reverse=True)
-    c = 0
-    for depth in sorted(bases_by_depth.keys(), reverse=True):
-        while depth < dt[c]:
-            c += 1
-            bases_within_threshs[dt[c]] = bases_within_threshs[dt[c - 1]]
-        if depth >= dt[c]:
-            bases_within_threshs[dt[c]] += bases_by_depth[depth]
-    while c + 1 < len(dt):
-        c += 1
-        bases_within_threshs[dt[c]] = total_size
-    for t in dt:
-        bs = bases_within_threshs[t]
-        if total_size > 0:
-            rate = 100.0 * bases_within_threshs[t] / total_size
-            assert rate <= 100, (
-                "Error: rate is > 1: rate = " + str(rate) + ", bases = " + str(bs) + ", size = " + str(total_size)
-            )
-            rates_within_threshs[t] = rate
-    return rates_within_threshs
+def _calculate_bases_within_thresholds(hist: Histogram, total_size, depth_thresholds):
+    """
+    Percentage of bases with at least each of the depth thresholds, or None if there are
+    no bases. Thresholds below the largest one that every depth reaches count all bases.
+    """
+    if total_size <= 0:
+        return {depth: None for depth in depth_thresholds}
+
+    # Bases with at least each depth, summing from the highest depth down
+    order = np.argsort(hist.x)[::-1]
+    depths = hist.x[order]
+    bases_from_top = np.cumsum(hist.y[order])
+
+    thresholds = np.array(depth_thresholds, dtype=np.int64)
+    n_reached = len(depths) - np.searchsorted(depths[::-1], thresholds, side="left")
+    bases = np.where(n_reached > 0, bases_from_top[np.maximum(n_reached, 1) - 1], 0.0)
+    reached_by_all = thresholds[thresholds <= depths[-1]]
+    if len(reached_by_all):
+        bases[thresholds < reached_by_all.max()] = total_size
+
+    rates = 100.0 * bases / total_size
+    assert (rates <= 100).all(), f"Error: rate is > 100: rates = {rates[rates > 100]}, size = {total_size}"
+    return dict(zip(depth_thresholds, rates.tolist()))
@@ -3,6 +3,8 @@ http://rseqc.sourceforge.net/#genebody-coverage-py """
 
 import logging
 
+import numpy as np
+
 from multiqc.plots import linegraph
 
 # Initialise the logger
@@ -86,13 +88,13 @@ def parse_reports(self):
     self.add_software_version(None)
 
     # Make a normalised coverage for plotting using the formula (cov - min_cov) / (max_cov - min_cov)
-    for s_name in self.gene_body_cov_hist_counts:
-        self.gene_body_cov_hist_percent[s_name] = dict()
+    for s_name, counts in self.gene_body_cov_hist_counts.items():
+        cov = linegraph.Series.from_dict(counts)
         # min_cov and max_cov are required to compute the normalized coverage
-        min_cov = min(self.gene_body_cov_hist_counts[s_name].values())
-        max_cov = max(self.gene_body_cov_hist_counts[s_name].values())
-        for k, v in self.gene_body_cov_hist_counts[s_name].items():
-            self.gene_body_cov_hist_percent[s_name][k] = (v - min_cov) / (max_cov - min_cov)
+        min_cov = cov.y.min()
+        max_cov = cov.y.max()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.gene_body_cov_hist_percent[s_name] = linegraph.Series(cov.x, (cov.y - min_cov) / (max_cov - min_cov))
 
     # Add line graph to section
     pconfig = {
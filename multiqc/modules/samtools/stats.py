@@ -7,6 +7,7 @@ import re
 
 from multiqc import config
 from multiqc.plots import bargraph, beeswarm
+from multiqc.utils import section_reader
 
 # Initialise the logger
 log = logging.getLogger(__name__)
@@ -23,49 +24,8 @@ class StatsReportMixin:
         """Find Samtools stats logs and parse their data"""
 
         self.samtools_stats = dict()
-        for f in self.find_log_files("samtools/stats"):
-            parsed_data = dict()
-            for line in f["f"].splitlines():
-                # Get version number from file contents
-                if line.startswith("# This file was produced by samtools stats"):
-                    # Look for Samtools version
-                    version_match = re.search(VERSION_REGEX, line)
-                    if version_match is None:
-                        continue
-
-                    # Add Samtools version
-                    samtools_version = version_match.group(1)
-                    self.add_software_version(samtools_version, f["s_name"])
-
-                    # Look for HTSlib version
-                    htslib_version_match = re.search(HTSLIB_REGEX, line)
-                    if htslib_version_match is None:
-                        continue
-
-                    # Add HTSlib version if different from Samtools version
-                    htslib_version = htslib_version_match.group(1)
-                    if htslib_version != samtools_version:
-                        self.add_software_version(htslib_version, f["s_name"], "HTSlib")
-
-                if not line.startswith("SN"):
-                    continue
-                sections = line.split("\t")
-                field = sections[1].strip()[:-1]
-                field = field.replace(" ", "_")
-                value = float(sections[2].strip())
-                parsed_data[field] = value
-
+        for f, parsed_data in self.map_log_files("samtools/stats", parse_stats_file):
             if len(parsed_data) > 0:
-                # Work out some percentages
-                if "raw_total_sequences" in parsed_data:
-                    for k in list(parsed_data.keys()):
-                        if (
-                            k.startswith("reads_")
-                            and k != "raw_total_sequences"
-                            and parsed_data["raw_total_sequences"] > 0
-                        ):
-                            parsed_data[f"{k}_percent"] = (parsed_data[k] / parsed_data["raw_total_sequences"]) * 100
-
                 if f["s_name"] in self.samtools_stats:
                     log.debug(f"Duplicate sample name found! Overwriting: {f['s_name']}")
                 self.add_data_source(f, section="stats")
@@ -262,3 +222,48 @@ def alignment_chart(data):
         "cpswitch_counts_label": "Number of Reads",
     }
     return bargraph.plot(data, keys, plot_conf)
+
+
+def parse_stats_file(module, f):
+    """Parses the summary numbers of a samtools stats file, for map_log_files()"""
+    parsed_data = dict()
+    # Only the summary numbers are used, so stop reading before the histograms
+    with f.open(errors="ignore") as fh:
+        for prefix, fields in section_reader.iter_prefixed_lines(fh, ["#", "SN"]):
+            line = fields[0]
+            # Get version number from file contents
+            if prefix == "#" and line.startswith("# This file was produced by samtools stats"):
+                # Look for Samtools version
+                version_match = re.search(VERSION_REGEX, line)
+                if version_match is None:
+                    continue
+
+                # Add Samtools version
+                samtools_version = version_match.group(1)
+                module.add_software_version(samtools_version, f["s_name"])
+
+                # Look for HTSlib version
+                htslib_version_match = re.search(HTSLIB_REGEX, line)
+                if htslib_version_match is None:
+                    continue
+
+                # Add HTSlib version if different from Samtools version
+                htslib_version = htslib_version_match.group(1)
+                if htslib_version != samtools_version:
+                    module.add_software_version(htslib_version, f["s_name"], "HTSlib")
+
+            if prefix != "SN":
+                continue
+            field = fields[1].strip()[:-1]
+            field = field.replace(" ", "_")
+            value = float(fields[2].strip())
+            parsed_data[field] = value
+
+    if len(parsed_data) > 0:
+        # Work out some percentages
+        if "raw_total_sequences" in parsed_data:
+            for k in list(parsed_data.keys()):
+                if k.startswith("reads_") and k != "raw_total_sequences" and parsed_data["raw_total_sequences"] > 0:
+                    parsed_data[f"{k}_percent"] = (parsed_data[k] / parsed_data["raw_total_sequences"]) * 100
+
+    return parsed_data
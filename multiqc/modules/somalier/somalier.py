@@ -4,14 +4,14 @@
 import csv
 import logging
 import random
-from collections import defaultdict
-from math import isinf, isnan
 
+import numpy as np
 import spectra
 
 from multiqc.modules.base_module import BaseMultiqcModule, ModuleNoSamplesFound
 from multiqc.plots import bargraph, heatmap, scatter, table
 from multiqc.utils import mqc_colour
+from multiqc.utils.pairwise import PairwiseTable, read_pairs
 
 # Initialise the logger
 log = logging.getLogger(__name__)
@@ -51,16 +51,21 @@ class MultiqcModule(BaseMultiqcModule):
                     self.add_data_source(f, s_name)
                     self.somalier_data[s_name] = parsed_data[s_name_raw]
 
-        # parse somalier CSV files
-        for f in self.find_log_files("somalier/pairs"):
-            parsed_data = self.parse_somalier_pairs_tsv(f)
-            if parsed_data is not None:
-                for s_name_raw in parsed_data:
-                    s_name = "*".join([self.clean_s_name(s, f) for s in s_name_raw.split("*")])
-                    if s_name in self.somalier_data.keys():
-                        log.debug(f"Duplicate sample name found! Overwriting: {s_name}")
-                    self.add_data_source(f, s_name)
-                    self.somalier_data[s_name] = parsed_data[s_name_raw]
+        # parse somalier pairs files. A cohort of N samples has N*(N-1)/2 pairs,
+        # so they are kept as arrays rather than a dict for every pair
+        self.somalier_pairs = PairwiseTable()
+        for f in self.find_log_files("somalier/pairs", filehandles=True):
+            n_pairs = read_pairs(
+                self.somalier_pairs,
+                f["f"],
+                sample_cols=("sample_a", "sample_b"),
+                finite=True,  # Inf or NaN indicate the absence of data
+                rename=lambda s, f=f: self.clean_s_name(s, f),
+            )
+            if n_pairs < 0:
+                log.warning(f"Could not find sample name in somalier output: {f['fn']}")
+            elif n_pairs > 0:
+                self.add_data_source(f, section="pairs")
 
         # parse somalier ancestry files
         for f in self.find_log_files("somalier/somalier-ancestry", filehandles=True):
@@ -68,11 +73,14 @@ class MultiqcModule(BaseMultiqcModule):
 
         # Filter to strip out ignored sample names
         self.somalier_data = self.ignore_samples(self.somalier_data)
+        self.somalier_pairs.keep_samples(self.ignore_samples(dict.fromkeys(self.somalier_pairs.samples)))
 
-        if len(self.somalier_data) == 0:
+        if len(self.somalier_data) == 0 and len(self.somalier_pairs) == 0:
             raise ModuleNoSamplesFound
 
         log.info(f"Found {len(self.somalier_data)} reports")
+        if len(self.somalier_pairs) > 0:
+            log.info(f"Found {len(self.somalier_pairs)} sample pairs")
 
         # Superfluous function call to confirm that it is used in this module
         # Replace None with actual version if it is available
@@ -80,6 +88,7 @@ class MultiqcModule(BaseMultiqcModule):
 
         # Write parsed report data to a file
         self.write_data_file(self.somalier_data, "multiqc_somalier")
+        self.somalier_pairs.write_data_file("multiqc_somalier_pairs")
 
         # Somalier Stats Table
         self.somalier_stats_table()
@@ -123,38 +132,6 @@ class MultiqcModule(BaseMultiqcModule):
             return None
         return parsed_data
 
-    @staticmethod
-    def parse_somalier_pairs_tsv(f):
-        """Parse csv output from somalier"""
-        parsed_data = dict()
-        headers = None
-        s_name_idx = None
-        for line in f["f"].splitlines():
-            s = line.lstrip("#").split("\t")
-            if headers is None:
-                headers = s
-                try:
-                    s_name_idx = [headers.index("sample_a"), headers.index("sample_b")]
-                except ValueError:
-                    log.warning(f"Could not find sample name in somalier output: {f['fn']}")
-                    return None
-            else:
-                s_name = "*".join([s[idx] for idx in s_name_idx])  # not safe to hard code, but works
-                parsed_data[s_name] = dict()
-                for i, v in enumerate(s):
-                    if i not in s_name_idx:  # Skip if (i == 0 or 1); i.e. sample_a, sample_b
-                        if isnan(float(v)) or isinf(float(v)):
-                            # Inf or NaN indicate the absence of data
-                            v = None
-                        else:
-                            # add the pattern as a suffix to key
-                            v = float(v)
-                        parsed_data[s_name][headers[i]] = v
-
-        if len(parsed_data) == 0:
-            return None
-        return parsed_data
-
     def parse_somalier_ancestry(self, f):
         # dict for parsed data, ancestry prediction probabilities and PCs
         parsed_data = dict()
@@ -425,32 +402,39 @@ class MultiqcModule(BaseMultiqcModule):
         extra_colours = _make_col_alpha(extra_colours, alpha)
         extra_colour_idx = 0
         data = dict()
-        for pair, d in self.somalier_data.items():
-            if "expected_relatedness" not in d:
-                continue
-
-            relatedness = d["expected_relatedness"]
+        pairs = self.somalier_pairs
+        if "expected_relatedness" in pairs:
+            expected = pairs.column("expected_relatedness")
             # -1 is not the same family, 0 is same family but unrelated
             # @brentp says he usually bundles them together
-            if relatedness == -1:
-                relatedness = 0
-
-            # New unique value that we've not seen before
-            if relatedness not in relatedness_groups:
-                relatedness_groups[relatedness] = {
-                    "name": str(relatedness),
-                    "color": extra_colours[extra_colour_idx],
+            expected = np.where(expected == -1, 0, expected)
+
+            # Group the pairs by value, with None for missing values
+            values, first_idx, group_idx = np.unique(expected, return_index=True, return_inverse=True)
+            values = [None if np.isnan(v) else v for v in values.tolist()]
+
+            # New unique values that we've not seen before, in the order they first appear
+            for i in np.argsort(first_idx, kind="stable").tolist():
+                relatedness = values[i]
+                if relatedness not in relatedness_groups:
+                    relatedness_groups[relatedness] = {
+                        "name": str(relatedness),
+                        "color": extra_colours[extra_colour_idx],
+                    }
+                    extra_colour_idx += 0
+                    if extra_colour_idx > len(extra_colours):
+                        extra_colour_idx = 0
+            groups = [relatedness_groups[v] for v in values]
+
+            for pair, x, y, gi in zip(
+                pairs.pair_names(), pairs.values("ibs0"), pairs.values("ibs2"), group_idx.ravel().tolist()
+            ):
+                data[pair] = {
+                    "x": x,
+                    "y": y,
+                    "color": groups[gi]["color"],
+                    "group": groups[gi]["name"],
                 }
-                extra_colour_idx += 0
-                if extra_colour_idx > len(extra_colours):
-                    extra_colour_idx = 0
-
-            data[pair] = {
-                "x": d["ibs0"],
-                "y": d["ibs2"],
-                "color": relatedness_groups[relatedness]["color"],
-                "group": relatedness_groups[relatedness]["name"],
-            }
 
         if len(data) == 0:
             return
@@ -481,27 +465,11 @@ class MultiqcModule(BaseMultiqcModule):
         # inspiration: MultiQC/modules/vcftools/relatedness2.py
 
         data = []
-        labels = set()
-        rels = defaultdict(dict)
-        for s_name, d in self.somalier_data.items():
-            if "relatedness" in d:
-                a, b = s_name.split("*")
-                labels.add(a)
-                labels.add(b)
-                rels[a][b] = rels[b][a] = d["relatedness"]
-                rels[a][a] = rels[b][b] = 1.0
-
-        # impose alphabetical order and avoid json serialisation errors in utils.report
-        labels = sorted(labels)
-
-        for x in labels:
-            line = []
-            for y in labels:
-                try:
-                    line.append(rels[x][y])
-                except KeyError:
-                    line.append(None)
-            data.append(line)
+        labels = []
+        if "relatedness" in self.somalier_pairs:
+            # impose alphabetical order
+            labels = sorted(self.somalier_pairs.samples)
+            data = self.somalier_pairs.matrix("relatedness", labels, symmetric=True, diagonal=1.0)
 
         if len(data) > 0:
             pconfig = {
@@ -1,12 +1,12 @@
 """ MultiQC module to parse output from Space Ranger count """
 
-import json
 import logging
 import os
 from collections import OrderedDict
 
 from multiqc import config
 from multiqc.plots import linegraph, table
+from multiqc.utils import loaders
 
 from ._utils import set_hidden_cols, transform_data, update_dict
 
@@ -153,7 +153,7 @@ class SpaceRangerCountMixin:
             line = line.strip()
             if line.startswith("const data"):
                 line = line.replace("const data = ", "")
-                summary = json.loads(line)
+                summary = loaders.load_json(line)
                 summary = summary["summary"]
                 break
 
@@ -2,10 +2,12 @@
 
 
 import logging
-import json
+
+import numpy as np
 
 from multiqc.modules.base_module import BaseMultiqcModule, ModuleNoSamplesFound
 from multiqc.plots import bargraph, linegraph
+from multiqc.utils import loaders
 
 
 # Initialise the logger
@@ -66,7 +68,7 @@ class MultiqcModule(BaseMultiqcModule):
     def parse_log(self, seg):
         data_dict = dict()
         for f in self.find_log_files(f"starsolo/{seg}"):
-            parsed_data = json.loads(f["f"])
+            parsed_data = loaders.load_json(f["f"])
             if parsed_data is not None:
                 s_name = f["s_name"].removesuffix(f".{seg}")
                 if s_name in data_dict:
@@ -165,10 +167,10 @@ class MultiqcModule(BaseMultiqcModule):
                 cur = umi_count_data[sample][sub]
                 if not cur:
                     continue
-                new = {}
-                for k, v in cur.items():
-                    new[int(k)] = v
-                plot_data[sub] = new
+                plot_data[sub] = linegraph.Series(
+                    np.fromiter(cur.keys(), dtype=np.int64, count=len(cur)),
+                    np.fromiter(cur.values(), dtype=float, count=len(cur)),
+                )
                 if "pure" in sub:
                     colors[sub] = "darkblue"
                 elif "mix" in sub:
@@ -1,10 +1,9 @@
 """ MultiQC module to parse relatedness output from vcftools relatedness """
 
-import csv
 import logging
-from collections import defaultdict
 
 from multiqc.plots import heatmap
+from multiqc.utils.pairwise import PairwiseTable, read_pairs
 
 # Initialise the logger
 log = logging.getLogger(__name__)
@@ -15,7 +14,7 @@ class Relatedness2Mixin:
         matrices = {}
         for f in self.find_log_files("vcftools/relatedness2", filehandles=True):
             m = _Relatedness2Matrix(f)
-            if m.data and m.x_labels and m.y_labels:
+            if len(m.data) and m.x_labels and m.y_labels:
                 matrices[f["s_name"]] = m
             self.add_data_source(f, section="Relatedness")
 
@@ -30,8 +29,10 @@ class Relatedness2Mixin:
 
         log.info(f"Found {len(matrices)} valid relatedness2 matrices")
 
-        # The matrices cannot be written to a file in their current format
-        # self.write_data_file(matrices, "vcftools_relatedness")
+        # The pairs are written by PairwiseTable as a binary file, rather than with self.write_data_file(),
+        # so that they are not kept in memory a second time as saved raw data
+        for name, m in matrices.items():
+            m.pairs.write_data_file(f"vcftools_relatedness2_{name}")
 
         helptext = """
         `RELATEDNESS_PHI` gives a relatedness score between two samples. A higher score indicates a higher degree of
@@ -67,27 +68,12 @@ class Relatedness2Mixin:
 
 class _Relatedness2Matrix:
     def __init__(self, relatedness_file):
-        self.data = []
-        self.x_labels = set()
-        self.y_labels = set()
-
-        self.parse(relatedness_file["f"])
-
-    def parse(self, f):
-        rels = defaultdict(dict)
-        r = csv.DictReader(f, delimiter="\t")
-        for line in r:
-            self.x_labels.add(line["INDV1"])
-            self.y_labels.add(line["INDV2"])
+        self.pairs = PairwiseTable()
+        read_pairs(self.pairs, relatedness_file["f"], sample_cols=("INDV1", "INDV2"))
 
-            rels[line["INDV1"]][line["INDV2"]] = float(line["RELATEDNESS_PHI"])
-
-        # impose alphabetical order and avoid json serialisation errors in utils.report
-        self.x_labels = sorted(self.x_labels)
-        self.y_labels = sorted(self.y_labels)
-
-        for x in self.x_labels:
-            line = []
-            for y in self.y_labels:
-                line.append(rels[x][y])
-            self.data.append(line)
+        # impose alphabetical order
+        self.x_labels = self.pairs.names_a()
+        self.y_labels = self.pairs.names_b()
+        self.data = []
+        if "RELATEDNESS_PHI" in self.pairs:
+            self.data = self.pairs.matrix("RELATEDNESS_PHI", self.x_labels, self.y_labels)
@@ -20,6 +20,7 @@ import tempfile
 import time
 import json
 import traceback
+from typing import Dict
 
 import jinja2
 import requests
@@ -30,7 +31,20 @@ from rich.syntax import Syntax
 
 from .modules.base_module import ModuleNoSamplesFound
 from .plots import table
-from .utils import config, log, megaqc, plugin_hooks, report, software_versions, strict_helpers, util_functions
+from .utils import (
+    config,
+    events,
+    log,
+    megaqc,
+    plugin_hooks,
+    report,
+    report_cache,
+    software_versions,
+    spill,
+    staging,
+    strict_helpers,
+    util_functions,
+)
 from .utils.util_functions import strtobool
 
 # Set up logging
@@ -105,6 +119,7 @@ click.rich_click.OPTION_GROUPS = {
                 "--zip-data-dir",
                 "--no-report",
                 "--pdf",
+                "--update",
             ],
         },
         {
@@ -116,8 +131,11 @@ click.rich_click.OPTION_GROUPS = {
                 "--development",
                 "--require-logs",
                 "--profile-runtime",
+                "--events-file",
+                "--low-memory",
                 "--no-megaqc-upload",
                 "--no-ansi",
+                "--client",
                 "--version",
                 "--help",
             ],
@@ -253,6 +271,12 @@ click.rich_click.OPTION_GROUPS = {
     is_flag=True,
     help="Creates PDF report with the [i]'simple'[/] template. Requires [link=https://pandoc.org/]Pandoc[/] to be installed.",
 )
+@click.option(
+    "--update",
+    "update_dir",
+    type=click.Path(exists=True, file_okay=False),
+    help="Regenerate the report in this directory, only running the modules whose input files have changed",
+)
 @click.option(
     "--no-megaqc-upload",
     "no_megaqc_upload",
@@ -271,7 +295,19 @@ click.rich_click.OPTION_GROUPS = {
 @click.option("-v", "--verbose", count=True, default=0, help="Increase output verbosity.")
 @click.option("-q", "--quiet", is_flag=True, help="Only show log warnings")
 @click.option("--profile-runtime", is_flag=True, help="Add analysis of how long MultiQC takes to run to the report")
+@click.option(
+    "--events-file",
+    "events_file",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write timings, sizes and counts of the run, modules and plots to a file as JSON lines",
+)
 @click.option("--no-ansi", is_flag=True, help="Disable coloured log output")
+@click.option(
+    "--low-memory",
+    "low_memory",
+    is_flag=True,
+    help="Keep parsed data on disk instead of in memory, for very large numbers of samples",
+)
 @click.option(
     "--custom-css-file",
     "custom_css_files",
@@ -279,6 +315,11 @@ click.rich_click.OPTION_GROUPS = {
     multiple=True,
     help="Custom CSS file to add to the final report",
 )
+@click.option(
+    "--client",
+    is_flag=True,
+    help="Send the run to a MultiQC server started with '[blue bold]multiqc serve[/]'",
+)
 @click.version_option(config.version, prog_name="multiqc")
 def run_cli(**kwargs):
     # Main MultiQC run command for use with the click command line, complete with all click function decorators.
@@ -295,6 +336,12 @@ def run_cli(**kwargs):
     For example, to run in the current working directory, use '[blue bold]multiqc .[/]'
     """
 
+    # Forward the command line to a running server instead of running here
+    if kwargs.pop("client", False):
+        from .serve import run_client
+
+        sys.exit(run_client([arg for arg in sys.argv[1:] if arg != "--client"]))
+
     # Pass on to a regular function that can be used easily without click
     multiqc_run = run(**kwargs)
 
@@ -303,6 +350,7 @@ def run_cli(**kwargs):
 
 
 # Main function that runs MultiQC. Available to use within an interactive Python environment
+@events.traced_run
 def run(
     analysis_dir,
     dirs=False,
@@ -337,14 +385,19 @@ def run(
     lint=False,  # Deprecated since v1.17
     development=False,
     make_pdf=False,
+    update_dir=None,
     no_megaqc_upload=False,
     config_file=(),
     cl_config=(),
     verbose=0,
     quiet=False,
     profile_runtime=False,
+    events_file=None,
     no_ansi=False,
+    low_memory=False,
     custom_css_files=(),
+    found_files=None,
+    snapshot_dir=None,
     **kwargs,
 ):
     """MultiQC aggregates results from bioinformatics analyses across many samples into a single report.
@@ -505,6 +558,14 @@ def run(
             config.export_plot_formats.append("png")
     if make_pdf:
         config.template = "simple"
+    if update_dir is not None:
+        # Overwrite the report in place
+        config.update_dir = os.path.realpath(update_dir)
+        config.output_dir = config.update_dir
+        config.force = True
+    if snapshot_dir is not None:
+        # Restore the modules of a snapshot instead of running them, see multiqc.slicing
+        config.snapshot_dir = os.path.realpath(snapshot_dir)
     if no_megaqc_upload:
         config.megaqc_upload = False
     else:
@@ -525,8 +586,12 @@ def run(
         config.require_logs = True
     if profile_runtime:
         config.profile_runtime = True
+    if events_file:
+        config.events_file = events_file
     if no_ansi:
         config.no_ansi = True
+    if low_memory:
+        config.low_memory = True
     if custom_css_files:
         config.custom_css_files.extend(custom_css_files)
     config.kwargs = kwargs  # Plugin command line options
@@ -559,15 +624,19 @@ def run(
     del plots_interactive
     del strict
     del lint
+    del update_dir
     del no_megaqc_upload
     del config_file
     del cl_config
     del verbose
     del quiet
     del profile_runtime
+    del events_file
     del no_ansi
+    del low_memory
     del custom_css_files
 
+    events.start_run()
     plugin_hooks.mqc_trigger("execution_start")
 
     logger.debug(f"Working dir : {os.getcwd()}")
@@ -679,21 +748,6 @@ def run(
     run_module_names = [list(m.keys())[0] for m in run_modules]
     logger.debug(f"Analysing modules: {', '.join(run_module_names)}")
 
-    # Create the temporary working directories
-    tmp_dir = tempfile.mkdtemp()
-    logger.debug(f"Using temporary directory for creating report: {tmp_dir}")
-    config.data_tmp_dir = os.path.join(tmp_dir, "multiqc_data")
-    if filename != "stdout" and config.make_data_dir is True:
-        config.data_dir = config.data_tmp_dir
-        os.makedirs(config.data_dir)
-    else:
-        config.data_dir = None
-    config.plots_tmp_dir = os.path.join(tmp_dir, "multiqc_plots")
-    if filename != "stdout" and config.export_plots is True:
-        config.plots_dir = config.plots_tmp_dir
-        os.makedirs(config.plots_dir)
-    else:
-        config.plots_dir = None
     if not config.make_report:
         config.output_fn = None
 
@@ -719,21 +773,57 @@ def run(
         run_module_names.append("software_versions")
 
     # Get the list of files to search
-    for d in config.analysis_dir:
-        logger.info(f"Search path : {os.path.abspath(d)}")
-    report.get_filelist(run_module_names)
+    if config.snapshot_dir is not None:
+        # Nothing to search, the modules are restored from the snapshot
+        run_modules = report_cache.snapshot_modules()
+        run_module_names = [list(m.keys())[0] for m in run_modules]
+        logger.info(f"Snapshot    : {os.path.relpath(config.snapshot_dir)}")
+    elif found_files is not None:
+        # Files found by a search shared with other reports, see multiqc.batch
+        report.use_files(found_files, run_module_names)
+    else:
+        for d in config.analysis_dir:
+            logger.info(f"Search path : {os.path.abspath(d)}")
+        report.get_filelist(run_module_names)
 
     # Only run the modules for which any files were found
-    non_empty_modules = {key.split("/")[0].lower() for key, files in report.files.items() if len(files) > 0}
-    # Always run custom content, as it can have data purely from a MultiQC config file (no search files)
-    if "custom_content" not in non_empty_modules:
-        non_empty_modules.add("custom_content")
-    run_modules = [m for m in run_modules if list(m.keys())[0].lower() in non_empty_modules]
-    run_module_names = [list(m.keys())[0] for m in run_modules]
+    if config.snapshot_dir is None:
+        non_empty_modules = {key.split("/")[0].lower() for key, files in report.files.items() if len(files) > 0}
+        # Always run custom content, as it can have data purely from a MultiQC config file (no search files)
+        if "custom_content" not in non_empty_modules:
+            non_empty_modules.add("custom_content")
+        run_modules = [m for m in run_modules if list(m.keys())[0].lower() in non_empty_modules]
+        run_module_names = [list(m.keys())[0] for m in run_modules]
 
     if not _required_logs_found(run_module_names):
         return {"report": report, "config": config, "sys_exit_code": 1}
 
+    # Create the temporary working directory for the report template, and the staging
+    # directory for data and plot files. The latter is created inside the output directory
+    # where possible, so that the files can be published with a rename at the end.
+    tmp_dir = tempfile.mkdtemp()
+    logger.debug(f"Using temporary directory for creating report: {tmp_dir}")
+    stage_dir = tmp_dir
+    if filename != "stdout" and (config.make_data_dir is True or config.export_plots is True):
+        stage_dir = staging.init(config.output_dir, tmp_dir)
+    config.data_tmp_dir = os.path.join(stage_dir, "multiqc_data")
+    if filename != "stdout" and config.make_data_dir is True:
+        config.data_dir = config.data_tmp_dir
+        os.makedirs(config.data_dir)
+        if config.zip_data_dir:
+            staging.start_zip(config.data_dir)
+    else:
+        config.data_dir = None
+    config.plots_tmp_dir = os.path.join(stage_dir, "multiqc_plots")
+    if filename != "stdout" and config.export_plots is True:
+        config.plots_dir = config.plots_tmp_dir
+        os.makedirs(config.plots_dir)
+    else:
+        config.plots_dir = None
+    if config.low_memory:
+        report.init_low_memory(tmp_dir)
+    report_cache.init()
+
     # Run the modules!
     plugin_hooks.mqc_trigger("before_modules")
     report.modules_output = list()
@@ -745,10 +835,20 @@ def run(
         mod_cust_config = list(mod_dict.values())[0]
         if mod_cust_config is None:
             mod_cust_config = {}
+        n_outputs = len(report.modules_output)
+        mod_span = events.start_span("module", module=this_module)
+        mod_error = None
+        mod_cache = report_cache.start_module(this_module, mod_cust_config)
         try:
-            mod = config.avail_modules[this_module].load()
-            mod.mod_cust_config = mod_cust_config  # feels bad doing this, but seems to work
-            output = mod()
+            # With --update, reuse the output of the report being updated if the inputs are the same.
+            # For multiqc slice, restore the output from the snapshot for the selected samples.
+            output = report_cache.restore_module(mod_cache)
+            if output is not None:
+                mod_span.set(reused=True)
+            else:
+                mod = config.avail_modules[this_module].load()
+                mod.mod_cust_config = mod_cust_config  # feels bad doing this, but seems to work
+                output = mod()
             if not isinstance(output, list):
                 output = [output]
             for m in output:
@@ -781,8 +881,13 @@ def run(
                 except AttributeError:
                     pass
 
+            report.store_module_raw_data()
+            report_cache.end_module(mod_cache, output)
         except ModuleNoSamplesFound:
             logger.debug(f"No samples found: {this_module}")
+            mod_span.set(no_samples_found=True)
+            report.store_module_raw_data()
+            report_cache.end_module(mod_cache, [])
         except UserWarning:  # UserWarning deprecated from 1.16
             msg = f"DEPRECIATED: Please raise 'ModuleNoSamplesFound' instead of 'UserWarning' in module: {this_module}"
             if config.strict:
@@ -792,7 +897,9 @@ def run(
                 logger.debug(msg)
             logger.debug(f"No samples found: {this_module}")
         except KeyboardInterrupt:
+            spill.close()
             shutil.rmtree(tmp_dir)
+            staging.cleanup()
             logger.critical(
                 "User Cancelled Execution!\n{eq}\n{tb}{eq}\n".format(eq=("=" * 60), tb=traceback.format_exc())
                 + "User Cancelled Execution!\nExiting MultiQC..."
@@ -851,8 +958,11 @@ def run(
             )
             # Exit code 1 for CI failures etc
             sys_exit_code = 1
+            mod_error = f"{sys.exc_info()[0].__name__}: {sys.exc_info()[1]}"
 
         report.runtimes["mods"][run_module_names[mod_idx]] = time.time() - mod_starttime
+        if events.enabled():
+            mod_span.end(error=mod_error, **_module_event_attributes(report.modules_output[n_outputs:]))
     report.runtimes["total_mods"] = time.time() - total_mods_starttime
 
     # Again, if config.require_logs is set, check if for all explicitly requested
@@ -879,7 +989,10 @@ def run(
     # Did we find anything?
     if len(report.modules_output) == 0:
         logger.warning("No analysis results found. Cleaning up..")
+        util_functions.wait_for_data_files()
+        spill.close()
         shutil.rmtree(tmp_dir)
+        staging.cleanup()
         logger.info("MultiQC complete")
         # Exit with an error code if a module broke
         return {"report": report, "config": config, "sys_exit_code": sys_exit_code}
@@ -984,26 +1097,34 @@ def run(
         # Create a file with the module DOIs
         report.dois_tofile(report.modules_output)
 
+        # Record the output of the modules for --update
+        report_cache.write_cache(config.data_dir)
+
     if config.make_report:
         # Compress the report plot JSON data
         runtime_compression_start = time.time()
         logger.debug("Compressing plot data")
-        report.plot_compressed_json = report.compress_json(report.plot_data)
+        report.compress_plot_data()
         report.runtimes["total_compression"] = time.time() - runtime_compression_start
 
     plugin_hooks.mqc_trigger("before_report_generation")
 
     # Data Export / MegaQC integration - save report data to file or send report data to an API endpoint
-    if config.data_dump_file or (config.megaqc_url and config.megaqc_upload):
-        multiqc_json_dump = util_functions.multiqc_dump_json(report)
-        if config.data_dump_file:
-            util_functions.write_data_file(multiqc_json_dump, "multiqc_data", False, "json")
-        if config.megaqc_url:
-            megaqc.multiqc_api_post(multiqc_json_dump)
+    dump_fpath = None
+    if config.data_dump_file and config.data_dir is not None:
+        dump_fpath = os.path.join(config.data_dir, "multiqc_data.json")
+    megaqc_post = bool(config.megaqc_url and config.megaqc_upload)
+    if dump_fpath or megaqc_post:
+        megaqc_body = util_functions.export_multiqc_json(report, dump_fpath, megaqc_body=megaqc_post)
+        if megaqc_post:
+            megaqc.multiqc_api_post(megaqc_body)
 
     if config.development:
         with open(os.path.join(config.data_dir, "multiqc_plots.js"), "w") as f:
-            f.write(json.dumps(report.plot_data))
+            f.write(json.dumps(dict(report.plot_data.items())))
+
+    # Data files are written in the background, make sure that they are all on disk
+    util_functions.wait_for_data_files()
 
     # Make the final report path & data directories
     if filename != "stdout":
@@ -1079,18 +1200,13 @@ def run(
                     "   (overwritten)" if deleted_data_dir else "",
                 )
             )
-            # Modules have run, so data directory should be complete by now. Move its contents.
-            logger.debug(f"Moving data file from '{config.data_tmp_dir}' to '{config.data_dir}'")
-            shutil.copytree(
-                config.data_tmp_dir,
-                config.data_dir,
-                # Override default shutil.copy2 function to copy files. The default
-                # function copies times and mode, which we want to avoid on purpose
-                # to get around the problem with mounted CIFS shares (see #625).
-                # shutil.copyfile only copies the file without any metadata.
-                copy_function=shutil.copyfile,
-            )
-            shutil.rmtree(config.data_tmp_dir)
+            # Modules have run, so data directory should be complete by now. Publish it.
+            if config.zip_data_dir:
+                logger.debug(f"Moving zipped data from '{config.data_tmp_dir}.zip' to '{config.data_dir}.zip'")
+                staging.publish_zip(f"{config.data_dir}.zip")
+            else:
+                logger.debug(f"Moving data directory from '{config.data_tmp_dir}' to '{config.data_dir}'")
+                staging.publish(config.data_tmp_dir, config.data_dir)
 
         if config.output_fn is not None:
             logger.debug(f"Full report path: {os.path.realpath(config.output_fn)}")
@@ -1104,7 +1220,9 @@ def run(
                 else:
                     logger.error(f"Output directory {config.plots_dir} already exists.")
                     logger.info("Use -f or --force to overwrite existing reports")
+                    spill.close()
                     shutil.rmtree(tmp_dir)
+                    staging.cleanup()
                     return {"report": report, "config": config, "sys_exit_code": 1}
             logger.info(
                 "Plots       : {}{}".format(
@@ -1113,18 +1231,9 @@ def run(
                 )
             )
 
-            # Modules have run, so plots directory should be complete by now. Move its contents.
+            # Modules have run, so plots directory should be complete by now. Publish it.
             logger.debug(f"Moving plots directory from '{config.plots_tmp_dir}' to '{config.plots_dir}'")
-            shutil.copytree(
-                config.plots_tmp_dir,
-                config.plots_dir,
-                # Override default shutil.copy2 function to copy files. The default
-                # function copies times and mode, which we want to avoid on purpose
-                # to get around the problem with mounted CIFS shares (see #625).
-                # shutil.copyfile only copies the file without any metadata.
-                copy_function=shutil.copyfile,
-            )
-            shutil.rmtree(config.plots_tmp_dir)
+            staging.publish(config.plots_tmp_dir, config.plots_dir)
 
     plugin_hooks.mqc_trigger("before_template")
 
@@ -1191,13 +1300,24 @@ def run(
 
         # Use jinja2 to render the template and overwrite
         config.analysis_dir = [os.path.realpath(d) for d in config.analysis_dir]
-        report_output = j_template.render(report=report, config=config)
+        runtime_render_start = time.time()
+        render_span = events.start_span("render", template=config.template, low_memory=config.low_memory)
         if filename == "stdout":
+            report_output = j_template.render(report=report, config=config)
+            report.runtimes["total_render"] = time.time() - runtime_render_start
+            render_span.end(bytes=len(report_output))
             print(report_output.encode("utf-8"), file=sys.stdout)
         else:
             try:
                 with io.open(config.output_fn, "w", encoding="utf-8") as f:
-                    print(report_output, file=f)
+                    if config.low_memory:
+                        # Write the report as it is rendered, without holding all of it in memory
+                        j_template.stream(report=report, config=config).dump(f)
+                        f.write("\n")
+                    else:
+                        print(j_template.render(report=report, config=config), file=f)
+                report.runtimes["total_render"] = time.time() - runtime_render_start
+                render_span.end(bytes=os.path.getsize(config.output_fn))
             except IOError as e:
                 raise IOError(f"Could not print report to '{config.output_fn}' - {IOError(e)}")
 
@@ -1210,13 +1330,10 @@ def run(
             except AttributeError:
                 pass  # No files to copy
 
-    # Clean up temporary directory
+    # Clean up temporary directories
+    spill.close()
     shutil.rmtree(tmp_dir)
-
-    # Zip the data directory if requested
-    if config.zip_data_dir and config.data_dir is not None:
-        shutil.make_archive(config.data_dir, "zip", config.data_dir)
-        shutil.rmtree(config.data_dir)
+    staging.cleanup()
 
     # Try to create a PDF if requested
     if make_pdf:
@@ -1262,8 +1379,13 @@ def run(
         logger.warning(f"Run took {report.runtimes['total']:.2f} seconds")
         logger.warning(f" - {report.runtimes['total_sp']:.2f}s: Searching files")
         logger.warning(f" - {report.runtimes['total_mods']:.2f}s: Running modules")
+        logger.warning(
+            f" - {sum(report.file_bytes_read.values()) / 1024 / 1024:.2f} MB read from files, "
+            f"of {sum(report.matched_file_bytes().values()) / 1024 / 1024:.2f} MB in matched files"
+        )
         if config.make_report:
             logger.warning(f" - {report.runtimes['total_compression']:.2f}s: Compressing report data")
+            logger.warning(f" - {report.runtimes['total_render']:.2f}s: Rendering the report template")
             logger.info(f"For more information, see the 'Run Time' section in {os.path.relpath(config.output_fn)}")
 
     if report.num_mpl_plots > 0 and not config.plots_force_flat:
@@ -1279,6 +1401,7 @@ def run(
         sys_exit_code = 1
 
     logger.info("MultiQC complete")
+    events.end_run(exit_code=sys_exit_code)
 
     # Move the log file into the data directory
     log.move_tmp_log(logger)
@@ -1292,6 +1415,21 @@ def run(
     return {"report": report, "config": config, "sys_exit_code": sys_exit_code}
 
 
+def _module_event_attributes(modules) -> Dict:
+    """Counts for the event of a module run, from the module objects that it returned"""
+    samples, files = set(), set()
+    for mod in modules:
+        for section in report.data_sources.get(mod.name, {}).values():
+            samples.update(section.keys())
+            files.update(section.values())
+    return {
+        "anchors": ",".join(mod.anchor for mod in modules),
+        "n_samples": len(samples),
+        "n_files": len(files),
+        "n_sections": sum(len(mod.sections) for mod in modules),
+    }
+
+
 def _required_logs_found(modules_with_logs):
     if config.require_logs:
         required_modules_with_no_logs = [
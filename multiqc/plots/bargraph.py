@@ -4,8 +4,9 @@
 import inspect
 import logging
 from collections import OrderedDict
+from typing import Dict, List
 
-import math
+import numpy as np
 import re
 
 from multiqc.utils import config, mqc_colour, report
@@ -86,11 +87,7 @@ def plot(data, cats=None, pconfig=None):
         try:
             cats[idx]
         except IndexError:
-            cats.append(list())
-            for s in data[idx].keys():
-                for k in data[idx][s].keys():
-                    if k not in cats[idx]:
-                        cats[idx].append(k)
+            cats.append(list(dict.fromkeys(k for s in data[idx].keys() for k in data[idx][s].keys())))
 
     # If we have cats in lists, turn them into dicts
     for idx, cat in enumerate(cats):
@@ -112,68 +109,44 @@ def plot(data, cats=None, pconfig=None):
                     for kk, vv in v.items():
                         cats[idx][k][kk] = vv
 
-    # Parse the data into a chart friendly format
+    # Parse the data into a (samples x categories) matrix, with a mask of the values that are set
     plotsamples = list()
-    plotdata = list()
+    plotcats = list()
+    plotvalues = list()
     for idx, d in enumerate(data):
         hc_samples = list(d.keys())
+        cat_keys = list(cats[idx].keys())
+        values = _values_matrix(d, hc_samples, cat_keys)
         if isinstance(d, OrderedDict):
             # Legacy: users assumed that passing an OrderedDict indicates that we
             # want to keep the sample order https://github.com/MultiQC/MultiQC/issues/2204
             pass
-        elif pconfig.get("sort_samples", True):
-            hc_samples = sorted(list(d.keys()))
-        hc_data = list()
-        sample_dcount = dict()
-        for c in cats[idx].keys():
-            thisdata = list()
-            catcount = 0
-            for s in hc_samples:
-                if s not in sample_dcount:
-                    sample_dcount[s] = 0
-
-                if s not in d or c not in d[s]:
-                    # Pad with NaNs when we have missing categories in a sample
-                    thisdata.append(float("nan"))
-                    continue
-                val = d[s][c]
-                if not isinstance(val, (float, int)):
-                    try:
-                        val = int(val)
-                    except ValueError:
-                        try:
-                            val = float(val)
-                        except ValueError:
-                            val = None
-                if val is None:
-                    # Pad with NaNs when we have missing categories in a sample
-                    thisdata.append(float("nan"))
-                    continue
-                if isinstance(val, float):
-                    if math.floor(val) == val:
-                        val = int(val)
-                thisdata.append(val)
-                catcount += 1
-                sample_dcount[s] += 1
-            if catcount > 0:
-                if pconfig.get("hide_zero_cats", True) is False or max(x for x in thisdata if not math.isnan(x)) > 0:
-                    thisdict = {"name": cats[idx][c]["name"], "data": thisdata}
-                    if "color" in cats[idx][c]:
-                        thisdict["color"] = cats[idx][c]["color"]
-                    hc_data.append(thisdict)
-
+        elif pconfig.get("sort_samples", True) and hc_samples:
+            order = np.argsort(np.array(hc_samples), kind="stable")
+            hc_samples = [hc_samples[i] for i in order]
+            values = values[order]
+        mask = ~np.isnan(values)
+
+        # Keep categories with any values, and unless hide_zero_cats is False, with positive values
+        keep_cats = mask.any(axis=0)
+        if pconfig.get("hide_zero_cats", True) is not False:
+            keep_cats &= np.where(mask, values, 0).max(axis=0, initial=0) > 0
         # Remove empty samples
-        for s, c in sample_dcount.items():
-            if c == 0:
-                idx = hc_samples.index(s)
-                del hc_samples[idx]
-                for j, d in enumerate(hc_data):
-                    del hc_data[j]["data"][idx]
-        if len(hc_data) > 0:
-            plotsamples.append(hc_samples)
-            plotdata.append(hc_data)
-
-    if len(plotdata) == 0:
+        keep_samples = mask.any(axis=1)
+        if not keep_cats.any():
+            continue
+
+        hc_cats = list()
+        for i in np.flatnonzero(keep_cats).tolist():
+            thiscat = {"name": cats[idx][cat_keys[i]]["name"]}
+            if "color" in cats[idx][cat_keys[i]]:
+                thiscat["color"] = cats[idx][cat_keys[i]]["color"]
+            hc_cats.append(thiscat)
+        plotsamples.append([s for s, keep in zip(hc_samples, keep_samples.tolist()) if keep])
+        plotcats.append(hc_cats)
+        plotvalues.append(values[keep_samples][:, keep_cats])
+
+    if len(plotcats) == 0:
         logger.warning(f"Tried to make bar plot, but had no data: {pconfig.get('id')}")
         return '<p class="text-danger">Error - was not able to plot data.</p>'
 
@@ -181,13 +154,18 @@ def plot(data, cats=None, pconfig=None):
     # identical to default scale of the Highcharts JS library, this is not strictly
     # needed. But it future proofs when we replace Highcharts with something else.
     scale = mqc_colour.mqc_colour_scale("plot_defaults")
-    for si, sd in enumerate(plotdata):
+    for sd in plotcats:
         for di, d in enumerate(sd):
             d.setdefault("color", scale.get_colour(di, lighten=1))
 
     # Make a plot - custom, interactive or flat
     mod = get_template_mod()
     if "bargraph" in mod.__dict__ and callable(mod.bargraph):
+        # Custom templates take one list of values per category
+        plotdata = [
+            [dict(cat, data=bar.pack_values(values[:, i], missing=float("nan"))) for i, cat in enumerate(cats)]
+            for cats, values in zip(plotcats, plotvalues)
+        ]
         try:
             return mod.bargraph(plotdata, plotsamples, pconfig)
         except:  # noqa: E722
@@ -196,4 +174,32 @@ def plot(data, cats=None, pconfig=None):
                 # debugging of modules
                 raise
 
-    return bar.plot(plotdata, plotsamples, pconfig)
+    return bar.plot(plotcats, plotsamples, pconfig, values_lists=plotvalues)
+
+
+def _values_matrix(d: Dict, samples: List, cat_keys: List) -> np.ndarray:
+    """
+    Values of the categories of each sample as a (samples x categories) float matrix,
+    with NaN for missing values and for values that are not numbers
+    """
+    rows = [[d[s].get(c) for c in cat_keys] for s in samples]
+    try:
+        return np.array(rows, dtype=float).reshape(len(samples), len(cat_keys))
+    except (ValueError, TypeError):
+        pass
+    # Some values are not numbers, so convert them one by one
+    values = np.full((len(samples), len(cat_keys)), np.nan)
+    for i, row in enumerate(rows):
+        for j, val in enumerate(row):
+            if val is None:
+                continue
+            if not isinstance(val, (float, int)):
+                try:
+                    val = int(val)
+                except ValueError:
+                    try:
+                        val = float(val)
+                    except ValueError:
+                        continue
+            values[i, j] = val
+    return values
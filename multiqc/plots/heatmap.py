@@ -24,7 +24,7 @@ def get_template_mod():
 
 def plot(data, xcats=None, ycats=None, pconfig=None):
     """Plot a 2D heatmap.
-    :param data: List of lists, each a representing a row of values; or a dict of dicts
+    :param data: List of lists, each a representing a row of values; a dict of dicts; or a 2D NumPy array
     :param xcats: Labels for x-axis
     :param ycats: Labels for y-axis. Defaults to same as x.
     :param pconfig: optional dict with config key:value pairs.
@@ -3,10 +3,13 @@
 import inspect
 import logging
 import re
-from typing import List, Dict
+from typing import List, Dict, Union
+
+import numpy as np
 
 from multiqc.utils import config, mqc_colour, report
 from multiqc.plots.plotly import line
+from multiqc.plots.plotly.line import Series
 
 logger = logging.getLogger(__name__)
 
@@ -26,7 +29,8 @@ def get_template_mod():
 
 def plot(data, pconfig=None):
     """Plot a line graph with X,Y data.
-    :param data: 2D dict, first keys as sample names, then x:y data pairs
+    :param data: 2D dict, first keys as sample names, then x:y data pairs. Instead of
+                 an x:y dict, a sample can have a Series with the x and y values as arrays
     :param pconfig: optional dict with config key:value pairs. See CONTRIBUTING.md
     :return: HTML and JS, ready to be inserted into the page
     """
@@ -123,12 +127,18 @@ def plot(data, pconfig=None):
             series_config = dataset_config.copy()
             pairs = []
             maxval = 0
-            if "categories" in series_config:
+            if isinstance(d[s], Series) and "categories" not in series_config:
+                pairs = _series_in_range(d[s], series_config)
+                y = pairs.y
+                if len(y) > 0:
+                    maxval = max(maxval, np.max(y, initial=0, where=~np.isnan(y)).item())
+            elif "categories" in series_config:
+                sd = d[s].to_dict() if isinstance(d[s], Series) else d[s]
                 # Go through categories and add either data or a blank
                 for k in series_config["categories"]:
                     try:
-                        pairs.append(d[s][k])
-                        maxval = max(maxval, d[s][k])
+                        pairs.append(sd[k])
+                        maxval = max(maxval, sd[k])
                     except KeyError:
                         pairs.append(None)
             else:
@@ -211,6 +221,10 @@ def plot(data, pconfig=None):
     # Make a plot - template custom, or interactive or flat
     mod = get_template_mod()
     if "linegraph" in mod.__dict__ and callable(mod.linegraph):
+        for sd in plotdata:
+            for d in sd:
+                if isinstance(d.get("data"), Series):
+                    d["data"] = d["data"].pairs()
         try:
             return mod.linegraph(plotdata, pconfig)
         except:  # noqa: E722
@@ -222,7 +236,45 @@ def plot(data, pconfig=None):
     return line.plot(plotdata, pconfig)
 
 
-def smooth_line_data(data: Dict[str, Dict], numpoints: int) -> Dict[str, Dict[int, int]]:
+def _series_in_range(series: Series, series_config: Dict) -> Series:
+    """
+    The points of a Series to plot, sorted by x. Same as for a dict of points: drops points outside
+    xmin and xmax, and points outside ymin and ymax unless the line comes back within the limit.
+    """
+    series = series.sorted()
+    if "xmax" in series_config:
+        series = series.take(~(series.x.astype(float) > float(series_config["xmax"])))
+    if "xmin" in series_config:
+        series = series.take(~(series.x.astype(float) < float(series_config["xmin"])))
+    y = series.y.astype(float)
+    keep = None
+    if "ymax" in series_config and not _comes_back(y, float(series_config["ymax"])):
+        keep = ~(y > float(series_config["ymax"]))
+    # Whether to drop points below ymin is decided by the points above it, same as for dicts
+    if "ymin" in series_config and not _comes_back(y, float(series_config["ymin"])):
+        below = y < float(series_config["ymin"])
+        keep = ~below if keep is None else keep & ~below
+    if keep is not None:
+        series = series.take(keep)
+    return series
+
+
+def _comes_back(y: np.ndarray, limit: float) -> bool:
+    """Whether y goes above the limit and there are more values after the last one that does"""
+    above = y > limit
+    if not above.any():
+        return False
+    last_above = len(above) - 1 - int(np.argmax(above[::-1]))
+    return bool(np.any(~np.isnan(y[last_above + 1 :])))
+
+
+def _smooth_indices(n: int, numpoints: int) -> np.ndarray:
+    """Indices of the points to keep to smooth n points to numpoints, see smooth_line_data()"""
+    binsize = (n - 1) / (numpoints - 1)
+    return np.unique(np.round(binsize * np.arange(numpoints)).astype(int))
+
+
+def smooth_line_data(data: Dict[str, Union[Dict, Series]], numpoints: int) -> Dict[str, Union[Dict[int, int], Series]]:
     """
     Function to take an x-y dataset and use binning to smooth to a maximum number of datapoints.
     Each datapoint in a smoothed dataset corresponds to the first point in a bin.
@@ -253,8 +305,11 @@ def smooth_line_data(data: Dict[str, Dict], numpoints: int) -> Dict[str, Dict[in
             smoothed_data[s_name] = d
             continue
 
-        binsize = (len(d) - 1) / (numpoints - 1)
-        first_element_indices = [round(binsize * i) for i in range(numpoints)]
+        first_element_indices = _smooth_indices(len(d), numpoints)
+        if isinstance(d, Series):
+            smoothed_data[s_name] = d.take(first_element_indices)
+            continue
+        first_element_indices = set(first_element_indices.tolist())
         smoothed_d = {x: y for i, (x, y) in enumerate(d.items()) if i in first_element_indices}
         smoothed_data[s_name] = smoothed_d
 
@@ -2,24 +2,25 @@
 import copy
 import dataclasses
 import logging
-from collections import defaultdict
-from typing import Dict, List
+from typing import Dict, List, Optional
 
-import math
+import numpy as np
 import plotly.graph_objects as go
 import spectra
 
 from multiqc.plots.plotly import determine_barplot_height
 from multiqc.plots.plotly.plot import Plot, PlotType, BaseDataset, split_long_string
-from multiqc.utils import util_functions, config
+from multiqc.utils import report_cache, util_functions, config
 
 logger = logging.getLogger(__name__)
 
 
+@report_cache.record_plot
 def plot(
     cats_lists: List[List[Dict]],
     samples_lists: List[List[str]],
     pconfig: Dict,
+    values_lists: Optional[List[np.ndarray]] = None,
 ) -> str:
     """
     Build and add the plot data to the report, return an HTML wrapper.
@@ -30,13 +31,18 @@ def plot(
     :param samples_lists: list of lists of bar names (that is, sample names). Similarly,
         each outer list will correspond to a separate tab.
     :param pconfig: Plot configuration dictionary
+    :param values_lists: optionally, the values of each dataset as a 2D NumPy array
+        (samples x categories) with NaN for missing values, in place of the `data` lists
     :return: HTML with JS, ready to be inserted into the page
     """
+    if values_lists is None:
+        values_lists = [None] * len(cats_lists)
     p = BarPlot(
         pconfig,
         cats_lists,
         samples_lists,
         max_n_samples=max([len(samples) for samples in samples_lists]),
+        values_lists=values_lists,
     )
 
     from multiqc.utils import report
@@ -44,25 +50,61 @@ def plot(
     return p.add_to_report(report)
 
 
+def pack_values(values: np.ndarray, missing=None) -> List:
+    """
+    A 1D array of values as a list for the report data, with whole numbers as integers
+    to keep the payload small, and `missing` in place of NaNs. Numbers from 2**53 up are
+    kept as floats, as not every integer is exact as a float there.
+    """
+    out = values.astype(object)
+    whole = (np.abs(values) < 2**53) & (values == np.floor(values))
+    out[whole] = values[whole].astype(np.int64).tolist()
+    out[np.isnan(values)] = missing
+    return out.tolist()
+
+
+def dump_for_json_export(dump: Dict) -> Dict:
+    """
+    Bar plot data for multiqc_data.json, with the packed values of each dataset unpacked into
+    the categories: cats[].data with the values of every sample, and cats[].data_pct with the
+    percentages, as before the report payload was packed.
+    """
+    datasets = []
+    for ds in dump["datasets"]:
+        ds = dict(ds)
+        columns = ds.pop("data", [])
+        values = np.array([[np.nan if v is None else v for v in column] for column in columns], dtype=float)
+        values = values.reshape(len(columns), len(ds["samples"]))
+        sums = np.nansum(np.abs(values), axis=0, keepdims=True)
+        pct = np.divide(values, sums, out=np.zeros_like(values), where=sums != 0) * 100.0
+        ds["cats"] = [
+            dict(cat, data=pack_values(values[i]), data_pct=pct[i].tolist()) for i, cat in enumerate(ds["cats"])
+        ]
+        datasets.append(ds)
+    return dict(dump, datasets=datasets)
+
+
 class BarPlot(Plot):
     @dataclasses.dataclass
     class Dataset(BaseDataset):
         cats: List[Dict]
         samples: List[str]
+        # Values as a (samples x categories) matrix, NaN for missing values
+        values: np.ndarray
+        _pct_values: Optional[np.ndarray] = None
 
         @staticmethod
         def create(
             dataset: BaseDataset,
             cats: List[Dict],
             samples: List[str],
+            values: Optional[np.ndarray] = None,
         ) -> "BarPlot.Dataset":
+            if values is None:
+                values = np.array([cat.pop("data") for cat in cats], dtype=float).T.reshape(len(samples), len(cats))
             # Need to reverse samples as the bar plot will show them reversed
             samples = list(reversed(samples))
-            for cat in cats:
-                # Reverse the data to match the reversed samples
-                cat["data"] = list(reversed(cat["data"]))
-                if "data_pct" in cat:
-                    cat["data_pct"] = list(reversed(cat["data_pct"]))
+            values = values[::-1]
 
             # Post-process categories
             for cat in cats:
@@ -75,17 +117,40 @@ class BarPlot(Plot):
                 color = spectra.html(cat["color"])
                 cat["color"] = ",".join([f"{x:.2f}" for x in color.rgb])
 
-                # Check that the number of samples is the same for all categories
-                assert len(samples) == len(cat["data"])
+            # Check that the number of samples and categories match the values
+            assert values.shape == (len(samples), len(cats))
 
             dataset = BarPlot.Dataset(
                 **dataset.__dict__,
                 cats=cats,
                 samples=samples,
+                values=values,
             )
 
             return dataset
 
+        def pct_values(self) -> np.ndarray:
+            """
+            Values as percentages of the sum of absolute values of each sample, computed
+            on first use. Missing values stay NaN, and samples summing to 0 get 0.
+            """
+            if self._pct_values is None:
+                sums = np.nansum(np.abs(self.values), axis=1, keepdims=True)
+                pct = np.divide(self.values, sums, out=np.zeros_like(self.values), where=sums != 0) * 100.0
+                self._pct_values = pct
+            return self._pct_values
+
+        def dump_for_javascript(self) -> Dict:
+            """
+            Send the values packed as one list per category, the percentages are derived
+            from them in the browser when the percentage switch is clicked.
+            """
+            d = super().dump_for_javascript()
+            del d["values"]
+            del d["_pct_values"]
+            d["data"] = [pack_values(column) for column in self.values.T]
+            return d
+
         def create_figure(
             self,
             layout: go.Layout,
@@ -97,29 +162,37 @@ class BarPlot(Plot):
             """
             fig = go.Figure(layout=layout)
 
-            for cat in self.cats:
-                data = cat["data_pct"] if is_pct else cat["data"]
-
+            values = self.pct_values() if is_pct else self.values
+            for cat_idx, cat in enumerate(self.cats):
                 params = copy.deepcopy(self.trace_params)
                 params["marker"]["color"] = f"rgb({cat['color']})"
                 fig.add_trace(
                     go.Bar(
                         y=self.samples,
-                        x=data,
+                        x=values[:, cat_idx],
                         name=cat["name"],
                         **params,
                     ),
                 )
             return fig
 
-    def __init__(self, pconfig: Dict, cats_lists: List, samples_lists: List, max_n_samples: int):
+    def __init__(
+        self,
+        pconfig: Dict,
+        cats_lists: List,
+        samples_lists: List,
+        max_n_samples: int,
+        values_lists: Optional[List[np.ndarray]] = None,
+    ):
         super().__init__(PlotType.BAR, pconfig, len(cats_lists))
         if len(cats_lists) != len(samples_lists):
             raise ValueError("Number of datasets and samples lists do not match")
+        if values_lists is None:
+            values_lists = [None] * len(cats_lists)
 
         self.datasets: List[BarPlot.Dataset] = [
-            BarPlot.Dataset.create(d, cats=cats, samples=samples)
-            for d, cats, samples in zip(self.datasets, cats_lists, samples_lists)
+            BarPlot.Dataset.create(d, cats=cats, samples=samples, values=values)
+            for d, cats, samples, values in zip(self.datasets, cats_lists, samples_lists, values_lists)
         ]
 
         # Set the barmode
@@ -190,20 +263,16 @@ class BarPlot(Plot):
             )
 
         for dataset in self.datasets:
+            values = dataset.values
             if barmode == "group":
                 # max category
-                xmax_cnt = max(max(cat["data"][i] for cat in dataset.cats) for i in range(len(dataset.samples)))
-                xmin_cnt = min(min(cat["data"][i] for cat in dataset.cats) for i in range(len(dataset.samples)))
+                xmax_cnt = _nan_reduce(np.max, values)
+                xmin_cnt = _nan_reduce(np.min, values)
             else:
                 # max sum of all categories across all samples
-                xmax_cnt = max(
-                    sum(cat["data"][i] if cat["data"][i] > 0 else 0 for cat in dataset.cats)
-                    for i in range(len(dataset.samples))
-                )
-                xmin_cnt = min(
-                    sum(cat["data"][i] if cat["data"][i] < 0 else 0 for cat in dataset.cats)
-                    for i in range(len(dataset.samples))
-                )
+                xmax_cnt = np.where(values > 0, values, 0).sum(axis=1).max(initial=0)
+                xmin_cnt = np.where(values < 0, values, 0).sum(axis=1).min(initial=0)
+                xmax_cnt, xmin_cnt = float(xmax_cnt), float(xmin_cnt)
 
             dataset.layout.update(
                 yaxis=dict(
@@ -234,53 +303,31 @@ class BarPlot(Plot):
                 dataset.trace_params["hovertemplate"] = dataset.trace_params["hovertemplate"].replace("%{text}", "")
 
             if dataset.layout["xaxis"]["hoverformat"] is None:
-                if all(all(isinstance(x, float) or math.isnan(x) for x in cat["data"]) for cat in dataset.cats):
+                present = dataset.values[~np.isnan(dataset.values)]
+                whole = present == np.floor(present)
+                if not whole.any():
                     dataset.layout["xaxis"]["hoverformat"] = ",.2f"
-                elif all(all(isinstance(x, int) or math.isnan(x) for x in cat["data"]) for cat in dataset.cats):
+                elif whole.all():
                     dataset.layout["xaxis"]["hoverformat"] = ",.0f"
 
-        # Expand data with zeroes if there are fewer values than samples
-        for dataset in self.datasets:
-            for cat in dataset.cats:
-                if len(cat["data"]) < len(dataset.samples):
-                    cat["data"].extend([0] * (len(dataset.samples) - len(cat["data"])))
-
-        # Calculate and save percentages
+        # Save the percentage range. The percentages themselves are derived from the values
+        # when needed: in the browser for interactive plots, on the fly for flat plots
         if self.add_pct_tab:
-            for pidx, dataset in enumerate(self.datasets):
-                # Count totals for each category
-                sums = [0 for _ in dataset.cats[0]["data"]]
-                for cat in dataset.cats:
-                    for sample_idx, val in enumerate(cat["data"]):
-                        if not math.isnan(val):
-                            sums[sample_idx] += abs(val)
-
-                # Now, calculate percentages for each category
-                for cat in dataset.cats:
-                    values = [x for x in cat["data"]]
-                    for sample_idx, val in enumerate(values):
-                        sum_for_sample = sums[sample_idx]
-                        if sum_for_sample == 0:
-                            values[sample_idx] = 0
-                        else:
-                            values[sample_idx] = float(val + 0.0) / float(sum_for_sample) * 100.0
-                    cat["data_pct"] = values
-
+            for dataset in self.datasets:
+                pct = dataset.pct_values()
                 if barmode == "group":
                     # calculating the min percentage range as well because it will be negative for negative values
-                    dataset.pct_range["xaxis"]["min"] = min(
-                        min(cat["data_pct"][i] for cat in dataset.cats) for i in range(len(dataset.samples))
-                    )
+                    dataset.pct_range["xaxis"]["min"] = _nan_reduce(np.min, pct)
                 else:
-                    dataset.pct_range["xaxis"]["min"] = min(
-                        sum(cat["data_pct"][i] if cat["data_pct"][i] < 0 else 0 for cat in dataset.cats)
-                        for i in range(len(dataset.samples))
-                    )
+                    dataset.pct_range["xaxis"]["min"] = float(np.where(pct < 0, pct, 0).sum(axis=1).min(initial=0))
 
         if self.add_log_tab:
             # Sorting from small to large so the log switch makes sense
             for dataset in self.datasets:
-                dataset.cats.sort(key=lambda x: sum(x["data"]))
+                order = np.argsort(np.nansum(dataset.values, axis=0), kind="stable")
+                dataset.cats = [dataset.cats[i] for i in order]
+                dataset.values = dataset.values[:, order]
+                dataset._pct_values = None
                 # But reversing the legend so the largest bars are still on the top
                 self.layout.legend.traceorder = "reversed"
 
@@ -293,14 +340,22 @@ class BarPlot(Plot):
         return ["xaxis"]
 
     def save_data_file(self, dataset: Dataset) -> None:
-        val_by_cat_by_sample = defaultdict(dict)
-        for cat in dataset.cats:
-            for d_idx, d_val in enumerate(cat["data"]):
-                s_name = dataset.samples[d_idx]
-                val_by_cat_by_sample[s_name][cat["name"]] = d_val
+        cat_names = [cat["name"] for cat in dataset.cats]
+        flat_values = pack_values(dataset.values.ravel(), missing=float("nan"))
+        n_cats = len(cat_names)
+        val_by_cat_by_sample = {
+            s_name: dict(zip(cat_names, flat_values[i * n_cats : (i + 1) * n_cats]))
+            for i, s_name in enumerate(dataset.samples)
+        }
         util_functions.write_data_file(val_by_cat_by_sample, dataset.uid)
 
     @staticmethod
     def tt_label() -> str:
         """Default tooltip label"""
         return "%{meta}: <b>%{x}</b>"
+
+
+def _nan_reduce(func, values: np.ndarray) -> float:
+    """Reduce the values of an array that are not NaN, e.g. with np.max, 0 if there are none"""
+    present = values[~np.isnan(values)]
+    return float(func(present)) if present.size else 0.0
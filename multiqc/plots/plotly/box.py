@@ -7,7 +7,7 @@ import plotly.graph_objects as go
 
 from multiqc.plots.plotly import determine_barplot_height
 from multiqc.plots.plotly.plot import Plot, PlotType, BaseDataset
-from multiqc.utils import util_functions
+from multiqc.utils import report_cache, util_functions
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +16,7 @@ logger = logging.getLogger(__name__)
 BoxT = List[Union[int, float]]
 
 
+@report_cache.record_plot
 def plot(list_of_data_by_sample: List[Dict[str, BoxT]], pconfig: Dict) -> str:
     """
     Build and add the plot data to the report, return an HTML wrapper.
@@ -1,10 +1,14 @@
 import dataclasses
 import logging
-from typing import Dict, List, Union, Optional
+import math
+import warnings
+from typing import Dict, List, Union, Optional, Tuple
+
+import numpy as np
 import plotly.graph_objects as go
 
 from multiqc.plots.plotly.plot import Plot, PlotType, BaseDataset, split_long_string
-from multiqc.utils import util_functions
+from multiqc.utils import config, report_cache, util_functions
 
 logger = logging.getLogger(__name__)
 
@@ -12,8 +16,9 @@ logger = logging.getLogger(__name__)
 ElemT = Union[str, float, int]
 
 
+@report_cache.record_plot
 def plot(
-    rows: Union[List[List[ElemT]], Dict[str, Dict[str, ElemT]]],
+    rows: Union[List[List[ElemT]], Dict[str, Dict[str, ElemT]], np.ndarray],
     pconfig: Dict,
     xcats: Optional[List[str]] = None,
     ycats: Optional[List[str]] = None,
@@ -43,7 +48,7 @@ class HeatmapPlot(Plot):
         @staticmethod
         def create(
             dataset: BaseDataset,
-            rows: Union[List[List[ElemT]], Dict[str, Dict[str, ElemT]]],
+            rows: Union[List[List[ElemT]], Dict[str, Dict[str, ElemT]], np.ndarray],
             xcats: Optional[List[str]] = None,
             ycats: Optional[List[str]] = None,
         ) -> "HeatmapPlot.Dataset":
@@ -58,6 +63,8 @@ class HeatmapPlot(Plot):
                             if x not in xcats:
                                 xcats.append(x)
                 rows = [[rows.get(y, {}).get(x) for x in xcats] for y in ycats]
+            elif isinstance(rows, np.ndarray):
+                rows = _matrix_to_rows(rows)
 
             dataset = HeatmapPlot.Dataset(
                 **dataset.__dict__,
@@ -88,14 +95,14 @@ class HeatmapPlot(Plot):
 
     def __init__(
         self,
-        rows: Union[List[List[ElemT]], Dict[str, Dict[str, ElemT]]],
+        rows: Union[List[List[ElemT]], Dict[str, Dict[str, ElemT]], np.ndarray],
         pconfig: Dict,
         xcats: Optional[List[str]],
         ycats: Optional[List[str]],
     ):
         super().__init__(PlotType.HEATMAP, pconfig, n_datasets=1)
 
-        if isinstance(rows, list):
+        if isinstance(rows, (list, np.ndarray)):
             if ycats and not isinstance(ycats, list):
                 raise ValueError(
                     f"Heatmap plot {self.id}: ycats must be passed as a list when the input data is a 2d list. "
@@ -131,20 +138,52 @@ class HeatmapPlot(Plot):
             )
         ]
 
+        # The numeric values as a matrix of floats, with NaN for missing and non-numeric values
+        dataset = self.datasets[0]
+        matrix = _rows_to_matrix(dataset.rows)
+
         self.min = self.pconfig.get("min", None)
-        if self.min is None:
-            for dataset in self.datasets:
-                for row in dataset.rows:
-                    for val in row:
-                        if val is not None and isinstance(val, (int, float)):
-                            self.min = val if self.min is None else min(self.min, val)
         self.max = self.pconfig.get("max", None)
-        if self.max is None:
-            for dataset in self.datasets:
-                for row in dataset.rows:
-                    for val in row:
-                        if val is not None and isinstance(val, (int, float)):
-                            self.max = val if self.max is None else max(self.max, val)
+        if (self.min is None or self.max is None) and matrix.size and not np.isnan(matrix).all():
+            # Take the values from the input rows, so that integers are kept as they are
+            if self.min is None:
+                self.min = _cell(dataset.rows, matrix, np.nanargmin(matrix))
+            if self.max is None:
+                self.max = _cell(dataset.rows, matrix, np.nanargmax(matrix))
+
+        # Reorder the rows and columns so that similar ones are next to each other
+        row_order = _cluster_order(matrix, pconfig) if pconfig.get("cluster_rows") else None
+        col_order = _cluster_order(matrix.T, pconfig) if pconfig.get("cluster_cols") else None
+        if dataset.xcats == dataset.ycats and (row_order is not None or col_order is not None):
+            # Keep the diagonal of square matrices, e.g. for sample relatedness
+            row_order = col_order = row_order if row_order is not None else col_order
+        if row_order is not None or col_order is not None:
+            row_order = np.arange(matrix.shape[0]) if row_order is None else row_order
+            col_order = np.arange(matrix.shape[1]) if col_order is None else col_order
+            matrix = matrix[np.ix_(row_order, col_order)]
+            dataset.rows = [[dataset.rows[r][c] for c in col_order.tolist()] for r in row_order.tolist()]
+            dataset.xcats = [dataset.xcats[c] for c in col_order.tolist()]
+            dataset.ycats = [dataset.ycats[r] for r in row_order.tolist()]
+            xcats, ycats = dataset.xcats, dataset.ycats
+
+        # Above the cell budget, aggregate blocks of cells into tiles, so that the size of the
+        # report doesn't grow with the square of the number of samples. The full-resolution
+        # data is still written to the data directory.
+        max_cells = pconfig.get("max_cells", config.heatmap_max_cells)
+        self.tiled = bool(max_cells) and matrix.size > max_cells
+        self.full_dataset = None
+        if self.tiled:
+            self.full_dataset = HeatmapPlot.Dataset(**dataset.__dict__)
+            aggregate = pconfig.get("tile_aggregate", "mean")
+            block_rows, block_cols = _block_shape(matrix.shape, max_cells, square=dataset.xcats == dataset.ycats)
+            logger.debug(
+                f"Heatmap {self.id}: aggregating {matrix.shape[0]}x{matrix.shape[1]} cells into tiles "
+                f"of {block_rows}x{block_cols} with the {aggregate}"
+            )
+            tiles, drilldown = _tile(matrix, block_rows, block_cols, aggregate, dataset.xcats, dataset.ycats)
+            dataset.rows = _matrix_to_rows(tiles)
+            dataset.xcats = xcats = _tile_labels(dataset.xcats, block_cols)
+            dataset.ycats = ycats = _tile_labels(dataset.ycats, block_rows)
 
         # Determining the size of the plot to reasonably display data without cluttering it too much.
         # For flat plots, we try to make the image large enough to display all samples, but to a limit
@@ -264,6 +303,11 @@ class HeatmapPlot(Plot):
         ylab = pconfig.get("ylab", "y")
         zlab = pconfig.get("zlab", "z")
         hovertemplate = f"{xlab}: %{{x}}<br>{ylab}: %{{y}}<br>{zlab}: %{{z}}<extra></extra>"
+        if self.tiled:
+            hovertemplate = (
+                f"{xlab}: %{{x}}<br>{ylab}: %{{y}}<br>{zlab} ({aggregate} of %{{customdata[0]}} cells): %{{z}}<br>"
+                f"Max: %{{customdata[1]}} ({xlab}: %{{customdata[2]}}, {ylab}: %{{customdata[3]}})<extra></extra>"
+            )
 
         for ds in self.datasets:
             ds.trace_params = {
@@ -274,6 +318,8 @@ class HeatmapPlot(Plot):
                 "zmax": pconfig.get("max", None),
                 "hovertemplate": hovertemplate,
             }
+            if self.tiled:
+                ds.trace_params["customdata"] = drilldown
             # Enable datalabels if there are less than 20x20 cells, unless heatmap_config.datalabels is set explicitly
             if pconfig.get("datalabels") is None and num_rows * num_cols < 400:
                 ds.trace_params["texttemplate"] = "%{z:." + str(decimal_places) + "f}"
@@ -281,8 +327,9 @@ class HeatmapPlot(Plot):
     def dump_for_javascript(self) -> Dict:
         """Serialise the plot data to pick up in JavaScript"""
         d = super().dump_for_javascript()
-        d["xcats_samples"] = self.pconfig.get("xcats_samples", True)
-        d["ycats_samples"] = self.pconfig.get("ycats_samples", True)
+        # Tiles are labelled with ranges of samples, that can't be highlighted or hidden
+        d["xcats_samples"] = self.pconfig.get("xcats_samples", True) and not self.tiled
+        d["ycats_samples"] = self.pconfig.get("ycats_samples", True) and not self.tiled
         d["square"] = self.square
         return d
 
@@ -316,7 +363,16 @@ class HeatmapPlot(Plot):
             )
         return buttons
 
+    def add_to_report(self, report) -> str:
+        html = super().add_to_report(report)
+        # The report only has the tiles of large heatmaps, so always save the full data
+        if self.tiled and not self.flat and self.pconfig.get("save_data_file", True):
+            self.save_data_file(self.datasets[0])
+        return html
+
     def save_data_file(self, dataset: Dataset) -> None:
+        if self.full_dataset is not None:
+            dataset = self.full_dataset
         data = [
             ["."] + dataset.xcats,
         ]
@@ -324,3 +380,133 @@ class HeatmapPlot(Plot):
             data.append([ycat] + row)
 
         util_functions.write_data_file(data, dataset.uid)
+
+
+def _rows_to_matrix(rows: List[List[ElemT]]) -> np.ndarray:
+    """Values as a 2D float array, with NaN for missing and non-numeric values"""
+    try:
+        matrix = np.array(rows, dtype=float)
+        if matrix.ndim == 2:
+            return matrix
+    except (TypeError, ValueError):
+        pass
+    width = max((len(row) for row in rows), default=0)
+    matrix = np.full((len(rows), width), np.nan)
+    for i, row in enumerate(rows):
+        for j, val in enumerate(row):
+            if isinstance(val, (int, float)):
+                matrix[i, j] = val
+    return matrix
+
+
+def _matrix_to_rows(matrix: np.ndarray) -> List[List[Optional[float]]]:
+    """Lists of values that can be dumped to JSON, with None instead of NaN"""
+    rows = matrix.tolist()
+    if np.issubdtype(matrix.dtype, np.floating) and np.isnan(matrix).any():
+        rows = [[None if val != val else val for val in row] for row in rows]
+    return rows
+
+
+def _cell(rows: List[List[ElemT]], matrix: np.ndarray, flat_idx: int) -> ElemT:
+    """The input value at a position of the matrix"""
+    i, j = np.unravel_index(flat_idx, matrix.shape)
+    try:
+        val = rows[i][j]
+    except (IndexError, TypeError):
+        val = None
+    return val if isinstance(val, (int, float)) else matrix[i, j].item()
+
+
+def _cluster_order(matrix: np.ndarray, pconfig: Dict) -> Optional[np.ndarray]:
+    """
+    Order of the rows of a matrix from hierarchical clustering, so that similar rows end
+    up next to each other. Needs scipy, returns None if it is not installed.
+    """
+    try:
+        from scipy.cluster import hierarchy
+    except ImportError:
+        logger.warning("Heatmap clustering requires scipy to be installed, keeping the original order")
+        return None
+    if matrix.shape[0] < 3:
+        return None
+    fill = np.nanmean(matrix) if not np.isnan(matrix).all() else 0.0
+    filled = np.where(np.isnan(matrix), fill, matrix)
+    linkage = hierarchy.linkage(filled, method=pconfig.get("cluster_method", "average"))
+    return hierarchy.leaves_list(linkage)
+
+
+def _block_shape(shape: Tuple[int, int], max_cells: int, square: bool) -> Tuple[int, int]:
+    """Size of the blocks of cells aggregated into one tile, to have at most max_cells tiles"""
+    n_rows, n_cols = shape
+    scale = math.sqrt(n_rows * n_cols / max_cells)
+    if square:
+        block = math.ceil(scale)
+        while math.ceil(n_rows / block) * math.ceil(n_cols / block) > max_cells:
+            block += 1
+        return block, block
+    # Don't aggregate an axis that has fewer values than the scaling factor
+    if n_rows < scale:
+        block_rows = 1
+        block_cols = math.ceil(n_cols / max(1, max_cells // n_rows))
+    else:
+        block_cols = min(n_cols, max(1, math.ceil(scale)))
+        block_rows = math.ceil(n_rows / max(1, max_cells // math.ceil(n_cols / block_cols)))
+    # Aggregate more cells on the axis with the most tiles, until there are few enough
+    while math.ceil(n_rows / block_rows) * math.ceil(n_cols / block_cols) > max_cells:
+        if math.ceil(n_rows / block_rows) >= math.ceil(n_cols / block_cols):
+            block_rows += 1
+        else:
+            block_cols += 1
+    return block_rows, block_cols
+
+
+def _tile(
+    matrix: np.ndarray, block_rows: int, block_cols: int, aggregate: str, xcats: List[str], ycats: List[str]
+) -> Tuple[np.ndarray, List]:
+    """
+    Aggregate blocks of cells into tiles with the max or mean of their values. Returns the
+    tiles, and for each tile a drill-down list of the number of cells and the value and
+    labels of the cell with the highest value.
+    """
+    n_rows, n_cols = matrix.shape
+    n_tile_rows, n_tile_cols = math.ceil(n_rows / block_rows), math.ceil(n_cols / block_cols)
+    padded = np.full((n_tile_rows * block_rows, n_tile_cols * block_cols), np.nan)
+    padded[:n_rows, :n_cols] = matrix
+    # Shape (tile row, tile column, cell in the block)
+    blocks = padded.reshape(n_tile_rows, block_rows, n_tile_cols, block_cols).swapaxes(1, 2)
+    blocks = blocks.reshape(n_tile_rows, n_tile_cols, block_rows * block_cols)
+
+    with warnings.catch_warnings():
+        # Blocks without any values give NaN
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        tiles = np.nanmax(blocks, axis=2) if aggregate == "max" else np.nanmean(blocks, axis=2)
+    n_cells = (~np.isnan(blocks)).sum(axis=2)
+
+    # Find the cell with the highest value in each tile
+    argmax = np.where(np.isnan(blocks), -np.inf, blocks).argmax(axis=2)
+    max_rows = np.arange(n_tile_rows)[:, None] * block_rows + argmax // block_cols
+    max_cols = np.arange(n_tile_cols)[None, :] * block_cols + argmax % block_cols
+    max_vals = np.take_along_axis(blocks, argmax[:, :, None], axis=2)[:, :, 0]
+
+    drilldown = []
+    for i in range(n_tile_rows):
+        drilldown.append(
+            [
+                [n, None if n == 0 else val, xcats[c] if n else None, ycats[r] if n else None]
+                for n, val, r, c in zip(
+                    n_cells[i].tolist(), max_vals[i].tolist(), max_rows[i].tolist(), max_cols[i].tolist()
+                )
+            ]
+        )
+    return tiles, drilldown
+
+
+def _tile_labels(cats: List[str], block: int) -> List[str]:
+    """Axis labels for tiles: the first and last category of each block"""
+    if block == 1:
+        return list(cats)
+    labels = []
+    for start in range(0, len(cats), block):
+        end = min(start + block, len(cats)) - 1
+        labels.append(str(cats[start]) if start == end else f"{cats[start]} - {cats[end]}")
+    return labels
@@ -2,20 +2,96 @@ import dataclasses
 import io
 import logging
 import os
-from typing import Dict, List, Union, Optional
+from typing import Dict, Iterator, List, Union, Optional, Tuple
+
+import numpy as np
 import plotly.graph_objects as go
 
 from multiqc.plots.plotly.plot import Plot, PlotType, BaseDataset
-from multiqc.utils import util_functions, config
+from multiqc.utils import report_cache, util_functions, config
 from multiqc.utils.config import update_dict
 
 logger = logging.getLogger(__name__)
 
 
-# {"name": "SAMPLE1", "color": "#111111", "data": [[x, y], [x, y], ...]}
-LineT = Dict[str, Union[str, List[List[float]]]]
+class Series:
+    """
+    The points of one line as two NumPy arrays of the same length, x and y. Can be given
+    to linegraph.plot() in place of a {x: y} dict, e.g. {"SAMPLE1": Series(x, y)}, to avoid
+    building a Python object for every point. Missing y values are NaN.
+    """
+
+    __slots__ = ("x", "y")
+
+    def __init__(self, x, y):
+        self.x = np.asarray(x)
+        self.y = np.asarray(y)
+        if self.y.dtype == object:
+            self.y = self.y.astype(float)  # None becomes NaN
+        if self.x.ndim != 1 or self.x.shape != self.y.shape:
+            raise ValueError(f"Series x and y must be 1D and of the same length, got {self.x.shape} and {self.y.shape}")
+
+    @classmethod
+    def from_dict(cls, d: Dict) -> "Series":
+        """Series from a {x: y} dict, keeping the order of the keys"""
+        return cls(list(d.keys()), list(d.values()))
+
+    def __len__(self) -> int:
+        return len(self.x)
+
+    def __repr__(self) -> str:
+        return f"<Series of {len(self)} points>"
+
+    def keys(self) -> List:
+        return self.x.tolist()
+
+    def values(self) -> List:
+        return self.y.tolist()
+
+    def items(self) -> Iterator[Tuple]:
+        """(x, y) tuples of Python numbers, like dict.items()"""
+        return zip(self.x.tolist(), self.y.tolist())
+
+    def to_dict(self) -> Dict:
+        return dict(self.items())
 
+    def pairs(self) -> List[List]:
+        """[[x, y], [x, y], ...], the format of the points in the plot JSON"""
+        if self.x.dtype == self.y.dtype and self.x.dtype.kind in "iuf":
+            return np.column_stack((self.x, self.y)).tolist()
+        return list(map(list, self.items()))
 
+    def take(self, idx) -> "Series":
+        """Series with the points at an index array or boolean mask"""
+        return Series(self.x[idx], self.y[idx])
+
+    def sorted(self) -> "Series":
+        """Series with the points sorted by x"""
+        if len(self) < 2 or np.all(self.x[:-1] <= self.x[1:]):
+            return self
+        return self.take(np.argsort(self.x, kind="stable"))
+
+    def pct(self, total=None) -> "Series":
+        """Series with y values as percentages of total, by default of the sum of y. All 0 if total is 0."""
+        if total is None:
+            total = self.y.sum()
+        if total == 0:
+            return Series(self.x, np.zeros(len(self.y)))
+        return Series(self.x, self.y / total * 100)
+
+    def y_range(self) -> Tuple[Optional[float], Optional[float]]:
+        """Min and max y value, ignoring NaN. None if there are no values."""
+        y = self.y[~np.isnan(self.y)] if self.y.dtype.kind == "f" else self.y
+        if len(y) == 0:
+            return None, None
+        return y.min().item(), y.max().item()
+
+
+# {"name": "SAMPLE1", "color": "#111111", "data": [[x, y], [x, y], ...]}, or a Series as "data"
+LineT = Dict[str, Union[str, List[List[float]], Series]]
+
+
+@report_cache.record_plot
 def plot(lists_of_lines: List[List[LineT]], pconfig: Dict) -> str:
     """
     Build and add the plot data to the report, return an HTML wrapper.
@@ -98,6 +174,14 @@ class LinePlot(Plot):
             )
             return dataset
 
+        def dump_for_javascript(self) -> Dict:
+            d = super().dump_for_javascript()
+            d["lines"] = [
+                dict(line, data=line["data"].pairs()) if isinstance(line["data"], Series) else line
+                for line in self.lines
+            ]
+            return d
+
         def create_figure(
             self,
             layout: go.Layout,
@@ -112,7 +196,10 @@ class LinePlot(Plot):
 
             fig = go.Figure(layout=layout)
             for line in self.lines:
-                if len(line["data"]) > 0 and isinstance(line["data"][0], list):
+                if isinstance(line["data"], Series):
+                    xs = line["data"].x
+                    ys = line["data"].y
+                elif len(line["data"]) > 0 and isinstance(line["data"][0], list):
                     xs = [x[0] for x in line["data"]]
                     ys = [x[1] for x in line["data"]]
                 elif self.dconfig.get("categories"):
@@ -170,14 +257,20 @@ class LinePlot(Plot):
                     ymax = dataset.layout["yaxis"]["autorangeoptions"]["maxallowed"]
                 if ymin is None or ymax is None:
                     for line in dataset.lines:
-                        if len(line["data"]) > 0 and isinstance(line["data"][0], list):
-                            ys = [x[1] for x in line["data"]]
+                        if isinstance(line["data"], Series):
+                            ys_min, ys_max = line["data"].y_range()
+                            if ys_min is None:
+                                continue
                         else:
-                            ys = line["data"]
+                            if len(line["data"]) > 0 and isinstance(line["data"][0], list):
+                                ys = [x[1] for x in line["data"]]
+                            else:
+                                ys = line["data"]
+                            ys_min, ys_max = min(ys), max(ys)
                         if ymin is None:
-                            ymin = min(ys)
+                            ymin = ys_min
                         if ymax is None:
-                            ymax = max(ys)
+                            ymax = ys_max
                             ymax += (ymax - ymin) * 0.05
                 dataset.layout["yaxis"]["range"] = [ymin, ymax]
 
@@ -192,14 +285,20 @@ class LinePlot(Plot):
                     xmax = dataset.layout["xaxis"]["autorangeoptions"]["maxallowed"]
                 if xmin is None or xmax is None:
                     for line in dataset.lines:
-                        if len(line["data"]) > 0 and isinstance(line["data"][0], list):
-                            xs = [x[0] for x in line["data"]]
+                        if isinstance(line["data"], Series):
+                            if len(line["data"]) == 0:
+                                continue
+                            xs_min, xs_max = line["data"].x.min().item(), line["data"].x.max().item()
                         else:
-                            xs = [x for x in range(len(line["data"]))]
+                            if len(line["data"]) > 0 and isinstance(line["data"][0], list):
+                                xs = [x[0] for x in line["data"]]
+                            else:
+                                xs = [x for x in range(len(line["data"]))]
+                            xs_min, xs_max = min(xs), max(xs)
                         if xmin is None:
-                            xmin = min(xs)
+                            xmin = xs_min
                         if xmax is None:
-                            xmax = max(xs)
+                            xmax = xs_max
                 dataset.layout["xaxis"]["range"] = [xmin, xmax]
 
         self.layout.shapes = (
@@ -290,6 +389,15 @@ class LinePlot(Plot):
         for line in dataset.lines:
             y_by_x_by_sample[line["name"]] = dict()
 
+            if isinstance(line["data"], Series):
+                xs = line["data"].keys()
+                if last_cats is None:
+                    last_cats = xs
+                elif last_cats != xs:
+                    shared_cats = False
+                y_by_x_by_sample[line["name"]] = line["data"].to_dict()
+                continue
+
             # Check to see if all categories are the same
             if len(line["data"]) > 0 and isinstance(line["data"][0], list):
                 if last_cats is None:
@@ -311,8 +419,10 @@ class LinePlot(Plot):
             sep = "\t" if config.data_format == "tsv" else ","
             fout = ""
             for line in dataset.lines:
-                fout += line["name"] + sep + "X" + sep + sep.join([str(x[0]) for x in line["data"]]) + "\n"
-                fout += line["name"] + sep + "Y" + sep + sep.join([str(x[1]) for x in line["data"]]) + "\n"
+                points = line["data"].items() if isinstance(line["data"], Series) else line["data"]
+                xs, ys = zip(*points) if len(line["data"]) > 0 else ((), ())
+                fout += line["name"] + sep + "X" + sep + sep.join([str(x) for x in xs]) + "\n"
+                fout += line["name"] + sep + "Y" + sep + sep.join([str(y) for y in ys]) + "\n"
 
             fn = f"{dataset.uid}.{config.data_format_extensions[config.data_format]}"
             fpath = os.path.join(config.data_dir, fn)
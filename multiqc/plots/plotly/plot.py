@@ -14,7 +14,7 @@ import math
 import plotly.graph_objects as go
 
 from multiqc.plots.plotly import check_plotly_version
-from multiqc.utils import mqc_colour, config, report
+from multiqc.utils import mqc_colour, config, events, report
 
 logger = logging.getLogger(__name__)
 
@@ -244,10 +244,13 @@ class Plot(ABC):
             if len(self.datasets) > 1:  # for flat plots, each dataset will have its own unique ID
                 ds.uid = report.save_htmlid(f"{self.id}_{ds.label}", skiplint=True)
 
-        if self.flat:
-            html = self.flat_plot()
-        else:
-            html = self.interactive_plot(report)
+        with events.start_span(
+            "plot", plot_id=self.id, plot_type=self.plot_type.value, n_datasets=len(self.datasets), flat=self.flat
+        ):
+            if self.flat:
+                html = self.flat_plot()
+            else:
+                html = self.interactive_plot(report)
         return html
 
     def interactive_plot(self, report) -> str:
@@ -270,7 +273,7 @@ class Plot(ABC):
 
         # Saving compressed data for JavaScript to pick up and uncompress.
         dump = self.dump_for_javascript()
-        report.plot_data[self.id] = dump
+        report.add_plot_data(self.id, dump)
         return html
 
     def flat_plot(self) -> str:
@@ -1,6 +1,7 @@
 import copy
 import dataclasses
 import logging
+import re
 from collections import defaultdict
 from typing import Dict, List, Union, Optional
 
@@ -8,7 +9,7 @@ import numpy as np
 from plotly import graph_objects as go
 
 from multiqc.plots.plotly.plot import Plot, PlotType, BaseDataset
-from multiqc.utils import util_functions
+from multiqc.utils import config, report_cache, util_functions
 
 logger = logging.getLogger(__name__)
 
@@ -16,7 +17,13 @@ logger = logging.getLogger(__name__)
 # {'color': 'rgb(211,211,211,0.05)', 'name': 'background: EUR', 'x': -0.294, 'y': -1.527}
 PointT = Dict[str, Union[str, float, int]]
 
+# In density mode, points further than this many standard deviations from the mean are drawn separately
+DENSITY_OUTLIER_Z = 3.0
+# Maximum number of outlier points drawn on top of a density
+DENSITY_MAX_OUTLIERS = 1000
 
+
+@report_cache.record_plot
 def plot(points_lists: List[List[PointT]], pconfig: Dict) -> str:
     """
     Build and add the plot data to the report, return an HTML wrapper.
@@ -36,6 +43,19 @@ class ScatterPlot(Plot):
     class Dataset(BaseDataset):
         points: List[PointT]
         categories: List[str]
+        # For datasets with many points: counts of points binned on a 2D grid, drawn as a heatmap.
+        # Only the outliers, annotated and highlighted points are kept in "points", all are kept in
+        # "all_points". The names and coordinates of the binned points are in density["samples"],
+        # so that the report can draw them on top of the density when they are highlighted.
+        density: Optional[Dict] = None
+        all_points: Optional[List[PointT]] = None
+
+        def dump_for_javascript(self) -> Dict:
+            d = super().dump_for_javascript()
+            del d["all_points"]
+            if self.density is None:
+                del d["density"]
+            return d
 
         @staticmethod
         def create(
@@ -49,6 +69,10 @@ class ScatterPlot(Plot):
                 categories=pconfig.get("categories", []),
             )
 
+            density_after = pconfig.get("density_after", config.scatter_density_after)
+            if density_after and len(points) > density_after and not dataset.categories:
+                dataset.make_density(pconfig)
+
             dataset.trace_params.update(
                 textfont=dict(size=8),
                 marker=dict(
@@ -60,6 +84,70 @@ class ScatterPlot(Plot):
             )
             return dataset
 
+        def make_density(self, pconfig: Dict):
+            """
+            Bin the points on a 2D grid, and keep only the points that should still be drawn
+            separately: the ones with an annotation, the outliers, and the samples highlighted
+            with config.highlight_patterns, which are left out of the bins.
+            """
+            xy = np.array(
+                [
+                    (p["x"], p["y"])
+                    if isinstance(p.get("x"), (int, float)) and isinstance(p.get("y"), (int, float))
+                    else (np.nan, np.nan)
+                    for p in self.points
+                ],
+                dtype=float,
+            ).reshape(-1, 2)
+            x, y = xy[:, 0], xy[:, 1]
+            finite = np.isfinite(x) & np.isfinite(y)
+            highlighted = np.array([_is_highlighted(str(p.get("name", ""))) for p in self.points], dtype=bool)
+            binned = finite & ~highlighted
+            if not binned.any():
+                return
+            n_bins = pconfig.get("density_bins", config.scatter_density_bins)
+            x_range = [pconfig.get("xmin", x[binned].min()), pconfig.get("xmax", x[binned].max())]
+            y_range = [pconfig.get("ymin", y[binned].min()), pconfig.get("ymax", y[binned].max())]
+            for rng in x_range, y_range:
+                if rng[0] == rng[1]:
+                    rng[0], rng[1] = rng[0] - 0.5, rng[1] + 0.5
+            counts, x_edges, y_edges = np.histogram2d(x[binned], y[binned], bins=n_bins, range=[x_range, y_range])
+
+            # Outliers: points far from the mean on either axis, the most outlying first
+            z_scores = np.zeros(len(x))
+            for values in x, y:
+                std = np.std(values[finite])
+                if std > 0:
+                    z = np.abs((values - np.mean(values[finite])) / std)
+                    z_scores = np.maximum(z_scores, np.where(finite, z, 0))
+            order = np.argsort(-z_scores, kind="stable")
+            outliers = order[z_scores[order] > DENSITY_OUTLIER_Z][:DENSITY_MAX_OUTLIERS]
+            keep = np.zeros(len(self.points), dtype=bool)
+            keep[outliers] = True
+            keep |= ~binned
+            keep |= np.array(["annotation" in p for p in self.points], dtype=bool)
+
+            logger.debug(
+                f"Scatter plot {self.plot.id}: {len(self.points)} points, showing their density on a "
+                f"{n_bins}x{n_bins} grid and {np.count_nonzero(keep)} outliers, annotated and highlighted points"
+            )
+            # Heatmap rows are along y, with empty bins left transparent
+            z = counts.T
+            self.density = {
+                "x": ((x_edges[:-1] + x_edges[1:]) / 2).tolist(),
+                "y": ((y_edges[:-1] + y_edges[1:]) / 2).tolist(),
+                "z": [[None if c == 0 else int(c) for c in row] for row in z.tolist()],
+                # Points that are only in the bins, for the toolbox highlights
+                "samples": {
+                    "name": [str(p.get("name", "")) for p, k in zip(self.points, keep.tolist()) if not k],
+                    "x": [float(f"{v:.4g}") for v in x[~keep].tolist()],
+                    "y": [float(f"{v:.4g}") for v in y[~keep].tolist()],
+                    "bin": _bin_indices(x[~keep], y[~keep], x_edges, y_edges).tolist(),
+                },
+            }
+            self.all_points = self.points
+            self.points = [p for p, k in zip(self.points, keep.tolist()) if k]
+
         def create_figure(
             self,
             layout: Optional[go.Layout] = None,
@@ -70,6 +158,8 @@ class ScatterPlot(Plot):
             Create a Plotly figure for a dataset
             """
             fig = go.Figure(layout=layout)
+            if self.density is not None:
+                fig.add_trace(go.Heatmap(**density_trace(self.density)))
 
             MAX_ANNOTATIONS = 10  # Maximum number of dots to be annotated directly on the plot
             n_annotated = len([el for el in self.points if "annotation" in el])
@@ -191,6 +281,15 @@ class ScatterPlot(Plot):
         """Default tooltip label"""
         return "<br><b>X</b>: %{x}<br><b>Y</b>: %{y}"
 
+    def add_to_report(self, report) -> str:
+        html = super().add_to_report(report)
+        # The report only has the outliers of large datasets, so always save all points
+        if not self.flat and self.pconfig.get("save_data_file", True):
+            for ds in self.datasets:
+                if ds.density is not None:
+                    self.save_data_file(ds)
+        return html
+
     def save_data_file(self, dataset: Dataset) -> None:
         data = [
             {
@@ -198,6 +297,44 @@ class ScatterPlot(Plot):
                 "X": point["x"],
                 "Y": point["y"],
             }
-            for point in dataset.points
+            for point in (dataset.all_points if dataset.all_points is not None else dataset.points)
         ]
         util_functions.write_data_file(data, dataset.uid)
+
+
+def _is_highlighted(name: str) -> bool:
+    """If a sample matches config.highlight_patterns, the same way as the toolbox highlights"""
+    for pattern in config.highlight_patterns or []:
+        if config.highlight_regex:
+            try:
+                if re.search(pattern, name):
+                    return True
+            except re.error:
+                continue
+        elif pattern in name:
+            return True
+    return False
+
+
+def _bin_indices(x: np.ndarray, y: np.ndarray, x_edges: np.ndarray, y_edges: np.ndarray) -> np.ndarray:
+    """Index of the bin of every point in the flattened density, row by row along y, or -1 if not binned"""
+    n_x, n_y = len(x_edges) - 1, len(y_edges) - 1
+    # As in np.histogram2d, the last bin includes its right edge
+    xi = np.minimum(np.searchsorted(x_edges, x, side="right") - 1, n_x - 1)
+    yi = np.minimum(np.searchsorted(y_edges, y, side="right") - 1, n_y - 1)
+    inside = (x >= x_edges[0]) & (x <= x_edges[-1]) & (y >= y_edges[0]) & (y <= y_edges[-1])
+    return np.where(inside, yi * n_x + xi, -1)
+
+
+def density_trace(density: Dict) -> Dict:
+    """Heatmap trace parameters for the binned density of a scatter plot, same as in scatter.js"""
+    return dict(
+        x=density["x"],
+        y=density["y"],
+        z=density["z"],
+        colorscale="Blues",
+        showscale=True,
+        colorbar=dict(title=dict(text="Points"), thickness=10, len=0.5, y=0, yanchor="bottom"),
+        hovertemplate="X: %{x}<br>Y: %{y}<br>Points: %{z}<extra></extra>",
+        showlegend=False,
+    )
@@ -7,7 +7,7 @@ import math
 import numpy as np
 import plotly.graph_objects as go
 
-from multiqc.utils import config, util_functions
+from multiqc.utils import config, events, report_cache, util_functions
 from multiqc.plots.table_object import DataTable
 from multiqc.plots.plotly.plot import Plot, PlotType, BaseDataset
 from multiqc.plots.plotly.table import make_table
@@ -15,6 +15,7 @@ from multiqc.plots.plotly.table import make_table
 logger = logging.getLogger(__name__)
 
 
+@report_cache.record_plot
 def plot(dt: DataTable, show_table_by_default=False) -> str:
     """
     Build and add the plot data to the report, return an HTML wrapper.
@@ -38,6 +39,19 @@ class ViolinPlot(Plot):
         scatter_values_by_sample_by_metric: Dict[str, Dict[str, Union[List[int], List[float], List[str]]]]
         all_samples: List[str]  # unique list of all samples in this dataset
         scatter_trace_params: Dict[str, Any]
+        # Precomputed density curve and quantiles, for metrics with too many values to send to the browser
+        density_by_metric: Dict[str, Dict[str, Any]] = dataclasses.field(default_factory=dict)
+        # All values of the metrics that have a precomputed density, for the data file
+        exact_values_by_sample_by_metric: Dict[str, Dict[str, Union[int, float]]] = dataclasses.field(
+            default_factory=dict
+        )
+
+        def dump_for_javascript(self) -> Dict:
+            d = super().dump_for_javascript()
+            del d["exact_values_by_sample_by_metric"]
+            if not self.density_by_metric:
+                del d["density_by_metric"]
+            return d
 
         @staticmethod
         def create(
@@ -56,6 +70,7 @@ class ViolinPlot(Plot):
             )
 
             all_samples = set()
+            density_values = dict()
             for metric, header in header_by_metric.items():
                 # Add Plotly-specific parameters to the header
                 xaxis = {"ticksuffix": header.get("suffix")}
@@ -100,6 +115,18 @@ class ViolinPlot(Plot):
                 header["show_points"] = len(value_by_sample) <= config.violin_min_threshold_no_points
                 header["show_only_outliers"] = len(value_by_sample) > config.violin_min_threshold_outliers
 
+                # Instead of downsampling large metrics, compute their density here and only show the outliers
+                max_violin_points = config.violin_downsample_after
+                use_density = (
+                    config.violin_density
+                    and values_are_numeric
+                    and max_violin_points is not None
+                    and len(value_by_sample) > max_violin_points
+                )
+                if use_density:
+                    header["show_points"] = True
+                    header["show_only_outliers"] = True
+
                 if values_are_numeric:
                     # Calculate range
                     xmin = header.get("dmin")
@@ -140,6 +167,15 @@ class ViolinPlot(Plot):
                             maxval=header.get("dmax"),
                             metric=header["title"],
                         )
+                        if use_density and np.count_nonzero(outlier_statuses) > max_violin_points:
+                            # Keep the payload bounded: only show the most outlying points
+                            outlier_statuses = find_outliers(
+                                values,
+                                top_n=max_violin_points,
+                                minval=header.get("dmin"),
+                                maxval=header.get("dmax"),
+                                metric=header["title"],
+                            )
                         logger.debug(
                             f"Violin for '{header['title']}': found {np.count_nonzero(outlier_statuses)} outliers"
                         )
@@ -151,8 +187,15 @@ class ViolinPlot(Plot):
 
                 # Now sort and downsample values to keep max 2000 points for each metric
                 violin_values_by_sample = value_by_sample
-                max_violin_points = config.violin_downsample_after
-                if max_violin_points is not None and len(violin_values_by_sample) > max_violin_points:
+                if use_density:
+                    logger.debug(
+                        f"Violin for '{header['title']}': sample number is {len(violin_values_by_sample)}. "
+                        f"Will precompute the density instead of adding all points."
+                    )
+                    ds.exact_values_by_sample_by_metric[metric] = violin_values_by_sample
+                    density_values[metric] = np.array(list(violin_values_by_sample.values()), dtype=float)
+                    violin_values_by_sample = {}
+                elif max_violin_points is not None and len(violin_values_by_sample) > max_violin_points:
                     logger.debug(
                         f"Violin for '{header['title']}': sample number is {len(violin_values_by_sample)}. "
                         f"Will downsample to max {max_violin_points} points."
@@ -178,6 +221,15 @@ class ViolinPlot(Plot):
 
             ds.all_samples = sorted(all_samples)
 
+            # Compute the densities of all large metrics together
+            if density_values:
+                densities = compute_densities(
+                    list(density_values.values()),
+                    method=config.violin_density_method,
+                    n_points=config.violin_density_points,
+                )
+                ds.density_by_metric = dict(zip(density_values.keys(), densities))
+
             ds.trace_params.update(
                 orientation="h",
                 box={"visible": True},
@@ -283,16 +335,20 @@ class ViolinPlot(Plot):
 
                 violin_values_by_sample = violin_values_by_sample_by_metric[metric]
                 axis_key = "" if metric_idx == 0 else str(metric_idx + 1)
-                fig.add_trace(
-                    go.Violin(
-                        x=list(violin_values_by_sample.values()),
-                        name=metric_idx,
-                        text=list(violin_values_by_sample.keys()),
-                        xaxis=f"x{axis_key}",
-                        yaxis=f"y{axis_key}",
-                        **params,
-                    ),
-                )
+                if metric in self.density_by_metric:
+                    for trace in density_traces(self.density_by_metric[metric], metric_idx, params):
+                        fig.add_trace(go.Scatter(xaxis=f"x{axis_key}", yaxis=f"y{axis_key}", **trace))
+                else:
+                    fig.add_trace(
+                        go.Violin(
+                            x=list(violin_values_by_sample.values()),
+                            name=metric_idx,
+                            text=list(violin_values_by_sample.keys()),
+                            xaxis=f"x{axis_key}",
+                            yaxis=f"y{axis_key}",
+                            **params,
+                        ),
+                    )
 
                 if add_scatter and header["show_points"]:
                     if header["show_only_outliers"]:
@@ -382,7 +438,9 @@ class ViolinPlot(Plot):
         # If the number of samples is high:
         # - do not add a table
         # - plot a Violin in Python, and serialise the figure instead of the datasets
-        self.n_samples = max(len(ds.all_samples) for ds in self.datasets)
+        self.n_samples = max(
+            len(set(ds.all_samples).union(*ds.exact_values_by_sample_by_metric.values())) for ds in self.datasets
+        )
         self.serialize_figure = False
         if self.n_samples > config.max_table_rows and not self.no_violin:
             self.show_table = False
@@ -461,6 +519,12 @@ class ViolinPlot(Plot):
                 + f' data-toggle="tooltip"></span> Showing {self.n_samples} samples.</p>'
             )
 
+        # The report only has the densities of large metrics, so always save all values
+        if not self.flat and self.pconfig.get("save_data_file", True):
+            for ds in self.datasets:
+                if ds.density_by_metric:
+                    self.save_data_file(ds)
+
         if not self.show_table:
             # Show violin alone.
             # Note that "no_violin" will be ignored here as we need to render _something_. The only case it can
@@ -468,7 +532,8 @@ class ViolinPlot(Plot):
             html = warning + super().add_to_report(report)
         elif self.no_violin:
             # Show table alone
-            table_html, configuration_modal = make_table(self.dt)
+            with events.start_span("plot", plot_id=self.dt.id, plot_type="table", n_samples=self.n_samples):
+                table_html, configuration_modal = make_table(self.dt)
             html = warning + table_html + configuration_modal
         else:
             # Render both, add a switch between table and violin
@@ -522,7 +587,9 @@ class ViolinPlot(Plot):
     def save_data_file(self, dataset: Dataset) -> None:
         data = {}
         for metric in dataset.metrics:
-            values_by_sample = dataset.violin_values_by_sample_by_metric[metric]
+            values_by_sample = dataset.exact_values_by_sample_by_metric.get(
+                metric, dataset.violin_values_by_sample_by_metric[metric]
+            )
             title = dataset.header_by_metric[metric]["title"]
             for sample, value in values_by_sample.items():
                 data.setdefault(sample, {})[title] = value
@@ -530,6 +597,166 @@ class ViolinPlot(Plot):
         util_functions.write_data_file(data, dataset.uid)
 
 
+def compute_densities(values_by_metric: List[np.ndarray], method: str = "kde", n_points: int = 200) -> List[Dict]:
+    """
+    Compute the density curve and the box plot statistics of many metrics in one batch.
+    The values of each metric are put in a row of a NaN-padded matrix, so that the
+    quantiles, and the histograms for all metrics are computed together.
+
+    With method="kde", the density is a Gaussian kernel density estimate, with Silverman's
+    rule for the bandwidth as in Plotly violins, and extends two bandwidths beyond the data.
+    It is computed by binning the values onto a grid of n_points and smoothing the counts
+    with an FFT convolution. With method="histogram", the density is a histogram with
+    n_points bins between the lowest and highest values.
+
+    Returns a dict for each metric, with the grid ("x"), the density ("y"), and "min", "q1",
+    "median", "q3", "max", "mean" and the whiskers "lower_fence" and "upper_fence".
+    Missing values (NaN) are left out.
+    """
+    n_metrics = len(values_by_metric)
+    values_by_metric = [np.asarray(v, dtype=float) for v in values_by_metric]
+    values_by_metric = [v[~np.isnan(v)] for v in values_by_metric]
+    counts = np.array([len(v) for v in values_by_metric])
+    padded = np.full((n_metrics, max(1, max(counts))), np.nan)
+    for i, values in enumerate(values_by_metric):
+        padded[i, : len(values)] = values
+
+    vmin = np.nanmin(padded, axis=1)
+    vmax = np.nanmax(padded, axis=1)
+    mean = np.nanmean(padded, axis=1)
+    std = np.nanstd(padded, axis=1)
+    q1, median, q3 = np.nanquantile(padded, [0.25, 0.5, 0.75], axis=1)
+    iqr = q3 - q1
+    # Whiskers go to the furthest values within 1.5 IQR of the box
+    with np.errstate(invalid="ignore"):
+        lower_fence = np.nanmin(np.where(padded >= (q1 - 1.5 * iqr)[:, None], padded, np.nan), axis=1)
+        upper_fence = np.nanmax(np.where(padded <= (q3 + 1.5 * iqr)[:, None], padded, np.nan), axis=1)
+
+    if method == "histogram":
+        lo, hi = vmin.copy(), vmax.copy()
+    else:
+        spread = np.where((iqr > 0) & (iqr / 1.349 < std), iqr / 1.349, std)
+        bandwidth = 1.059 * spread * counts ** (-1 / 5)
+        # Metrics where all values are the same still get a narrow peak
+        bandwidth = np.where(bandwidth > 0, bandwidth, np.maximum(np.abs(vmin), 1) * 0.01)
+        lo, hi = vmin - 2 * bandwidth, vmax + 2 * bandwidth
+    flat = hi == lo
+    lo, hi = np.where(flat, lo - 0.5, lo), np.where(flat, hi + 0.5, hi)
+
+    # Bin the values of all metrics with a single bincount, into n_points bins per metric
+    width = (hi - lo) / n_points
+    bins = np.floor((padded - lo[:, None]) / width[:, None])
+    valid = ~np.isnan(padded)
+    bins = np.clip(bins[valid].astype(np.int64), 0, n_points - 1)
+    metric_idx = np.broadcast_to(np.arange(n_metrics)[:, None], padded.shape)[valid]
+    hist = np.bincount(metric_idx * n_points + bins, minlength=n_metrics * n_points).reshape(n_metrics, n_points)
+    grid = lo[:, None] + width[:, None] * (np.arange(n_points) + 0.5)
+
+    if method == "histogram":
+        density = hist / (counts[:, None] * width[:, None])
+    else:
+        # Gaussian kernels for every metric, in units of bins, convolved with the counts using FFT
+        size = 2 * n_points
+        offsets = np.fft.fftfreq(size, 1 / size)
+        sigma = (bandwidth / width)[:, None]
+        kernels = np.exp(-0.5 * (offsets[None, :] / sigma) ** 2) / (sigma * np.sqrt(2 * np.pi))
+        smoothed = np.fft.irfft(np.fft.rfft(hist, size, axis=1) * np.fft.rfft(kernels, axis=1), size, axis=1)
+        density = np.clip(smoothed[:, :n_points], 0, None) / (counts[:, None] * width[:, None])
+
+    stats = {
+        "min": vmin,
+        "q1": q1,
+        "median": median,
+        "q3": q3,
+        "max": vmax,
+        "mean": mean,
+        "lower_fence": lower_fence,
+        "upper_fence": upper_fence,
+    }
+    stats = {k: v.tolist() for k, v in stats.items()}
+    grid, density = grid.tolist(), density.tolist()
+    return [{"x": grid[i], "y": density[i], **{k: v[i] for k, v in stats.items()}} for i in range(n_metrics)]
+
+
+def density_traces(density: Dict[str, Any], metric_idx: int, params: Dict) -> List[Dict]:
+    """
+    Scatter traces that draw a precomputed density like a violin: the density outline
+    mirrored around the violin axis, a box from the 1st to the 3rd quartile, and lines for
+    the whiskers, the median and the mean. Mirrors buildTraces() in violin.js.
+    """
+    scale = 0.45 / (max(density["y"]) or 1)
+    y_top = [metric_idx + v * scale for v in density["y"]]
+    y_bottom = [metric_idx - v * scale for v in density["y"]]
+    line_color = params.get("line", {}).get("color", "grey")
+    box_top, box_bottom = metric_idx + 0.05, metric_idx - 0.05
+    # The mean line spans the density at the mean, like the meanline of a Plotly violin
+    mean_height = float(np.interp(density["mean"], density["x"], density["y"])) * scale
+    box_text = (
+        "<br>".join(
+            f"{label}: {density[key]:.4g}"
+            for key, label in [("max", "Max"), ("q3", "Q3"), ("median", "Median"), ("mean", "Mean"), ("q1", "Q1")]
+        )
+        + f"<br>Min: {density['min']:.4g}"
+    )
+    return [
+        {
+            "x": density["x"] + density["x"][::-1],
+            "y": y_top + y_bottom[::-1],
+            "mode": "lines",
+            "fill": "toself",
+            "fillcolor": params.get("fillcolor"),
+            "line": params.get("line"),
+            "opacity": params.get("opacity"),
+            "hoverinfo": "skip",
+            "showlegend": False,
+        },
+        {
+            "x": [density["q1"], density["q3"], density["q3"], density["q1"], density["q1"]],
+            "y": [box_bottom, box_bottom, box_top, box_top, box_bottom],
+            "mode": "lines",
+            "fill": "toself",
+            "fillcolor": "white",
+            "line": {"width": 1, "color": line_color},
+            "hoveron": "fills",
+            "hoverinfo": "text",
+            "text": box_text,
+            "showlegend": False,
+        },
+        {
+            "x": [
+                density["lower_fence"],
+                density["q1"],
+                None,
+                density["q3"],
+                density["upper_fence"],
+                None,
+                density["median"],
+                density["median"],
+                None,
+                density["mean"],
+                density["mean"],
+            ],
+            "y": [
+                metric_idx,
+                metric_idx,
+                None,
+                metric_idx,
+                metric_idx,
+                None,
+                box_bottom,
+                box_top,
+                None,
+                metric_idx - mean_height,
+                metric_idx + mean_height,
+            ],
+            "mode": "lines",
+            "line": {"width": 2, "color": line_color},
+            "hoverinfo": "skip",
+            "showlegend": False,
+        },
+    ]
+
+
 def find_outliers(
     values: Union[List[int], List[float]],
     top_n: Optional[int] = None,
@@ -252,6 +252,35 @@ class DataTable:
                 for custom_k, custom_v in config.custom_table_header_config.get(self.id, {}).get(k, {}).items():
                     headers[idx][k][custom_k] = custom_v
 
+        # Assign to buckets for sorting
+        # So the final ordering is:
+        #   placement > section > explicit_ordering
+        # Of course, the user can shuffle these manually.
+        for idx, hs in enumerate(headers):
+            for k in hs.keys():
+                self.headers_in_order[headers[idx][k]["placement"]].append((idx, k))
+
+        # Skip any data that is not used in the table
+        # Would be ignored for making the table anyway, but can affect whether a beeswarm plot is used
+        for idx, d in enumerate(data):
+            for s_name in list(d.keys()):
+                if not any(h in data[idx][s_name].keys() for h in headers[idx]):
+                    del data[idx][s_name]
+
+        # Assign to class
+        self.data = data
+        self.headers = headers
+        self.pconfig = pconfig
+        self.update_scales()
+
+    def update_scales(self):
+        """
+        Work out the colour scale of every column from the data, where the max and min
+        aren't given. Columns with the same shared_key get the same scale.
+        """
+        data, headers = self.data, self.headers
+        for idx in range(len(headers)):
+            for k in headers[idx]:
                 # Work out max and min value if not given
                 setdmax = False
                 setdmin = False
@@ -305,11 +334,6 @@ class DataTable:
                     shared_keys[sk]["dmin"] = min(
                         headers[idx][k]["dmin"], shared_keys[sk].get("dmin", headers[idx][k]["dmin"])
                     )
-
-        # Overwrite shared key settings and at the same time assign to buckets for sorting
-        # So the final ordering is:
-        #   placement > section > explicit_ordering
-        # Of course, the user can shuffle these manually.
         for idx, hs in enumerate(headers):
             for k in hs.keys():
                 sk = headers[idx][k]["shared_key"]
@@ -317,20 +341,6 @@ class DataTable:
                     headers[idx][k]["dmax"] = shared_keys[sk]["dmax"]
                     headers[idx][k]["dmin"] = shared_keys[sk]["dmin"]
 
-                self.headers_in_order[headers[idx][k]["placement"]].append((idx, k))
-
-        # Skip any data that is not used in the table
-        # Would be ignored for making the table anyway, but can affect whether a beeswarm plot is used
-        for idx, d in enumerate(data):
-            for s_name in list(d.keys()):
-                if not any(h in data[idx][s_name].keys() for h in headers[idx]):
-                    del data[idx][s_name]
-
-        # Assign to class
-        self.data = data
-        self.headers = headers
-        self.pconfig = pconfig
-
     def get_headers_in_order(self) -> List[Tuple[int, str, Dict]]:
         """
         Gets the headers in the order they want to be displayed.
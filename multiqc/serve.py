@@ -0,0 +1,413 @@
+#!/usr/bin/env python
+
+""" MultiQC report server.
+
+`multiqc serve` starts a long-running process that keeps the MultiQC modules,
+templates and compiled search patterns loaded, and runs report jobs sent to it
+by `multiqc --client`. This avoids paying the start-up cost for every report
+when many reports are generated in a row, e.g. one per batch in a pipeline.
+
+Jobs are sent as JSON over HTTP on a local Unix socket (or on 127.0.0.1 with
+--port) and run one at a time, with the config and report reset between them.
+A job runs any command line as the user of the server, so the socket is only
+accessible to that user, in a directory that only that user can write to, and on a
+TCP port every request must carry the shared secret from $MULTIQC_SERVE_TOKEN. The
+client checks that the socket belongs to its user before sending a job, and only
+sends the environment variables that MultiQC reads.
+"""
+
+import getpass
+import hmac
+import http.client
+import io
+import json
+import logging
+import os
+import re
+import signal
+import socket
+import socketserver
+import stat
+import sys
+import tempfile
+import time
+import traceback
+from contextlib import redirect_stderr, redirect_stdout
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Dict, List, Optional
+
+import rich_click as click
+
+from multiqc.utils import config
+
+logger = logging.getLogger("multiqc.serve")
+
+ADDRESS_ENV_VAR = "MULTIQC_SERVE_ADDRESS"
+TOKEN_ENV_VAR = "MULTIQC_SERVE_TOKEN"
+
+# Environment variables that MultiQC reads, which the client sends with a job, along with
+# all MULTIQC_* variables. The rest of the client environment isn't sent.
+FORWARDED_ENV_VARS = {
+    "MEGAQC_ACCESS_TOKEN",
+    "XDG_CONFIG_HOME",
+    "XDG_CACHE_HOME",
+    "CI",
+    "GITHUB_ACTIONS",
+    "GITHUB_WORKSPACE",
+    "FORCE_COLOR",
+    "PY_COLORS",
+    "NO_COLOR",
+    "TZ",
+}
+
+
+def default_address() -> str:
+    """Socket path or http://127.0.0.1:PORT address used by both the server and the client"""
+    address = os.environ.get(ADDRESS_ENV_VAR)
+    if address:
+        return address
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return os.path.join(runtime_dir, "multiqc.sock")
+    try:
+        user = getpass.getuser()
+    except Exception:
+        user = str(os.getuid())
+    # A directory of our own, as anyone can create files in the temporary directory
+    return os.path.join(tempfile.gettempdir(), f"multiqc-{user}", "serve.sock")
+
+
+def _is_forwarded(name: str) -> bool:
+    return (name.startswith("MULTIQC_") and name != TOKEN_ENV_VAR) or name in FORWARDED_ENV_VARS
+
+
+def _check_socket_dir(directory: str):
+    """
+    Raise OSError unless the directory belongs to this user (or root), and other users
+    can't replace the files in it: not writable by them, or with the sticky bit like /tmp
+    """
+    st = os.stat(directory)
+    if st.st_uid not in (os.getuid(), 0):
+        raise OSError(f"'{directory}' belongs to another user")
+    if st.st_mode & (stat.S_IWGRP | stat.S_IWOTH) and not st.st_mode & stat.S_ISVTX:
+        raise OSError(f"'{directory}' can be written by other users")
+
+
+def _check_socket(path: str):
+    """Raise OSError unless the path is a socket of this user, in a directory checked by _check_socket_dir()"""
+    _check_socket_dir(os.path.dirname(os.path.abspath(path)))
+    st = os.lstat(path)
+    if not stat.S_ISSOCK(st.st_mode):
+        raise OSError(f"'{path}' is not a socket")
+    if st.st_uid != os.getuid():
+        raise OSError(f"'{path}' belongs to another user")
+
+
+def _tcp_port(address: str) -> Optional[int]:
+    m = re.match(r"^https?://(?:127\.0\.0\.1|localhost):(\d+)/?$", address)
+    return int(m.group(1)) if m else None
+
+
+class _UnixHTTPServer(socketserver.UnixStreamServer):
+    allow_reuse_address = True
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection that connects to a Unix socket instead of a TCP port"""
+
+    def __init__(self, socket_path: str, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class JobHandler(BaseHTTPRequestHandler):
+    """Handles POST /run with a job, and GET /status"""
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        if self.path.rstrip("/") == "/status":
+            self._send_json(200, {"status": "ok", "version": config.version, "jobs_run": self.server.jobs_run})
+        else:
+            self._send_json(404, {"error": f"Unknown endpoint: {self.path}"})
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        if self.path.rstrip("/") != "/run":
+            self._send_json(404, {"error": f"Unknown endpoint: {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            job = json.loads(self.rfile.read(length))
+        except (ValueError, TypeError) as e:
+            self._send_json(400, {"error": f"Could not parse job: {e}"})
+            return
+        self._send_json(200, run_job(job))
+        self.server.jobs_run += 1
+
+    def _authorized(self) -> bool:
+        """Check the token of the request if the server has one, and send an error if it's wrong"""
+        token = self.server.token
+        if token is None:
+            return True
+        given = self.headers.get("Authorization", "")
+        if hmac.compare_digest(given.encode("utf-8"), f"Bearer {token}".encode("utf-8")):
+            return True
+        self._send_json(401, {"error": f"Missing or wrong token, set ${TOKEN_ENV_VAR} to the token of the server"})
+        return False
+
+    def _send_json(self, code: int, data: Dict):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix socket clients don't have an address
+        return self.client_address[0] if self.client_address else "local"
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} - {format % args}")
+
+
+def warm_up(kaleido: bool = False):
+    """
+    Load everything that doesn't depend on the job, so that it's already in
+    memory when the first job arrives
+    """
+    t0 = time.time()
+    # Module and template entry points
+    for name, entry_point in list(config.avail_modules.items()) + list(config.avail_templates.items()):
+        try:
+            entry_point.load()
+        except Exception as e:
+            logger.warning(f"Could not load '{name}': {e}")
+
+    # Search patterns, compiled regexes are cached by the re module
+    n_patterns = 0
+    for patterns in config.sp.values():
+        for pattern in patterns if isinstance(patterns, list) else [patterns]:
+            if not isinstance(pattern, dict):
+                continue
+            for key in ("fn_re", "contents_re"):
+                if pattern.get(key):
+                    try:
+                        re.compile(pattern[key])
+                        n_patterns += 1
+                    except re.error:
+                        pass
+
+    # Plotting libraries
+    import plotly.graph_objects  # noqa: F401
+    import plotly.io  # noqa: F401
+
+    if kaleido:
+        try:
+            import kaleido as kaleido_lib
+
+            kaleido_lib.start_sync_server(silence_warnings=True)
+        except Exception as e:
+            logger.warning(f"Could not start Kaleido, flat plots will be slower to export: {e}")
+
+    logger.info(
+        f"Loaded {len(config.avail_modules)} modules, {len(config.avail_templates)} templates "
+        f"and {n_patterns} search patterns in {time.time() - t0:.2f}s"
+    )
+
+
+def run_job(job: Dict) -> Dict:
+    """
+    Run a single MultiQC job: the command line arguments, working directory
+    and environment of the client. Returns the exit code and captured output.
+    """
+    from multiqc import multiqc
+
+    argv: List[str] = job.get("argv", [])
+    cwd: str = job.get("cwd") or os.getcwd()
+    env: Optional[Dict[str, str]] = job.get("env")
+    if env is not None:
+        env = {k: v for k, v in env.items() if _is_forwarded(k)}
+
+    saved_cwd = os.getcwd()
+    saved_env = dict(os.environ)
+    saved_argv = sys.argv
+    stdout, stderr = io.StringIO(), io.StringIO()
+    sys_exit_code = 1
+    logger.info(f"Running job in {cwd}: multiqc {' '.join(argv)}")
+    t0 = time.time()
+    try:
+        os.chdir(cwd)
+        if env is not None:
+            # The variables that MultiQC reads come from the client, the rest from the server
+            for name in [name for name in os.environ if _is_forwarded(name)]:
+                del os.environ[name]
+            os.environ.update(env)
+
+        # Start from a clean config, as if MultiQC had just been launched in this directory
+        config.reset(cwd)
+        config.megaqc_access_token = os.environ.get("MEGAQC_ACCESS_TOKEN")
+        multiqc.start_execution_time = time.time()
+        sys.argv = ["multiqc"] + argv
+
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            try:
+                with multiqc.run_cli.make_context("multiqc", list(argv)) as ctx:
+                    params = dict(ctx.params)
+                params.pop("client", None)
+                sys_exit_code = multiqc.run(**params)["sys_exit_code"]
+            except click.exceptions.Exit as e:
+                # --help and --version
+                sys_exit_code = e.exit_code
+            except click.ClickException as e:
+                e.show(file=sys.stderr)
+                sys_exit_code = e.exit_code
+            except SystemExit as e:
+                sys_exit_code = e.code if isinstance(e.code, int) else 1
+            except Exception:
+                traceback.print_exc()
+                sys_exit_code = 1
+    finally:
+        sys.argv = saved_argv
+        os.chdir(saved_cwd)
+        if env is not None:
+            os.environ.clear()
+            os.environ.update(saved_env)
+
+    logger.info(f"Finished job with exit code {sys_exit_code} in {time.time() - t0:.2f}s")
+    return {"sys_exit_code": sys_exit_code, "stdout": stdout.getvalue(), "stderr": stderr.getvalue()}
+
+
+def run_client(argv: List[str], address: Optional[str] = None) -> int:
+    """Forward a command line to a running `multiqc serve` and print its output"""
+    address = address or default_address()
+    job = {"argv": argv, "cwd": os.getcwd(), "env": {k: v for k, v in os.environ.items() if _is_forwarded(k)}}
+    port = _tcp_port(address)
+    if port is not None:
+        conn = http.client.HTTPConnection("127.0.0.1", port)
+    else:
+        # Don't send the job to a socket that another user could have put there
+        try:
+            _check_socket(address)
+        except FileNotFoundError:
+            pass  # Reported when connecting
+        except OSError as e:
+            print(f"Not sending the job to the MultiQC server at '{address}': {e}", file=sys.stderr)
+            return 1
+        conn = _UnixHTTPConnection(address)
+    headers = {"Content-Type": "application/json"}
+    token = os.environ.get(TOKEN_ENV_VAR)
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    try:
+        conn.request("POST", "/run", body=json.dumps(job), headers=headers)
+        response = conn.getresponse()
+        result = json.loads(response.read())
+    except (OSError, http.client.HTTPException) as e:
+        print(
+            f"Could not connect to the MultiQC server at '{address}': {e}\n"
+            "Start one with 'multiqc serve', or run without --client.",
+            file=sys.stderr,
+        )
+        return 1
+    finally:
+        conn.close()
+    if "error" in result:
+        print(f"MultiQC server error: {result['error']}", file=sys.stderr)
+        return 1
+    sys.stderr.write(result.get("stderr", ""))
+    sys.stdout.write(result.get("stdout", ""))
+    return result.get("sys_exit_code", 1)
+
+
+@click.command(context_settings=dict(help_option_names=["-h", "--help"]))
+@click.option("--socket", "socket_path", type=str, help="Unix socket to listen on")
+@click.option("--port", type=int, help="Listen on 127.0.0.1 with this port instead of a Unix socket")
+@click.option("--kaleido", is_flag=True, help="Keep Kaleido running to speed up exporting flat plots")
+@click.option("-v", "--verbose", is_flag=True, help="Log every request")
+def serve_cli(socket_path, port, kaleido, verbose):
+    """Run a MultiQC server that keeps everything loaded between reports.
+
+    Send reports to it with '[blue bold]multiqc --client .[/]', using the same
+    arguments as a normal MultiQC run. The server address can also be set with
+    the [yellow]$MULTIQC_SERVE_ADDRESS[/] environment variable. With --port,
+    the server and clients need the same secret in [yellow]$MULTIQC_SERVE_TOKEN[/].
+    """
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter("[%(asctime)s] %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG if verbose else logging.INFO)
+    # Keep server logs out of the job logs, which are set up on the parent "multiqc" logger
+    logger.propagate = False
+
+    address = default_address()
+    if port is None and socket_path is None:
+        port = _tcp_port(address)
+    token = os.environ.get(TOKEN_ENV_VAR) or None
+    if port is not None:
+        # Any local user can connect to a TCP port, and jobs run arbitrary commands as this user
+        if token is None:
+            raise click.ClickException(f"Set a secret token in ${TOKEN_ENV_VAR} to listen on a TCP port")
+        server = HTTPServer(("127.0.0.1", port), JobHandler)
+        address = f"http://127.0.0.1:{server.server_address[1]}"
+    else:
+        address = socket_path or address
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(address)), mode=0o700, exist_ok=True)
+            _check_socket_dir(os.path.dirname(os.path.abspath(address)))
+            if os.path.lexists(address):
+                _check_socket(address)
+        except OSError as e:
+            raise click.ClickException(f"Can't listen on '{address}': {e}")
+        if os.path.lexists(address):
+            # Only remove the socket if nothing is listening on it any more
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(address)
+                raise click.ClickException(f"A MultiQC server is already running on '{address}'")
+            except ConnectionRefusedError:
+                os.remove(address)
+            finally:
+                probe.close()
+        # Create the socket only accessible to this user, rather than changing its mode after binding
+        old_umask = os.umask(0o177)
+        try:
+            server = _UnixHTTPServer(address, JobHandler)
+        finally:
+            os.umask(old_umask)
+    server.jobs_run = 0
+    server.token = token
+
+    def stop(signum, frame):
+        # Stop taking jobs straight away, the rest is cleaned up below
+        if port is None and os.path.exists(address):
+            os.remove(address)
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, stop)
+
+    warm_up(kaleido=kaleido)
+    logger.info(f"MultiQC v{config.version} server listening on {address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Shutting down")
+    finally:
+        server.server_close()
+        if port is None and os.path.exists(address):
+            os.remove(address)
+        if kaleido:
+            try:
+                import kaleido as kaleido_lib
+
+                kaleido_lib.stop_sync_server(silence_warnings=True)
+            except Exception:
+                pass
@@ -0,0 +1,619 @@
+#!/usr/bin/env python
+
+""" MultiQC report slicing.
+
+`multiqc slice SNAPSHOT --samples customer_a.txt` makes a report for a subset of the
+samples of an earlier run, without searching or parsing any files again. The earlier
+run must have been made with `slice_snapshot: true`, which saves the output of every
+module in the data directory (as for --update, see multiqc.utils.report_cache), along
+with a copy of the inputs of every plot.
+
+Each module of the snapshot is restored with only the selected samples: the General
+Statistics rows, data sources and data files are filtered by sample name, and the
+plots and tables are made again from their inputs, with the other samples masked out.
+Modules with none of the selected samples are left out of the report.
+
+Samples are selected like in a normal run, with `sample_names_only_include` (set from
+the --samples files), `sample_names_ignore` (--ignore-samples) and `sample_names_ignore_re`.
+Only names that are known to be samples of a module are filtered: the sample names in
+its General Statistics rows, data sources, bar graphs, box plots and tables, and names
+that start with one of them followed by a separator, like "S1_R1" for "S1".
+
+HTML that a module writes itself, such as the module introduction and section content,
+can't be made again. JSON payloads in it (`<script type="application/json">`) are filtered
+the same way, and module introductions and sections that still mention other samples
+are left out with a warning, so that a sliced report never shows them.
+"""
+
+import copy
+import importlib
+import inspect
+import json
+import logging
+import os
+import re
+import sys
+import time
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+import rich_click as click
+
+from multiqc.utils import config, log, report_cache
+
+logger = logging.getLogger("multiqc.slicing")
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def find_snapshot(path: str) -> str:
+    """
+    The data directory of a snapshot, given the data directory or the report directory.
+    Raises SnapshotError if it wasn't made with slice_snapshot.
+    """
+    candidates = [path, os.path.join(path, config.data_dir_name)]
+    if os.path.isdir(path):
+        candidates.extend(os.path.join(path, d) for d in sorted(os.listdir(path)))
+    for data_dir in candidates:
+        if os.path.isfile(os.path.join(data_dir, report_cache.MANIFEST_FN)):
+            break
+    else:
+        raise SnapshotError(f"No MultiQC snapshot found in '{path}'")
+    try:
+        manifest = report_cache.load_manifest(data_dir)
+    except (OSError, ValueError) as e:
+        raise SnapshotError(f"Could not load the snapshot in '{data_dir}': {e}")
+    if not manifest.get("slice_snapshot"):
+        raise SnapshotError(f"The report in '{data_dir}' wasn't made with 'slice_snapshot: true'")
+    return data_dir
+
+
+def read_sample_list(path: str) -> List[str]:
+    """Sample names or glob patterns in a file, one per line"""
+    with open(path) as fh:
+        return [line.strip() for line in fh if line.strip() and not line.startswith("#")]
+
+
+def slice_report(snapshot: str, samples: Optional[List[str]] = None, outdir: Optional[str] = None, **kwargs) -> Dict:
+    """
+    Make a report for a subset of the samples of a snapshot, without searching or parsing
+    any files. Starts from a clean config, as if MultiQC had just been launched.
+    :param snapshot: report or data directory of a run made with slice_snapshot
+    :param samples: sample names or glob patterns to keep, all samples if not given
+    :param outdir: directory to write the report to
+    :param kwargs: any other arguments of multiqc.run(), e.g. title or ignore_samples
+    :return: same as multiqc.run()
+    """
+    from multiqc import multiqc
+
+    snapshot_dir = find_snapshot(snapshot)
+    config.reset(os.getcwd())
+    multiqc.start_execution_time = time.time()
+    return multiqc.run(**_run_params(snapshot_dir, samples, outdir, **kwargs))
+
+
+def _run_params(snapshot_dir: str, samples: Optional[List[str]], outdir: Optional[str], **kwargs) -> Dict:
+    """Parameters of multiqc.run() to make a report from a snapshot"""
+    cl_config = tuple(kwargs.pop("cl_config", ()))
+    if samples:
+        cl_config += (json.dumps({"sample_names_only_include": list(samples)}),)
+    return dict(
+        analysis_dir=report_cache.load_manifest(snapshot_dir).get("analysis_dir") or [],
+        outdir=outdir,
+        cl_config=cl_config,
+        snapshot_dir=snapshot_dir,
+        **kwargs,
+    )
+
+
+def slice_record(record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    The output of a module recorded in a snapshot, for the selected samples. Makes the
+    plots again and returns the rest to add to the report, or None if the module has
+    none of the selected samples.
+    """
+    calls = []
+    for call in record.get("plot_calls", []):
+        func = _plot_function(call["func"])
+        params = inspect.signature(func).bind(*call["args"], **call["kwargs"]).arguments
+        calls.append((call, func, dict(params)))
+
+    selection = _Selection(_record_samples(record, calls))
+    if not selection.any_kept(selection.samples):
+        return None
+
+    # Make the plots again, and swap them in place of the old ones in the sections
+    replaced_html = []
+    replaced_plot_ids = set()
+    replaced_raw_data = set()
+    for call, func, params in calls:
+        replaced_plot_ids.update(call["plot_ids"])
+        replaced_raw_data.update(call["saved_raw_data_keys"])
+        slicer = _SLICERS.get(call["func"])
+        params = slicer(params, selection) if slicer is not None else None
+        html = ""
+        if params is not None:
+            try:
+                html = func(**params)
+            except Exception as e:
+                if config.strict:
+                    raise
+                logger.warning(f"Could not make plot for the selected samples, leaving it out: {e}")
+        replaced_html.append((call["html"], html))
+
+    modules = []
+    for attrs in record["modules"]:
+        attrs = dict(attrs)
+        for key in _MODULE_HTML_ATTRS:
+            if isinstance(attrs.get(key), str):
+                attrs[key] = _kept_html(attrs[key], selection)
+                leaked = selection.leaked(attrs[key])
+                if leaked:
+                    logger.warning(
+                        f"{attrs.get('name')}: leaving out the module {key}, "
+                        f"it has data of {len(leaked)} samples that aren't selected"
+                    )
+                    attrs[key] = ""
+        sections = []
+        for section in attrs["sections"]:
+            section = dict(section)
+            had_output = _has_output(section)
+            for key in ["plot", "content"]:
+                if isinstance(section.get(key), str):
+                    for old_html, new_html in replaced_html:
+                        if old_html:
+                            section[key] = section[key].replace(old_html, new_html)
+            # Sections that only had plots without any of the selected samples
+            if had_output and not _has_output(section):
+                continue
+            leaked = set()
+            for key, value in section.items():
+                if isinstance(value, str):
+                    section[key] = _kept_html(value, selection)
+                    leaked.update(selection.leaked(section[key]))
+            if leaked:
+                logger.warning(
+                    f"{attrs.get('name')}: leaving out section '{section.get('name') or section.get('anchor')}', "
+                    f"it has data of {len(leaked)} samples that aren't selected"
+                )
+                continue
+            sections.append(section)
+        modules.append(dict(attrs, sections=sections))
+
+    saved_raw_data = {}
+    for fn, data in record["saved_raw_data"].items():
+        if fn not in replaced_raw_data:
+            sliced = selection.filter(data)
+            if not isinstance(data, Mapping) or len(sliced) > 0 or len(data) == 0:
+                saved_raw_data[fn] = sliced
+    general_stats = []
+    for data, headers in record["general_stats"]:
+        data = selection.filter(data)
+        if data:
+            general_stats.append((data, headers))
+    return dict(
+        record,
+        modules=modules,
+        plot_data={plot_id: d for plot_id, d in record["plot_data"].items() if plot_id not in replaced_plot_ids},
+        general_stats=general_stats,
+        saved_raw_data=saved_raw_data,
+        data_sources={
+            mod_name: {section: selection.filter(sources) for section, sources in sections.items()}
+            for mod_name, sections in record["data_sources"].items()
+        },
+    )
+
+
+class _Selection:
+    """The known samples of a module, and which of them to keep"""
+
+    def __init__(self, samples: Iterable):
+        self.samples = {str(s_name) for s_name in samples}
+        self._kept: Dict[str, bool] = {}
+        self._sample_of: Dict[str, Optional[str]] = {}
+        self._names_re: Optional[re.Pattern] = None
+
+    def sample_of(self, name) -> Optional[str]:
+        """
+        The known sample that a name is for: the sample itself, or the longest sample name
+        that it starts with followed by a separator, e.g. "S1_R1" or "S1 - FR" for "S1"
+        """
+        name = str(name)
+        if name not in self._sample_of:
+            self._sample_of[name] = None
+            if name in self.samples:
+                self._sample_of[name] = name
+            else:
+                for i in range(len(name) - 1, 0, -1):
+                    if not name[i].isalnum() and name[:i].rstrip() in self.samples:
+                        self._sample_of[name] = name[:i].rstrip()
+                        break
+        return self._sample_of[name]
+
+    def keep(self, name) -> bool:
+        """Keep anything that isn't for a known sample, and the selected samples"""
+        from multiqc.modules.base_module import BaseMultiqcModule
+
+        name = str(name)
+        if name not in self._kept:
+            s_name = self.sample_of(name)
+            self._kept[name] = s_name is None or not BaseMultiqcModule.is_ignore_sample(s_name)
+        return self._kept[name]
+
+    def mask(self, names: Iterable) -> np.ndarray:
+        """Boolean mask of the names to keep"""
+        return np.array([self.keep(name) for name in names], dtype=bool)
+
+    def any_kept(self, names: Iterable) -> bool:
+        """False if there are known samples among the names, but none of them are kept"""
+        known = [name for name in names if self.sample_of(name) is not None]
+        return not known or any(self.keep(name) for name in known)
+
+    def filter(self, data):
+        """Dict without the samples that aren't kept, other data as it is"""
+        if isinstance(data, Mapping):
+            return {k: v for k, v in data.items() if self.keep(k)}
+        return data
+
+    def leaked(self, text: str) -> List[str]:
+        """Known samples that aren't kept and are mentioned in a text, as whole words"""
+        if not self.samples or not text:
+            return []
+        if self._names_re is None:
+            self._names_re = re.compile(r"(?<![A-Za-z0-9])" + _words_regex(self.samples) + r"(?![A-Za-z0-9])")
+        text = _DATA_URI_RE.sub("", text)  # Embedded images, like flat plots
+        return sorted({m.group(0) for m in self._names_re.finditer(text) if not self.keep(m.group(0))})
+
+
+def _words_regex(words: Iterable[str]) -> str:
+    """
+    Regular expression for any of the words, longest first, written as a tree of their
+    prefixes so that it stays fast with many thousands of sample names
+    """
+    tree: Dict = {}
+    for word in words:
+        node = tree
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def to_regex(node: Dict) -> str:
+        branches = [re.escape(char) + to_regex(child) for char, child in node.items() if char]
+        if "" in node:
+            branches.append("")
+        if len(branches) == 1:
+            return branches[0]
+        return "(?:" + "|".join(branches) + ")"
+
+    return to_regex(tree)
+
+
+def _plot_function(path: str) -> Callable:
+    module_name, func_name = path.rsplit(".", 1)
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def _record_samples(record: Dict[str, Any], calls: List) -> set:
+    """Names that are known to be samples of a recorded module"""
+    samples = set()
+    for data, _ in record["general_stats"]:
+        samples.update(data.keys())
+    for sections in record["data_sources"].values():
+        for sources in sections.values():
+            samples.update(sources.keys())
+    for call, _, params in calls:
+        if call["func"] == "multiqc.plots.plotly.bar.plot":
+            for s_names in params["samples_lists"]:
+                samples.update(s_names)
+        elif call["func"] == "multiqc.plots.plotly.box.plot":
+            for data_by_sample in params["list_of_data_by_sample"]:
+                samples.update(data_by_sample.keys())
+        elif call["func"] == "multiqc.plots.plotly.violin.plot":
+            for data in params["dt"].data:
+                samples.update(data.keys())
+    return samples
+
+
+def _has_output(section: Dict) -> bool:
+    return any(isinstance(section.get(key), str) and section[key].strip() for key in ["plot", "content"])
+
+
+def _kept_value(value, selection: _Selection):
+    """Value without the samples that aren't kept in dicts keyed by sample, at any depth"""
+    if isinstance(value, Mapping):
+        if any(selection.sample_of(k) is not None for k in value.keys()):
+            value = selection.filter(value)
+        return {k: _kept_value(v, selection) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_kept_value(v, selection) for v in value]
+    return value
+
+
+def _kept_pconfig(pconfig: Optional[Dict], selection: _Selection) -> Optional[Dict]:
+    """
+    Plot config without the samples that aren't kept in dicts keyed by sample, such as
+    "colors", also when there is one such dict per dataset
+    """
+    if not isinstance(pconfig, Mapping):
+        return pconfig
+    return {key: _kept_value(value, selection) for key, value in pconfig.items()}
+
+
+# Module attributes with HTML that the module writes itself
+_MODULE_HTML_ATTRS = ["intro", "comment", "info", "extra"]
+
+_DATA_URI_RE = re.compile(r"data:[\w/+.-]+;base64,[A-Za-z0-9+/=]+")
+
+_JSON_SCRIPT_RE = re.compile(r'(<script type="application/json"[^>]*>)(.*?)(</script>)', re.DOTALL)
+
+
+def _kept_html(html: str, selection: _Selection) -> str:
+    """HTML with the samples that aren't kept taken out of its JSON payloads, like the FastQC pass/fails"""
+
+    def replace(m):
+        try:
+            value = json.loads(m.group(2))
+        except ValueError:
+            return m.group(0)
+        return m.group(1) + json.dumps(_kept_value(value, selection)) + m.group(3)
+
+    return _JSON_SCRIPT_RE.sub(replace, html)
+
+
+def _kept_datasets(pconfig: Dict, kept: List[int], n_datasets: int) -> Dict:
+    """Plot config with the labels of the datasets that are kept"""
+    labels = pconfig.get("data_labels")
+    if len(kept) == n_datasets or not isinstance(labels, list) or len(labels) != n_datasets:
+        return pconfig
+    return dict(pconfig, data_labels=[labels[i] for i in kept])
+
+
+def _slice_bar(params: Dict, selection: _Selection) -> Optional[Dict]:
+    n_datasets = len(params["samples_lists"])
+    values_lists = params.get("values_lists") or [None] * n_datasets
+    kept, cats_lists, samples_lists, kept_values = [], [], [], []
+    for i, (cats, samples, values) in enumerate(zip(params["cats_lists"], params["samples_lists"], values_lists)):
+        mask = selection.mask(samples)
+        if not mask.any():
+            continue
+        if values is not None:
+            values = values[mask]
+        else:
+            cats = [dict(cat, data=[v for v, m in zip(cat["data"], mask) if m]) for cat in cats]
+        kept.append(i)
+        cats_lists.append(cats)
+        samples_lists.append([s_name for s_name, m in zip(samples, mask) if m])
+        kept_values.append(values)
+    if not kept:
+        return None
+    params.update(
+        cats_lists=cats_lists,
+        samples_lists=samples_lists,
+        values_lists=kept_values if params.get("values_lists") is not None else None,
+        pconfig=_kept_datasets(_kept_pconfig(params["pconfig"], selection), kept, n_datasets),
+    )
+    return params
+
+
+def _named_lists_slicer(key: str) -> Callable:
+    """Slicer for plots with datasets that are lists of dicts with a "name", like lines and points"""
+
+    def slicer(params: Dict, selection: _Selection) -> Optional[Dict]:
+        kept, lists = [], []
+        for i, items in enumerate(params[key]):
+            names = [item.get("name") for item in items]
+            if not selection.any_kept(names):
+                continue
+            kept.append(i)
+            lists.append([item for item, m in zip(items, selection.mask(names)) if m])
+        if not kept:
+            return None
+        pconfig = _kept_datasets(_kept_pconfig(params["pconfig"], selection), kept, len(params[key]))
+        params.update({key: lists, "pconfig": pconfig})
+        return params
+
+    return slicer
+
+
+def _slice_box(params: Dict, selection: _Selection) -> Optional[Dict]:
+    n_datasets = len(params["list_of_data_by_sample"])
+    kept, datasets = [], []
+    for i, data_by_sample in enumerate(params["list_of_data_by_sample"]):
+        data_by_sample = selection.filter(data_by_sample)
+        if data_by_sample:
+            kept.append(i)
+            datasets.append(data_by_sample)
+    if not kept:
+        return None
+    pconfig = _kept_datasets(_kept_pconfig(params["pconfig"], selection), kept, n_datasets)
+    params.update(list_of_data_by_sample=datasets, pconfig=pconfig)
+    return params
+
+
+def _slice_heatmap(params: Dict, selection: _Selection) -> Optional[Dict]:
+    rows, pconfig = params["rows"], params["pconfig"]
+    xcats, ycats = params.get("xcats"), params.get("ycats")
+    if isinstance(rows, Mapping):
+        if not ycats:
+            ycats = list(rows.keys())
+        if not xcats:
+            xcats = list(dict.fromkeys(x for value_by_x in rows.values() for x in value_by_x.keys()))
+        rows = [[rows.get(y, {}).get(x) for x in xcats] for y in ycats]
+
+    n_rows = len(rows)
+    n_cols = len(rows[0]) if n_rows else 0
+    y_mask = np.ones(n_rows, dtype=bool)
+    x_mask = np.ones(n_cols, dtype=bool)
+    if ycats is not None and pconfig.get("ycats_samples", True) and len(ycats) == n_rows:
+        if not selection.any_kept(ycats):
+            return None
+        y_mask = selection.mask(ycats)
+        ycats = [cat for cat, m in zip(ycats, y_mask) if m]
+    if xcats is not None and pconfig.get("xcats_samples", True) and len(xcats) == n_cols:
+        if not selection.any_kept(xcats):
+            return None
+        x_mask = selection.mask(xcats)
+        xcats = [cat for cat, m in zip(xcats, x_mask) if m]
+    if not y_mask.any() or not x_mask.any():
+        return None
+
+    if isinstance(rows, np.ndarray):
+        rows = rows[np.ix_(y_mask, x_mask)]
+    else:
+        x_idx = np.flatnonzero(x_mask)
+        rows = [[row[j] for j in x_idx] for row, m in zip(rows, y_mask) if m]
+    params.update(rows=rows, xcats=xcats, ycats=ycats, pconfig=_kept_pconfig(pconfig, selection))
+    return params
+
+
+def _slice_violin(params: Dict, selection: _Selection) -> Optional[Dict]:
+    names = [s_name for data in params["dt"].data for s_name in data.keys()]
+    if not selection.any_kept(names):
+        return None
+    # Tables that were empty to start with are kept, like in a normal run. The column
+    # scales are worked out again for the selected samples.
+    dt = copy.copy(params["dt"])
+    dt.data = [selection.filter(data) for data in dt.data]
+    dt.headers = [{k: dict(header) for k, header in headers.items()} for headers in dt.headers]
+    dt.update_scales()
+    dt.pconfig = _kept_pconfig(dt.pconfig, selection)
+    params["dt"] = dt
+    return params
+
+
+# How to take the samples out of the inputs of every function decorated with report_cache.record_plot
+_SLICERS: Dict[str, Callable[[Dict, _Selection], Optional[Dict]]] = {
+    "multiqc.plots.plotly.bar.plot": _slice_bar,
+    "multiqc.plots.plotly.line.plot": _named_lists_slicer("lists_of_lines"),
+    "multiqc.plots.plotly.scatter.plot": _named_lists_slicer("points_lists"),
+    "multiqc.plots.plotly.box.plot": _slice_box,
+    "multiqc.plots.plotly.heatmap.plot": _slice_heatmap,
+    "multiqc.plots.plotly.violin.plot": _slice_violin,
+}
+
+
+@click.command(context_settings=dict(help_option_names=["-h", "--help"]))
+@click.argument("snapshot", type=click.Path(exists=True, file_okay=False))
+@click.option(
+    "-s",
+    "--samples",
+    "sample_files",
+    type=click.Path(exists=True, dir_okay=False),
+    multiple=True,
+    help="File with the sample names (or glob patterns) to keep, one per line. Use several times for several reports",
+)
+@click.option("--ignore-samples", type=str, multiple=True, metavar="GLOB EXPRESSION", help="Ignore sample names")
+@click.option(
+    "-o",
+    "--outdir",
+    type=click.Path(),
+    help="Create report in the specified output directory, with a subdirectory for each --samples file if several",
+)
+@click.option("-i", "--title", type=str, help="Report title")
+@click.option("-n", "--filename", type=str, help="Report filename")
+@click.option("-p", "--processes", type=int, default=1, help="Number of reports to generate at the same time")
+@click.option("-f", "--force", is_flag=True, help="Overwrite any existing reports")
+@click.option(
+    "-c",
+    "--config",
+    "config_file",
+    type=click.Path(exists=True, readable=True),
+    multiple=True,
+    help="Specific config file to load",
+)
+@click.option("--cl-config", type=str, multiple=True, help="Specify MultiQC config YAML on the command line")
+@click.option("-v", "--verbose", count=True, default=0, help="Increase output verbosity")
+@click.option("-q", "--quiet", is_flag=True, help="Only show log warnings")
+@click.option("--no-ansi", is_flag=True, help="Disable coloured log output")
+def slice_cli(
+    snapshot,
+    sample_files,
+    ignore_samples,
+    outdir,
+    title,
+    filename,
+    processes,
+    force,
+    config_file,
+    cl_config,
+    verbose,
+    quiet,
+    no_ansi,
+):
+    """Make reports for subsets of the samples of an earlier MultiQC run.
+
+    [yellow]SNAPSHOT[/] is the report or data directory of a run made with
+    [yellow]slice_snapshot: true[/]. No files are searched or parsed again.
+    """
+    from multiqc.batch import run_job
+
+    loglevel = log.LEVELS.get(min(verbose, 1), "INFO")
+    if quiet:
+        loglevel = "WARNING"
+    # Every report sets up the "multiqc" logger again, so keep these logs apart
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter("|%(module)18s | %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(loglevel)
+    logger.propagate = False
+    t0 = time.time()
+    if not sample_files and not ignore_samples:
+        logger.error("No samples to select, use --samples or --ignore-samples")
+        sys.exit(1)
+    try:
+        snapshot_dir = find_snapshot(snapshot)
+    except SnapshotError as e:
+        logger.error(str(e))
+        sys.exit(1)
+
+    jobs = []
+    for sample_fn in sample_files or [None]:
+        job_outdir = outdir
+        if len(sample_files) > 1:
+            job_outdir = os.path.join(outdir or ".", os.path.splitext(os.path.basename(sample_fn))[0])
+        params = _run_params(
+            snapshot_dir,
+            read_sample_list(sample_fn) if sample_fn else None,
+            job_outdir,
+            title=title,
+            filename=filename,
+            ignore_samples=ignore_samples,
+            force=force,
+            config_file=config_file,
+            cl_config=cl_config,
+            verbose=verbose,
+            quiet=quiet or (processes > 1 and not verbose),
+            no_ansi=no_ansi,
+        )
+        jobs.append((sample_fn or snapshot, params))
+
+    exit_codes = []
+    cwd = os.getcwd()
+    if processes > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            futures = {pool.submit(run_job, params, cwd): name for name, params in jobs}
+            for future in as_completed(futures):
+                try:
+                    exit_codes.append(_log_slice(futures[future], future.result()))
+                except Exception as e:
+                    logger.error(f"Report for '{futures[future]}' crashed: {e}")
+                    exit_codes.append(1)
+    else:
+        for name, params in jobs:
+            exit_codes.append(_log_slice(name, run_job(params, cwd)))
+
+    n_failed = sum(1 for code in exit_codes if code != 0)
+    logger.info(f"Generated {len(jobs) - n_failed} of {len(jobs)} reports in {time.time() - t0:.2f}s")
+    sys.exit(1 if n_failed else 0)
+
+
+def _log_slice(name: str, exit_code: int) -> int:
+    if exit_code == 0:
+        logger.info(f"Finished report for '{name}'")
+    else:
+        logger.error(f"Report for '{name}' failed with exit code {exit_code}")
+    return exit_code
@@ -6,14 +6,29 @@ class BarPlot extends Plot {
 
   activeDatasetSize() {
     if (this.datasets.length === 0) return 0; // no datasets
-    let cats = this.datasets[this.activeDatasetIdx]["cats"];
-    if (cats.length === 0) return 0; // no categories
-    return cats[0].data.length; // no data for a category
+    let data = this.datasets[this.activeDatasetIdx]["data"];
+    if (data.length === 0) return 0; // no categories
+    return data[0].length; // no data for a category
+  }
+
+  // Percentages of the sum of absolute values of each sample, derived from the packed
+  // values the first time the percentage switch is used for a dataset
+  pctData(dataset) {
+    if (dataset["data_pct"] === undefined) {
+      let sums = dataset["samples"].map((_, si) =>
+        dataset["data"].reduce((sum, values) => (values[si] === null ? sum : sum + Math.abs(values[si])), 0),
+      );
+      dataset["data_pct"] = dataset["data"].map((values) =>
+        values.map((val, si) => (sums[si] === 0 ? 0 : val === null ? null : (val / sums[si]) * 100)),
+      );
+    }
+    return dataset["data_pct"];
   }
 
   prepData() {
-    let cats = this.datasets[this.activeDatasetIdx]["cats"];
-    let samples = this.datasets[this.activeDatasetIdx]["samples"];
+    let dataset = this.datasets[this.activeDatasetIdx];
+    let samples = dataset["samples"];
+    let data = this.pActive ? this.pctData(dataset) : dataset["data"];
 
     let samplesSettings = applyToolboxSettings(samples);
 
@@ -21,10 +36,9 @@ class BarPlot extends Plot {
     this.filteredSettings = samplesSettings.filter((s) => !s.hidden);
     samples = this.filteredSettings.map((s) => s.name);
 
-    cats = cats.map((cat) => {
-      let data = this.pActive ? cat["data_pct"] : cat.data;
+    let cats = dataset["cats"].map((cat, ci) => {
       return {
-        data: data.filter((_, si) => !samplesSettings[si].hidden),
+        data: data[ci].filter((_, si) => !samplesSettings[si].hidden),
         color: cat.color,
         name: cat.name,
       };
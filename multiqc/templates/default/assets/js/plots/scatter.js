@@ -32,32 +32,92 @@ class ScatterPlot extends Plot {
     let dataset = this.datasets[this.activeDatasetIdx];
 
     let [samples, points] = this.prepData();
-    if (points.length === 0 || samples.length === 0) return [];
+
+    // Large datasets have the density of their points binned in Python, and only the outliers as points
+    let densityTraces = [];
+    let binnedHighlights = null;
+    if (dataset.density) {
+      let z = dataset.density.z;
+      binnedHighlights = this.binnedHighlights(dataset.density);
+      if (binnedHighlights.x.length > 0) {
+        // Take the highlighted samples out of their bins, they are drawn as points on top
+        z = z.map((row) => row.slice());
+        let nX = dataset.density.x.length;
+        binnedHighlights.bin.forEach((bin) => {
+          if (bin < 0) return;
+          let [yi, xi] = [Math.floor(bin / nX), bin % nX];
+          if (z[yi][xi] !== null) z[yi][xi] = z[yi][xi] > 1 ? z[yi][xi] - 1 : null;
+        });
+      }
+      densityTraces.push({
+        type: "heatmap",
+        x: dataset.density.x,
+        y: dataset.density.y,
+        z: z,
+        colorscale: "Blues",
+        showscale: true,
+        colorbar: { title: { text: "Points" }, thickness: 10, len: 0.5, y: 0, yanchor: "bottom" },
+        hovertemplate: "X: %{x}<br>Y: %{y}<br>Points: %{z}<extra></extra>",
+        showlegend: false,
+      });
+    }
+    if (binnedHighlights !== null && binnedHighlights.x.length > 0) {
+      let params = JSON.parse(JSON.stringify(dataset["trace_params"])); // deep copy
+      params.marker.color = binnedHighlights.color;
+      densityTraces.push({
+        type: "scatter",
+        x: binnedHighlights.x,
+        y: binnedHighlights.y,
+        text: binnedHighlights.name,
+        showlegend: false,
+        ...params,
+        mode: "markers",
+      });
+    }
+    if (points.length === 0 || samples.length === 0) return densityTraces;
 
     // Reorder points so highlighted points are on top
     let highlighted = points.filter((p) => p.highlight);
     let nonHighlighted = points.filter((p) => !p.highlight);
     points = nonHighlighted.concat(highlighted);
 
-    return points.map((point) => {
-      let params = JSON.parse(JSON.stringify(dataset["trace_params"])); // deep copy
-      params.marker.size = point["marker_size"] ?? params.marker.size;
-      params.marker.line = {
-        width: point["marker_line_width"] ?? params.marker.line.width,
-      };
-      params.marker.opacity = point["opacity"] ?? params.marker.opacity;
-      params.marker.color = point["color"] ?? params.marker.color;
-      if (highlighted.length > 0) params.marker.color = point.highlight ?? "#cccccc";
-
-      return {
-        type: "scatter",
-        x: [point.x],
-        y: [point.y],
-        name: point.name,
-        text: [point.annotation ?? point.name],
-        ...params,
-      };
+    return densityTraces.concat(
+      points.map((point) => {
+        let params = JSON.parse(JSON.stringify(dataset["trace_params"])); // deep copy
+        params.marker.size = point["marker_size"] ?? params.marker.size;
+        params.marker.line = {
+          width: point["marker_line_width"] ?? params.marker.line.width,
+        };
+        params.marker.opacity = point["opacity"] ?? params.marker.opacity;
+        params.marker.color = point["color"] ?? params.marker.color;
+        if (highlighted.length > 0) params.marker.color = point.highlight ?? "#cccccc";
+
+        return {
+          type: "scatter",
+          x: [point.x],
+          y: [point.y],
+          name: point.name,
+          text: [point.annotation ?? point.name],
+          ...params,
+        };
+      }),
+    );
+  }
+
+  binnedHighlights(density) {
+    // Samples that are only in the bins of the density, but are highlighted in the toolbox
+    let result = { name: [], x: [], y: [], bin: [], color: [] };
+    if (!density.samples || window.mqc_highlight_f_texts.length === 0) return result;
+    let sampleSettings = applyToolboxSettings(density.samples.name);
+    sampleSettings.forEach((settings, idx) => {
+      if (!settings.highlight || settings.hidden) return;
+      result.name.push(settings.name);
+      result.x.push(density.samples.x[idx]);
+      result.y.push(density.samples.y[idx]);
+      result.bin.push(density.samples.bin[idx]);
+      result.color.push(settings.highlight);
     });
+    return result;
   }
 
   exportData(format) {
@@ -167,6 +167,17 @@ class ViolinPlot extends Plot {
         params["line"]["color"] = "rgb(" + header["color"] + ")";
       }
 
+      let axisKey = metricIdx === 0 ? "" : metricIdx + 1;
+
+      // Metrics with too many values have their density precomputed in Python
+      let density = (dataset["density_by_metric"] ?? {})[metric];
+      if (density !== undefined) {
+        densityTraces(density, metricIdx, params).forEach((trace) => {
+          traces.push({ type: "scatter", xaxis: "x" + axisKey, yaxis: "y" + axisKey, ...trace });
+        });
+        return;
+      }
+
       // Create violin traces
       let violinValuesBySample = violinValuesBySampleByMetric[metric];
       let samples = [],
@@ -176,7 +187,6 @@ class ViolinPlot extends Plot {
         values.push(value);
       });
 
-      let axisKey = metricIdx === 0 ? "" : metricIdx + 1;
       traces.push({
         type: "violin",
         x: values,
@@ -317,3 +327,92 @@ class ViolinPlot extends Plot {
     });
   }
 }
+
+// Traces that draw a precomputed density like a violin, see density_traces() in violin.py
+function densityTraces(density, metricIdx, params) {
+  let maxY = Math.max(...density.y);
+  let scale = 0.45 / (maxY || 1);
+  let lineColor = params["line"] ? params["line"]["color"] : "grey";
+  let boxTop = metricIdx + 0.05;
+  let boxBottom = metricIdx - 0.05;
+
+  // The mean line spans the density at the mean, like the meanline of a Plotly violin
+  let meanHeight = 0;
+  for (let i = 1; i < density.x.length; i++) {
+    if (density.x[i] >= density.mean) {
+      let frac = (density.mean - density.x[i - 1]) / (density.x[i] - density.x[i - 1]);
+      meanHeight = (density.y[i - 1] + frac * (density.y[i] - density.y[i - 1])) * scale;
+      break;
+    }
+  }
+
+  let fmt = (v) => parseFloat(v.toPrecision(4));
+  let boxText = [
+    ["max", "Max"],
+    ["q3", "Q3"],
+    ["median", "Median"],
+    ["mean", "Mean"],
+    ["q1", "Q1"],
+    ["min", "Min"],
+  ]
+    .map(([key, label]) => label + ": " + fmt(density[key]))
+    .join("<br>");
+
+  return [
+    {
+      x: density.x.concat(density.x.slice().reverse()),
+      y: density.y.map((v) => metricIdx + v * scale).concat(density.y.map((v) => metricIdx - v * scale).reverse()),
+      mode: "lines",
+      fill: "toself",
+      fillcolor: params["fillcolor"],
+      line: params["line"],
+      opacity: params["opacity"],
+      hoverinfo: "skip",
+      showlegend: false,
+    },
+    {
+      x: [density.q1, density.q3, density.q3, density.q1, density.q1],
+      y: [boxBottom, boxBottom, boxTop, boxTop, boxBottom],
+      mode: "lines",
+      fill: "toself",
+      fillcolor: "white",
+      line: { width: 1, color: lineColor },
+      hoveron: "fills",
+      hoverinfo: "text",
+      text: boxText,
+      showlegend: false,
+    },
+    {
+      x: [
+        density.lower_fence,
+        density.q1,
+        null,
+        density.q3,
+        density.upper_fence,
+        null,
+        density.median,
+        density.median,
+        null,
+        density.mean,
+        density.mean,
+      ],
+      y: [
+        metricIdx,
+        metricIdx,
+        null,
+        metricIdx,
+        metricIdx,
+        null,
+        boxBottom,
+        boxTop,
+        null,
+        metricIdx - meanHeight,
+        metricIdx + meanHeight,
+      ],
+      mode: "lines",
+      line: { width: 2, color: lineColor },
+      hoverinfo: "skip",
+      showlegend: false,
+    },
+  ];
+}
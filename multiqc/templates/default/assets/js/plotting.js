@@ -149,6 +149,9 @@ $(function () {
 
   // Decompress the JSON plot data and init plot objects
   let mqc_plotdata = JSON.parse(LZString.decompressFromBase64(mqc_compressed_plotdata));
+  for (const [plot_id, compressed] of mqc_compressed_plotdata_parts) {
+    mqc_plotdata[plot_id] = JSON.parse(LZString.decompressFromBase64(compressed));
+  }
   mqc_plots = Object.fromEntries(Object.values(mqc_plotdata).map((data) => [data.id, initPlot(data)]));
 
   let shouldRender = $(".hc-plot.not_rendered:visible:not(.gt_max_num_ds)");
@@ -512,6 +512,27 @@ $(function () {
   /// SAVING STUFF
   // Load the saved setting names
   populate_mqc_saveselect();
+  // Highlights from the MultiQC config, unless saved settings were loaded
+  if (window.mqc_highlight_f_texts.length === 0 && notEmptyObj(mqc_config["highlight_patterns"])) {
+    if (mqc_config["highlight_regex"] === true) {
+      $("#mqc_cols .mqc_regex_mode .re_mode").removeClass("off").addClass("on").text("on");
+    }
+    $.each(mqc_config["highlight_patterns"], function (idx, f_text) {
+      var f_col = (mqc_config["highlight_colors"] || [])[idx] || mqc_colours[mqc_colours_idx % mqc_colours.length];
+      $("#mqc_col_filters").append(
+        '<li style="color:' +
+          f_col +
+          ';" id="' +
+          hashCode(f_text + f_col) +
+          '"><span class="hc_handle"><span></span><span></span></span><input class="f_text" value="' +
+          f_text +
+          '" /><button type="button" class="close" aria-label="Close"><span aria-hidden="true">&times;</span></button></li>',
+      );
+      mqc_colours_idx += 1;
+    });
+    $("#mqc_colour_filter_color").val(mqc_colours[mqc_colours_idx % mqc_colours.length]);
+    apply_mqc_highlights();
+  }
   // Save config
   $("#mqc_saveconfig_form").submit(function (e) {
     e.preventDefault();
@@ -24,6 +24,9 @@ $(function () {
 
   // Decompress the JSON plot data
   mqc_plots = JSON.parse(LZString.decompressFromBase64(mqc_compressed_plotdata));
+  for (const [plot_id, compressed] of mqc_compressed_plotdata_parts) {
+    mqc_plots[plot_id] = JSON.parse(LZString.decompressFromBase64(compressed));
+  }
 
   // HighCharts Defaults
   window.HCDefaults = $.extend(true, {}, Highcharts.getOptions(), {});
@@ -5,6 +5,7 @@ config variables to be used across all other modules """
 from pathlib import Path
 from typing import List, Dict, Optional, Union
 
+import copy
 import inspect
 
 # Default logger will be replaced by caller
@@ -19,6 +20,7 @@ import yaml
 import pyaml_env
 
 import multiqc
+from multiqc.utils import loaders
 from multiqc.utils.util_functions import strtobool
 
 logger = logging.getLogger("multiqc")
@@ -28,7 +30,7 @@ version = importlib_metadata.version("multiqc_sgr")
 short_version = version
 git_hash = None
 git_hash_short = None
-script_path = str(Path(__file__).parent)  # dynamically used by util_functions.multiqc_dump_json()
+script_path = str(Path(__file__).parent)  # dynamically used by util_functions.multiqc_json_chunks()
 git_root = None
 try:
     git_root = subprocess.check_output(
@@ -95,7 +97,13 @@ version_check_url: str
 
 make_data_dir: bool
 zip_data_dir: bool
+data_write_threads: int
+data_write_queue_size: int
+data_columnar_export: bool
+data_pairs_text: bool
 data_dump_file: bool
+update_cache: bool
+slice_snapshot: bool
 megaqc_url: str
 megaqc_access_token: str
 megaqc_timeout: float
@@ -134,6 +142,7 @@ fn_ignore_dirs: List[str]
 fn_ignore_paths: List[str]
 sample_names_ignore: List[str]
 sample_names_ignore_re: List[str]
+sample_names_only_include: List[str]
 sample_names_rename_buttons: List[str]
 sample_names_replace: Dict
 sample_names_replace_regex: bool
@@ -144,6 +153,9 @@ show_hide_buttons: List
 show_hide_patterns: List
 show_hide_regex: List
 show_hide_mode: List
+highlight_patterns: List[str]
+highlight_colors: List[str]
+highlight_regex: bool
 no_version_check: bool
 log_filesize_limit: int
 filesearch_lines_limit: int
@@ -155,6 +167,7 @@ versions_table_group_header: str
 data_format_extensions: Dict[str, str]
 export_plot_formats: List[str]
 filesearch_file_shared: List[str]
+filesearch_max_filesize: Dict[str, int]
 custom_content: Dict
 fn_clean_sample_names: bool
 use_filename_as_sample_name: bool
@@ -166,15 +179,13 @@ module_order: List[Union[str, Dict]]
 
 # Populating the variables above from the default MultiQC config
 config_defaults_path = os.path.join(MULTIQC_DIR, "utils", "config_defaults.yaml")
-with open(config_defaults_path) as f:
-    _default_config = yaml.safe_load(f)
+_default_config = loaders.load_package_yaml(config_defaults_path)
 for c, v in _default_config.items():
     globals()[c] = v
 
 # Module filename search patterns
 searchp_fn = os.path.join(MULTIQC_DIR, "utils", "search_patterns.yaml")
-with open(searchp_fn) as f:
-    sp = yaml.safe_load(f)
+sp = loaders.load_package_yaml(searchp_fn)
 
 # Other defaults that can't be set in YAML
 data_tmp_dir = "/tmp"  # will be overwritten by core script
@@ -195,6 +206,8 @@ custom_data: Dict = {}
 report_section_order: Dict = {}
 output_fn: Optional[str] = None
 megaqc_upload: bool = False
+update_dir: Optional[str] = None
+snapshot_dir: Optional[str] = None
 
 ##### Available modules
 # Modules must be listed in setup.py under entry_points['multiqc.modules.v1']
@@ -271,7 +284,7 @@ def mqc_load_config(yaml_config_path: str):
     if os.path.isfile(yaml_config_path):
         try:
             # pyaml_env allows referencing environment variables in YAML for default values
-            new_config = pyaml_env.parse_config(yaml_config_path)
+            new_config = pyaml_env.parse_config(yaml_config_path, loader=loaders.SafeLoader)
             logger.debug(f"Loading config settings from: {yaml_config_path}")
             mqc_add_config(new_config, yaml_config_path)
         except (IOError, AttributeError) as e:
@@ -284,11 +297,11 @@ def mqc_load_config(yaml_config_path: str):
 def mqc_cl_config(cl_config):
     for clc_str in cl_config:
         try:
-            parsed_clc = yaml.safe_load(clc_str)
+            parsed_clc = loaders.load_yaml(clc_str)
             # something:var fails as it needs a space. Fix this (a common mistake)
             if isinstance(parsed_clc, str) and ":" in clc_str:
                 clc_str = ": ".join(clc_str.split(":"))
-                parsed_clc = yaml.safe_load(clc_str)
+                parsed_clc = loaders.load_yaml(clc_str)
             assert isinstance(parsed_clc, dict)
         except yaml.scanner.ScannerError as e:
             logger.error(f"Could not parse command line config: {clc_str}\n{e}")
@@ -492,3 +505,38 @@ def update_dict(target, source, none_only=False):
                 else:
                     target[key] = val
     return target
+
+
+# Config values that are never changed by a run, so don't need restoring by reset()
+_reset_skip_keys = {"avail_modules", "avail_templates"}
+_reset_types = (str, int, float, bool, list, dict, type(None))
+
+
+def _config_state() -> Dict:
+    return {
+        k: v
+        for k, v in globals().items()
+        if not k.startswith("_") and k not in _reset_skip_keys and isinstance(v, _reset_types)
+    }
+
+
+# Snapshot of the defaults, taken before any user config is loaded
+_default_state = copy.deepcopy(_config_state())
+
+
+def reset(working_dir: Optional[str] = None):
+    """
+    Restore the default config, discarding everything set since MultiQC was imported.
+    Used to isolate runs from each other when several run in the same process.
+    :param working_dir: Directory to use for the default analysis and output directories
+    """
+    g = globals()
+    for k in _config_state():
+        if k not in _default_state:
+            del g[k]
+    g.update(copy.deepcopy(_default_state))
+    g["creation_date"] = datetime.now().astimezone().strftime("%Y-%m-%d, %H:%M %Z")
+    if working_dir is not None:
+        g["working_dir"] = working_dir
+        g["analysis_dir"] = [working_dir]
+        g["output_dir"] = os.path.realpath(working_dir)
@@ -0,0 +1,371 @@
+#!/usr/bin/env python
+
+""" MultiQC instrumentation events. The run, the file search, every module and plot,
+the compression of the plot data and the rendering of the template are recorded as
+spans, with their duration and attributes such as sample counts, file counts and
+byte sizes. Subscribers get an Event every time a span ends.
+
+Nothing is measured unless something subscribes: start_span() then returns a shared
+no-op span. Two subscribers are built in, configured with `events_file` (or
+--events-file), which writes one JSON object per line, and `events_otlp_endpoint`,
+which sends the spans to an OpenTelemetry collector with the OTLP/HTTP JSON protocol. """
+
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Event:
+    """
+    A finished span. Names used by MultiQC: "run", "file_search", "module", "plot",
+    "compress_json" and "render", plus "hook" with a zero duration for every plugin hook.
+    """
+
+    name: str
+    start_time: float  # Seconds since the epoch
+    duration: float  # Seconds
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    trace_id: str = ""
+    span_id: str = ""
+    parent_id: Optional[str] = None
+    error: Optional[str] = None
+
+
+_subscribers: List[Callable[[Event], None]] = []
+_run_sinks: List[Callable[[Event], None]] = []
+_local = threading.local()
+_trace_id = os.urandom(16).hex()
+
+
+def subscribe(callback: Callable[[Event], None]):
+    """Call callback(event) for every span that ends, e.g. from a plugin hook"""
+    _subscribers.append(callback)
+
+
+def unsubscribe(callback: Callable[[Event], None]):
+    if callback in _subscribers:
+        _subscribers.remove(callback)
+
+
+def enabled() -> bool:
+    """Whether anything is subscribed, to skip measurements that are only used for events"""
+    return bool(_subscribers)
+
+
+class Span:
+    """
+    A timed operation. Use it as a context manager, or call end() explicitly. Spans that
+    are started while another span of the same thread is open become its children.
+    """
+
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        self.name = name
+        self.attributes = attributes
+        self.span_id = os.urandom(8).hex()
+        stack = _stack()
+        self.parent_id = stack[-1].span_id if stack else None
+        stack.append(self)
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self._ended = False
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self, error: Optional[str] = None, **attributes):
+        if self._ended:
+            return
+        self._ended = True
+        duration = time.perf_counter() - self._start
+        self.attributes.update(attributes)
+        stack = _stack()
+        if self in stack:
+            stack.remove(self)
+        _emit(
+            Event(
+                name=self.name,
+                start_time=self.start_time,
+                duration=duration,
+                attributes=self.attributes,
+                trace_id=_trace_id,
+                span_id=self.span_id,
+                parent_id=self.parent_id,
+                error=error,
+            )
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.end(error=f"{exc_type.__name__}: {exc_value}" if exc_type is not None else None)
+        return False
+
+
+class _NoopSpan:
+    """Returned by start_span() when there are no subscribers"""
+
+    def set(self, **attributes):
+        pass
+
+    def end(self, error: Optional[str] = None, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def start_span(name: str, **attributes):
+    """Start a span, or return a no-op span if nothing is subscribed"""
+    if not _subscribers:
+        return _NOOP_SPAN
+    return Span(name, attributes)
+
+
+def current_span():
+    """The innermost open span of this thread, to add attributes to it"""
+    stack = _stack() if _subscribers else None
+    return stack[-1] if stack else _NOOP_SPAN
+
+
+def emit(name: str, **attributes):
+    """Emit an event with a zero duration, under the current span"""
+    if not _subscribers:
+        return
+    stack = _stack()
+    _emit(
+        Event(
+            name=name,
+            start_time=time.time(),
+            duration=0.0,
+            attributes=attributes,
+            trace_id=_trace_id,
+            span_id=os.urandom(8).hex(),
+            parent_id=stack[-1].span_id if stack else None,
+        )
+    )
+
+
+def _stack() -> List[Span]:
+    try:
+        return _local.stack
+    except AttributeError:
+        _local.stack = []
+        return _local.stack
+
+
+def _emit(event: Event):
+    for callback in list(_subscribers):
+        try:
+            callback(event)
+        except Exception as e:
+            # Instrumentation should never break a run
+            logger.debug(f"Event subscriber {callback} failed: {e}")
+
+
+def traced_run(func):
+    """
+    Decorator for multiqc.run(). Records the whole run as the "run" span, with all other
+    spans of the run as its descendants. If run() returns or raises before calling end_run(),
+    the span is ended and the sinks of start_run() are closed here.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        global _trace_id
+        _trace_id = os.urandom(16).hex()
+        _local.stack = []
+        _local.run_start = (time.time(), time.perf_counter())
+        _local.run_span = None
+        result = None
+        error = None
+        try:
+            result = func(*args, **kwargs)
+            return result
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            end_run(error=error, exit_code=result.get("sys_exit_code") if isinstance(result, dict) else None)
+
+    return wrapper
+
+
+def start_run():
+    """
+    Subscribe the built-in sinks that are set in the config, and start the span for the run.
+    Called by multiqc.run() once the config is loaded.
+    """
+    if config.events_file:
+        _add_run_sink(JsonLinesSink(config.events_file))
+    if config.events_otlp_endpoint:
+        _add_run_sink(OtlpSpanExporter(config.events_otlp_endpoint))
+    if not _subscribers:
+        return
+    span = Span("run", {"version": config.version})
+    # The span started when run() was called, before the config was loaded
+    run_start = getattr(_local, "run_start", None)
+    if run_start is not None:
+        span.start_time, span._start = run_start
+    _local.run_span = span
+
+
+def end_run(error: Optional[str] = None, **attributes):
+    """
+    End the span of the run, then unsubscribe and close the sinks added by start_run().
+    Called by multiqc.run() before the log file is closed, as the sinks can log errors.
+    """
+    from . import report
+
+    run_span = getattr(_local, "run_span", None)
+    _local.run_span = None
+    if run_span is not None:
+        run_span.end(error=error, n_modules=len(getattr(report, "modules_output", None) or []), **attributes)
+    finish_run()
+
+
+def finish_run():
+    """Unsubscribe and close the sinks added by start_run()"""
+    while _run_sinks:
+        sink = _run_sinks.pop()
+        unsubscribe(sink)
+        try:
+            sink.close()
+        except Exception as e:
+            logger.warning(f"Could not close event sink {sink}: {e}")
+
+
+def _add_run_sink(sink):
+    _run_sinks.append(sink)
+    subscribe(sink)
+
+
+class JsonLinesSink:
+    """Writes every event to a file as a line of JSON"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fh = open(path, "w", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def __call__(self, event: Event):
+        line = json.dumps(asdict(event), default=str)
+        with self._lock:
+            self._fh.write(line + "\n")
+            self._fh.flush()
+
+    def close(self):
+        self._fh.close()
+        logger.debug(f"Wrote events to {self.path}")
+
+    def __repr__(self):
+        return f"<JsonLinesSink {self.path}>"
+
+
+class OtlpSpanExporter:
+    """
+    Sends the spans to an OpenTelemetry collector, as OTLP/HTTP JSON requests to
+    {endpoint}/v1/traces. Spans are sent in batches, and the rest when the run ends.
+    Errors are logged, and don't stop the run.
+    """
+
+    BATCH_SIZE = 512
+
+    def __init__(self, endpoint: str, timeout: float = 10):
+        self.url = endpoint if endpoint.rstrip("/").endswith("/v1/traces") else endpoint.rstrip("/") + "/v1/traces"
+        self.timeout = timeout
+        self._spans: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def __call__(self, event: Event):
+        span = {
+            "traceId": event.trace_id,
+            "spanId": event.span_id,
+            "name": event.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(int(event.start_time * 1e9)),
+            "endTimeUnixNano": str(int((event.start_time + event.duration) * 1e9)),
+            "attributes": _otlp_attributes(event.attributes),
+            "status": {"code": 2, "message": event.error} if event.error else {"code": 1},
+        }
+        if event.parent_id:
+            span["parentSpanId"] = event.parent_id
+        with self._lock:
+            self._spans.append(span)
+            batch = self._take_batch() if len(self._spans) >= self.BATCH_SIZE else None
+        if batch:
+            self._send(batch)
+
+    def _take_batch(self) -> List[Dict]:
+        batch, self._spans = self._spans, []
+        return batch
+
+    def close(self):
+        with self._lock:
+            batch = self._take_batch()
+        if batch:
+            self._send(batch)
+
+    def _send(self, spans: List[Dict]):
+        body = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": _otlp_attributes({"service.name": "multiqc", "service.version": config.version})
+                    },
+                    "scopeSpans": [{"scope": {"name": "multiqc", "version": config.version}, "spans": spans}],
+                }
+            ]
+        }
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(body).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+        except (urllib.error.URLError, OSError) as e:
+            logger.warning(f"Could not send {len(spans)} spans to {self.url}: {e}")
+        else:
+            logger.debug(f"Sent {len(spans)} spans to {self.url}")
+
+    def __repr__(self):
+        return f"<OtlpSpanExporter {self.url}>"
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict]:
+    """Attributes as OTLP key-value pairs. 64-bit integers are strings in the JSON encoding."""
+    out = []
+    for key, value in attributes.items():
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            typed = {"boolValue": value}
+        elif isinstance(value, int):
+            typed = {"intValue": str(value)}
+        elif isinstance(value, float):
+            typed = {"doubleValue": value}
+        else:
+            typed = {"stringValue": str(value)}
+        out.append({"key": key, "value": typed})
+    return out
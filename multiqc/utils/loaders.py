@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+""" Loading YAML and JSON. Uses the libyaml bindings of PyYAML and orjson when they are
+installed, which parse several times faster than the pure-Python implementations, and
+falls back to those otherwise. The results are the same either way.
+
+YAML files shipped with MultiQC, like the config defaults and the search patterns, are
+parsed once and cached, in memory and in the user's cache directory, so that they are
+not parsed again when MultiQC is imported the next time. The cache files are saved with
+marshal, which only holds plain values and can't run code when loaded. """
+
+import hashlib
+import json
+import logging
+import marshal
+import os
+import pickle
+from stat import S_ISREG
+from typing import IO, Any, Dict, Union
+
+import yaml
+
+try:
+    from yaml import CBaseLoader as BaseLoader
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import BaseLoader, SafeLoader
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Pickled contents of package files that were already loaded, by path
+_package_cache: Dict[str, bytes] = dict()
+
+
+def load_yaml(stream: Union[str, bytes, IO], all_strings: bool = False) -> Any:
+    """
+    Parse a YAML document, like yaml.safe_load(). With all_strings, like
+    yaml.load(stream, Loader=yaml.BaseLoader): scalars are not converted to numbers,
+    booleans or None, so that e.g. a version "1.10" is not read as the float 1.1.
+    """
+    return yaml.load(stream, Loader=BaseLoader if all_strings else SafeLoader)
+
+
+def load_json(s: Union[str, bytes, bytearray, IO]) -> Any:
+    """
+    Parse a JSON document from a string or a file handle, like json.loads() and json.load().
+    orjson is stricter than the standard library: it rejects NaN and Infinity, integers that
+    don't fit in 64 bits and invalid UTF-8. Anything it rejects is parsed again with the
+    standard library, which either accepts it or raises json.JSONDecodeError as usual.
+    """
+    if hasattr(s, "read"):
+        s = s.read()
+    if orjson is not None:
+        try:
+            return orjson.loads(s)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(s)
+
+
+def load_package_yaml(path: str) -> Any:
+    """
+    Parse a YAML file that is part of the MultiQC package. The parsed result is cached,
+    keyed by the size and modification time of the file, so editing the file updates it.
+    Every call returns a new copy, which the caller is free to change.
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns, yaml.__version__)
+
+    blob = _package_cache.get(key[0])
+    if blob is not None:
+        cached_key, data = pickle.loads(blob)
+        if cached_key == key:
+            return data
+
+    cache_path = _disk_cache_path(key[0])
+    if cache_path is not None:
+        data = _read_disk_cache(cache_path, key)
+        if data is not None:
+            _package_cache[key[0]] = pickle.dumps((key, data), protocol=pickle.HIGHEST_PROTOCOL)
+            return data
+
+    with open(path, encoding="utf-8") as fh:
+        data = load_yaml(fh)
+    _package_cache[key[0]] = pickle.dumps((key, data), protocol=pickle.HIGHEST_PROTOCOL)
+    if cache_path is not None:
+        _write_disk_cache(cache_path, key, data)
+    return data
+
+
+def _read_disk_cache(cache_path: str, key: tuple) -> Any:
+    """
+    Read a parsed package file from the cache directory. It is only used if it's a regular
+    file owned by the current user, that nobody else can write, and written for this key.
+    Returns None otherwise.
+    """
+    try:
+        fd = os.open(cache_path, os.O_RDONLY | getattr(os, "O_NOFOLLOW", 0))
+    except OSError:
+        return None
+    with os.fdopen(fd, "rb") as fh:
+        st = os.fstat(fh.fileno())
+        if not _private_file(st):
+            logger.debug(f"Not using '{cache_path}': it must be owned by you and have mode 0600")
+            return None
+        try:
+            cached_key, data = marshal.loads(fh.read())
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+    if tuple(cached_key) != key:
+        return None
+    return data
+
+
+def _write_disk_cache(cache_path: str, key: tuple, data: Any):
+    """Cache a parsed package file. YAML with values that marshal can't save isn't cached."""
+    try:
+        blob = marshal.dumps((key, data))
+    except ValueError:
+        return
+    # Write to a temporary file first, so that concurrent runs never see a partial file
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(cache_path), mode=0o700, exist_ok=True)
+        # Only readable and writable by the user, from the moment it's created
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_NOFOLLOW", 0), 0o600)
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(blob)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logger.debug(f"Could not cache parsed '{key[0]}' in '{cache_path}': {e}")
+
+
+def _private_file(st: os.stat_result) -> bool:
+    """Whether a file is a regular file of the current user, that only the user can read and write"""
+    if not S_ISREG(st.st_mode):
+        return False
+    if hasattr(os, "getuid") and (st.st_uid != os.getuid() or st.st_mode & 0o077):
+        return False
+    return True
+
+
+def _disk_cache_path(path: str):
+    """Where to cache a parsed package file: in $XDG_CACHE_HOME/multiqc, or ~/.cache/multiqc"""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    if cache_home.startswith("~"):
+        return None
+    path_hash = hashlib.sha1(path.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(cache_home, "multiqc", f"{os.path.basename(path)}.{path_hash}.marshal")
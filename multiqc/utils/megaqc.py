@@ -16,18 +16,25 @@ log = config.logger
 
 
 def multiqc_api_post(exported_data):
+    """
+    Send the report data to MegaQC. Takes either the gzipped request body
+    from util_functions.export_multiqc_json(), or a dict to serialise here.
+    """
     headers = {"Content-Type": "application/json", "content-encoding": "gzip"}
     if config.megaqc_access_token is not None:
         headers["access_token"] = config.megaqc_access_token
-    post_data = json.dumps({"data": exported_data}, cls=MQCJSONEncoder, ensure_ascii=False, indent=2)
-    post_data = post_data.encode("utf-8", "ignore")
-
-    # Gzip the JSON for massively decreased filesize
-    sio_obj = io.BytesIO()
-    gzfh = gzip.GzipFile(fileobj=sio_obj, mode="w")
-    gzfh.write(post_data)
-    gzfh.close()
-    request_body = sio_obj.getvalue()
+    if isinstance(exported_data, bytes):
+        request_body = exported_data
+    else:
+        post_data = json.dumps({"data": exported_data}, cls=MQCJSONEncoder, ensure_ascii=False, indent=2)
+        post_data = post_data.encode("utf-8", "ignore")
+
+        # Gzip the JSON for massively decreased filesize
+        sio_obj = io.BytesIO()
+        gzfh = gzip.GzipFile(fileobj=sio_obj, mode="w")
+        gzfh.write(post_data)
+        gzfh.close()
+        request_body = sio_obj.getvalue()
 
     log.debug("Sending data to MegaQC")
     log.debug(f"MegaQC URL: {config.megaqc_url}")
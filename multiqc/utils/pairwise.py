@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+
+""" Storage for metrics of sample pairs, shared by the modules for relatedness tools such
+as somalier, peddy and vcftools --relatedness2. The number of pairs grows with the square
+of the number of samples, so instead of a dict for every pair, sample names are interned
+to integer ids, and each metric is kept as a NumPy array with one element per pair. Files
+are parsed in chunks of lines, converting each column of a chunk in one go, and matrices
+for heatmaps are filled with vectorised indexing. """
+
+import logging
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from . import config, staging, util_functions
+
+logger = logging.getLogger(__name__)
+
+# Number of lines to split before converting them to arrays
+CHUNK_LINES = 50000
+
+
+class PairwiseTable:
+    """
+    Metrics for pairs of samples. Pairs are kept in the order they were added, and a
+    pair that is added again replaces the earlier one. Numeric columns are float arrays
+    with NaN for missing values; columns with any non-numeric value are arrays of strings.
+    """
+
+    def __init__(self):
+        self.samples: List[str] = []
+        self._sample_ids: Dict[str, int] = dict()
+        self._chunks: List[Tuple[np.ndarray, np.ndarray, Dict[str, np.ndarray]]] = []
+        self._a = np.zeros(0, dtype=np.int32)
+        self._b = np.zeros(0, dtype=np.int32)
+        self._columns: Dict[str, np.ndarray] = dict()
+
+    def _intern(self, s_name: str) -> int:
+        sid = self._sample_ids.get(s_name)
+        if sid is None:
+            sid = self._sample_ids[s_name] = len(self.samples)
+            self.samples.append(s_name)
+        return sid
+
+    def add_pairs(
+        self,
+        samples_a: Sequence[str],
+        samples_b: Sequence[str],
+        columns: Dict[str, Sequence[str]],
+        finite: bool = False,
+        rename: Optional[Callable[[str], str]] = None,
+    ):
+        """
+        Add pairs from columns of strings as read from a file, one value per pair. Sample
+        names are passed through rename() once for every distinct name. With finite, inf
+        values are stored as NaN, for tools that write inf when a metric can't be computed.
+        """
+        names = dict()
+
+        def sample_id(raw: str) -> int:
+            sid = names.get(raw)
+            if sid is None:
+                sid = names[raw] = self._intern(rename(raw) if rename is not None else raw)
+            return sid
+
+        n = len(samples_a)
+        a = np.fromiter((sample_id(s) for s in samples_a), dtype=np.int32, count=n)
+        b = np.fromiter((sample_id(s) for s in samples_b), dtype=np.int32, count=n)
+        arrays = {col: _to_array(values, finite) for col, values in columns.items()}
+        self._chunks.append((a, b, arrays))
+
+    def _consolidate(self):
+        """Join the chunks added since the last call, keeping the last of any duplicate pairs"""
+        if not self._chunks:
+            return
+        chunks = [(self._a, self._b, self._columns)] + self._chunks
+        self._chunks = []
+        n_rows = [len(a) for a, _, _ in chunks]
+        names = list(dict.fromkeys(col for _, _, cols in chunks for col in cols))
+        self._a = np.concatenate([a for a, _, _ in chunks])
+        self._b = np.concatenate([b for _, b, _ in chunks])
+        self._columns = {col: _concat_column([cols.get(col) for _, _, cols in chunks], n_rows) for col in names}
+
+        # Keep the last occurrence of each pair, in the order of the pairs
+        key = self._a.astype(np.int64) * len(self.samples) + self._b
+        _, last = np.unique(key[::-1], return_index=True)
+        if len(last) < len(key):
+            keep = np.sort(len(key) - 1 - last)
+            self._a, self._b = self._a[keep], self._b[keep]
+            self._columns = {col: values[keep] for col, values in self._columns.items()}
+
+    def __len__(self) -> int:
+        self._consolidate()
+        return len(self._a)
+
+    @property
+    def sample_a(self) -> np.ndarray:
+        """Ids of the first sample of every pair, indices into self.samples"""
+        self._consolidate()
+        return self._a
+
+    @property
+    def sample_b(self) -> np.ndarray:
+        """Ids of the second sample of every pair, indices into self.samples"""
+        self._consolidate()
+        return self._b
+
+    @property
+    def columns(self) -> List[str]:
+        self._consolidate()
+        return list(self._columns)
+
+    def __contains__(self, column: str) -> bool:
+        return column in self.columns
+
+    def column(self, column: str) -> np.ndarray:
+        """Values of a column, one per pair"""
+        self._consolidate()
+        return self._columns[column]
+
+    def pair_names(self, sep: str = "*") -> List[str]:
+        """Names of the pairs, as the two sample names joined with sep"""
+        return [
+            f"{self.samples[a]}{sep}{self.samples[b]}" for a, b in zip(self.sample_a.tolist(), self.sample_b.tolist())
+        ]
+
+    def values(self, column: str) -> list:
+        """Values of a column as a list, with None for missing values"""
+        values = self.column(column)
+        if values.dtype.kind == "f":
+            return np.where(np.isnan(values), None, values).tolist()
+        return values.tolist()
+
+    def names_a(self) -> List[str]:
+        """Names of the samples that are first in any pair, in alphabetical order"""
+        return sorted(self.samples[i] for i in np.unique(self.sample_a).tolist())
+
+    def names_b(self) -> List[str]:
+        """Names of the samples that are second in any pair, in alphabetical order"""
+        return sorted(self.samples[i] for i in np.unique(self.sample_b).tolist())
+
+    def keep_samples(self, s_names: Iterable[str]):
+        """Drop all pairs with a sample that is not in s_names, e.g. after ignore_samples()"""
+        s_names = set(s_names)
+        keep_ids = np.array([s in s_names for s in self.samples], dtype=bool)
+        if keep_ids.all():
+            return
+        self._consolidate()
+        keep = keep_ids[self._a] & keep_ids[self._b] if len(keep_ids) else np.zeros(0, dtype=bool)
+        # Renumber the remaining samples
+        new_ids = np.cumsum(keep_ids, dtype=np.int64) - 1
+        self._a = new_ids[self._a[keep]].astype(np.int32)
+        self._b = new_ids[self._b[keep]].astype(np.int32)
+        self._columns = {col: values[keep] for col, values in self._columns.items()}
+        self.samples = [s for s, k in zip(self.samples, keep_ids.tolist()) if k]
+        self._sample_ids = {s: i for i, s in enumerate(self.samples)}
+
+    def matrix(
+        self,
+        column: str,
+        rows: Optional[List[str]] = None,
+        cols: Optional[List[str]] = None,
+        symmetric: bool = False,
+        diagonal: Optional[float] = None,
+    ) -> np.ndarray:
+        """
+        Values of a numeric column as a (rows x cols) matrix, with the first sample of
+        each pair as the row and the second sample as the column, and NaN for missing
+        pairs. Both default to all samples, in the order they were added. With symmetric,
+        every pair also fills the cell of the reversed pair. With diagonal, cells where
+        the row and column are the same sample are set to that value.
+        """
+        rows = self.samples if rows is None else rows
+        cols = rows if cols is None else cols
+        row_pos = self._positions(rows)
+        col_pos = self._positions(cols)
+        matrix = np.full((len(rows), len(cols)), np.nan)
+        if len(self) and len(rows) and len(cols):
+            r, c = row_pos[self.sample_a], col_pos[self.sample_b]
+            values = self.column(column).astype(float)
+            if symmetric:
+                # Interleave each pair with its reverse, so that later pairs win in both cells
+                r = np.stack([r, row_pos[self.sample_b]], 1).ravel()
+                c = np.stack([c, col_pos[self.sample_a]], 1).ravel()
+                values = np.repeat(values, 2)
+            mask = (r >= 0) & (c >= 0)
+            matrix[r[mask], c[mask]] = values[mask]
+        if diagonal is not None:
+            col_index = {s: i for i, s in enumerate(cols)}
+            for i, s in enumerate(rows):
+                if s in col_index:
+                    matrix[i, col_index[s]] = diagonal
+        return matrix
+
+    def _positions(self, s_names: List[str]) -> np.ndarray:
+        """For each sample id, its position in s_names, or -1 if it's not there"""
+        positions = np.full(len(self.samples), -1, dtype=np.int64)
+        for i, s in enumerate(s_names):
+            sid = self._sample_ids.get(s)
+            if sid is not None:
+                positions[sid] = i
+        return positions
+
+    def write_data_file(self, fn: str):
+        """
+        Write the pairs to the data directory with util_functions.write_data_file_with(), as
+        a binary file: Parquet if pyarrow is installed, with the sample names dictionary-encoded,
+        otherwise a NumPy .npz archive with the sample names in "samples" and the pairs as ids
+        into it. With config.data_pairs_text, they are also written as a delimited text file
+        with the names of the two samples and the metrics of each pair on a row.
+        """
+        if config.data_dir is None or len(self) == 0:
+            return
+        # The arrays are replaced rather than changed in place, so the writer thread can use them
+        samples, sample_a, sample_b, columns = list(self.samples), self.sample_a, self.sample_b, dict(self._columns)
+        text = config.data_pairs_text
+
+        def write(fpath_base: str):
+            _write_binary(fpath_base, samples, sample_a, sample_b, columns)
+            if text:
+                _write_text(fpath_base, samples, sample_a, sample_b, columns)
+            logger.debug(f"Wrote {len(sample_a)} pairs to {fn}")
+
+        util_functions.write_data_file_with(write, fn)
+
+
+def _write_binary(fpath_base: str, samples: List[str], sample_a, sample_b, columns: Dict[str, np.ndarray]):
+    """Write the pairs as a .parquet or .npz file"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        fpath = f"{fpath_base}.npz"
+        np.savez_compressed(
+            fpath,
+            samples=np.array(samples, dtype=str),
+            sample_a=sample_a,
+            sample_b=sample_b,
+            **columns,
+        )
+    else:
+        fpath = f"{fpath_base}.parquet"
+        names = pyarrow.array(samples, type=pyarrow.string())
+        table = {
+            "sample_a": pyarrow.DictionaryArray.from_arrays(sample_a, names),
+            "sample_b": pyarrow.DictionaryArray.from_arrays(sample_b, names),
+        }
+        table.update(columns)
+        pyarrow.parquet.write_table(pyarrow.table(table), fpath)
+    staging.add_data_file(fpath)
+
+
+def _write_text(fpath_base: str, samples: List[str], sample_a, sample_b, columns: Dict[str, np.ndarray]):
+    """Write the pairs as a csv file if config.data_format is csv, or tsv otherwise, in chunks of pairs"""
+    data_format = "csv" if config.data_format == "csv" else "tsv"
+    sep = "," if data_format == "csv" else "\t"
+    fpath = f"{fpath_base}.{config.data_format_extensions[data_format]}"
+    names = np.array(samples, dtype=object)
+    with open(fpath, "w", encoding="utf-8", errors="ignore") as fh:
+        fh.write(sep.join(["sample_a", "sample_b"] + list(columns)) + "\n")
+        for start in range(0, len(sample_a), CHUNK_LINES):
+            end = start + CHUNK_LINES
+            chunk = [names[sample_a[start:end]], names[sample_b[start:end]]]
+            chunk += [values[start:end] for values in columns.values()]
+            fh.write("".join(sep.join(map(str, row)) + "\n" for row in zip(*(col.tolist() for col in chunk))))
+    staging.add_data_file(fpath)
+
+
+def read_pairs(
+    table: PairwiseTable,
+    lines: Iterable[str],
+    sample_cols: Tuple[str, str],
+    sep: str = "\t",
+    finite: bool = False,
+    rename: Optional[Callable[[str], str]] = None,
+) -> int:
+    """
+    Parse a delimited file with one pair per line into the table, streaming through the
+    lines in chunks. The header is the first line, and a leading "#" is stripped from it.
+    Returns the number of pairs read, or -1 if the header doesn't have the sample columns.
+    """
+    lines = iter(lines)
+    header = next(lines, "").rstrip("\r\n").lstrip("#").split(sep)
+    try:
+        idx_a, idx_b = header.index(sample_cols[0]), header.index(sample_cols[1])
+    except ValueError:
+        return -1
+
+    n_pairs = 0
+    chunk = []
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if line:
+            chunk.append(line.split(sep))
+        if len(chunk) >= CHUNK_LINES:
+            n_pairs += _add_chunk(table, header, chunk, idx_a, idx_b, finite, rename)
+            chunk = []
+    if chunk:
+        n_pairs += _add_chunk(table, header, chunk, idx_a, idx_b, finite, rename)
+    return n_pairs
+
+
+def _add_chunk(table, header, rows, idx_a, idx_b, finite, rename) -> int:
+    n_cols = len(header)
+    rows = [row for row in rows if len(row) == n_cols]
+    if not rows:
+        return 0
+    values = list(zip(*rows))
+    columns = {h: values[i] for i, h in enumerate(header) if i not in (idx_a, idx_b)}
+    table.add_pairs(values[idx_a], values[idx_b], columns, finite=finite, rename=rename)
+    return len(rows)
+
+
+def _to_array(values: Sequence[str], finite: bool) -> np.ndarray:
+    """Strings as a float array if they are all numbers, otherwise as a string array"""
+    try:
+        array = np.array(values, dtype=float)
+    except ValueError:
+        return np.array(values, dtype=str)
+    if finite:
+        array[np.isinf(array)] = np.nan
+    return array
+
+
+def _concat_column(parts: List[Optional[np.ndarray]], n_rows: List[int]) -> np.ndarray:
+    """Join the parts of a column, filling in chunks that don't have it"""
+    kinds = {p.dtype.kind for p in parts if p is not None}
+    numeric = kinds == {"f"}
+    filled = []
+    for part, n in zip(parts, n_rows):
+        if part is None:
+            part = np.full(n, np.nan) if numeric else np.full(n, "", dtype=str)
+        elif not numeric and part.dtype.kind == "f":
+            part = part.astype(str)
+        filled.append(part)
+    return np.concatenate(filled)
@@ -6,6 +6,8 @@ trigger points during MultiQC execution. """
 
 from importlib_metadata import entry_points
 
+from . import events
+
 # Load the hooks
 hook_functions = {}
 for entry_point in entry_points(group="multiqc.hooks.v1"):
@@ -17,5 +19,6 @@ for entry_point in entry_points(group="multiqc.hooks.v1"):
 
 # Function to run the hooks
 def mqc_trigger(trigger):
+    events.emit("hook", trigger=trigger, n_functions=len(hook_functions.get(trigger, [])))
     for hook in hook_functions.get(trigger, []):
         hook()
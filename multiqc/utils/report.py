@@ -15,6 +15,7 @@ import re
 import time
 from collections import defaultdict, OrderedDict
 from pathlib import Path
+from typing import Dict, List, Optional
 import rich
 import rich.progress
 import yaml
@@ -22,7 +23,7 @@ from yaml.representer import Representer
 
 from multiqc.utils import lzstring
 
-from . import config
+from . import config, events, spill, staging
 
 logger = config.logger
 
@@ -49,6 +50,11 @@ def init():
     global plot_data
     plot_data = dict()
 
+    # With --low-memory, the plot data compressed for the report one plot at a time
+    global plot_compressed_parts
+    plot_compressed_parts = None
+    spill.close()
+
     global html_ids
     html_ids = list()
 
@@ -64,6 +70,9 @@ def init():
     global saved_raw_data
     saved_raw_data = dict()
 
+    global module_raw_data
+    module_raw_data = dict()
+
     global last_found_file
     last_found_file = None
 
@@ -73,6 +82,7 @@ def init():
         "total_sp": 0,
         "total_mods": 0,
         "total_compression": 0,
+        "total_render": 0,
         "sp": defaultdict(),
         "mods": defaultdict(),
     }
@@ -87,8 +97,14 @@ def init():
         "skipped_no_match": 0,
         "skipped_directory_fn_ignore_dirs": 0,
         "skipped_file_contents_search_errors": 0,
+        "streamed_over_filesize_limit": 0,
     }
 
+    # Bytes read from the found files, by the file search ("search") and by each search pattern
+    # key through find_log_files(). Compared to the size of the matched files when profiling.
+    global file_bytes_read
+    file_bytes_read = defaultdict(int)
+
     global searchfiles
     searchfiles = list()
 
@@ -96,6 +112,10 @@ def init():
     global files
     files = dict()
 
+    # Search keys passed to find_log_files(), in order, to know which files each module used
+    global searched_sp_keys
+    searched_sp_keys = list()
+
     # Map of software tools to a set of unique version strings
     global software_versions
     software_versions = defaultdict(lambda: defaultdict(list))
@@ -161,6 +181,8 @@ def get_filelist(run_module_names):
     """
     # Prep search patterns
     spatterns = [{}, {}, {}, {}, {}, {}, {}]
+    # The same, with only the patterns of modules that parse files as a stream
+    streaming_spatterns = [{}, {}, {}, {}, {}, {}, {}]
     runtimes["sp"] = defaultdict()
     ignored_patterns = []
     skipped_patterns = []
@@ -173,6 +195,10 @@ def get_filelist(run_module_names):
         if not isinstance(sps, list):
             sps = [sps]
 
+        # Size limit for the files of this key, from the config
+        if key in config.filesearch_max_filesize:
+            sps = [{**x, "max_filesize": config.filesearch_max_filesize[key]} for x in sps]
+
         # Warn if we have any unrecognised search pattern keys
         expected_sp_keys = [
             "fn",
@@ -183,6 +209,7 @@ def get_filelist(run_module_names):
             "shared",
             "skip",
             "max_filesize",
+            "streaming",
             "exclude_fn",
             "exclude_fn_re",
             "exclude_contents",
@@ -199,20 +226,23 @@ def get_filelist(run_module_names):
         # Split search patterns according to speed of execution.
         if any([x for x in sps if "contents_re" in x]):
             if any([x for x in sps if "num_lines" in x]):
-                spatterns[4][key] = sps
+                group = 4
             elif any([x for x in sps if "max_filesize" in x]):
-                spatterns[5][key] = sps
+                group = 5
             else:
-                spatterns[6][key] = sps
+                group = 6
         elif any([x for x in sps if "contents" in x]):
             if any([x for x in sps if "num_lines" in x]):
-                spatterns[1][key] = sps
+                group = 1
             elif any([x for x in sps if "max_filesize" in x]):
-                spatterns[2][key] = sps
+                group = 2
             else:
-                spatterns[3][key] = sps
+                group = 3
         else:
-            spatterns[0][key] = sps
+            group = 0
+        spatterns[group][key] = sps
+        if any([x.get("streaming") for x in sps]):
+            streaming_spatterns[group][key] = [x for x in sps if x.get("streaming")]
 
     if len(ignored_patterns) > 0:
         logger.debug(f"Ignored {len(ignored_patterns)} search patterns as didn't match running modules.")
@@ -241,14 +271,19 @@ def get_filelist(run_module_names):
             return False
 
         # Limit search to small files, to avoid 30GB FastQ files etc.
+        # Larger files are only matched against the patterns of modules that parse files as a
+        # stream, which don't need to hold them in memory, up to their max_filesize if they have one.
+        over_limit = False
         try:
             f["filesize"] = os.path.getsize(os.path.join(root, fn))
         except (IOError, OSError, ValueError, UnicodeDecodeError):
             logger.debug(f"Couldn't read file when checking filesize: {fn}")
         else:
             if f["filesize"] > config.log_filesize_limit:
-                file_search_stats["skipped_filesize_limit"] += 1
-                return False
+                if not any(streaming_spatterns):
+                    file_search_stats["skipped_filesize_limit"] += 1
+                    return False
+                over_limit = True
 
         # Use mimetypes to exclude binary files where possible
         if not re.match(r".+_mqc\.(png|jpg|jpeg)", f["fn"]) and config.ignore_images:
@@ -258,7 +293,22 @@ def get_filelist(run_module_names):
             if ftype is not None and ftype.startswith("image"):
                 return False
 
-        # Test file for each search pattern
+        if not over_limit:
+            return search_patterns(f, spatterns)
+
+        file_matched = search_patterns(f, streaming_spatterns)
+        if file_matched:
+            file_search_stats["streamed_over_filesize_limit"] += 1
+            logger.debug(
+                f"Accepting file larger than log_filesize_limit, as its module parses it as a stream: "
+                f"{os.path.join(root, fn)} ({f['filesize']} bytes)"
+            )
+        else:
+            file_search_stats["skipped_filesize_limit"] += 1
+        return file_matched
+
+    def search_patterns(f, spatterns):
+        """Test a file for each search pattern, returns True if it matched any"""
         file_matched = False
         for patterns in spatterns:
             for key, sps in patterns.items():
@@ -282,6 +332,7 @@ def get_filelist(run_module_names):
         return file_matched
 
     # Go through the analysis directories and get file list
+    span = events.start_span("file_search", n_search_patterns=sum(len(sps) for sps in spatterns))
     total_sp_starttime = time.time()
     for path in config.analysis_dir:
         handle_analysis_path(Path(path))
@@ -313,6 +364,12 @@ def get_filelist(run_module_names):
         progress.update(mqc_task, s_fn="")
 
     runtimes["total_sp"] = time.time() - total_sp_starttime
+    span.end(
+        n_files=len(searchfiles),
+        n_matched=sum(len(matched) for matched in files.values()),
+        bytes_read=file_bytes_read["search"],
+        **file_search_stats,
+    )
     if config.profile_runtime:
         logger.info(f"Profile-runtime: Searching files took {runtimes['total_sp']:.2f}s")
 
@@ -324,6 +381,38 @@ def get_filelist(run_module_names):
     logger.debug(f"Summary of files that were skipped by the search: [{'] // ['.join(summaries)}]")
 
 
+def use_files(found_files: Dict[str, List[Dict]], run_module_names):
+    """
+    Take the files found by an earlier search, by search pattern key, instead of searching
+    the analysis directories. Used by `multiqc batch` to share one search between reports.
+    """
+    run_module_names = {m.lower() for m in run_module_names}
+    for key in config.sp:
+        if key.split("/", 1)[0].lower() in run_module_names:
+            files[key] = [dict(f) for f in found_files.get(key, [])]
+    # For modules that still search the files themselves
+    seen = set()
+    for key_files in files.values():
+        for f in key_files:
+            if (f["fn"], f["root"]) not in seen:
+                seen.add((f["fn"], f["root"]))
+                searchfiles.append([f["fn"], f["root"]])
+    logger.debug(f"Using {len(seen)} files found by an earlier search")
+
+
+def count_bytes_read(key: Optional[str], fh):
+    """Add the number of bytes read so far from an open text file handle to file_bytes_read"""
+    try:
+        file_bytes_read[key or "other"] += fh.buffer.tell()
+    except (AttributeError, OSError, ValueError):
+        pass
+
+
+def matched_file_bytes():
+    """Total size of the files found for each search pattern key"""
+    return {key: sum(f.get("filesize", 0) for f in key_files) for key, key_files in files.items() if key_files}
+
+
 def search_file(pattern, f, module_key):
     """
     Function to searach a single file for a single search pattern.
@@ -391,6 +480,7 @@ def search_file(pattern, f, module_key):
                                 f["contents_lines"].append(line)
                                 if i >= config.filesearch_lines_limit and i >= pattern.get("num_lines", 0):
                                     break
+                            count_bytes_read("search", fh)
                     except Exception as e:
                         if config.report_readerrors:
                             logger.debug(f"Still couldn't read the file, skipping: {file_path}, {e}")
@@ -408,6 +498,7 @@ def search_file(pattern, f, module_key):
                     file_search_stats["skipped_file_contents_search_errors"] += 1
                     return False
             finally:
+                count_bytes_read("search", fh)
                 fh.close()
 
         # Go through the parsed file contents
@@ -477,7 +568,8 @@ def exclude_file(sp, f):
 
 def data_sources_tofile():
     fn = f"multiqc_sources.{config.data_format_extensions[config.data_format]}"
-    with io.open(os.path.join(config.data_dir, fn), "w", encoding="utf-8") as f:
+    fpath = os.path.join(config.data_dir, fn)
+    with io.open(fpath, "w", encoding="utf-8") as f:
         if config.data_format == "json":
             jsonstr = json.dumps(data_sources, indent=4, ensure_ascii=False)
             print(jsonstr.encode("utf-8", "ignore").decode("utf-8"), file=f)
@@ -491,6 +583,7 @@ def data_sources_tofile():
                         lines.append([mod, sec, s_name, source])
             body = "\n".join(["\t".join(line) for line in lines])
             print(body.encode("utf-8", "ignore").decode("utf-8"), file=f)
+    staging.add_data_file(fpath)
 
 
 def dois_tofile(modules_output):
@@ -502,7 +595,8 @@ def dois_tofile(modules_output):
             dois[mod.anchor] = mod.doi
     # Write to a file
     fn = f"multiqc_citations.{config.data_format_extensions[config.data_format]}"
-    with io.open(os.path.join(config.data_dir, fn), "w", encoding="utf-8") as f:
+    fpath = os.path.join(config.data_dir, fn)
+    with io.open(fpath, "w", encoding="utf-8") as f:
         if config.data_format == "json":
             jsonstr = json.dumps(dois, indent=4, ensure_ascii=False)
             print(jsonstr.encode("utf-8", "ignore").decode("utf-8"), file=f)
@@ -514,6 +608,7 @@ def dois_tofile(modules_output):
                 for doi in dois:
                     body += f"{doi}{' ' * (50 - len(doi))} # {mod}\n"
             print(body.encode("utf-8", "ignore").decode("utf-8"), file=f)
+    staging.add_data_file(fpath)
 
 
 def save_htmlid(html_id, skiplint=False):
@@ -567,12 +662,79 @@ def save_htmlid(html_id, skiplint=False):
     return html_id_clean
 
 
+def init_low_memory(tmp_dir: str):
+    """
+    Keep the plot data and the saved raw data in an on-disk store for the rest of the run,
+    for --low-memory. Each plot is compressed for the report as soon as it's added, instead
+    of compressing the plot data of the whole report at the end.
+    """
+    global plot_data, saved_raw_data, plot_compressed_parts
+    spill.init(os.path.join(tmp_dir, "multiqc_low_memory.sqlite"))
+    plot_data = spill.SpillDict("plot_data")
+    saved_raw_data = spill.SpillDict("saved_raw_data")
+    plot_compressed_parts = spill.SpillDict("plot_compressed_parts")
+
+
+def save_raw_data(fn: str, data):
+    """
+    Save the data of a data file for multiqc_data.json. With --low-memory, it's stored on
+    disk straight away, and stored again when the module has finished, as modules can still
+    change the data after writing the file.
+    """
+    saved_raw_data[fn] = data
+    if isinstance(saved_raw_data, spill.SpillDict):
+        module_raw_data[fn] = data
+
+
+def store_module_raw_data():
+    """Store the data saved by the module that has just finished again, see save_raw_data()"""
+    for fn, data in module_raw_data.items():
+        saved_raw_data[fn] = data
+    module_raw_data.clear()
+
+
+def new_sample_store(namespace: str, by_field: bool = False):
+    """
+    A dict for modules to keep their parsed data in, one value per sample. With --low-memory,
+    the values are kept on disk and loaded when they are used. With by_field, each field of
+    a sample's dict is loaded separately, see spill.SpillDict.
+    """
+    if spill.is_active():
+        return spill.SpillDict(namespace, by_field=by_field)
+    return dict()
+
+
+def add_plot_data(plot_id: str, dump):
+    """Add the data of an interactive plot, for the JavaScript to pick up"""
+    if events.enabled():
+        events.current_span().set(payload_bytes=len(json.dumps(dump)))
+    plot_data[plot_id] = dump
+    if plot_compressed_parts is not None:
+        plot_compressed_parts[plot_id] = compress_json(dump)
+
+
+def compress_plot_data():
+    """Compress the plot data for the report, called once all modules have run"""
+    global plot_compressed_json
+    if plot_compressed_parts is None:
+        plot_compressed_json = compress_json(plot_data)
+        return
+    # Plots added to report.plot_data directly, e.g. by plugins, were not compressed yet
+    for plot_id in plot_data:
+        if plot_id not in plot_compressed_parts:
+            plot_compressed_parts[plot_id] = compress_json(plot_data[plot_id])
+    plot_compressed_json = compress_json(dict())
+
+
 def compress_json(data):
     """Take a Python data object. Convert to JSON and compress using lzstring"""
-    json_string = json.dumps(data).encode("utf-8", "ignore").decode("utf-8")
-    json_string = sanitise_json(json_string)
-    x = lzstring.LZString()
-    return x.compressToBase64(json_string)
+    with events.start_span("compress_json") as span:
+        json_string = json.dumps(data).encode("utf-8", "ignore").decode("utf-8")
+        json_string = sanitise_json(json_string)
+        x = lzstring.LZString()
+        compressed = x.compressToBase64(json_string)
+        span.set(bytes_in=len(json_string), bytes_out=len(compressed))
+    return compressed
 
 
 def sanitise_json(json_string):
@@ -0,0 +1,576 @@
+#!/usr/bin/env python
+
+""" MultiQC partial re-rendering. With `update_cache`, every module that runs records
+what it added to the report (its sections, plot data, General Statistics columns,
+data files and exported plots) in the data directory, next to a manifest with a
+fingerprint of the files it searched, the version of the package providing it and
+a hash of the config. MultiQC run with --update REPORT_DIR only runs the modules
+whose fingerprint changed since that report was made, restores the output of the
+others from the cache and renders the report again.
+
+With `slice_snapshot`, the inputs of every plot are recorded as well, so that
+`multiqc slice` can restore the modules for a subset of the samples, see
+multiqc.slicing.
+
+The cached output is pickled, and loading a pickle can run any code. So that a
+report directory from somewhere else can't do that, every pickle is signed with an
+HMAC using a secret key kept in the user's cache directory, and only pickles with a
+valid signature are loaded. """
+
+import copy
+import functools
+import hashlib
+import hmac
+import json
+import logging
+import os
+import pickle
+import re
+import secrets
+import shutil
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from . import config, report, staging, util_functions
+
+try:
+    # Also pickles lambda functions, e.g. in the General Statistics headers of many modules
+    import cloudpickle as _pickler
+except ImportError:
+    _pickler = pickle
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FN = "multiqc_update_manifest.json"
+CACHE_DIR_NAME = "multiqc_update_cache"
+KEY_FN = "update_cache.key"
+
+# Module attributes that are used to render the report
+_MODULE_ATTRS = (
+    "name",
+    "anchor",
+    "href",
+    "info",
+    "comment",
+    "extra",
+    "doi",
+    "doi_link",
+    "mname",
+    "intro",
+    "versions",
+    "css",
+    "js",
+    "nih",
+    "mod_cust_config",
+)
+
+# Config values that don't change what the modules produce
+_CONFIG_HASH_SKIP = {
+    "creation_date",
+    "working_dir",
+    "analysis_dir",
+    "output_dir",
+    "output_fn",
+    "output_fn_name",
+    "data_dir",
+    "data_dir_name",
+    "data_tmp_dir",
+    "plots_dir",
+    "plots_dir_name",
+    "plots_tmp_dir",
+    "update_dir",
+    "update_cache",
+    "snapshot_dir",
+    "force",
+    "quiet",
+    "no_ansi",
+    "no_version_check",
+    "profile_runtime",
+    "events_file",
+    "events_otlp_endpoint",
+    "megaqc_upload",
+    "megaqc_access_token",
+    "data_write_threads",
+    "data_write_queue_size",
+    "parse_processes",
+    "parse_processes_min_files",
+    "avail_modules",
+    "avail_templates",
+    "kwargs",
+    "nondefault_config",  # Has the values of the other keys, including the skipped ones
+}
+
+
+@dataclass
+class ModuleRun:
+    """What the report looked like before a module ran, and what it recorded afterwards"""
+
+    key: str
+    module: str
+    mod_cust_config: Dict
+    version: str
+    n_html_ids: int
+    n_general_stats: int
+    n_sp_keys: int
+    n_data_files: int
+    data_dir_files: set
+    num_hc_plots: int
+    num_mpl_plots: int
+    n_plot_calls: int
+    plot_ids: set
+    saved_raw_data_keys: set
+    plot_files: set
+    record: Optional[Dict[str, Any]] = None
+    entry: Dict[str, Any] = field(default_factory=dict)
+    restored: bool = False
+
+
+_config_hash: Optional[str] = None
+_previous: Optional[Dict] = None
+_previous_data_dir: Optional[str] = None
+_previous_plots_dir: Optional[str] = None
+_runs: List[ModuleRun] = []
+_keys_seen: Dict[str, int] = {}
+_plot_calls: List[Dict[str, Any]] = []
+_key: Optional[bytes] = None
+
+
+def enabled() -> bool:
+    return bool(config.update_cache or config.update_dir or config.slice_snapshot or config.snapshot_dir)
+
+
+def slicing() -> bool:
+    """Restoring the modules of a snapshot for a subset of the samples, see multiqc.slicing"""
+    return config.snapshot_dir is not None
+
+
+def init():
+    """
+    Called before the modules run, once the output directories are known. Loads the manifest
+    of the report being updated, which is only used if it was made with the same config.
+    """
+    global _config_hash, _previous, _previous_data_dir, _previous_plots_dir, _runs, _keys_seen, _plot_calls
+    _config_hash = None
+    _previous = None
+    _previous_data_dir = None
+    _previous_plots_dir = None
+    _runs = []
+    _keys_seen = {}
+    _plot_calls = []
+    if not enabled():
+        return
+    if slicing():
+        _previous = load_manifest(config.snapshot_dir)
+        _previous_data_dir = config.snapshot_dir
+        if _previous.get("multiqc_version") != config.version:
+            logger.warning(f"Snapshot was made with MultiQC v{_previous.get('multiqc_version')}")
+        return
+    _config_hash = config_hash()
+    if not config.update_dir:
+        return
+
+    _previous_data_dir = os.path.join(config.output_dir, config.data_dir_name)
+    _previous_plots_dir = os.path.join(config.output_dir, config.plots_dir_name)
+    manifest_path = os.path.join(_previous_data_dir, MANIFEST_FN)
+    try:
+        with open(manifest_path) as fh:
+            manifest = json.load(fh)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not load '{manifest_path}', running all modules: {e}")
+        return
+    if manifest.get("multiqc_version") != config.version:
+        logger.info(f"Report was made with MultiQC v{manifest.get('multiqc_version')}, running all modules")
+    elif manifest.get("config_hash") != _config_hash:
+        logger.info("Config has changed since the report was made, running all modules")
+    else:
+        _previous = manifest
+        logger.info(f"Updating report in {os.path.relpath(config.output_dir)}")
+
+
+def load_manifest(data_dir: str) -> Dict:
+    """Load the manifest in a data directory"""
+    with open(os.path.join(data_dir, MANIFEST_FN)) as fh:
+        return json.load(fh)
+
+
+def snapshot_modules() -> List[Dict[str, Dict]]:
+    """The modules recorded in the snapshot being sliced, in the order that they ran"""
+    manifest = load_manifest(config.snapshot_dir)
+    return [{entry["module"]: entry.get("mod_cust_config") or {}} for entry in manifest["modules"].values()]
+
+
+def record_plot(func):
+    """
+    Decorator for the functions that add a plot to the report. With slice_snapshot, a copy
+    of the inputs of every plot is recorded with the module that made it, so that the plot
+    can be made again for a subset of the samples.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not config.slice_snapshot or slicing() or not _runs or _runs[-1].entry:
+            return func(*args, **kwargs)
+        inputs = copy.deepcopy((args, kwargs))
+        plot_ids = set(report.plot_data.keys())
+        saved_raw_data_keys = set(report.saved_raw_data.keys())
+        html = func(*args, **kwargs)
+        _plot_calls.append(
+            {
+                "func": f"{func.__module__}.{func.__name__}",
+                "args": inputs[0],
+                "kwargs": inputs[1],
+                "html": html,
+                "plot_ids": [plot_id for plot_id in report.plot_data.keys() if plot_id not in plot_ids],
+                "saved_raw_data_keys": [fn for fn in report.saved_raw_data.keys() if fn not in saved_raw_data_keys],
+            }
+        )
+        return html
+
+    return wrapper
+
+
+def config_hash() -> str:
+    """Hash of the config values that can change what modules produce"""
+    values = {
+        k: v
+        for k, v in vars(config).items()
+        if not k.startswith("_")
+        and k not in _CONFIG_HASH_SKIP
+        and isinstance(v, (str, int, float, bool, list, tuple, dict, type(None)))
+    }
+    return hashlib.sha1(json.dumps(values, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def start_module(module: str, mod_cust_config: Dict) -> Optional[ModuleRun]:
+    """Take note of the report contents before a module runs. Returns None if not caching."""
+    if not enabled():
+        return None
+    key = re.sub(r"\W+", "_", module)
+    if mod_cust_config:
+        cust_json = json.dumps(mod_cust_config, sort_keys=True, default=str)
+        key = f"{key}-{hashlib.sha1(cust_json.encode('utf-8')).hexdigest()[:10]}"
+    _keys_seen[key] = _keys_seen.get(key, 0) + 1
+    if _keys_seen[key] > 1:
+        key = f"{key}-{_keys_seen[key]}"
+
+    try:
+        version = config.avail_modules[module].dist.version
+    except (AttributeError, KeyError):
+        version = config.version
+    mod_run = ModuleRun(
+        key=key,
+        module=module,
+        mod_cust_config=mod_cust_config,
+        version=version,
+        n_html_ids=len(report.html_ids),
+        n_general_stats=len(report.general_stats_data),
+        n_sp_keys=len(report.searched_sp_keys),
+        n_data_files=len(util_functions.data_file_names),
+        data_dir_files=_list_files(config.data_dir),
+        num_hc_plots=report.num_hc_plots,
+        num_mpl_plots=report.num_mpl_plots,
+        n_plot_calls=len(_plot_calls),
+        plot_ids=set(report.plot_data.keys()),
+        saved_raw_data_keys=set(report.saved_raw_data.keys()),
+        plot_files=_list_files(config.plots_dir),
+    )
+    _runs.append(mod_run)
+    return mod_run
+
+
+def restore_module(mod_run: Optional[ModuleRun]) -> Optional[List]:
+    """
+    Restore the output of a module from the report being updated, if its input files,
+    version and config are the same. Returns the module objects to add to the report,
+    or None if the module has to run. Raises ModuleNoSamplesFound if the module found
+    nothing to report last time either.
+    """
+    if mod_run is None or _previous is None:
+        return None
+    if slicing():
+        return _restore_slice(mod_run)
+    entry = _previous["modules"].get(mod_run.key)
+    if entry is None or entry["version"] != mod_run.version:
+        return None
+    if entry["fingerprint"] != _fingerprint(entry["sp_keys"]):
+        logger.debug(f"{mod_run.module}: input files have changed")
+        return None
+
+    record = None
+    if entry["cache"] is not None:
+        try:
+            record = _load_cached(entry)
+        except Exception as e:
+            logger.debug(f"{mod_run.module}: could not load cached output: {e}")
+            return None
+    if "data_dir_files" not in entry or not all(_is_relative(p) for p in entry["data_dir_files"] + entry["plot_files"]):
+        return None
+    data_files = [os.path.join(_previous_data_dir, rel_path) for rel_path in entry["data_dir_files"]]
+    if not all(os.path.isfile(path) for path in data_files):
+        logger.debug(f"{mod_run.module}: data files are missing")
+        return None
+    if config.plots_dir is not None:
+        plot_files = [os.path.join(_previous_plots_dir, rel_path) for rel_path in entry["plot_files"]]
+        if not all(os.path.isfile(path) for path in plot_files):
+            logger.debug(f"{mod_run.module}: exported plots are missing")
+            return None
+    else:
+        plot_files = []
+
+    mod_run.entry = entry
+    mod_run.restored = True
+    logger.debug(f"{mod_run.module}: input files unchanged, reusing output")
+    if record is None:
+        from multiqc.modules.base_module import ModuleNoSamplesFound
+
+        raise ModuleNoSamplesFound
+
+    # Copy across the files that the module wrote the last time
+    if config.data_dir is not None:
+        for path in data_files:
+            dest = os.path.join(config.data_dir, os.path.relpath(path, _previous_data_dir))
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            shutil.copyfile(path, dest)
+            staging.add_data_file(dest)
+    for path in plot_files:
+        dest = os.path.join(config.plots_dir, os.path.relpath(path, _previous_plots_dir))
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        shutil.copyfile(path, dest)
+    util_functions.data_file_names.extend(entry["data_files"])
+    return _add_record(record)
+
+
+def _restore_slice(mod_run: ModuleRun) -> List:
+    """
+    Restore a module of the snapshot for the selected samples. The plots are made again
+    from their recorded inputs, and the data files are written again, without the other
+    samples. Raises ModuleNoSamplesFound if the module has none of the selected samples.
+    """
+    from multiqc.modules.base_module import ModuleNoSamplesFound
+    from multiqc import slicing
+
+    entry = _previous["modules"].get(mod_run.key)
+    mod_run.entry = entry or {}
+    mod_run.restored = True
+    if entry is None or entry["cache"] is None:
+        raise ModuleNoSamplesFound
+    try:
+        record = _load_cached(entry)
+    except Exception as e:
+        logger.warning(f"{mod_run.module}: could not load the snapshot: {e}")
+        raise ModuleNoSamplesFound
+    record = slicing.slice_record(record)
+    if record is None:
+        raise ModuleNoSamplesFound
+    for fn, data in record["saved_raw_data"].items():
+        util_functions.write_data_file(data, fn)
+    return _add_record(record)
+
+
+def _load_cached(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Load the cached output of a module, if it was signed with our key"""
+    with open(os.path.join(_previous_data_dir, CACHE_DIR_NAME, os.path.basename(entry["cache"])), "rb") as fh:
+        blob = fh.read()
+    signature = _signature(blob)
+    if signature is None or not hmac.compare_digest(signature, str(entry.get("cache_hmac") or "")):
+        raise ValueError(f"{entry['cache']} wasn't made with the key in {_key_path()}, not loading it")
+    return pickle.loads(blob)
+
+
+def _add_record(record: Dict[str, Any]) -> List:
+    """Add everything that a module added to the report, returns the module objects"""
+    known_ids = set(report.html_ids)
+    report.html_ids.extend(html_id for html_id in record["html_ids"] if html_id not in known_ids)
+    report.num_hc_plots += record["num_hc_plots"]
+    report.num_mpl_plots += record["num_mpl_plots"]
+    for plot_id, dump in record["plot_data"].items():
+        report.add_plot_data(plot_id, dump)
+    for data, headers in record["general_stats"]:
+        report.general_stats_data.append(data)
+        report.general_stats_headers.append(headers)
+    for fn, data in record["saved_raw_data"].items():
+        report.saved_raw_data[fn] = data
+    for mod_name, sections in record["data_sources"].items():
+        for section, sources in sections.items():
+            report.data_sources[mod_name][section].update(sources)
+
+    from multiqc.modules.base_module import BaseMultiqcModule
+
+    modules = []
+    for attrs in record["modules"]:
+        mod = BaseMultiqcModule.__new__(BaseMultiqcModule)
+        mod.__dict__.update(attrs)
+        for software_name, versions in mod.versions.items():
+            report.software_versions[mod.name][software_name] = versions
+        modules.append(mod)
+    return modules
+
+
+def end_module(mod_run: Optional[ModuleRun], modules: List):
+    """Record what a module added to the report, once it has run successfully"""
+    if mod_run is None or mod_run.restored:
+        return
+    # Let the data files of the module finish, to find all the files that it wrote
+    util_functions.wait_for_data_files()
+    new_plot_files = _list_files(config.plots_dir) - mod_run.plot_files
+    new_data_dir_files = _list_files(config.data_dir) - mod_run.data_dir_files
+    sp_keys = sorted(set(report.searched_sp_keys[mod_run.n_sp_keys :]))
+    mod_run.entry = {
+        "module": mod_run.module,
+        "version": mod_run.version,
+        "sp_keys": sp_keys,
+        "fingerprint": _fingerprint(sp_keys),
+        "sections": [s["anchor"] for m in modules for s in m.sections],
+        "sources": {m.name: report.data_sources.get(m.name, {}) for m in modules},
+        "data_files": util_functions.data_file_names[mod_run.n_data_files :],
+        "data_dir_files": sorted(new_data_dir_files),
+        "plot_files": sorted(new_plot_files),
+        "mod_cust_config": mod_run.mod_cust_config,
+        "cache": None,
+    }
+    if not modules:
+        return
+    # Later steps change the General Statistics headers in place, and the order of the
+    # sections, so take copies now. The rest is only picked up when the cache is written.
+    mod_run.record = {
+        "modules": [
+            {**{a: getattr(m, a) for a in _MODULE_ATTRS if hasattr(m, a)}, "sections": list(m.sections)}
+            for m in modules
+        ],
+        "html_ids": report.html_ids[mod_run.n_html_ids :],
+        "num_hc_plots": report.num_hc_plots - mod_run.num_hc_plots,
+        "num_mpl_plots": report.num_mpl_plots - mod_run.num_mpl_plots,
+        "plot_calls": _plot_calls[mod_run.n_plot_calls :],
+        "plot_ids": [plot_id for plot_id in report.plot_data.keys() if plot_id not in mod_run.plot_ids],
+        "general_stats": [
+            (
+                {s_name: dict(d) for s_name, d in report.general_stats_data[i].items()},
+                {k: dict(h) for k, h in report.general_stats_headers[i].items()},
+            )
+            for i in range(mod_run.n_general_stats, len(report.general_stats_data))
+        ],
+        "saved_raw_data_keys": [fn for fn in report.saved_raw_data.keys() if fn not in mod_run.saved_raw_data_keys],
+        "data_sources": {
+            m.name: {section: dict(sources) for section, sources in report.data_sources.get(m.name, {}).items()}
+            for m in modules
+        },
+    }
+    mod_run.entry["cache"] = f"{mod_run.key}.pickle"
+
+
+def write_cache(data_dir: str):
+    """Write the manifest and the cached output of every module to the data directory"""
+    if not enabled() or slicing():
+        return
+    if config.zip_data_dir:
+        logger.debug("Not writing the cache for --update, as the data directory is zipped")
+        return
+
+    cache_dir = os.path.join(data_dir, CACHE_DIR_NAME)
+    os.makedirs(cache_dir, exist_ok=True)
+    modules = {}
+    for mod_run in _runs:
+        if not mod_run.entry:
+            continue  # The module crashed, so always run it again
+        cache_fn = mod_run.entry["cache"]
+        if mod_run.restored and cache_fn is not None:
+            shutil.copyfile(
+                os.path.join(_previous_data_dir, CACHE_DIR_NAME, cache_fn), os.path.join(cache_dir, cache_fn)
+            )
+        elif mod_run.record is not None:
+            record = dict(mod_run.record)
+            record["plot_data"] = {plot_id: report.plot_data[plot_id] for plot_id in record.pop("plot_ids")}
+            record["saved_raw_data"] = {fn: report.saved_raw_data[fn] for fn in record.pop("saved_raw_data_keys")}
+            try:
+                blob = _pickler.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+            except Exception as e:
+                # e.g. a table header with a function that can't be pickled
+                logger.debug(f"{mod_run.module}: could not cache output, will always run with --update: {e}")
+                continue
+            with open(os.path.join(cache_dir, cache_fn), "wb") as fh:
+                fh.write(blob)
+            mod_run.entry["cache_hmac"] = _signature(blob)
+        modules[mod_run.key] = mod_run.entry
+
+    manifest = {
+        "multiqc_version": config.version,
+        "config_hash": _config_hash,
+        "slice_snapshot": bool(config.slice_snapshot),
+        "analysis_dir": [os.path.abspath(d) for d in config.analysis_dir],
+        "modules": modules,
+    }
+    with open(os.path.join(data_dir, MANIFEST_FN), "w") as fh:
+        json.dump(manifest, fh, indent=4, default=str)
+
+    if config.update_dir:
+        n_restored = sum(mod_run.restored for mod_run in _runs)
+        logger.info(f"Reused the output of {n_restored} of {len(_runs)} modules")
+
+
+def _fingerprint(sp_keys: List[str]) -> str:
+    """Hash of the paths, sizes and modification times of the files found for search keys"""
+    h = hashlib.sha1()
+    for sp_key in sp_keys:
+        for f in sorted(report.files.get(sp_key, []), key=lambda f: (f["root"], f["fn"])):
+            path = os.path.join(f["root"], f["fn"])
+            try:
+                st = os.stat(path)
+                h.update(f"{sp_key}\0{path}\0{st.st_size}\0{st.st_mtime_ns}\n".encode("utf-8", "surrogateescape"))
+            except OSError:
+                h.update(f"{sp_key}\0{path}\0\n".encode("utf-8", "surrogateescape"))
+    return h.hexdigest()
+
+
+def _key_path() -> Optional[str]:
+    """Where the key to sign the cache is kept: in $XDG_CACHE_HOME/multiqc, or ~/.cache/multiqc"""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    if cache_home.startswith("~"):
+        return None
+    return os.path.join(cache_home, "multiqc", KEY_FN)
+
+
+def _signature(blob: bytes) -> Optional[str]:
+    """
+    HMAC of cached output, with a secret key that is created with a random value the first
+    time. Returns None if there is no key and it can't be created.
+    """
+    global _key
+    if _key is None:
+        path = _key_path()
+        if path is None:
+            return None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Only readable by the user, from the moment it's created
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            pass
+        except OSError as e:
+            logger.debug(f"Could not create the key to sign the cache with in '{path}': {e}")
+            return None
+        else:
+            with os.fdopen(fd, "w") as fh:
+                fh.write(secrets.token_hex(32))
+        try:
+            with open(path) as fh:
+                _key = fh.read().strip().encode("utf-8")
+        except OSError as e:
+            logger.debug(f"Could not read the key to sign the cache with in '{path}': {e}")
+            return None
+        if not _key:
+            _key = None
+            return None
+    return hmac.new(_key, blob, hashlib.sha256).hexdigest()
+
+
+def _is_relative(path: str) -> bool:
+    """A path in the manifest that stays inside the directory that it is relative to"""
+    path = os.path.normpath(path)
+    return not os.path.isabs(path) and path != ".." and not path.startswith(f"..{os.sep}")
+
+
+def _list_files(root: Optional[str]) -> set:
+    """Paths of all files under a directory, relative to it"""
+    if root is None or not os.path.isdir(root):
+        return set()
+    return {os.path.relpath(os.path.join(dirpath, fn), root) for dirpath, _, fns in os.walk(root) for fn in fns}
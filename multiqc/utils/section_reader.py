@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+""" Helpers for modules to parse tool outputs made of sections, reading only the
+sections that they use. Lines are consumed from any iterable (usually an open
+file handle from LogFile.open()), so if reading stops early the rest of the file
+is never read from disk. """
+
+from typing import Callable, Collection, Iterable, Iterator, List, Optional, Tuple
+
+
+def iter_prefixed_lines(
+    lines: Iterable[str],
+    prefixes: Collection[str],
+    sep: str = "\t",
+    comment: str = "#",
+) -> Iterator[Tuple[str, List[str]]]:
+    """
+    Yields (prefix, fields) for the lines that start with one of the prefixes,
+    for outputs where each section is a contiguous block of lines starting with
+    the section name, e.g. the SN, COV and GCD sections of samtools stats.
+
+    Stops reading as soon as every requested section has been seen and has ended.
+    Comment lines never end a section; they are only yielded (as the whole line,
+    with the comment prefix as key) if the comment prefix is in prefixes.
+    """
+    wanted = set(prefixes) - {comment}
+    keep_comments = comment in prefixes
+    done = set()
+    current = None
+    for line in lines:
+        if line.startswith(comment):
+            if keep_comments:
+                yield comment, [line.rstrip("\r\n")]
+            continue
+        prefix = line.split(sep, 1)[0]
+        if prefix != current:
+            if current in wanted:
+                done.add(current)
+                if done == wanted:
+                    return
+            current = prefix
+        if prefix in wanted:
+            yield prefix, line.rstrip("\r\n").split(sep)
+
+
+def iter_tables(
+    lines: Iterable[str],
+    is_marker: Callable[[str], bool],
+    keep_table: Optional[Callable[[str, List[str]], bool]] = None,
+    sep: str = "\t",
+    comment: str = "#",
+) -> Iterator[Tuple[str, object]]:
+    """
+    Reads outputs made of tables, each introduced by a marker comment line and
+    a header line, e.g. the "## METRICS CLASS" and "## HISTOGRAM" tables in
+    Picard outputs. Yields, in file order:
+
+    - ("comment", line) for every comment line, including the table markers, so
+      that the module can pick up sample names from the command lines in headers;
+    - ("table", (marker, header, rows)) for every table that keep_table(marker, header)
+      returns True for (all tables if keep_table is not set). The header and rows are
+      lists of fields, with surrounding whitespace stripped from the line.
+
+    A table ends at the next comment line. Blank lines are skipped, and the rows of
+    tables that are not kept are skipped without being split.
+    """
+    lines = iter(lines)
+    line = next(lines, None)
+    while line is not None:
+        if not line.startswith(comment):
+            line = next(lines, None)
+            continue
+        marker = line.rstrip("\r\n")
+        yield "comment", marker
+        line = next(lines, None)
+        if not is_marker(marker) or line is None or line.startswith(comment):
+            continue
+
+        header = line.strip().split(sep)
+        keep = keep_table is None or keep_table(marker, header)
+        rows = []
+        line = next(lines, None)
+        while line is not None and not line.startswith(comment):
+            if keep and line.strip():
+                rows.append(line.strip().split(sep))
+            line = next(lines, None)
+        if keep:
+            yield "table", (marker, header, rows)
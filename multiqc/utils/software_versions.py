@@ -11,6 +11,7 @@ from typing import List, Dict
 import packaging.version
 import yaml
 
+from multiqc.utils import loaders
 from multiqc.utils import report as mqc_report
 
 # Initialise the logger
@@ -71,16 +72,16 @@ def load_versions_from_config(config):
         with open(file_name) as fh:
             log.debug(f"Reading software versions settings from: {file_name}")
             try:
-                versions_from_one_file = yaml.load(
+                versions_from_one_file = loaders.load_yaml(
                     fh,
                     # We need to be cautious when loading unquoted version strings from a YAML file.
                     # For instance, the version `1.10` will be parsed as a float by default, this converted
-                    # into `1.1`. Passing yaml.BaseLoader explicitly makes YAML treat all scalar values
+                    # into `1.1`. Loading with all_strings uses yaml.BaseLoader, which treats all scalar values
                     # as strings, so `1.10` will turn into a string `"1.10"` as we want.
                     # From https://pyyaml.org/wiki/PyYAMLDocumentation
                     #      BaseLoader(stream) does not resolve or support any tags
                     #      and constructs only basic Python objects: lists, dictionaries and Unicode strings.
-                    Loader=yaml.BaseLoader,
+                    all_strings=True,
                 )
             except yaml.scanner.ScannerError as e:
                 log.error(f"Error parsing versions YAML: {e}")
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+
+""" On-disk storage for the --low-memory mode. Data that would otherwise be held for the
+whole run (plot data, raw data saved for multiqc_data.json, and the parsed samples of
+modules that opt in) is kept in a SQLite database in the temporary directory instead.
+Values are pickled and compressed, and only loaded back when they are used, so memory
+use doesn't grow with the number of samples. """
+
+import logging
+import pickle
+import sqlite3
+import zlib
+from collections.abc import Mapping, MutableMapping
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_connection: Optional[sqlite3.Connection] = None
+
+
+def init(path: str):
+    """Create the database that SpillDict objects store their values in"""
+    global _connection
+    close()
+    # Nothing is kept if MultiQC crashes, so trade durability for speed
+    _connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    _connection.execute("PRAGMA journal_mode=OFF")
+    _connection.execute("PRAGMA synchronous=OFF")
+    _connection.execute(
+        "CREATE TABLE IF NOT EXISTS items "
+        "(id INTEGER PRIMARY KEY, namespace TEXT, key TEXT, value BLOB, UNIQUE (namespace, key))"
+    )
+    logger.debug(f"Keeping report data on disk in {path}")
+
+
+def close():
+    global _connection
+    if _connection is not None:
+        _connection.close()
+        _connection = None
+
+
+def is_active() -> bool:
+    return _connection is not None
+
+
+class SpillDict(MutableMapping):
+    """
+    A dict with string keys whose values live in the on-disk store. Keys keep their
+    insertion order, like a dict. Values are copies: changing a value that was read
+    from the store doesn't change it in the store, so assign it again after changing it.
+    Values that can't be pickled (e.g. lambda functions in table headers) are kept in memory.
+
+    With by_field, dict values are stored one field at a time, and are read back as a
+    read-only SpilledRecord that loads a field when it is accessed. That suits modules
+    that loop over the samples once for each plot, using a different field every time.
+    """
+
+    def __init__(self, namespace: str, by_field: bool = False):
+        if _connection is None:
+            raise RuntimeError("spill.init() must be called before creating a SpillDict")
+        self.namespace = namespace
+        self.by_field = by_field
+        self._fields_namespace = f"{namespace}\x00fields"
+        self._in_memory: Dict[str, Any] = dict()
+        _connection.execute("DELETE FROM items WHERE namespace IN (?, ?)", (namespace, self._fields_namespace))
+
+    def __setitem__(self, key: str, value: Any):
+        if key in self and self.by_field:
+            self._delete_fields(key)
+        if self.by_field and isinstance(value, dict):
+            for field, field_value in value.items():
+                self._put(self._fields_namespace, f"{key}\x00{field}", field_value)
+            value = _RecordFields(value.keys())
+        self._put(self.namespace, key, value)
+
+    def __getitem__(self, key: str) -> Any:
+        row = _connection.execute(
+            "SELECT value FROM items WHERE namespace = ? AND key = ?", (self.namespace, key)
+        ).fetchone()
+        if row is None:
+            raise KeyError(key)
+        value = self._load(key, row[0])
+        if isinstance(value, _RecordFields):
+            return SpilledRecord(self, key, value)
+        return value
+
+    def __delitem__(self, key: str):
+        cursor = _connection.execute("DELETE FROM items WHERE namespace = ? AND key = ?", (self.namespace, key))
+        if cursor.rowcount == 0:
+            raise KeyError(key)
+        self._in_memory.pop(key, None)
+        if self.by_field:
+            self._delete_fields(key)
+
+    def _put(self, namespace: str, key: str, value: Any):
+        blob = _dumps(value)
+        if blob is None:
+            self._in_memory[key] = value
+        else:
+            self._in_memory.pop(key, None)
+        _connection.execute(
+            "INSERT INTO items (namespace, key, value) VALUES (?, ?, ?) "
+            "ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value",
+            (namespace, key, blob),
+        )
+
+    def _delete_fields(self, key: str):
+        # All field keys of the record start with the key and a null character
+        _connection.execute(
+            "DELETE FROM items WHERE namespace = ? AND key >= ? AND key < ?",
+            (self._fields_namespace, f"{key}\x00", f"{key}\x01"),
+        )
+        for field_key in [k for k in self._in_memory if k.startswith(f"{key}\x00")]:
+            del self._in_memory[field_key]
+
+    def _load_field(self, key: str, field: str) -> Any:
+        row = _connection.execute(
+            "SELECT value FROM items WHERE namespace = ? AND key = ?", (self._fields_namespace, f"{key}\x00{field}")
+        ).fetchone()
+        if row is None:
+            raise KeyError(field)
+        return self._load(f"{key}\x00{field}", row[0])
+
+    def __contains__(self, key) -> bool:
+        row = _connection.execute(
+            "SELECT 1 FROM items WHERE namespace = ? AND key = ?", (self.namespace, key)
+        ).fetchone()
+        return row is not None
+
+    def __iter__(self) -> Iterator[str]:
+        # Fetch all keys first, so that the dict can be changed while iterating over it
+        rows = _connection.execute("SELECT key FROM items WHERE namespace = ? ORDER BY id", (self.namespace,))
+        return iter([key for (key,) in rows.fetchall()])
+
+    def __len__(self) -> int:
+        return _connection.execute("SELECT COUNT(*) FROM items WHERE namespace = ?", (self.namespace,)).fetchone()[0]
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        """Loads the values from disk one at a time, in insertion order"""
+        for key in self:
+            try:
+                yield key, self[key]
+            except KeyError:  # Deleted while iterating
+                continue
+
+    def values(self) -> Iterator[Any]:
+        for _, value in self.items():
+            yield value
+
+    def _load(self, key: str, blob: Optional[bytes]) -> Any:
+        if blob is None:
+            return self._in_memory[key]
+        return pickle.loads(zlib.decompress(blob))
+
+    def __repr__(self):
+        return f"<SpillDict '{self.namespace}' with {len(self)} items>"
+
+
+class _RecordFields(tuple):
+    """Field names of a record stored with by_field, stored in place of the record itself"""
+
+
+class SpilledRecord(Mapping):
+    """A dict value of a SpillDict stored with by_field, loading its fields on access"""
+
+    def __init__(self, store: SpillDict, key: str, fields: Tuple[str, ...]):
+        self._store = store
+        self._key = key
+        self._fields = fields
+
+    def __getitem__(self, field: str) -> Any:
+        if field not in self._fields:
+            raise KeyError(field)
+        return self._store._load_field(self._key, field)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._fields)
+
+    def __len__(self) -> int:
+        return len(self._fields)
+
+    def __reduce__(self):
+        # Pickle and copy as a plain dict, e.g. if the record is saved in another SpillDict
+        return dict, (dict(self.items()),)
+
+
+def _dumps(value: Any) -> Optional[bytes]:
+    """Pickle and compress a value, None if it can't be pickled"""
+    try:
+        return zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), 1)
+    except (pickle.PicklingError, TypeError, AttributeError):
+        return None
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+""" MultiQC output staging. Data files and exported plots are written into
+a staging directory created inside the output directory, so that at the end
+of the run they can be published with a single rename instead of being copied
+file by file. Falls back to copying only if the rename crosses devices. """
+
+import errno
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+staging_dir: Optional[str] = None
+_owns_staging_dir = False
+_zip_fh: Optional[zipfile.ZipFile] = None
+_zip_root: Optional[str] = None
+_zip_lock = threading.Lock()
+
+
+def init(output_dir: str, fallback_dir: str) -> str:
+    """
+    Create the staging directory on the same filesystem as the output directory.
+    If that is not possible (e.g. the output directory is not writable yet),
+    use fallback_dir instead, and files will be copied when published.
+    """
+    global staging_dir, _owns_staging_dir, _zip_fh, _zip_root
+    _zip_fh = None
+    _zip_root = None
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        staging_dir = tempfile.mkdtemp(prefix=".multiqc_tmp_", dir=output_dir)
+        _owns_staging_dir = True
+    except OSError as e:
+        logger.debug(f"Could not create staging directory in '{output_dir}', using '{fallback_dir}' instead: {e}")
+        staging_dir = fallback_dir
+        _owns_staging_dir = False
+    logger.debug(f"Using staging directory for output files: {staging_dir}")
+    return staging_dir
+
+
+def start_zip(data_dir: str):
+    """
+    Open a zip archive next to the staged data directory. Data files are added
+    to it as soon as they are written, see add_data_file().
+    """
+    global _zip_fh, _zip_root
+    _zip_root = data_dir
+    _zip_fh = zipfile.ZipFile(f"{data_dir}.zip", "w", compression=zipfile.ZIP_DEFLATED)
+
+
+def add_data_file(path: str):
+    """
+    Called once a file in the data directory is complete. When the data directory
+    is being zipped, the file is streamed into the archive and removed from disk.
+    """
+    if _zip_fh is None or _zip_root is None:
+        return
+    with _zip_lock:
+        _zip_fh.write(path, os.path.relpath(path, _zip_root))
+    os.remove(path)
+
+
+def publish(src: str, dest: str):
+    """Move a finished staged file or directory to its final location"""
+    try:
+        os.replace(src, dest)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        logger.debug(f"Could not rename '{src}' to '{dest}' across devices, copying instead")
+        if os.path.isdir(src):
+            shutil.copytree(
+                src,
+                dest,
+                # Override default shutil.copy2 function to copy files. The default
+                # function copies times and mode, which we want to avoid on purpose
+                # to get around the problem with mounted CIFS shares (see #625).
+                # shutil.copyfile only copies the file without any metadata.
+                copy_function=shutil.copyfile,
+            )
+            shutil.rmtree(src)
+        else:
+            shutil.copyfile(src, dest)
+            os.remove(src)
+
+
+def publish_zip(dest: str):
+    """
+    Add any data files that were not streamed into the archive yet
+    (e.g. written directly by a template), close it and publish it.
+    """
+    global _zip_fh, _zip_root
+    if _zip_fh is None or _zip_root is None:
+        return
+    for root, _, fns in os.walk(_zip_root):
+        for fn in sorted(fns):
+            add_data_file(os.path.join(root, fn))
+    _zip_fh.close()
+    publish(f"{_zip_root}.zip", dest)
+    shutil.rmtree(_zip_root, ignore_errors=True)
+    _zip_fh = None
+    _zip_root = None
+
+
+def cleanup():
+    """Remove the staging directory and anything left in it"""
+    global staging_dir, _zip_fh
+    if _zip_fh is not None:
+        _zip_fh.close()
+        _zip_fh = None
+    if staging_dir is not None and _owns_staging_dir:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    staging_dir = None
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+
+""" Columnar storage for taxonomic classification reports, shared by the modules for
+Kraken-style tools. Each sample is kept as a set of NumPy arrays with one element per
+report line, and taxa are interned to integer ids across all samples, so that sums
+across samples and the top taxa of each rank are computed with vectorised operations
+instead of looping over every line of every report. """
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Columns stored for every sample, and their types
+INT_COLUMNS = ["counts_rooted", "counts_direct", "tax_id", "num_spaces"]
+MINIMIZER_COLUMNS = ["minimizer", "minimizer_distinct"]
+
+
+class TaxonomyTable:
+    """
+    Per-sample columns of a taxonomy report. A taxon is identified by its rank code
+    and name, as the reports of different tools and database versions don't always
+    agree on the taxonomy IDs.
+    """
+
+    def __init__(self, min_pct: float = 0):
+        self.min_pct = min_pct
+        self.samples: Dict[str, Dict[str, np.ndarray]] = dict()
+        # Sum of the counts assigned directly to each taxon, over all lines before filtering
+        self.sample_totals: Dict[str, int] = dict()
+        self._taxon_ids: Dict[Tuple[str, str], int] = dict()
+        self.taxon_ranks: List[str] = []
+        self.taxon_names: List[str] = []
+
+    def add_sample(self, s_name: str, columns: Dict[str, list]):
+        """
+        Add a sample from lists of values, one per report line: "percent", "rank_code",
+        "classif" and the INT_COLUMNS, optionally with the MINIMIZER_COLUMNS. Lines below
+        the min_pct threshold are discarded, except for the unclassified line.
+        """
+        taxon = np.fromiter(
+            (self._intern(rank, name) for rank, name in zip(columns["rank_code"], columns["classif"])),
+            dtype=np.int64,
+            count=len(columns["rank_code"]),
+        )
+        data = {"taxon": taxon, "percent": np.array(columns["percent"], dtype=float)}
+        for col in INT_COLUMNS:
+            data[col] = np.array(columns[col], dtype=np.int64)
+        if all(col in columns for col in MINIMIZER_COLUMNS):
+            for col in MINIMIZER_COLUMNS:
+                data[col] = np.array(columns[col], dtype=np.int64)
+
+        self.sample_totals[s_name] = int(data["counts_direct"].sum())
+        if self.min_pct and len(taxon):
+            keep = (data["percent"] >= self.min_pct) | (np.array(columns["rank_code"], dtype=object) == "U")
+            data = {col: values[keep] for col, values in data.items()}
+        self.samples[s_name] = data
+
+    def _intern(self, rank_code: str, classif: str) -> int:
+        key = (rank_code, classif)
+        tid = self._taxon_ids.get(key)
+        if tid is None:
+            tid = self._taxon_ids[key] = len(self.taxon_ranks)
+            self.taxon_ranks.append(rank_code)
+            self.taxon_names.append(classif)
+        return tid
+
+    def has_minimizers(self, s_name: str) -> bool:
+        return "minimizer" in self.samples[s_name]
+
+    def keep_samples(self, s_names: Iterable[str]):
+        """Drop all samples that are not in s_names, e.g. after ignore_samples()"""
+        s_names = set(s_names)
+        self.samples = {s: d for s, d in self.samples.items() if s in s_names}
+        self.sample_totals = {s: t for s, t in self.sample_totals.items() if s in s_names}
+
+    def rows(self, s_name: str) -> List[Dict]:
+        """The lines of one sample as a list of dicts, with the fields in report order"""
+        d = self.samples[s_name]
+        cols = {col: values.tolist() for col, values in d.items()}
+        rows = []
+        for i, tid in enumerate(cols["taxon"]):
+            row = {
+                "percent": cols["percent"][i],
+                "counts_rooted": cols["counts_rooted"][i],
+                "counts_direct": cols["counts_direct"][i],
+            }
+            if "minimizer" in cols:
+                row["minimizer"] = cols["minimizer"][i]
+                row["minimizer_distinct"] = cols["minimizer_distinct"][i]
+                row["minimizer_duplication"] = _duplication(cols["minimizer"][i], cols["minimizer_distinct"][i])
+            row["rank_code"] = self.taxon_ranks[tid]
+            row["tax_id"] = cols["tax_id"][i]
+            row["num_spaces"] = cols["num_spaces"][i]
+            row["classif"] = self.taxon_names[tid]
+            rows.append(row)
+        return rows
+
+    def taxon_ids(self, rank_code: str, names: Iterable[str]) -> np.ndarray:
+        """Integer ids of taxa of a rank, -1 for taxa that are not in any sample"""
+        return np.array([self._taxon_ids.get((rank_code, name), -1) for name in names], dtype=np.int64)
+
+    def rank_mask(self, s_name: str, rank_code: str) -> np.ndarray:
+        """Booleans telling which lines of a sample are at a rank"""
+        rank_ids = np.array([rank == rank_code for rank in self.taxon_ranks], dtype=bool)
+        return rank_ids[self.samples[s_name]["taxon"]]
+
+    def _concat(self, column: str, s_names: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Taxon ids, sample indices and values of a column, over the lines of the samples"""
+        taxa = [self.samples[s]["taxon"] for s in s_names]
+        if not taxa:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+        sample_idx = np.repeat(np.arange(len(taxa)), [len(t) for t in taxa])
+        values = np.concatenate([self._column(self.samples[s], column) for s in s_names])
+        return np.concatenate(taxa), sample_idx, values
+
+    @staticmethod
+    def _column(d: Dict[str, np.ndarray], column: str) -> np.ndarray:
+        if column == "minimizer_duplication":
+            return _duplication_array(d["minimizer"], d["minimizer_distinct"])
+        return d[column]
+
+    def fraction_of_total(self, column: str = "counts_rooted") -> Dict[str, np.ndarray]:
+        """A column divided by the total count of each sample, 0 for samples without counts"""
+        fractions = dict()
+        for s_name, d in self.samples.items():
+            total = self.sample_totals[s_name]
+            fractions[s_name] = d[column] / total if total else np.zeros(len(d[column]))
+        return fractions
+
+    def summed_fractions(self) -> Dict[str, Dict[str, float]]:
+        """
+        Fraction of each sample assigned to every taxon, summed across all samples, by
+        rank code. Using fractions rather than counts means that deeply sequenced samples
+        are not over-represented. Taxa without an exact rank (e.g. "-" or "G2") are skipped.
+        """
+        fractions = self.fraction_of_total()
+        taxa = [d["taxon"] for d in self.samples.values()]
+        if not taxa:
+            return dict()
+        taxa = np.concatenate(taxa)
+        sums = np.bincount(taxa, weights=np.concatenate(list(fractions.values())), minlength=len(self.taxon_ranks))
+        seen = np.zeros(len(self.taxon_ranks), dtype=bool)
+        seen[taxa] = True
+
+        totals = dict()
+        for tid in np.flatnonzero(seen).tolist():
+            rank_code = self.taxon_ranks[tid]
+            if rank_code == "-" or any(c.isdigit() for c in rank_code):
+                continue
+            totals.setdefault(rank_code, dict())[self.taxon_names[tid]] = float(sums[tid])
+        return totals
+
+    def top_taxa(self, rank_code: str, n: int, summed: Optional[Dict[str, Dict[str, float]]] = None) -> List[str]:
+        """Names of the n taxa of a rank with the highest summed fractions across samples"""
+        if summed is None:
+            summed = self.summed_fractions()
+        if rank_code not in summed:
+            return []
+        names = list(summed[rank_code].keys())
+        # Stable sort, so that ties keep the order in which the taxa were first seen
+        order = np.argsort(-np.array(list(summed[rank_code].values())), kind="stable")
+        return [names[i] for i in order[:n]]
+
+    def taxon_matrix(
+        self,
+        rank_code: str,
+        names: List[str],
+        column: str = "counts_rooted",
+        first: bool = False,
+        s_names: Optional[List[str]] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Values of a column for the given taxa of a rank, as a (samples x taxa) matrix, and
+        a matrix of booleans telling whether the sample has the taxon at all. Lines for the
+        same taxon are summed, or only the first one is taken if first is True. The rows are
+        the samples in s_names, or all samples in the order they were added.
+        """
+        if s_names is None:
+            s_names = list(self.samples)
+        lookup = np.full(len(self.taxon_ranks), -1, dtype=np.int64)
+        for i, tid in enumerate(self.taxon_ids(rank_code, names).tolist()):
+            if tid >= 0:
+                lookup[tid] = i
+
+        n_samples, n_taxa = len(s_names), len(names)
+        values = np.zeros((n_samples, n_taxa))
+        present = np.zeros((n_samples, n_taxa), dtype=bool)
+        if n_taxa == 0 or n_samples == 0:
+            return values, present
+        taxa, sample_idx, col = self._concat(column, s_names)
+        pos = lookup[taxa]
+        mask = pos >= 0
+        cell = sample_idx[mask] * n_taxa + pos[mask]
+        col = col[mask]
+        if first:
+            cell, first_idx = np.unique(cell, return_index=True)
+            values.flat[cell] = col[first_idx]
+        else:
+            values.flat[:] = np.bincount(cell, weights=col, minlength=n_samples * n_taxa)
+        present.flat[cell] = True
+        return values, present
+
+
+def _duplication(total: int, distinct: int) -> float:
+    """Minimizer duplication factor, 0 if there are no distinct minimizers"""
+    try:
+        return float(total) / distinct
+    except ZeroDivisionError:
+        return 0.0
+
+
+def _duplication_array(total: np.ndarray, distinct: np.ndarray) -> np.ndarray:
+    return np.divide(total, distinct, out=np.zeros(len(total)), where=distinct != 0)
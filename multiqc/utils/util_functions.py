@@ -3,19 +3,30 @@
 """ MultiQC Utility functions, used in a variety of places. """
 
 
+import copy
+import gzip
 import io
 import json
 import logging
+import math
 import os
 import shutil
 import sys
+import threading
 import time
 import datetime
-from typing import Dict, List, Union
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
+import numpy as np
 import yaml
 
-from . import config
+from . import config, spill, staging
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 log = logging.getLogger(__name__)
 
@@ -44,6 +55,18 @@ def robust_rmtree(path, logger=None, max_retries=10):
     shutil.rmtree(path)
 
 
+# Background pool for writing data files, created on first use
+_data_writer_pool: Optional[ThreadPoolExecutor] = None
+_data_writer_slots: Optional[threading.BoundedSemaphore] = None
+_data_writer_futures: List[Future] = []
+
+# Names of the data files passed to write_data_file(), without the extension
+data_file_names: List[str] = []
+
+# Number of rows to join in memory before writing them out
+DATA_FILE_CHUNK_ROWS = 1000
+
+
 def write_data_file(
     data: Union[Dict[str, Union[Dict, List]], List[Dict]],
     fn: str,
@@ -53,6 +76,8 @@ def write_data_file(
     """
     Write a data file to the report directory. Will not do anything
     if config.data_dir is not set.
+    The file is written by a pool of background threads if config.data_write_threads
+    is set, so call wait_for_data_files() before using the data directory.
     :param: data - either: a 2D dict, first key sample name (row header),
         second key field (column header); a list of dicts; or a list of lists
     :param: fn - Desired filename. Directory will be prepended automatically.
@@ -60,89 +85,195 @@ def write_data_file(
     :param: data_format - Output format. Defaults to config.data_format (usually tsv)
     :return: None
     """
-
     if config.data_dir is None:
         return
+    data_file_names.append(fn)
 
     # Get data format from config
     if data_format is None:
         data_format = config.data_format
 
-    # JSON encoder class to handle lambda functions
-    class MQCJSONEncoder(json.JSONEncoder):
-        def default(self, obj):
-            if callable(obj):
-                # noinspection PyBroadException
-                try:
-                    return obj(1)
-                except Exception:
-                    return None
-            return json.JSONEncoder.default(self, obj)
-
-    body = None
-    # Some metrics can't be coerced to tab-separated output, test and handle exceptions
+    if not config.data_write_threads:
+        _write_data_file(data, fn, sort_cols, data_format, config.data_dir)
+        return
+
+    # Modules can keep modifying their data after writing it, so take a copy of the
+    # rows that the writer thread will read. Nested structures go to JSON and YAML as-is.
+    if data_format in ["tsv", "csv"]:
+        if isinstance(data, dict):
+            data = {k: (dict(d) if isinstance(d, dict) else d) for k, d in data.items()}
+        elif isinstance(data, list):
+            data = [(dict(d) if isinstance(d, dict) else d) for d in data]
+    else:
+        data = copy.deepcopy(data)
+
+    _submit_data_file(_write_data_file, data, fn, sort_cols, data_format, config.data_dir)
+
+
+def write_data_file_with(write: Callable[[str], None], fn: str):
+    """
+    Write a data file in a format of its own, such as a binary one, like write_data_file():
+    in a writer thread if config.data_write_threads is set, and listed in data_file_names.
+    Will not do anything if config.data_dir is not set.
+    :param: write - function that writes the file, given its path without the extension.
+        It adds the extension, and passes the files it wrote to staging.add_data_file().
+        It runs later in a writer thread, so it must only use data that doesn't change.
+    :param: fn - Desired filename, without the extension
+    """
+    if config.data_dir is None:
+        return
+    data_file_names.append(fn)
+    fpath_base = os.path.join(config.data_dir, fn)
+    if not config.data_write_threads:
+        write(fpath_base)
+        return
+    _submit_data_file(write, fpath_base)
+
+
+def _submit_data_file(func: Callable, *args):
+    """Queue a data file for the writer threads"""
+    global _data_writer_pool, _data_writer_slots
+
+    if _data_writer_pool is None:
+        _data_writer_pool = ThreadPoolExecutor(max_workers=config.data_write_threads, thread_name_prefix="mqc_data")
+        _data_writer_slots = threading.BoundedSemaphore(max(1, config.data_write_queue_size))
+
+    # Block the module if too many files are waiting to be written, to bound memory use
+    _data_writer_slots.acquire()
+    future = _data_writer_pool.submit(func, *args)
+    future.add_done_callback(lambda _: _data_writer_slots.release())
+    _data_writer_futures.append(future)
+
+
+def wait_for_data_files():
+    """
+    Block until all data files queued by write_data_file() have been written.
+    Errors from the writer threads are logged, or raised in strict mode.
+    """
+    global _data_writer_pool, _data_writer_slots
+    while _data_writer_futures:
+        future = _data_writer_futures.pop(0)
+        try:
+            future.result()
+        except Exception as e:
+            if config.strict or config.development:
+                raise
+            log.error(f"Could not write data file: {e}")
+    if _data_writer_pool is not None:
+        _data_writer_pool.shutdown()
+        _data_writer_pool = None
+        _data_writer_slots = None
+
+
+def _write_data_file(data, fn: str, sort_cols: bool, data_format: str, data_dir: str):
+    """Does the work for write_data_file(), possibly in a writer thread"""
+
     if data_format in ["tsv", "csv"]:
         sep = "\t" if data_format == "tsv" else ","
-        # Attempt to reshape data to tsv
+        fpath = os.path.join(data_dir, f"{fn}.{config.data_format_extensions[data_format]}")
+        # Some metrics can't be coerced to tab-separated output, test and handle exceptions
         # noinspection PyBroadException
         try:
-            # Get all headers from the data, except if data is a dictionary (i.e. has >1 dimensions)
-            headers = []
-            rows = []
-
-            for d in data.values() if isinstance(data, dict) else data:
-                if not d or (isinstance(d, list) and isinstance(d[0], dict)):
-                    continue
-                if isinstance(d, dict):
-                    for h in d.keys():
-                        if h not in headers:
-                            headers.append(h)
-            if headers:
-                if sort_cols:
-                    headers = sorted(headers)
-                headers_str = [str(item) for item in headers]
-                if isinstance(data, dict):
-                    # Add Sample header as a first element
-                    headers_str.insert(0, "Sample")
-                rows.append(sep.join(headers_str))
-
-            # The rest of the rows
-            for key, d in sorted(data.items()) if isinstance(data, dict) else enumerate(data):
-                # Make a list starting with the sample name, then each field in order of the header cols
-                if headers:
-                    line = [str(d.get(h, "")) for h in headers]
-                else:
-                    line = [
-                        str(item)
-                        for item in (d.values() if isinstance(d, dict) else (d if isinstance(d, list) else [d]))
-                    ]
-                if isinstance(data, dict):
-                    # Add Sample header as a first element
-                    line.insert(0, str(key))
-                rows.append(sep.join(line))
-            body = "\n".join(rows)
-
+            headers = _write_table(data, fpath, sep, sort_cols)
         except Exception as e:
+            if os.path.exists(fpath):
+                os.remove(fpath)
             if config.development:
                 raise
             data_format = "yaml"
             log.debug(f"{fn} could not be saved as tsv/csv, falling back to YAML. {e}")
+        else:
+            staging.add_data_file(fpath)
+            if config.data_columnar_export and headers and isinstance(data, dict):
+                _write_columnar(data, headers, os.path.join(data_dir, fn))
+            log.debug(f"Wrote data file {os.path.basename(fpath)}")
+            return
 
     # Add relevant file extension to filename, save file.
     fn = f"{fn}.{config.data_format_extensions[data_format]}"
-    fpath = os.path.join(config.data_dir, fn)
-    with io.open(fpath, "w", encoding="utf-8") as f:
+    fpath = os.path.join(data_dir, fn)
+    with io.open(fpath, "w", encoding="utf-8", errors="ignore") as f:
         if data_format == "json":
-            jsonstr = json.dumps(data, indent=4, cls=MQCJSONEncoder, ensure_ascii=False)
-            print(jsonstr.encode("utf-8", "ignore").decode("utf-8"), file=f)
+            json.dump(data, f, indent=4, cls=MQCJSONEncoder, ensure_ascii=False)
+            f.write("\n")
         elif data_format == "yaml":
             yaml.dump(data, f, default_flow_style=False)
-        elif body:
-            # Default - tab separated output
-            print(body.encode("utf-8", "ignore").decode("utf-8"), file=f)
+    staging.add_data_file(fpath)
     log.debug(f"Wrote data file {fn}")
 
 
+def _write_table(data, fpath: str, sep: str, sort_cols: bool) -> List:
+    """
+    Write a 2D dict, a list of dicts or a list of lists as a delimited table,
+    streaming the rows to disk in chunks. Returns the column headers.
+    """
+    # Get all headers from the data, except if data is a dictionary (i.e. has >1 dimensions).
+    # Use a dict as an ordered set, to keep the headers in the order they were first seen.
+    headers = dict()
+    for d in data.values() if isinstance(data, dict) else data:
+        if not d or (isinstance(d, list) and isinstance(d[0], dict)):
+            continue
+        if isinstance(d, dict):
+            headers.update(dict.fromkeys(d.keys()))
+    headers = sorted(headers) if sort_cols else list(headers)
+
+    # Make a list starting with the sample name, then each field in order of the header cols
+    def make_row(key, d):
+        if headers:
+            line = [str(d.get(h, "")) for h in headers]
+        else:
+            line = [str(item) for item in (d.values() if isinstance(d, dict) else (d if isinstance(d, list) else [d]))]
+        if isinstance(data, dict):
+            line.insert(0, str(key))
+        return sep.join(line)
+
+    with io.open(fpath, "w", encoding="utf-8", errors="ignore") as f:
+        if headers:
+            headers_str = [str(item) for item in headers]
+            if isinstance(data, dict):
+                # Add Sample header as a first element
+                headers_str.insert(0, "Sample")
+            f.write(sep.join(headers_str) + "\n")
+
+        # The rest of the rows
+        items = sorted(data.items()) if isinstance(data, dict) else enumerate(data)
+        chunk = []
+        for key, d in items:
+            chunk.append(make_row(key, d))
+            if len(chunk) >= DATA_FILE_CHUNK_ROWS:
+                f.write("\n".join(chunk) + "\n")
+                chunk = []
+        if chunk:
+            f.write("\n".join(chunk) + "\n")
+    return headers
+
+
+def _write_columnar(data: Dict[str, Dict], headers: List, fpath_base: str):
+    """
+    Write a 2D dict as a binary columnar file next to the text output. Uses Parquet
+    if pyarrow is installed, otherwise a NumPy .npz archive with one array per column.
+    """
+    samples = sorted(data.keys())
+    columns = {"Sample": [str(s) for s in samples]}
+    for h in headers:
+        vals = [data[s].get(h) if isinstance(data[s], dict) else None for s in samples]
+        if all(v is None or (isinstance(v, (int, float)) and not isinstance(v, bool)) for v in vals):
+            columns[str(h)] = np.array([np.nan if v is None else v for v in vals], dtype=float)
+        else:
+            columns[str(h)] = np.array(["" if v is None else str(v) for v in vals], dtype=str)
+
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        fpath = f"{fpath_base}.npz"
+        np.savez_compressed(fpath, **columns)
+    else:
+        fpath = f"{fpath_base}.parquet"
+        pyarrow.parquet.write_table(pyarrow.table(columns), fpath)
+    staging.add_data_file(fpath)
+
+
 def force_term_colors():
     """
     Check if any environment variables are set to force Rich to use coloured output
@@ -207,55 +338,208 @@ class MQCJSONEncoder(json.JSONEncoder):
         return json.JSONEncoder.default(self, obj)
 
 
+# Report and config attributes exported to multiqc_data.json and MegaQC
+JSON_EXPORT_VARS = {
+    "report": [
+        "data_sources",
+        "general_stats_data",
+        "general_stats_headers",
+        "multiqc_command",
+        "plot_data",
+        "saved_raw_data",
+    ],
+    "config": [
+        "analysis_dir",
+        "creation_date",
+        "git_hash",
+        "intro_text",
+        "report_comment",
+        "report_header_info",
+        "script_path",
+        "short_version",
+        "subtitle",
+        "title",
+        "version",
+        "output_dir",
+    ],
+}
+
+
+def _json_export_fields(report) -> Iterator[Tuple[str, object]]:
+    """Yield the (key, value) pairs that are exported to multiqc_data.json"""
+    for s, keys in JSON_EXPORT_VARS.items():
+        for k in keys:
+            try:
+                yield f"{s}_{k}", getattr(config if s == "config" else report, k)
+            except AttributeError as e:
+                log.warning(f"Couldn't export data key '{s}.{k}': {e}")
+    # Get the absolute paths of analysis directories
+    analysis_dir_abs = list()
+    for d in getattr(config, "analysis_dir", []):
+        try:
+            analysis_dir_abs.append(os.path.abspath(d))
+        except Exception:
+            pass
+    yield "config_analysis_dir_abs", analysis_dir_abs
+
+
 def multiqc_dump_json(report):
     """
-    Export the parsed data in memory to a JSON file.
-    Used for MegaQC and other data export.
+    Export the parsed data in memory to a dict that can be dumped to JSON.
+    Kept for plugins - MultiQC itself streams the data with export_multiqc_json().
     WARNING: May be depreciated and removed in future versions.
     """
     exported_data = dict()
-    export_vars = {
-        "report": [
-            "data_sources",
-            "general_stats_data",
-            "general_stats_headers",
-            "multiqc_command",
-            "plot_data",
-            "saved_raw_data",
-        ],
-        "config": [
-            "analysis_dir",
-            "creation_date",
-            "git_hash",
-            "intro_text",
-            "report_comment",
-            "report_header_info",
-            "script_path",
-            "short_version",
-            "subtitle",
-            "title",
-            "version",
-            "output_dir",
-        ],
-    }
-    for s in export_vars:
-        for k in export_vars[s]:
-            try:
-                d = None
-                if s == "config":
-                    d = {f"{s}_{k}": getattr(config, k)}
-                elif s == "report":
-                    d = {f"{s}_{k}": getattr(report, k)}
-                if d:
-                    json.dumps(d, cls=MQCJSONEncoder, ensure_ascii=False)  # Test that exporting to JSON works
-                    exported_data.update(d)
-            except (TypeError, KeyError, AttributeError) as e:
-                log.warning(f"Couldn't export data key '{s}.{k}': {e}")
-        # Get the absolute paths of analysis directories
-        exported_data["config_analysis_dir_abs"] = list()
-        for d in exported_data.get("config_analysis_dir", []):
-            try:
-                exported_data["config_analysis_dir_abs"].append(os.path.abspath(d))
-            except Exception:
-                pass
+    for key, val in _json_export_fields(report):
+        if isinstance(val, spill.SpillDict):
+            val = dict(val.items())
+        if key == "report_plot_data":
+            val = {plot_id: _plot_dump_for_export(dump) for plot_id, dump in val.items()}
+        try:
+            json.dumps(val, cls=MQCJSONEncoder, ensure_ascii=False)  # Test that exporting to JSON works
+            exported_data[key] = val
+        except (TypeError, ValueError) as e:
+            log.warning(f"Couldn't export data key '{key}': {e}")
     return exported_data
+
+
+def _plot_dump_for_export(dump):
+    """
+    Plot data as it is exported to multiqc_data.json. Bar plots are packed for the report,
+    and get the values of every category in cats[].data and cats[].data_pct in the export.
+    """
+    from multiqc.plots.plotly import bar
+
+    if isinstance(dump, dict) and dump.get("plot_type") == bar.PlotType.BAR.value:
+        return bar.dump_for_json_export(dump)
+    return dump
+
+
+def _orjson_default(obj):
+    """Handle lambda functions when dumping with orjson, same as MQCJSONEncoder"""
+    if callable(obj):
+        try:
+            return obj(1)
+        except Exception:
+            return None
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+# Indentation of multiqc_data.json. orjson can only indent by 2 spaces, so the standard
+# library fallback does the same.
+JSON_INDENT = 2
+
+
+def _replace_nan(value):
+    """
+    Switch NaN and Infinity floats for None in nested dicts, lists and tuples. They are
+    valid JavaScript but invalid JSON, and the standard library would write them as bare tokens.
+    """
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {k: _replace_nan(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_replace_nan(v) for v in value]
+    return value
+
+
+def dump_json_value(value) -> bytes:
+    """
+    Serialise a single value to UTF-8 JSON in one pass. Uses orjson if it is installed,
+    falling back to the standard library for anything orjson can't handle.
+    Lambda functions are called, NaN and Infinity are written as null.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(
+                value,
+                default=_orjson_default,
+                option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY,
+            )
+        except TypeError:
+            pass
+    body = json.dumps(_replace_nan(value), indent=JSON_INDENT, cls=MQCJSONEncoder, ensure_ascii=False)
+    return body.encode("utf-8", "ignore")
+
+
+def multiqc_json_chunks(report) -> Iterator[bytes]:
+    """
+    Serialise the exported data as a JSON object, yielding one chunk of bytes per top-level key,
+    so that the whole document never has to be held in memory. Keys that can't be serialised
+    are skipped with a warning.
+    """
+    indent = b" " * JSON_INDENT
+    sep = b"{\n"
+    for key, val in _json_export_fields(report):
+        if key == "report_plot_data":
+            # One plot at a time, each converted to the schema of the JSON export
+            yield sep + indent + json.dumps(key).encode("utf-8") + b": "
+            name = val.namespace if isinstance(val, spill.SpillDict) else key
+            yield from _dict_json_chunks(val.items(), name, indent, transform=_plot_dump_for_export)
+            sep = b",\n"
+            continue
+        if isinstance(val, spill.SpillDict):
+            yield sep + indent + json.dumps(key).encode("utf-8") + b": "
+            yield from _dict_json_chunks(val.items(), val.namespace, indent)
+            sep = b",\n"
+            continue
+        try:
+            body = dump_json_value(val)
+        except (TypeError, ValueError) as e:
+            log.warning(f"Couldn't export data key '{key}': {e}")
+            continue
+        # Nested lines need one more level of indentation inside the top-level object.
+        # JSON strings can't contain raw newlines, so this only touches whitespace.
+        yield sep + indent + json.dumps(key).encode("utf-8") + b": " + body.replace(b"\n", b"\n" + indent)
+        sep = b",\n"
+    yield b"{}" if sep == b"{\n" else b"\n}\n"
+
+
+def _dict_json_chunks(
+    items: Iterable[Tuple[str, object]], name: str, indent: bytes, transform: Optional[Callable] = None
+) -> Iterator[bytes]:
+    """
+    Serialise the items of a dict one value at a time, nested in the top-level object. Used for
+    dicts kept on disk with --low-memory, and for the plot data. Values are passed through
+    transform first, if given.
+    """
+    sep = b"{\n"
+    for key, val in items:
+        try:
+            body = dump_json_value(transform(val) if transform is not None else val)
+        except (TypeError, ValueError) as e:
+            log.warning(f"Couldn't export data key '{name}.{key}': {e}")
+            continue
+        yield sep + indent * 2 + json.dumps(key).encode("utf-8") + b": " + body.replace(b"\n", b"\n" + indent * 2)
+        sep = b",\n"
+    yield b"{}" if sep == b"{\n" else b"\n" + indent + b"}"
+
+
+def export_multiqc_json(report, fpath: Optional[str] = None, megaqc_body: bool = False) -> Optional[bytes]:
+    """
+    Write multiqc_data.json to fpath with a single serialisation pass. If megaqc_body is set,
+    the same stream is gzip-compressed on the fly into a MegaQC request body, which is returned.
+    """
+    gz_buffer = io.BytesIO() if megaqc_body else None
+    gz_fh = gzip.GzipFile(fileobj=gz_buffer, mode="wb") if megaqc_body else None
+    fh = open(fpath, "wb") if fpath is not None else None
+    try:
+        if gz_fh is not None:
+            gz_fh.write(b'{"data": ')
+        for chunk in multiqc_json_chunks(report):
+            if fh is not None:
+                fh.write(chunk)
+            if gz_fh is not None:
+                gz_fh.write(chunk)
+        if gz_fh is not None:
+            gz_fh.write(b"}")
+    finally:
+        if fh is not None:
+            fh.close()
+        if gz_fh is not None:
+            gz_fh.close()
+    if fpath is not None:
+        staging.add_data_file(fpath)
+        log.debug(f"Wrote data file {os.path.basename(fpath)}")
+    return gz_buffer.getvalue() if gz_buffer is not None else None
@@ -0,0 +1,123 @@
+"""
+Shared helpers for the tests: small log files of a few tools, written on the fly, and a
+way to make a report from them in the same process.
+"""
+
+import json
+import logging
+import os
+import random
+
+import pytest
+
+from multiqc.batch import run_job
+
+FASTQC_STATUSES = ["pass", "warn", "fail"]
+
+
+def write_fastqc(directory: str, s_name: str, seed: int = 0) -> str:
+    """A fastqc_data.txt file for a sample, with the modules that the FastQC module plots"""
+    rng = random.Random(seed)
+    path = os.path.join(directory, f"{s_name}_fastqc", "fastqc_data.txt")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    total = rng.randint(10**6, 10**7)
+    lines = [
+        "##FastQC\t0.12.1",
+        ">>Basic Statistics\tpass",
+        "#Measure\tValue",
+        f"Filename\t{s_name}.fastq.gz",
+        "File type\tConventional base calls",
+        "Encoding\tSanger / Illumina 1.9",
+        f"Total Sequences\t{total}",
+        "Sequences flagged as poor quality\t0",
+        "Sequence length\t50",
+        f"%GC\t{rng.randint(40, 60)}",
+        ">>END_MODULE",
+        f">>Per base sequence quality\t{rng.choice(FASTQC_STATUSES)}",
+        "#Base\tMean\tMedian\tLower Quartile\tUpper Quartile\t10th Percentile\t90th Percentile",
+    ]
+    lines += [f"{i}\t{rng.uniform(28, 38):.2f}\t35.0\t33.0\t36.0\t29.0\t37.0" for i in range(1, 51)]
+    lines += [">>END_MODULE", f">>Per base sequence content\t{rng.choice(FASTQC_STATUSES)}", "#Base\tG\tA\tT\tC"]
+    for i in range(1, 51):
+        g, a, t = rng.uniform(20, 30), rng.uniform(20, 30), rng.uniform(20, 30)
+        lines.append(f"{i}\t{g:.2f}\t{a:.2f}\t{t:.2f}\t{100 - g - a - t:.2f}")
+    lines += [">>END_MODULE", f">>Per sequence GC content\t{rng.choice(FASTQC_STATUSES)}", "#GC Content\tCount"]
+    lines += [f"{i}\t{rng.uniform(0, 1000):.1f}" for i in range(0, 101)]
+    lines += [">>END_MODULE", ">>Overrepresented sequences\tpass", ">>END_MODULE"]
+    with open(path, "w") as fh:
+        fh.write("\n".join(lines) + "\n")
+    return path
+
+
+def write_samtools_stats(directory: str, s_name: str, seed: int = 0) -> str:
+    """A samtools stats file for a sample"""
+    rng = random.Random(seed)
+    path = os.path.join(directory, f"{s_name}.stats")
+    os.makedirs(directory, exist_ok=True)
+    total = rng.randint(10**6, 10**7)
+    mapped = int(total * rng.uniform(0.8, 0.99))
+    summary = {
+        "raw total sequences": total,
+        "filtered sequences": 0,
+        "sequences": total,
+        "reads mapped": mapped,
+        "reads mapped and paired": mapped,
+        "reads unmapped": total - mapped,
+        "reads properly paired": int(mapped * 0.95),
+        "reads paired": total,
+        "reads duplicated": int(total * 0.05),
+        "reads MQ0": 10,
+        "reads QC failed": 0,
+        "non-primary alignments": 0,
+        "total length": total * 150,
+        "bases mapped": mapped * 150,
+        "bases mapped (cigar)": mapped * 150,
+        "bases duplicated": 100,
+        "error rate": 0.002,
+        "average length": 150,
+        "maximum length": 150,
+        "average quality": 35.1,
+        "insert size average": 300.5,
+        "insert size standard deviation": 50,
+        "inward oriented pairs": 100,
+        "outward oriented pairs": 1,
+        "pairs with other orientation": 1,
+        "pairs on different chromosomes": 1,
+    }
+    with open(path, "w") as fh:
+        fh.write("# This file was produced by samtools stats (1.17+htslib-1.17)\n")
+        for key, value in summary.items():
+            fh.write(f"SN\t{key}:\t{value}\n")
+    return path
+
+
+def make_report(analysis_dir, outdir, **params) -> dict:
+    """Run MultiQC in this process, like multiqc batch does, and return multiqc_data.json"""
+    params = dict(analysis_dir=[str(analysis_dir)], outdir=str(outdir), force=True, quiet=True, **params)
+    assert run_job(params, os.getcwd()) == 0
+    with open(os.path.join(outdir, "multiqc_data", "multiqc_data.json")) as fh:
+        return json.load(fh)
+
+
+@pytest.fixture
+def fastqc_samtools_dir(tmp_path):
+    """FastQC and samtools stats results of 10 samples, SAMPLE_01 to SAMPLE_10"""
+    data_dir = tmp_path / "data"
+    for i in range(1, 11):
+        write_fastqc(str(data_dir / "fastqc"), f"SAMPLE_{i:02d}", seed=i)
+        write_samtools_stats(str(data_dir / "samtools"), f"SAMPLE_{i:02d}", seed=i)
+    return data_dir
+
+
+@pytest.fixture(autouse=True)
+def no_version_check(monkeypatch):
+    monkeypatch.setenv("MULTIQC_NO_VERSION_CHECK", "1")
+
+
+@pytest.fixture(autouse=True)
+def no_log_handlers():
+    """A report leaves its log file handler behind, with the file already moved away"""
+    yield
+    logger = logging.getLogger("multiqc")
+    while logger.handlers:
+        logger.removeHandler(logger.handlers[0])
@@ -0,0 +1,18 @@
+import numpy as np
+
+from multiqc.plots.plotly.bar import pack_values
+
+
+def test_pack_values():
+    values = np.array([1.0, 2.5, np.nan, -3.0, 0.0])
+    packed = pack_values(values)
+    assert packed == [1, 2.5, None, -3, 0]
+    assert [type(v) for v in packed] == [int, float, type(None), int, int]
+    assert np.isnan(pack_values(values, missing=float("nan"))[2])
+
+
+def test_pack_values_keeps_large_numbers_as_floats():
+    values = np.array([2.0**53 - 1, 2.0**53, -(2.0**53), 1e20, -1e300, np.inf])
+    packed = pack_values(values)
+    assert packed == [2**53 - 1, 2.0**53, -(2.0**53), 1e20, -1e300, np.inf]
+    assert [type(v) for v in packed] == [int, float, float, float, float, float]
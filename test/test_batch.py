@@ -0,0 +1,148 @@
+import json
+import os
+
+import pytest
+
+from multiqc import batch
+from multiqc.utils import report
+
+from conftest import write_fastqc
+
+
+def _write_manifest(directory, manifest) -> str:
+    path = directory / "manifest.yaml"
+    path.write_text(json.dumps(manifest))
+    return str(path)
+
+
+def test_load_manifest(tmp_path):
+    (tmp_path / "run_42").mkdir()
+    (tmp_path / "samples_a.txt").write_text("# Project A\nS1\n\nS2*\n")
+    path = _write_manifest(
+        tmp_path,
+        {
+            "analysis_dir": "run_42",
+            "config": {"fn_ignore_dirs": ["work"]},
+            "reports": [
+                {"title": "A", "output_dir": "reports/a", "samples": "samples_a.txt"},
+                {"output_dir": "/abs/b", "ignore_samples": ["Undetermined*", 3]},
+            ],
+        },
+    )
+    manifest = batch.load_manifest(path)
+    assert manifest["analysis_dir"] == [str(tmp_path / "run_42")]
+    assert manifest["config"] == {"fn_ignore_dirs": ["work"]}
+    a, b = manifest["reports"]
+    assert a["output_dir"] == str(tmp_path / "reports" / "a")
+    assert a["samples"] == ["S1", "S2*"]
+    assert a["ignore_samples"] == []
+    assert b["output_dir"] == "/abs/b"
+    assert b["samples"] == []
+    assert b["ignore_samples"] == ["Undetermined*", "3"]
+
+
+@pytest.mark.parametrize(
+    "manifest, error",
+    [
+        (["not", "a", "mapping"], "should contain a mapping"),
+        ({"reports": [{"output_dir": "a"}]}, "No 'analysis_dir'"),
+        ({"analysis_dir": "missing", "reports": [{"output_dir": "a"}]}, "does not exist"),
+        ({"analysis_dir": "."}, "No 'reports'"),
+        ({"analysis_dir": ".", "reports": [{"output_dir": "a"}, {"title": "B"}]}, "Report 2 .* no 'output_dir'"),
+    ],
+)
+def test_load_manifest_errors(tmp_path, manifest, error):
+    with pytest.raises(batch.ManifestError, match=error):
+        batch.load_manifest(_write_manifest(tmp_path, manifest))
+
+
+def _found(*paths):
+    return [{"fn": os.path.basename(p), "root": os.path.dirname(p)} for p in paths]
+
+
+def test_partition_files():
+    analysis_dirs = ["/data/run_1", "/data/run_2"]
+    found = {
+        "fastqc/data": _found(
+            "/data/run_1/project_a/S1_fastqc/fastqc_data.txt",
+            "/data/run_1/project_b/S2_fastqc/fastqc_data.txt",
+            "/data/run_2/project_a/S3_fastqc/fastqc_data.txt",
+        ),
+        "samtools/stats": _found("/data/run_2/project_a/work/S3.stats"),
+    }
+
+    def names(partition):
+        return {key: [os.path.join(f["root"], f["fn"]) for f in key_files] for key, key_files in partition.items()}
+
+    assert batch.partition_files(found, analysis_dirs) == found
+
+    # Relative to each analysis directory
+    assert names(batch.partition_files(found, analysis_dirs, ["project_a/*"])) == {
+        "fastqc/data": [
+            "/data/run_1/project_a/S1_fastqc/fastqc_data.txt",
+            "/data/run_2/project_a/S3_fastqc/fastqc_data.txt",
+        ],
+        "samtools/stats": ["/data/run_2/project_a/work/S3.stats"],
+    }
+    # Full paths
+    assert names(batch.partition_files(found, analysis_dirs, ["/data/run_1/*"])) == {
+        "fastqc/data": [
+            "/data/run_1/project_a/S1_fastqc/fastqc_data.txt",
+            "/data/run_1/project_b/S2_fastqc/fastqc_data.txt",
+        ],
+        "samtools/stats": [],
+    }
+    # Exclusion filters, with or without path filters
+    assert names(batch.partition_files(found, analysis_dirs, None, ["*/work/*", "project_b/*"])) == {
+        "fastqc/data": [
+            "/data/run_1/project_a/S1_fastqc/fastqc_data.txt",
+            "/data/run_2/project_a/S3_fastqc/fastqc_data.txt",
+        ],
+        "samtools/stats": [],
+    }
+    assert names(batch.partition_files(found, analysis_dirs, ["project_a/*"], ["/data/run_2/*"])) == {
+        "fastqc/data": ["/data/run_1/project_a/S1_fastqc/fastqc_data.txt"],
+        "samtools/stats": [],
+    }
+
+
+def test_use_files():
+    report.init()
+    found = {
+        "fastqc/data": _found("/data/S1_fastqc/fastqc_data.txt", "/data/S2_fastqc/fastqc_data.txt"),
+        "fastqc/zip": _found("/data/S1_fastqc.zip"),
+        "samtools/stats": _found("/data/S1.stats"),
+        "not_a_search_pattern": _found("/data/other.txt"),
+    }
+    report.use_files(found, ["FastQC"])
+
+    assert sorted(report.files) == sorted(key for key in report.files if key.startswith("fastqc/"))
+    assert report.files["fastqc/data"] == found["fastqc/data"]
+    assert report.files["fastqc/zip"] == found["fastqc/zip"]
+    assert report.files["fastqc/theoretical_gc"] == []
+    # Every report gets copies, so that one module changing them doesn't affect the others
+    assert report.files["fastqc/data"][0] is not found["fastqc/data"][0]
+    assert sorted(report.searchfiles) == [
+        ["S1_fastqc.zip", "/data"],
+        ["fastqc_data.txt", "/data/S1_fastqc"],
+        ["fastqc_data.txt", "/data/S2_fastqc"],
+    ]
+
+
+def test_reports_from_one_search(tmp_path):
+    data_dir = tmp_path / "data"
+    for project, s_name in [("project_a", "S1"), ("project_a", "S2"), ("project_b", "S3")]:
+        write_fastqc(str(data_dir / project), s_name)
+    found = batch.search_files([str(data_dir)])
+
+    params = dict(
+        analysis_dir=[str(data_dir)],
+        outdir=str(tmp_path / "project_a"),
+        force=True,
+        quiet=True,
+        found_files=batch.partition_files(found, [str(data_dir)], ["project_a/*"]),
+    )
+    assert batch.run_job(params, os.getcwd()) == 0
+    with open(tmp_path / "project_a" / "multiqc_data" / "multiqc_data.json") as fh:
+        data = json.load(fh)
+    assert sorted(data["report_saved_raw_data"]["multiqc_fastqc"]) == ["S1.fastq.gz", "S2.fastq.gz"]
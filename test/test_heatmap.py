@@ -0,0 +1,26 @@
+import math
+
+import pytest
+
+from multiqc.plots.plotly.heatmap import _block_shape
+
+
+@pytest.mark.parametrize(
+    "shape",
+    [(7, 30000), (30000, 7), (1, 10**6), (10**6, 1), (3, 2000), (2000, 3), (1500, 1500), (999, 1001), (5000, 40)],
+)
+@pytest.mark.parametrize("max_cells", [1, 10, 1000, 250000])
+@pytest.mark.parametrize("square", [False, True])
+def test_block_shape_keeps_to_the_tile_budget(shape, max_cells, square):
+    n_rows, n_cols = shape
+    block_rows, block_cols = _block_shape(shape, max_cells, square)
+    assert math.ceil(n_rows / block_rows) * math.ceil(n_cols / block_cols) <= max_cells
+    assert 1 <= block_rows and 1 <= block_cols
+    if square:
+        assert block_rows == block_cols
+
+
+def test_block_shape_of_wide_matrix_keeps_rows():
+    # Fewer rows than the scaling factor: only columns are aggregated
+    assert _block_shape((7, 30000), 1000, square=False) == (1, 212)
+    assert _block_shape((30000, 7), 1000, square=False) == (30, 7)
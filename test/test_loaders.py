@@ -0,0 +1,71 @@
+import marshal
+import os
+
+import pytest
+
+from multiqc.utils import loaders
+
+
+@pytest.fixture
+def package_yaml(tmp_path, monkeypatch):
+    """A YAML file, with the cache in a fresh directory"""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setattr(loaders, "_package_cache", dict())
+    path = tmp_path / "patterns.yaml"
+    path.write_text("tool:\n  fn: '*.txt'\n  num_lines: 10\n")
+    return str(path)
+
+
+def test_cached_on_disk(package_yaml):
+    assert loaders.load_package_yaml(package_yaml) == {"tool": {"fn": "*.txt", "num_lines": 10}}
+    cache_path = loaders._disk_cache_path(os.path.abspath(package_yaml))
+    assert os.stat(cache_path).st_mode & 0o777 == 0o600
+    assert os.stat(os.path.dirname(cache_path)).st_mode & 0o777 == 0o700
+
+    loaders._package_cache.clear()
+    assert loaders.load_package_yaml(package_yaml) == {"tool": {"fn": "*.txt", "num_lines": 10}}
+
+
+def _replace_cache(package_yaml, data, mode=0o600):
+    loaders.load_package_yaml(package_yaml)
+    loaders._package_cache.clear()
+    cache_path = loaders._disk_cache_path(os.path.abspath(package_yaml))
+    with open(cache_path, "rb") as fh:
+        key, _ = marshal.load(fh)
+    with open(cache_path, "wb") as fh:
+        marshal.dump((key, data), fh)
+    os.chmod(cache_path, mode)
+
+
+def test_cache_used_when_private(package_yaml):
+    _replace_cache(package_yaml, {"from": "cache"})
+    assert loaders.load_package_yaml(package_yaml) == {"from": "cache"}
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid"), reason="no file owners")
+@pytest.mark.parametrize("mode", [0o644, 0o620, 0o606])
+def test_cache_ignored_when_others_can_access(package_yaml, mode):
+    _replace_cache(package_yaml, {"from": "cache"}, mode=mode)
+    assert loaders.load_package_yaml(package_yaml) == {"tool": {"fn": "*.txt", "num_lines": 10}}
+
+
+def test_cache_ignored_when_invalid(package_yaml):
+    loaders.load_package_yaml(package_yaml)
+    loaders._package_cache.clear()
+    with open(loaders._disk_cache_path(os.path.abspath(package_yaml)), "wb") as fh:
+        fh.write(b"\x80\x04not marshal")
+    assert loaders.load_package_yaml(package_yaml) == {"tool": {"fn": "*.txt", "num_lines": 10}}
+
+
+def test_cache_ignored_when_file_changed(package_yaml):
+    loaders.load_package_yaml(package_yaml)
+    with open(package_yaml, "a") as fh:
+        fh.write("other: 1\n")
+    assert loaders.load_package_yaml(package_yaml)["other"] == 1
+
+
+def test_not_cached_on_disk_if_marshal_cant(package_yaml):
+    with open(package_yaml, "w") as fh:
+        fh.write("date: 2024-01-02\n")
+    assert str(loaders.load_package_yaml(package_yaml)["date"]) == "2024-01-02"
+    assert not os.path.exists(loaders._disk_cache_path(os.path.abspath(package_yaml)))
@@ -0,0 +1,32 @@
+import re
+
+from conftest import make_report
+
+# Differ between any two runs
+SKIP_KEYS = {
+    "config_creation_date",
+    "config_output_dir",
+    "config_data_dir",
+    "config_plots_dir",
+    "config_low_memory",
+    "report_multiqc_command",
+}
+
+
+def _without_random_ids(plot_data: dict) -> dict:
+    """Plots of tables without an ID get a random one"""
+    return {plot_id: dump for plot_id, dump in plot_data.items() if not re.match(r"^table-\w{4}-\d+$", plot_id)}
+
+
+def test_low_memory_gives_the_same_data(fastqc_samtools_dir, tmp_path):
+    normal = make_report(fastqc_samtools_dir, tmp_path / "normal")
+    low_memory = make_report(fastqc_samtools_dir, tmp_path / "low_memory", low_memory=True)
+
+    # samtools stats adds fields to its data after writing the data file
+    assert "reads_mapped_MQ1" in normal["report_saved_raw_data"]["multiqc_samtools_stats"]["SAMPLE_01"]
+    for data in [normal, low_memory]:
+        data["report_plot_data"] = _without_random_ids(data["report_plot_data"])
+    assert sorted(normal.keys()) == sorted(low_memory.keys())
+    for key in normal:
+        if key not in SKIP_KEYS:
+            assert normal[key] == low_memory[key], key
@@ -0,0 +1,124 @@
+import numpy as np
+import pytest
+
+from multiqc.utils import config, pairwise, util_functions
+from multiqc.utils.pairwise import PairwiseTable, read_pairs
+
+
+@pytest.fixture
+def table():
+    t = PairwiseTable()
+    t.add_pairs(["S1", "S1", "S2"], ["S2", "S3", "S3"], {"relatedness": ["0.5", "0.1", "nan"], "kind": ["a", "b", "c"]})
+    return t
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "data_dir", str(tmp_path))
+    monkeypatch.setattr(config, "data_write_threads", 0)
+    monkeypatch.setattr(util_functions, "data_file_names", [])
+    return tmp_path
+
+
+def test_pairs_and_columns(table):
+    assert len(table) == 3
+    assert table.samples == ["S1", "S2", "S3"]
+    assert table.pair_names() == ["S1*S2", "S1*S3", "S2*S3"]
+    assert table.values("relatedness") == [0.5, 0.1, None]
+    assert table.column("kind").tolist() == ["a", "b", "c"]
+
+
+def test_added_again_replaces_pair(table):
+    table.add_pairs(["S1"], ["S2"], {"relatedness": ["0.7"]})
+    assert len(table) == 3
+    assert table.pair_names() == ["S1*S3", "S2*S3", "S1*S2"]
+    # The new chunk has no "kind", so that pair gets an empty string
+    assert table.values("relatedness") == [0.1, None, 0.7]
+    assert table.column("kind").tolist() == ["b", "c", ""]
+
+
+def test_finite_and_rename():
+    t = PairwiseTable()
+    t.add_pairs(["a.bam"], ["b.bam"], {"ibs0": ["inf"]}, finite=True, rename=lambda s: s.replace(".bam", ""))
+    assert t.samples == ["a", "b"]
+    assert t.values("ibs0") == [None]
+
+
+def test_keep_samples_masks_pairs(table):
+    table.keep_samples(["S1", "S3"])
+    assert table.samples == ["S1", "S3"]
+    assert table.pair_names() == ["S1*S3"]
+    assert table.sample_a.tolist() == [0]
+    assert table.sample_b.tolist() == [1]
+    assert table.values("relatedness") == [0.1]
+
+    table.keep_samples(["S2"])
+    assert len(table) == 0
+    assert table.samples == []
+
+
+def test_matrix(table):
+    m = table.matrix("relatedness", symmetric=True, diagonal=1.0)
+    expected = np.array([[1.0, 0.5, 0.1], [0.5, 1.0, np.nan], [0.1, np.nan, 1.0]])
+    np.testing.assert_array_equal(m, expected)
+
+    m = table.matrix("relatedness", rows=["S1"], cols=["S3", "S2", "S4"])
+    np.testing.assert_array_equal(m, np.array([[0.1, 0.5, np.nan]]))
+
+
+def test_read_pairs_in_chunks(monkeypatch):
+    monkeypatch.setattr(pairwise, "CHUNK_LINES", 2)
+    lines = ["#sample_a\tsample_b\tn\n", "S1\tS2\t1\n", "S1\tS3\t2\n", "bad line\n", "S2\tS3\t3\n", "\n"]
+    t = PairwiseTable()
+    assert read_pairs(t, lines, ("sample_a", "sample_b")) == 3
+    assert t.pair_names() == ["S1*S2", "S1*S3", "S2*S3"]
+    assert t.values("n") == [1.0, 2.0, 3.0]
+    assert read_pairs(PairwiseTable(), ["x\ty\n"], ("sample_a", "sample_b")) == -1
+
+
+def test_binary_export_by_default(table, data_dir, monkeypatch):
+    monkeypatch.setattr(config, "data_pairs_text", False)
+    try:
+        import pyarrow.parquet
+    except ImportError:
+        pyarrow = None
+
+    table.write_data_file("pairs")
+    assert util_functions.data_file_names == ["pairs"]
+    if pyarrow is None:
+        assert sorted(p.name for p in data_dir.iterdir()) == ["pairs.npz"]
+        with np.load(data_dir / "pairs.npz") as npz:
+            assert npz["samples"].tolist() == ["S1", "S2", "S3"]
+            assert npz["sample_a"].tolist() == [0, 0, 1]
+            assert npz["sample_b"].tolist() == [1, 2, 2]
+            np.testing.assert_array_equal(npz["relatedness"], [0.5, 0.1, np.nan])
+            assert npz["kind"].tolist() == ["a", "b", "c"]
+    else:
+        assert sorted(p.name for p in data_dir.iterdir()) == ["pairs.parquet"]
+        columns = pyarrow.parquet.read_table(data_dir / "pairs.parquet").to_pydict()
+        assert columns["sample_a"] == ["S1", "S1", "S2"]
+        assert columns["sample_b"] == ["S2", "S3", "S3"]
+        assert columns["kind"] == ["a", "b", "c"]
+
+
+@pytest.mark.parametrize("data_format, sep, ext", [("tsv", "\t", "txt"), ("csv", ",", "csv"), ("json", "\t", "txt")])
+def test_text_export_in_chunks(table, data_dir, monkeypatch, data_format, sep, ext):
+    monkeypatch.setattr(config, "data_pairs_text", True)
+    monkeypatch.setattr(config, "data_format", data_format)
+    monkeypatch.setattr(pairwise, "CHUNK_LINES", 2)
+
+    table.write_data_file("pairs")
+    with open(data_dir / f"pairs.{ext}") as fh:
+        rows = [line.rstrip("\n").split(sep) for line in fh]
+    assert rows == [
+        ["sample_a", "sample_b", "relatedness", "kind"],
+        ["S1", "S2", "0.5", "a"],
+        ["S1", "S3", "0.1", "b"],
+        ["S2", "S3", "nan", "c"],
+    ]
+
+
+def test_no_export_without_pairs(data_dir):
+    PairwiseTable().write_data_file("pairs")
+    assert list(data_dir.iterdir()) == []
+    assert util_functions.data_file_names == []
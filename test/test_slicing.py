@@ -0,0 +1,227 @@
+import json
+import os
+import re
+
+import numpy as np
+import pytest
+
+from multiqc import slicing
+from multiqc.batch import run_job
+from multiqc.plots.table_object import DataTable
+
+from conftest import make_report
+
+
+def _slice(snapshot, outdir, samples) -> str:
+    """Slice a snapshot like multiqc slice does, and return the report HTML"""
+    params = slicing._run_params(slicing.find_snapshot(str(snapshot)), samples, str(outdir), force=True, quiet=True)
+    assert run_job(params, os.getcwd()) == 0
+    with open(outdir / "multiqc_report.html") as fh:
+        return fh.read()
+
+
+def test_slice_leaves_out_other_samples(fastqc_samtools_dir, tmp_path):
+    make_report(fastqc_samtools_dir, tmp_path / "snapshot", cl_config=("slice_snapshot: true",))
+    html = _slice(tmp_path / "snapshot", tmp_path / "slice", ["SAMPLE_01*", "SAMPLE_02*"])
+
+    names = set(re.findall(r"SAMPLE_\d\d", html))
+    assert names == {"SAMPLE_01", "SAMPLE_02"}
+    # The FastQC pass/fails and sequence content are still there, for the selected samples
+    assert 'class="fastqc_passfails"' in html
+    assert 'class="fastqc_seq_content"' in html
+
+
+def test_slice_record_leaves_out_html_with_other_samples(monkeypatch):
+    monkeypatch.setattr(slicing.config, "sample_names_only_include", ["S1"])
+    payload = '<script type="application/json" class="statuses">{"S1": "pass", "S2": "fail"}</script>'
+    record = {
+        "modules": [
+            {
+                "name": "Tool",
+                "intro": "<p>Tool summary</p>" + payload,
+                "comment": "<p>Samples S1 and S2 look odd</p>",
+                "sections": [
+                    {"name": "Kept", "anchor": "kept", "content": "<p>S1 and S10 only</p>" + payload},
+                    {"name": "Left out", "anchor": "left_out", "content": "<p>S2_R1 has low quality</p>"},
+                ],
+            }
+        ],
+        "general_stats": [({"S1": {"x": 1}, "S2": {"x": 2}}, {"x": {}})],
+        "data_sources": {},
+        "saved_raw_data": {},
+        "plot_data": {},
+    }
+    sliced = slicing.slice_record(record)
+
+    module = sliced["modules"][0]
+    assert (
+        module["intro"] == '<p>Tool summary</p><script type="application/json" class="statuses">{"S1": "pass"}</script>'
+    )
+    assert module["comment"] == ""
+    assert [section["anchor"] for section in module["sections"]] == ["kept"]
+    assert "S2" not in module["sections"][0]["content"]
+    assert sliced["general_stats"] == [({"S1": {"x": 1}}, {"x": {}})]
+
+
+@pytest.fixture
+def selection(monkeypatch):
+    """S1 and S10 are selected, of S1, S2 and S10"""
+    monkeypatch.setattr(slicing.config, "sample_names_only_include", ["S1", "S10*"])
+    return slicing._Selection(["S1", "S2", "S10"])
+
+
+def test_sample_of():
+    selection = slicing._Selection(["S1", "S1_L001", "S2"])
+    assert selection.sample_of("S1") == "S1"
+    assert selection.sample_of("S1_R1") == "S1"
+    assert selection.sample_of("S1 - FR") == "S1"
+    assert selection.sample_of("S1_L001_R1") == "S1_L001"
+    assert selection.sample_of("S10") is None
+    assert selection.sample_of("S1x") is None
+    assert selection.sample_of("Other") is None
+    assert selection.sample_of(2) is None
+
+
+def test_keep_and_filter(selection):
+    assert selection.keep("S1") and selection.keep("S1_R1") and selection.keep("S10")
+    assert not selection.keep("S2") and not selection.keep("S2_R2")
+    assert selection.keep("Not a sample")
+    assert selection.filter({"S1": 1, "S2": 2, "total": 3}) == {"S1": 1, "total": 3}
+    assert selection.any_kept(["S2", "S10_R1"])
+    assert not selection.any_kept(["S2", "S2_R1"])
+    assert selection.any_kept([])
+
+
+def test_kept_pconfig(selection):
+    pconfig = {
+        "id": "plot",
+        "colors": {"S1": "red", "S2": "blue"},
+        "extra_series": [{"S1_R1": 1, "S2_R1": 2}, {"S10": 3}],
+        "ylab": "S2",
+        "data_labels": [{"name": "Reads"}, {"name": "Bases"}],
+    }
+    assert slicing._kept_pconfig(pconfig, selection) == {
+        "id": "plot",
+        "colors": {"S1": "red"},
+        "extra_series": [{"S1_R1": 1}, {"S10": 3}],
+        "ylab": "S2",
+        "data_labels": [{"name": "Reads"}, {"name": "Bases"}],
+    }
+    assert slicing._kept_pconfig(None, selection) is None
+
+
+def test_slice_bar(selection):
+    cats = [{"name": "Mapped", "color": "red", "data": [1, 2, 3]}]
+    params = {
+        "cats_lists": [cats, [dict(cat, data=[4]) for cat in cats]],
+        "samples_lists": [["S1", "S2", "S10"], ["S2"]],
+        "pconfig": {"data_labels": ["Reads", "Only S2"]},
+        "values_lists": None,
+    }
+    sliced = slicing._slice_bar(params, selection)
+    assert sliced["samples_lists"] == [["S1", "S10"]]
+    assert sliced["cats_lists"] == [[{"name": "Mapped", "color": "red", "data": [1, 3]}]]
+    assert sliced["pconfig"]["data_labels"] == ["Reads"]
+    assert sliced["values_lists"] is None
+
+    params = {
+        "cats_lists": [[{"name": "Mapped", "color": "red"}, {"name": "Unmapped", "color": "blue"}]],
+        "samples_lists": [["S1", "S2", "S10"]],
+        "pconfig": {},
+        "values_lists": [np.array([[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]])],
+    }
+    sliced = slicing._slice_bar(params, selection)
+    assert sliced["samples_lists"] == [["S1", "S10"]]
+    np.testing.assert_array_equal(sliced["values_lists"][0], [[1.0, 2.0], [5.0, 6.0]])
+
+    assert slicing._slice_bar({"cats_lists": [cats], "samples_lists": [["S2"]], "pconfig": {}}, selection) is None
+
+
+def test_slice_heatmap(selection):
+    params = {
+        "rows": [[1, 0.5, 0.1], [0.5, 1, 0.2], [0.1, 0.2, 1]],
+        "xcats": ["S1", "S2", "S10"],
+        "ycats": ["S1", "S2", "S10"],
+        "pconfig": {},
+    }
+    sliced = slicing._slice_heatmap(params, selection)
+    assert sliced["rows"] == [[1, 0.1], [0.1, 1]]
+    assert sliced["xcats"] == sliced["ycats"] == ["S1", "S10"]
+
+    params = {"rows": {"S1": {"A": 1, "B": 2}, "S2": {"A": 3, "B": 4}}, "xcats": None, "ycats": None, "pconfig": {}}
+    sliced = slicing._slice_heatmap(params, selection)
+    assert sliced["rows"] == [[1, 2]]
+    assert sliced["xcats"] == ["A", "B"]
+    assert sliced["ycats"] == ["S1"]
+
+    params = {"rows": np.arange(6.0).reshape(3, 2), "xcats": ["x", "y"], "ycats": ["S1", "S2", "S10"], "pconfig": {}}
+    sliced = slicing._slice_heatmap(params, selection)
+    np.testing.assert_array_equal(sliced["rows"], [[0.0, 1.0], [4.0, 5.0]])
+
+    params = {"rows": [[1], [2]], "xcats": ["x"], "ycats": ["S1", "S2"], "pconfig": {"ycats_samples": False}}
+    assert slicing._slice_heatmap(params, selection)["rows"] == [[1], [2]]
+    params = {"rows": [[1]], "xcats": ["x"], "ycats": ["S2"], "pconfig": {}}
+    assert slicing._slice_heatmap(params, selection) is None
+
+
+def test_slice_line(selection):
+    slicer = slicing._SLICERS["multiqc.plots.plotly.line.plot"]
+    params = {
+        "lists_of_lines": [
+            [{"name": "S1", "data": [[1, 2]]}, {"name": "S2_R1", "data": [[1, 3]]}, {"name": "Expected", "data": []}],
+            [{"name": "S2", "data": [[1, 4]]}],
+        ],
+        "pconfig": {"data_labels": [{"name": "Counts"}, {"name": "Other"}]},
+    }
+    sliced = slicer(params, selection)
+    assert [[line["name"] for line in lines] for lines in sliced["lists_of_lines"]] == [["S1", "Expected"]]
+    assert sliced["pconfig"]["data_labels"] == [{"name": "Counts"}]
+
+
+def test_slice_violin_keeps_empty_tables(selection):
+    dt = DataTable({}, {"reads": {"title": "Reads"}}, {"id": "empty_table"})
+    sliced = slicing._slice_violin({"dt": dt}, selection)
+    assert sliced is not None
+    assert sliced["dt"].data == [{}]
+
+
+def test_slice_violin_scales_from_selected_samples(selection):
+    dt = DataTable({"S1": {"reads": 10.0}, "S2": {"reads": 100.0}}, {"reads": {"title": "Reads"}}, {"id": "reads"})
+    assert dt.headers[0]["reads"]["dmax"] == 100.0
+    sliced = slicing._slice_violin({"dt": dt}, selection)
+    assert sliced["dt"].data == [{"S1": {"reads": 10.0}}]
+    assert sliced["dt"].headers[0]["reads"]["dmax"] == 10.0
+    # The table of the snapshot itself isn't changed
+    assert dt.headers[0]["reads"]["dmax"] == 100.0
+
+
+def _data_json(outdir) -> dict:
+    """multiqc_data.json without what changes from run to run, such as random table ids"""
+    with open(outdir / "multiqc_data" / "multiqc_data.json") as fh:
+        data = json.load(fh)
+    data["report_plot_data"] = {k: v for k, v in data["report_plot_data"].items() if not RANDOM_ID_RE.match(k)}
+    for key in ["config_output_dir", "config_creation_date", "config_analysis_dir_abs"]:
+        data.pop(key, None)
+    return data
+
+
+RANDOM_ID_RE = re.compile(r"table-[a-z]{4}(-\d+)?$")
+
+
+def test_slice_same_as_normal_run(fastqc_samtools_dir, tmp_path):
+    selected = ["SAMPLE_01*", "SAMPLE_02*"]
+    make_report(
+        fastqc_samtools_dir, tmp_path / "normal", cl_config=(json.dumps({"sample_names_only_include": selected}),)
+    )
+    make_report(fastqc_samtools_dir, tmp_path / "snapshot", cl_config=("slice_snapshot: true",))
+    _slice(tmp_path / "snapshot", tmp_path / "slice", selected)
+
+    normal = _data_json(tmp_path / "normal")
+    sliced = _data_json(tmp_path / "slice")
+    # Modules add the data sources of ignored samples in a normal run, a slice leaves them out
+    for sections in normal["report_data_sources"].values():
+        for section, sources in sections.items():
+            sections[section] = {s: source for s, source in sources.items() if s.startswith(("SAMPLE_01", "SAMPLE_02"))}
+    assert sliced.keys() == normal.keys()
+    for key in normal:
+        assert sliced[key] == normal[key], key
@@ -0,0 +1,12 @@
+import numpy as np
+import pytest
+
+from multiqc.plots.plotly.violin import compute_densities
+
+
+@pytest.mark.parametrize("method", ["kde", "histogram"])
+def test_densities_leave_out_missing_values(method):
+    with_nan, without_nan = compute_densities([np.array([1.0, np.nan, 3.0, 4.0]), np.array([1.0, 3.0, 4.0])], method)
+    assert with_nan == without_nan
+    width = without_nan["x"][1] - without_nan["x"][0]
+    assert sum(without_nan["y"]) * width == pytest.approx(1.0, abs=0.03)